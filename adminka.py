@@ -1,10 +1,13 @@
-import telebot, sqlite3, shelve, os, json, re, datetime
+import telebot, sqlite3, os, json, re, datetime
 from datetime import timezone
 import config, dop, files
+import state_store
 import db
+import callback_codec
 import telethon_config
 import telethon_manager
 from utils.ascii_chart import sparkline
+import business_intelligence
 from business_intelligence import generate_bi_report
 from utils.professional_box import render_box
 from advertising_system.admin_integration import (
@@ -21,6 +24,7 @@ from navigation import nav_system
 from utils.message_chunker import send_long_message
 from broadcast import start_broadcast
 
+import io
 import logging
 import math
 
@@ -38,14 +42,14 @@ _disabled_products: set[tuple[int, str]] = set()
 
 def set_state(chat_id, state, prev="main"):
     """Store user state and previous menu"""
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         bd[str(chat_id)] = state
         bd[f"{chat_id}_prev"] = prev
 
 
 def clear_state(chat_id):
     """Remove stored state"""
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         bd.pop(str(chat_id), None)
         bd.pop(f"{chat_id}_prev", None)
         bd.pop(f"{chat_id}_new_product", None)
@@ -63,7 +67,7 @@ def handle_cancel_command(message):
 
 
 def get_prev(chat_id):
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         return bd.get(f"{chat_id}_prev", "main")
 
 # ---------------------------------------------------------------------------
@@ -161,7 +165,7 @@ def show_marketing_unified(store_id, chat_id):
     limit = dop.get_campaign_limit(store_id)
 
     active = [c for c in campaigns if c.get("status") == "active"]
-    scheduler = CampaignScheduler(files.main_db, shop_id=store_id)
+    scheduler = CampaignScheduler(files.main_db, shop_id=store_id, readonly=True)
     try:
         pending = scheduler.get_pending_sends()
     except Exception:
@@ -449,28 +453,80 @@ def admin_create_shop(chat_id, user_id):
     set_state(chat_id, 900, "main")
 
 
-def admin_bi_report(chat_id, user_id):
+# Periodo del último reporte BI visto por cada chat (para exportarlo)
+_bi_report_period = {}
+
+BI_PERIOD_BUTTONS = [
+    ("7 días", "7d"),
+    ("30 días", "30d"),
+    ("90 días", "90d"),
+    ("Mes", "mtd"),
+    ("Año vs anterior", "yoy"),
+    ("Histórico", "all"),
+]
+
+
+def _bi_report_allowed(chat_id, user_id, action="bi_report"):
+    if db.get_user_role(user_id) == "superadmin":
+        return True
+    key = nav_system.create_universal_navigation(
+        chat_id, "admin_bi_report_denied"
+    )
+    send_long_message(
+        bot,
+        chat_id,
+        "❌ Solo SuperAdmin.",
+        markup=key,
+    )
+    db.log_event("WARNING", f"user {user_id} denied {action}")
+    return False
+
+
+def admin_bi_report(chat_id, user_id, period=None):
     """Enviar reporte de Business Intelligence al SuperAdmin."""
-    if db.get_user_role(user_id) != "superadmin":
-        key = nav_system.create_universal_navigation(
-            chat_id, "admin_bi_report_denied"
-        )
-        send_long_message(
-            bot,
-            chat_id,
-            "❌ Solo SuperAdmin.",
-            markup=key,
-        )
-        db.log_event("WARNING", f"user {user_id} denied bi_report")
+    if not _bi_report_allowed(chat_id, user_id):
         return
 
     send_long_message(bot, chat_id, "⏳ Generando reporte...")
-    report = generate_bi_report()
-    key = nav_system.create_universal_navigation(chat_id, "admin_bi_report")
+    if period is None:
+        report = generate_bi_report()
+        period = "all"
+    else:
+        report = generate_bi_report(period)
+    _bi_report_period[chat_id] = period
+    quick_actions = [
+        (("• " if key == period else "") + text, f"admin_bi_report_{key}")
+        for text, key in BI_PERIOD_BUTTONS
+    ]
+    quick_actions += [
+        ("📄 CSV", "admin_bi_export_csv"),
+        ("🧾 JSON", "admin_bi_export_json"),
+    ]
+    key = nav_system.create_universal_navigation(
+        chat_id, "admin_bi_report", quick_actions=quick_actions
+    )
     send_long_message(bot, chat_id, report, markup=key, parse_mode="Markdown")
     db.log_event("INFO", f"user {user_id} viewed bi_report")
 
 
+def admin_bi_export(chat_id, user_id, fmt):
+    """Enviar el reporte BI del periodo actual como archivo CSV o JSON."""
+    if not _bi_report_allowed(chat_id, user_id, "bi_export"):
+        return
+
+    period = _bi_report_period.get(chat_id, "all")
+    try:
+        data = business_intelligence.export_bi_report(period, fmt)
+    except Exception as e:
+        logging.error(f"Error exportando reporte BI: {e}")
+        send_long_message(bot, chat_id, "❌ No se pudo exportar el reporte.")
+        return
+    document = io.BytesIO(data.encode("utf-8"))
+    document.name = f"reporte_bi_{period}_{datetime.date.today().isoformat()}.{fmt}"
+    bot.send_document(chat_id, document, caption=f"📊 Reporte BI ({fmt.upper()})")
+    db.log_event("INFO", f"user {user_id} exported bi_report {fmt}")
+
+
 # Compatibilidad retroactiva
 show_bi_report = admin_bi_report
 
@@ -506,6 +562,20 @@ def _admin_bi_report_nav(chat_id, user_id):
 nav_system.register("admin_bi_report", _admin_bi_report_nav)
 
 
+def _bi_period_nav(period):
+    return lambda chat_id, user_id: show_bi_report(chat_id, user_id, period)
+
+
+def _bi_export_nav(fmt):
+    return lambda chat_id, user_id: admin_bi_export(chat_id, user_id, fmt)
+
+
+for _text, _period in BI_PERIOD_BUTTONS:
+    nav_system.register(f"admin_bi_report_{_period}", _bi_period_nav(_period))
+for _fmt in ("csv", "json"):
+    nav_system.register(f"admin_bi_export_{_fmt}", _bi_export_nav(_fmt))
+
+
 def route_superadmin_callback(callback_data, chat_id, user_id):
     """Dispatch superadmin dashboard callbacks to their handlers."""
     if callback_data in (
@@ -535,7 +605,7 @@ def configure_responses(store_id, chat_id):
 
     lines = []
     quick_actions = []
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         for t, label in templates.items():
             status = "✅" if t in bd else "❌"
             lines.append(f"{label}: {status}")
@@ -580,21 +650,21 @@ def response_edit_after_buy(chat_id, store_id):
 
 
 def response_preview_start(chat_id, store_id):
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         text = bd.get("start", "❌ Sin configurar")
     key = nav_system.create_universal_navigation(chat_id, "response_preview_start")
     send_long_message(bot, chat_id, text, markup=key, parse_mode="Markdown")
 
 
 def response_preview_help(chat_id, store_id):
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         text = bd.get("help", "❌ Sin configurar")
     key = nav_system.create_universal_navigation(chat_id, "response_preview_help")
     send_long_message(bot, chat_id, text, markup=key, parse_mode="Markdown")
 
 
 def response_preview_after_buy(chat_id, store_id):
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         text = bd.get("after_buy", "❌ Sin configurar")
     key = nav_system.create_universal_navigation(
         chat_id, "response_preview_after_buy"
@@ -608,7 +678,7 @@ def admin_surtido(chat_id, store_id):
 
 def show_product_list(store_id, chat_id, page: int = 1):
     """Show products with stock and inline controls."""
-    goods = dop.get_goods(store_id)
+    goods = dop.list_products_by_category(None, store_id, with_ids=True)
     quick_actions = [("➕ Nuevo", "add_prod_step_name")]
     if not goods:
         key = nav_system.create_universal_navigation(chat_id, "product_list", quick_actions)
@@ -625,18 +695,24 @@ def show_product_list(store_id, chat_id, page: int = 1):
 
     lines = []
     rows = []
-    for name in subset:
+    for product_id, name in subset:
         stock = dop.amount_of_goods(name, store_id)
         active = (store_id, name) not in _disabled_products
         status = "🟢" if active else "🔴"
         lines.append(f"{status} {name} — {stock} unidades")
 
         btn_edit = telebot.types.InlineKeyboardButton(
-            text="✏️", callback_data=f"product_edit_{name}"
+            text="✏️",
+            callback_data=callback_codec.encode(
+                "product_edit", shop_id=store_id, product_id=product_id
+            ),
         )
         toggle_text = "🚫" if active else "✅"
         btn_toggle = telebot.types.InlineKeyboardButton(
-            text=toggle_text, callback_data=f"product_toggle_{name}"
+            text=toggle_text,
+            callback_data=callback_codec.encode(
+                "product_toggle", shop_id=store_id, product_id=product_id
+            ),
         )
         rows.append([btn_edit, btn_toggle])
 
@@ -644,13 +720,19 @@ def show_product_list(store_id, chat_id, page: int = 1):
     if page > 1:
         pagination.append(
             telebot.types.InlineKeyboardButton(
-                text="⬅️", callback_data=f"product_page_{page-1}"
+                text="⬅️",
+                callback_data=callback_codec.encode(
+                    "product_page", shop_id=store_id, page=page - 1
+                ),
             )
         )
     if page < total_pages:
         pagination.append(
             telebot.types.InlineKeyboardButton(
-                text="➡️", callback_data=f"product_page_{page+1}"
+                text="➡️",
+                callback_data=callback_codec.encode(
+                    "product_page", shop_id=store_id, page=page + 1
+                ),
             )
         )
     if pagination:
@@ -680,7 +762,7 @@ def toggle_product(chat_id, store_id, name):
 def add_prod_step_name(chat_id, store_id):
     """Solicitar nombre del nuevo producto."""
     set_state(chat_id, 310, prev="product")
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         bd[f"{chat_id}_new_product"] = {"shop_id": store_id}
     key = nav_system.create_universal_navigation(chat_id, "add_prod_name", store_id)
     send_long_message(bot, chat_id, "📝 Ingresa el nombre del producto:", markup=key)
@@ -715,7 +797,7 @@ def add_prod_step_stock(chat_id, store_id):
 def handle_multimedia(message):
     """Procesar multimedia en el flujo de creación de producto."""
     chat_id = message.chat.id
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(str(chat_id))
         if state != 312:
             return
@@ -744,7 +826,7 @@ def handle_multimedia(message):
         send_long_message(bot, chat_id, "❌ Tipo de archivo no soportado.")
         return
 
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         data = bd.get(f"{chat_id}_new_product", {})
         data.update(
             {
@@ -762,17 +844,49 @@ def manage_products(chat_id, store_id):
     show_product_list(store_id, chat_id)
 
 
+# Callbacks antiguos con argumento: prefijo -> handler(chat_id, store_id, arg)
+CALLBACK_PREFIXES = {
+    "product_edit_": lambda c, s, name: edit_product(c, s, name),
+    "product_toggle_": lambda c, s, name: toggle_product(c, s, name),
+    "product_page_": lambda c, s, page: show_product_list(s, c, int(page)),
+}
+
+
+def _coded_product(handler):
+    """Adapt ``handler(chat_id, store_id, name)`` to a decoded payload.
+
+    The token is only honoured for products of ``store_id``, the shop the
+    admin is working on, whatever shop the token names.
+    """
+
+    def route(chat_id, store_id, payload):
+        if payload.shop_id != store_id:
+            return
+        product = dop.get_product_by_id(payload.product_id)
+        if product and product[1] == store_id:
+            handler(chat_id, store_id, product[0])
+
+    return route
+
+
+def _coded_product_page(chat_id, store_id, payload):
+    if payload.shop_id == store_id:
+        show_product_list(store_id, chat_id, payload.page)
+
+
+# Botones con token de callback_codec: acción -> handler(chat_id, store_id, payload)
+CODED_ACTIONS = {
+    "product_edit": _coded_product(lambda c, s, name: edit_product(c, s, name)),
+    "product_toggle": _coded_product(lambda c, s, name: toggle_product(c, s, name)),
+    "product_page": _coded_product_page,
+}
+
+
 def route_callback(callback_data, chat_id, store_id):
     """Dispatch product-related callbacks to their handlers."""
-    router = {
-        "product_edit": lambda c, s, name: edit_product(c, s, name),
-        "product_toggle": lambda c, s, name: toggle_product(c, s, name),
-        "product_page": lambda c, s, page: show_product_list(s, c, int(page)),
-    }
-    for prefix, handler in router.items():
-        if callback_data.startswith(prefix + "_"):
-            arg = callback_data[len(prefix) + 1 :]
-            handler(chat_id, store_id, arg)
+    for prefix, handler in CALLBACK_PREFIXES.items():
+        if callback_data.startswith(prefix):
+            handler(chat_id, store_id, callback_data[len(prefix):])
             return True
     return False
 
@@ -826,14 +940,14 @@ def config_payments(chat_id, store_id):
 
 def paypal_enable(chat_id, store_id):
     """Enable PayPal and prompt for credentials."""
-    with shelve.open(files.payments_bd) as bd:
+    with state_store.open_store(files.payments_bd) as bd:
         bd["paypal"] = "✅"
     paypal_set_key(chat_id, store_id)
 
 
 def paypal_disable(chat_id, store_id):
     """Disable PayPal payments."""
-    with shelve.open(files.payments_bd) as bd:
+    with state_store.open_store(files.payments_bd) as bd:
         bd["paypal"] = "❌"
     configure_payments(store_id, chat_id)
 
@@ -853,14 +967,14 @@ def paypal_set_key(chat_id, store_id):
 
 def binance_enable(chat_id, store_id):
     """Enable Binance Pay and request credentials."""
-    with shelve.open(files.payments_bd) as bd:
+    with state_store.open_store(files.payments_bd) as bd:
         bd["binance"] = "✅"
     binance_set_key(chat_id, store_id)
 
 
 def binance_disable(chat_id, store_id):
     """Disable Binance Pay."""
-    with shelve.open(files.payments_bd) as bd:
+    with state_store.open_store(files.payments_bd) as bd:
         bd["binance"] = "❌"
     configure_payments(store_id, chat_id)
 
@@ -880,7 +994,7 @@ def binance_set_key(chat_id, store_id):
 
 def handle_payment_credentials(chat_id, message_text):
     """Store credentials sent by the admin for PayPal or Binance."""
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(str(chat_id))
 
     if state == 400:
@@ -1312,7 +1426,7 @@ def finalize_product_campaign(chat_id, shop_id, product):
             telethon_manager.distribute_campaign(shop_id)
     except Exception:
         pass
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         if str(chat_id) in bd:
             del bd[str(chat_id)]
     show_marketing_menu(chat_id)
@@ -1,45 +1,61 @@
 #!/usr/bin/env python3
-import time
-import subprocess
-import sys
+"""Servicio de envío automático de campañas.
+
+Carga las programaciones una sola vez y duerme hasta el siguiente envío
+(ver ``advertising_system/schedule_service.py``).  Los registros salen por
+la salida estándar en formato ``evento clave=valor``; redirígelos con
+``systemd``/``nohup`` si necesitas guardarlos en un archivo.
+
+Un solo proceso atiende todas las tiendas: cada una envía con sus propios
+tokens y los grupos de las distintas tiendas se atienden por turnos (ver
+``advertising_system/shop_fanout.py``).
+
+Uso: ``python advertising_daemon.py [shop_id]`` (sin argumento, todas)
+"""
+import logging
 import os
-from datetime import datetime
+import signal
+import sys
 
 # Cambiar al directorio del script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
 
-# Forzar logs al archivo directamente
-log_file = os.path.join(script_dir, 'advertising.log')
+from advertising_system.schedule_service import ScheduleService, log_event
+from advertising_system.shop_fanout import ShopFanout
 
-def log_message(msg):
-    with open(log_file, 'a') as f:
-        f.write(f"{msg}\n")
-        f.flush()
-    print(msg)  # También imprimir a stdout
 
-log_message(f"🚀 Advertising Daemon iniciado: {datetime.now()}")
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+        stream=sys.stdout,
+    )
 
-while True:
+    shop_id = None
+    if len(sys.argv) > 1:
+        try:
+            shop_id = int(sys.argv[1])
+        except ValueError:
+            log_event("invalid_shop_id", logging.WARNING, value=sys.argv[1])
+    elif os.getenv("SHOP_ID"):
+        shop_id = int(os.getenv("SHOP_ID"))
+
+    import advertising_cron
+
+    fanout = ShopFanout(fallback_tokens=advertising_cron.fallback_tokens())
+    fanout.start()
+    service = ScheduleService(fanout.submit, shop_id=shop_id)
+    signal.signal(signal.SIGTERM, lambda *_: service.stop())
     try:
-        log_message(f"⏰ Ejecutando advertising_cron.py: {datetime.now()}")
-        
-        # Ejecutar advertising_cron.py
-        result = subprocess.run([
-            '/usr/bin/python3',
-            'advertising_cron.py'
-        ], capture_output=True, text=True, cwd=script_dir)
-        
-        if result.returncode == 0:
-            log_message(f"✅ Advertising ejecutado correctamente")
-            if result.stdout:
-                log_message(f"   Output: {result.stdout.strip()}")
-        else:
-            log_message(f"❌ Error en advertising: {result.stderr}")
-            
-    except Exception as e:
-        log_message(f"❌ Error inesperado: {e}")
-    
-    # Esperar 60 segundos antes de la próxima ejecución
-    log_message(f"😴 Esperando 60 segundos...")
-    time.sleep(60)
\ No newline at end of file
+        service.run_forever()
+    except KeyboardInterrupt:
+        service.stop()
+    finally:
+        fanout.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import logging
 import files
 import db
 from advertising_system.telegram_multi import TelegramMultiBot
+from advertising_system.schedule_service import compute_next_fire_at, notify_schedules_changed
 
 class AdvertisingManager:
     def __init__(self, db_path, shop_id=1):
@@ -16,7 +17,7 @@ class AdvertisingManager:
     def _get_connection(self):
         if self.db_path == files.main_db:
             return db.get_db_connection(), True
-        return sqlite3.connect(self.db_path), False
+        return db.connect(self.db_path), False
 
     def create_campaign(self, data):
         """Crear una nueva campaña"""
@@ -147,25 +148,29 @@ class AdvertisingManager:
             return False, 'Campaña no encontrada'
 
         try:
+            db.ensure_schedule_fire_times(cur)
+            now = datetime.now()
             cur.execute(
                 """INSERT INTO campaign_schedules
                    (campaign_id, schedule_name, frequency, schedule_json,
-                    target_platforms, created_date, shop_id, group_ids)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    target_platforms, created_date, shop_id, group_ids, next_fire_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (
                     campaign_id,
                     'manual',
                     'weekly',
                     schedule_json,
                     ','.join(platforms),
-                    datetime.now().isoformat(),
+                    now.isoformat(),
                     self.shop_id,
                     ','.join(map(str, group_ids)) if group_ids else None,
+                    compute_next_fire_at(schedule_json, now),
                 ),
             )
             conn.commit()
             if not shared:
                 conn.close()
+            notify_schedules_changed()
             return True, 'Programación creada'
         except Exception as e:
             if not shared:
@@ -419,4 +424,6 @@ class AdvertisingManager:
         conn.commit()
         if not shared:
             conn.close()
+        if success:
+            notify_schedules_changed()
         return success
@@ -11,6 +11,7 @@ from .scheduler import CampaignScheduler
 from .rate_limiter import IntelligentRateLimiter
 from .statistics import StatisticsManager
 from .telegram_multi import TelegramMultiBot
+from .group_dispatcher import GroupDispatcher
 
 
 class AutoSender:
@@ -73,7 +74,6 @@ class AutoSender:
                             success = self._send_telegram_campaign_corrected(campaign_id, schedule_id, send_data)
                             if success:
                                 processed = True
-                            time.sleep(2)
                     
                 except Exception as e:
                     self.logger.error(f"Error procesando envío {send_data}: {e}")
@@ -157,16 +157,14 @@ class AutoSender:
                 media_type = campaign[4]
                 print(f"✅ USANDO DATOS DE CAMPAÑA: {title}")
             
-            # Obtener tokens
-            tokens = self.telegram_tokens
-            if not tokens:
-                tokens_env = os.getenv("TELEGRAM_TOKEN")
-                if not tokens_env:
-                    print("❌ No hay tokens de Telegram configurados")
-                    conn.close()
-                    return False
-                tokens = [t.strip() for t in tokens_env.split(',') if t.strip()]
-            telegram_bot = TelegramMultiBot(tokens)
+            # Reutilizar el cliente creado al iniciar en lugar de uno por envío
+            if self.telegram is None:
+                self._init_telegram()
+            if self.telegram is None:
+                print("❌ No hay tokens de Telegram configurados")
+                conn.close()
+                return False
+            telegram_bot = self.telegram
             
             # Preparar botones
             buttons = None
@@ -176,33 +174,25 @@ class AutoSender:
                     'button1_url': campaign[7]
                 }
             
-            # ENVIAR A GRUPOS
-            sent_count = 0
-            for group in groups:
-                try:
-                    group_id, topic_id = group
+            # ENVIAR A GRUPOS (en paralelo entre todos los tokens)
+            def send(bot_index, group_id, topic_id):
+                telegram_bot.deliver(
+                    bot_index,
+                    group_id,
+                    full_message,
+                    media_file_id=media_file_id,
+                    media_type=media_type,
+                    buttons=buttons,
+                    topic_id=topic_id,
+                )
 
-                    success, result = telegram_bot.send_message(
-                        group_id,
-                        full_message,
-                        media_file_id=media_file_id,
-                        media_type=media_type,
-                        buttons=buttons,
-                        topic_id=topic_id,
-                    )
-                    
-                    if success:
-                        sent_count += 1
-                        if product:
-                            print(f'🎉 CAMPAÑA DE PRODUCTO {campaign_id} ENVIADA A {group_id}')
-                        else:
-                            print(f'🎉 CAMPAÑA NORMAL {campaign_id} ENVIADA A {group_id}')
-                    else:
-                        print(f'❌ Error enviando campaña {campaign_id} a {group_id}: {result}')
-                        
-                except Exception as e:
-                    print(f'❌ Error enviando a grupo {group_id}: {e}')
-                    continue
+            dispatcher = GroupDispatcher(len(telegram_bot.bots))
+            result = dispatcher.run(groups, send)
+            sent_count = result.sent
+            kind = 'DE PRODUCTO' if product else 'NORMAL'
+            print(f'🎉 CAMPAÑA {kind} {campaign_id} ENVIADA A {sent_count}/{len(groups)} GRUPOS')
+            for (group_id, _topic), error in result.errors.items():
+                print(f'❌ Error enviando campaña {campaign_id} a {group_id}: {TelegramMultiBot.describe_error(error)}')
             
             if sent_count > 0:
                 self.scheduler.update_next_send(schedule_id, 'telegram')
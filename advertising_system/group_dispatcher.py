@@ -0,0 +1,160 @@
+"""Concurrent delivery of a campaign to many groups.
+
+A small pool of worker threads sends to different groups at the same time,
+spreading the work over every bot token.  Each token has its own bucket
+(Telegram allows about 30 messages per second per bot) and each group has
+one shared by the whole process (about 20 messages per minute per group).
+
+Nothing sleeps on a ``429 Too Many Requests``: the token that got it is
+paused for the ``retry_after`` Telegram asks for and the delivery goes back
+into the queue with that delay, while the other tokens keep sending.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import telemetry
+from broadcast_engine import ChatBuckets, TokenBucket, classify_error
+
+BOT_RATE = 30               # mensajes por segundo por token
+GROUP_RATE = 20 / 60        # mensajes por segundo a un mismo grupo
+DEFAULT_WORKERS = 8
+MAX_RETRIES = 3
+
+# Compartidos por todas las campañas del proceso
+_group_buckets = ChatBuckets(rate=GROUP_RATE)
+
+
+class DeliveryResult:
+    """Outcome counters of a campaign delivery."""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = {}
+
+
+class GroupDispatcher:
+    """Send to many groups through ``bot_count`` tokens with rate limits."""
+
+    def __init__(self, bot_count, workers=DEFAULT_WORKERS, bot_rate=BOT_RATE,
+                 group_buckets=None, max_retries=MAX_RETRIES, clock=time.monotonic):
+        self.bot_buckets = [TokenBucket(bot_rate, clock=clock) for _ in range(max(1, bot_count))]
+        self.group_buckets = group_buckets or _group_buckets
+        self.workers = max(1, int(workers))
+        self.max_retries = max_retries
+        self._clock = clock
+        self._next_bot = 0
+
+    def _pick_bot(self):
+        """Return ``(index, 0)`` for a token with capacity, or ``(None, wait)``."""
+        count = len(self.bot_buckets)
+        shortest = None
+        for step in range(count):
+            index = (self._next_bot + step) % count
+            wait = self.bot_buckets[index].try_acquire()
+            if not wait:
+                self._next_bot = (index + 1) % count
+                return index, 0
+            shortest = wait if shortest is None else min(shortest, wait)
+        return None, shortest
+
+    def run(self, targets, send, on_result=None):
+        """Deliver to every ``(group_id, topic_id, ...)`` in ``targets``.
+
+        ``send(bot_index, *target)`` performs the API call and raises on
+        failure; extra items after ``topic_id`` are passed through so the
+        caller can tell deliveries to the same group apart.  ``on_result``
+        is called with ``(target, error)`` once per target (``error`` is
+        ``None`` when it was sent).  Returns a :class:`DeliveryResult`.
+        """
+        targets = list(targets)
+        result = DeliveryResult()
+        if not targets:
+            return result
+        seq = itertools.count()
+        queue = [(0.0, next(seq), target, 0) for target in targets]
+        heapq.heapify(queue)
+        cond = threading.Condition()
+        state = {'remaining': len(targets)}
+
+        def take():
+            with cond:
+                while state['remaining']:
+                    if not queue:
+                        cond.wait()
+                        continue
+                    ready_at, _, target, attempt = queue[0]
+                    now = self._clock()
+                    if ready_at > now:
+                        cond.wait(ready_at - now)
+                        continue
+                    heapq.heappop(queue)
+                    bot_index, wait = self._pick_bot()
+                    if bot_index is None:
+                        heapq.heappush(queue, (now + wait, next(seq), target, attempt))
+                        continue
+                    wait = self.group_buckets.get(target[0]).try_acquire()
+                    if wait:
+                        heapq.heappush(queue, (now + wait, next(seq), target, attempt))
+                        continue
+                    return bot_index, target, attempt
+                return None
+
+        def finish(target, error=None):
+            telemetry.MESSAGES.inc(source='campaign', outcome='sent' if error is None else 'failed')
+            if on_result is not None:
+                try:
+                    on_result(target, error)
+                except Exception as e:
+                    logging.error(f"Error registrando resultado de envío: {e}")
+            with cond:
+                if error is None:
+                    result.sent += 1
+                else:
+                    result.failed += 1
+                    result.errors[target] = error
+                state['remaining'] -= 1
+                cond.notify_all()
+
+        def worker():
+            while True:
+                task = take()
+                if task is None:
+                    return
+                bot_index, target, attempt = task
+                group_id = target[0]
+                try:
+                    send(bot_index, *target)
+                except Exception as e:
+                    outcome, retry_after = classify_error(e)
+                    if outcome == 'retry' and attempt < self.max_retries:
+                        logging.info(
+                            f"Límite de Telegram en el token {bot_index}, grupo {group_id} reintenta en {retry_after}s"
+                        )
+                        self.bot_buckets[bot_index].pause(retry_after)
+                        with cond:
+                            result.retried += 1
+                            heapq.heappush(
+                                queue,
+                                (self._clock() + retry_after, next(seq), target, attempt + 1),
+                            )
+                            cond.notify_all()
+                        continue
+                    finish(target, str(e))
+                    continue
+                finish(target)
+
+        threads = [
+            threading.Thread(target=worker, daemon=True)
+            for _ in range(min(self.workers, len(targets)))
+        ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        return result
@@ -1,5 +1,4 @@
 import time
-import sqlite3
 from collections import defaultdict
 from datetime import datetime
 import files
@@ -23,7 +22,7 @@ class IntelligentRateLimiter:
     def _get_connection(self):
         if self.db_path == files.main_db:
             return db.get_db_connection(), True
-        return sqlite3.connect(self.db_path), False
+        return db.connect(self.db_path), False
 
     def can_send(self, platform):
         now = datetime.now()
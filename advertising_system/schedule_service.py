@@ -0,0 +1,367 @@
+"""Long-running scheduler for advertising campaigns.
+
+Replaces the loop in ``advertising_daemon.py`` that started a new
+interpreter for ``advertising_cron.py`` every minute.  Active schedules are
+loaded once and the next fire time of each one, computed from its
+``schedule_json``, is kept in a min-heap; the service sleeps until the
+earliest one is due.
+
+Each schedule's next fire time is stored in the indexed
+``campaign_schedules.next_fire_at`` column.  A send is *claimed* by moving
+that value forward with a compare-and-swap ``UPDATE`` before anything is
+delivered, so a slot fires once even if several processes look at it.
+
+Schedules are reloaded when :func:`notify_schedules_changed` is called in
+the same process (the admin panel does it after creating, editing or
+deleting one) and when another process edits them, detected every
+``poll_interval`` seconds by comparing the ``campaign_schedules`` counter
+that triggers keep in ``data_versions`` (see
+:func:`db.ensure_schedule_version`).  Other writes to the database, and the
+scheduler moving ``next_fire_at``, do not cause a reload.
+"""
+
+import heapq
+import json
+import logging
+import sqlite3
+import threading
+import weakref
+from datetime import datetime, timedelta
+
+import db
+import files
+
+logger = logging.getLogger("advertising.scheduler")
+
+# Índice de ``datetime.weekday()`` para los nombres usados en ``schedule_json``
+DAY_INDEX = {
+    'lunes': 0, 'martes': 1, 'miercoles': 2, 'miércoles': 2, 'jueves': 3,
+    'viernes': 4, 'sabado': 5, 'sábado': 5, 'domingo': 6,
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+
+# Un envío que se retrasa más que esto (p. ej. con el equipo suspendido) se
+# omite en lugar de dispararse tarde.
+MISFIRE_GRACE = timedelta(minutes=2)
+POLL_INTERVAL = 30
+
+_services = weakref.WeakSet()
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log ``event`` followed by ``key=value`` pairs."""
+    parts = [event] + [f"{key}={value}" for key, value in fields.items()]
+    logger.log(level, ' '.join(parts))
+
+
+def parse_schedule(schedule_json):
+    """Return ``{weekday: [(hour, minute), ...]}`` from a ``schedule_json`` value."""
+    try:
+        raw = json.loads(schedule_json or '{}')
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(raw, dict):
+        return {}
+    slots = {}
+    for day, times in raw.items():
+        weekday = DAY_INDEX.get(str(day).lower().strip())
+        if weekday is None or not isinstance(times, (list, tuple)):
+            continue
+        for value in times:
+            try:
+                hour, minute = (int(p) for p in str(value).split(':')[:2])
+            except ValueError:
+                continue
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                slots.setdefault(weekday, set()).add((hour, minute))
+    return {day: sorted(times) for day, times in slots.items()}
+
+
+def next_fire_time(slots, not_before):
+    """Return the first slot at or after ``not_before``, or ``None``."""
+    if not slots:
+        return None
+    start = not_before.replace(second=0, microsecond=0)
+    if start < not_before:
+        start += timedelta(minutes=1)
+    for offset in range(8):
+        day = start + timedelta(days=offset)
+        for hour, minute in slots.get(day.weekday(), ()):
+            candidate = day.replace(hour=hour, minute=minute)
+            if candidate >= start:
+                return candidate
+    return None
+
+
+def format_fire_at(moment):
+    """Return the ``next_fire_at`` text for ``moment`` (``None`` stays ``None``)."""
+    return moment.isoformat(timespec='seconds') if moment is not None else None
+
+
+def compute_next_fire_at(schedule_json, not_before):
+    """Return the ``next_fire_at`` text of the first slot at or after ``not_before``."""
+    return format_fire_at(next_fire_time(parse_schedule(schedule_json), not_before))
+
+
+def _resume_point(value):
+    """Earliest fire time allowed by a stored ``next_send_telegram`` value.
+
+    Used for schedules created before ``next_fire_at`` existed:
+    ``CampaignScheduler.update_next_send`` stored the next send time in ISO
+    format and older versions of ``advertising_cron.py`` the keys already
+    sent (``YYYY-MM-DD HH:MM``) separated by commas.
+    """
+    if not value:
+        return None
+    last = str(value).split(',')[-1].strip()
+    try:
+        moment = datetime.fromisoformat(last)
+    except ValueError:
+        return None
+    if 'T' in last:
+        return moment
+    return moment + timedelta(minutes=1)
+
+
+def fill_missing_fire_times(con, now, shop_id=None):
+    """Compute ``next_fire_at`` for active schedules that have none yet.
+
+    Slots up to :data:`MISFIRE_GRACE` old still count, and a legacy
+    ``next_send_telegram`` value is respected so nothing already sent fires
+    again.  Returns the number of schedules updated.
+    """
+    query = (
+        "SELECT id, schedule_json, next_send_telegram FROM campaign_schedules "
+        "WHERE is_active = 1 AND next_fire_at IS NULL"
+    )
+    params = []
+    if shop_id is not None:
+        query += " AND shop_id = ?"
+        params.append(shop_id)
+    updated = 0
+    for sid, schedule_json, next_send in con.execute(query, params).fetchall():
+        not_before = now - MISFIRE_GRACE
+        resume = _resume_point(next_send)
+        if resume is not None and resume > not_before:
+            not_before = resume
+        fire_at = compute_next_fire_at(schedule_json, not_before)
+        if fire_at is None:
+            continue
+        cur = con.execute(
+            "UPDATE campaign_schedules SET next_fire_at = ? WHERE id = ? AND next_fire_at IS NULL",
+            (fire_at, sid),
+        )
+        updated += cur.rowcount
+    return updated
+
+
+def claim(con, schedule_id, due, next_fire, now):
+    """Move schedule ``schedule_id`` from ``due`` to ``next_fire``.
+
+    Returns True only for the caller whose ``UPDATE`` moved it and only if
+    ``due`` is not older than :data:`MISFIRE_GRACE`; that caller must send.
+    ``next_send_telegram`` mirrors the new value for the admin listings.
+    The caller commits.
+    """
+    cur = con.execute(
+        "UPDATE campaign_schedules SET next_fire_at = ?, next_send_telegram = ? "
+        "WHERE id = ? AND next_fire_at = ?",
+        (next_fire, next_fire, schedule_id, due),
+    )
+    if cur.rowcount != 1:
+        return False
+    if now - datetime.fromisoformat(due) > MISFIRE_GRACE:
+        log_event("send_missed", logging.WARNING, schedule_id=schedule_id, due=due)
+        return False
+    return True
+
+
+def claim_due(con, now, shop_id=None):
+    """Claim every schedule due at ``now``; return the ids that must be sent.
+
+    "What is due" is a range query on ``(is_active, next_fire_at)``.
+    """
+    db.ensure_schedule_fire_times(con.cursor())
+    fill_missing_fire_times(con, now, shop_id)
+    query = (
+        "SELECT id, schedule_json, next_fire_at FROM campaign_schedules "
+        "WHERE is_active = 1 AND next_fire_at <= ?"
+    )
+    params = [format_fire_at(now)]
+    if shop_id is not None:
+        query += " AND shop_id = ?"
+        params.append(shop_id)
+    query += " ORDER BY next_fire_at"
+    claimed = []
+    for sid, schedule_json, due in con.execute(query, params).fetchall():
+        next_fire = compute_next_fire_at(
+            schedule_json, datetime.fromisoformat(due) + timedelta(minutes=1)
+        )
+        if claim(con, sid, due, next_fire, now):
+            claimed.append(sid)
+    con.commit()
+    return claimed
+
+
+def notify_schedules_changed():
+    """Ask the schedulers running in this process to reload their schedules."""
+    for service in list(_services):
+        service.request_reload()
+
+
+class ScheduleService:
+    """Fire campaign schedules at their times from a single process.
+
+    ``sender(schedule)`` receives a dict with the schedule row (``id``,
+    ``campaign_id``, ``group_ids``, ``target_platforms``, ``shop_id``) and
+    returns whether the campaign was delivered.
+    """
+
+    def __init__(self, sender, shop_id=None, db_path=None, clock=datetime.now,
+                 poll_interval=POLL_INTERVAL):
+        self.sender = sender
+        self.shop_id = shop_id
+        self.db_path = db_path or files.main_db
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._heap = []
+        self._schedules = {}
+        self._con = None
+        self._schedule_version = None
+        self._wakeup = threading.Event()
+        self._reload = True
+        self._stopped = threading.Event()
+        _services.add(self)
+
+    def _connection(self):
+        if self._con is None:
+            self._con = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._con
+
+    def request_reload(self):
+        self._reload = True
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _schedules_changed(self):
+        try:
+            version = db.get_data_version("campaign_schedules", self._connection())
+        except sqlite3.Error as e:
+            log_event("schedule_version_failed", logging.ERROR, error=e)
+            return False
+        changed = self._schedule_version is not None and version != self._schedule_version
+        self._schedule_version = version
+        return changed
+
+    def reload(self, now=None):
+        """Load active schedules and rebuild the heap of fire times."""
+        now = now or self._clock()
+        query = (
+            "SELECT id, campaign_id, schedule_json, target_platforms, "
+            "next_fire_at, shop_id, group_ids "
+            "FROM campaign_schedules WHERE is_active = 1 AND next_fire_at IS NOT NULL"
+        )
+        params = []
+        if self.shop_id is not None:
+            query += " AND shop_id = ?"
+            params.append(self.shop_id)
+        con = self._connection()
+        try:
+            db.ensure_schedule_fire_times(con.cursor())
+            db.ensure_schedule_version(con.cursor())
+            fill_missing_fire_times(con, now, self.shop_id)
+            con.commit()
+            rows = con.execute(query, params).fetchall()
+            version = db.get_data_version("campaign_schedules", con)
+        except sqlite3.Error as e:
+            log_event("reload_failed", logging.ERROR, error=e)
+            return False
+        self._reload = False
+        self._schedule_version = version
+
+        schedules = {}
+        heap = []
+        for sid, campaign_id, schedule_json, platforms, fire_at, shop_id, group_ids in rows:
+            try:
+                moment = datetime.fromisoformat(fire_at)
+            except ValueError:
+                continue
+            schedules[sid] = {
+                'id': sid,
+                'campaign_id': campaign_id,
+                'target_platforms': platforms,
+                'shop_id': shop_id,
+                'group_ids': group_ids,
+                'slots': parse_schedule(schedule_json),
+            }
+            heap.append((moment, sid, fire_at))
+        heapq.heapify(heap)
+        self._schedules = schedules
+        self._heap = heap
+        log_event("schedules_loaded", schedules=len(schedules), shop_id=self.shop_id)
+        return True
+
+    def next_due(self):
+        """Return the earliest fire time, or ``None`` if nothing is scheduled."""
+        return self._heap[0][0] if self._heap else None
+
+    def _claim(self, schedule_id, due, next_fire, now):
+        con = self._connection()
+        try:
+            won = claim(con, schedule_id, due, format_fire_at(next_fire), now)
+            con.commit()
+            return won
+        except sqlite3.Error as e:
+            log_event("claim_failed", logging.ERROR, schedule_id=schedule_id, error=e)
+            return False
+
+    def run_pending(self, now=None):
+        """Fire every schedule due at ``now``; return how many were sent."""
+        now = now or self._clock()
+        sent = 0
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, sid, due = heapq.heappop(self._heap)
+            schedule = self._schedules.get(sid)
+            if schedule is None:
+                continue
+            next_fire = next_fire_time(schedule['slots'], fire_at + timedelta(minutes=1))
+            if next_fire is not None:
+                heapq.heappush(self._heap, (next_fire, sid, format_fire_at(next_fire)))
+            if not self._claim(sid, due, next_fire, now):
+                continue
+            try:
+                ok = bool(self.sender(dict(schedule)))
+            except Exception as e:
+                ok = False
+                log_event("send_failed", logging.ERROR, schedule_id=sid,
+                          campaign_id=schedule['campaign_id'], error=e)
+            if ok:
+                sent += 1
+            log_event("campaign_sent" if ok else "campaign_not_sent",
+                      schedule_id=sid, campaign_id=schedule['campaign_id'],
+                      shop_id=schedule['shop_id'], due=due)
+        return sent
+
+    def _sleep_seconds(self, now):
+        due = self.next_due()
+        if due is None:
+            return self.poll_interval
+        return max(0.0, min((due - now).total_seconds(), self.poll_interval))
+
+    def run_forever(self):
+        """Run until :meth:`stop` is called."""
+        log_event("scheduler_started", shop_id=self.shop_id, db=self.db_path)
+        while not self._stopped.is_set():
+            if self._reload or self._schedules_changed():
+                self.reload()
+            self.run_pending()
+            self._wakeup.wait(self._sleep_seconds(self._clock()))
+            self._wakeup.clear()
+        log_event("scheduler_stopped", shop_id=self.shop_id)
+        if self._con is not None:
+            self._con.close()
+            self._con = None
@@ -1,8 +1,15 @@
-import sqlite3
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import files
 import db
+from .schedule_service import (
+    MISFIRE_GRACE,
+    claim_due,
+    compute_next_fire_at,
+    fill_missing_fire_times,
+    format_fire_at,
+    notify_schedules_changed,
+)
 
 class CampaignScheduler:
 
@@ -24,9 +31,11 @@ class CampaignScheduler:
         day_lower = day.lower().strip()
         return self.SPANISH_DAYS.get(day_lower, day_lower)
 
-    def __init__(self, db_path, shop_id=1):
+    def __init__(self, db_path, shop_id=1, readonly=False):
         self.db_path = db_path
         self.shop_id = shop_id
+        # Los paneles solo consultan; los envíos reclaman lo pendiente
+        self.readonly = readonly
         self.optimal_times = ['10:00', '15:00', '20:00']
         self.platform_delays = {
             'telegram': 60
@@ -35,7 +44,7 @@ class CampaignScheduler:
     def _get_connection(self):
         if self.db_path == files.main_db:
             return db.get_db_connection(), True
-        return sqlite3.connect(self.db_path), False
+        return db.connect(self.db_path), False
 
     def create_daily_schedule(self, campaign_id, platforms=['telegram']):
         conn, shared = self._get_connection()
@@ -72,108 +81,97 @@ class CampaignScheduler:
     def save_schedule(self, data):
         conn, shared = self._get_connection()
         cursor = conn.cursor()
+        db.ensure_schedule_fire_times(cursor)
+        now = datetime.now()
         cursor.execute(
             """INSERT INTO campaign_schedules
-               (campaign_id, schedule_name, frequency, schedule_json, target_platforms, created_date, shop_id, group_ids)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+               (campaign_id, schedule_name, frequency, schedule_json, target_platforms, created_date, shop_id, group_ids, next_fire_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (
                 data['campaign_id'],
                 'auto',
                 'daily',
                 data['schedule_json'],
                 data['platform'],
-                datetime.now().isoformat(),
+                now.isoformat(),
                 data.get('shop_id', self.shop_id),
                 ','.join(map(str, data.get('group_ids', []))) if data.get('group_ids') else None,
+                compute_next_fire_at(data['schedule_json'], now),
             )
         )
         conn.commit()
         if not shared:
             conn.close()
+        notify_schedules_changed()
 
     def get_pending_sends(self):
+        """Return the schedules due now, joined with their campaign.
+
+        Due schedules come from a range query on ``next_fire_at``.  Unless
+        the scheduler is ``readonly`` they are claimed (their
+        ``next_fire_at`` moves to the following slot) before being returned,
+        so each slot is handed out once.
+        """
         now = datetime.now()
-        current_time = now.strftime('%H:%M')
-        
-        # Crear rango de ±2 minutos para matching más flexible
-        time_range = []
-        for offset in [-2, -1, 0, 1, 2]:
-            time_check = (now + timedelta(minutes=offset)).strftime('%H:%M')
-            time_range.append(time_check)
-        
         conn, shared = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            """SELECT cs.*, c.name, c.message_text, c.media_file_id, c.media_type,
-                       c.button1_text, c.button1_url, c.button2_text, c.button2_url
-                   FROM campaign_schedules cs
-                   JOIN campaigns c ON cs.campaign_id = c.id
-                   WHERE cs.is_active = 1 AND c.status = 'active' AND cs.shop_id = ? AND c.shop_id = ?""",
-            (self.shop_id, self.shop_id),
+        columns = (
+            "cs.id, cs.campaign_id, cs.schedule_name, cs.frequency, cs.schedule_json, "
+            "cs.target_platforms, cs.is_active, cs.next_send_telegram, cs.created_date, "
+            "cs.shop_id, cs.group_ids, c.name, c.message_text, c.media_file_id, c.media_type, "
+            "c.button1_text, c.button1_url, c.button2_text, c.button2_url"
         )
-        rows = cursor.fetchall()
-        pending = []
-        day_map = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
-        today = day_map[now.weekday()]
-        for row in rows:
-            try:
-                schedule = json.loads(row[4] or '{}')
-            except Exception:
-                continue
-            next_send = row[7] if len(row) > 7 else None
-            if next_send:
-                try:
-                    if datetime.fromisoformat(next_send) > now:
-                        continue
-                except Exception:
-                    pass
-            # Buscar en el rango de tiempo en lugar de hora exacta
-            if any(t in schedule.get(today, []) for t in time_range):
-                pending.append(row)
+        try:
+            if self.readonly:
+                db.ensure_schedule_fire_times(cursor)
+                fill_missing_fire_times(conn, now, self.shop_id)
+                conn.commit()
+                cursor.execute(
+                    f"""SELECT {columns}
+                        FROM campaign_schedules cs
+                        JOIN campaigns c ON cs.campaign_id = c.id
+                        WHERE cs.is_active = 1 AND cs.next_fire_at BETWEEN ? AND ?
+                          AND c.status = 'active' AND cs.shop_id = ? AND c.shop_id = ?
+                        ORDER BY cs.next_fire_at""",
+                    (format_fire_at(now - MISFIRE_GRACE), format_fire_at(now),
+                     self.shop_id, self.shop_id),
+                )
+                return cursor.fetchall()
 
-        if not shared:
-            conn.close()
-        return pending
+            ids = claim_due(conn, now, self.shop_id)
+            if not ids:
+                return []
+            placeholders = ','.join('?' for _ in ids)
+            cursor.execute(
+                f"""SELECT {columns}
+                    FROM campaign_schedules cs
+                    JOIN campaigns c ON cs.campaign_id = c.id
+                    WHERE cs.id IN ({placeholders})
+                      AND c.status = 'active' AND c.shop_id = ?""",
+                (*ids, self.shop_id),
+            )
+            rows = {row[0]: row for row in cursor.fetchall()}
+            return [rows[sid] for sid in ids if sid in rows]
+        finally:
+            if not shared:
+                conn.close()
 
     def update_next_send(self, schedule_id, platform):
-        from datetime import datetime, timedelta
-        import json
-        
+        """Mirror ``next_fire_at`` into ``next_send_<platform>`` after a send.
+
+        ``next_fire_at`` itself already moved forward when the send was
+        claimed in :meth:`get_pending_sends`.
+        """
+        if platform != 'telegram':
+            return
         conn, shared = self._get_connection()
         cursor = conn.cursor()
-        
-        # Obtener programación actual
-        cursor.execute("SELECT schedule_json FROM campaign_schedules WHERE id = ?", (schedule_id,))
-        result = cursor.fetchone()
-        if not result:
-            if not shared:
-                conn.close()
-            return
-            
-        schedule = json.loads(result[0])
-        now = datetime.now()
-        day_map = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
-        today = day_map[now.weekday()]
-        
-        # Buscar próxima hora de envío
-        next_send = None
-        if today in schedule:
-            current_time = now.strftime('%H:%M')
-            future_times = [t for t in schedule[today] if t > current_time]
-            if future_times:
-                # Hay más envíos hoy
-                next_time = min(future_times)
-                next_send = now.replace(hour=int(next_time[:2]), minute=int(next_time[3:]), second=0, microsecond=0)
-            else:
-                # No hay más envíos hoy, próximo será mañana
-                next_send = now + timedelta(days=1)
-                next_send = next_send.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        if platform == 'telegram' and next_send:
+        if db.ensure_schedule_fire_times(cursor):
             cursor.execute(
-                "UPDATE campaign_schedules SET next_send_telegram = ? WHERE id = ?",
-                (next_send.isoformat(), schedule_id))
-        conn.commit()
+                "UPDATE campaign_schedules SET next_send_telegram = next_fire_at WHERE id = ?",
+                (schedule_id,),
+            )
+            conn.commit()
         if not shared:
             conn.close()
 
@@ -194,6 +192,9 @@ class CampaignScheduler:
                 schedule[d] = times or []
             fields.append("schedule_json = ?")
             params.append(json.dumps(schedule))
+            db.ensure_schedule_fire_times(cursor)
+            fields.append("next_fire_at = ?")
+            params.append(compute_next_fire_at(json.dumps(schedule), datetime.now()))
 
         if platforms is not None:
             fields.append("target_platforms = ?")
@@ -217,6 +218,8 @@ class CampaignScheduler:
         success = cursor.rowcount > 0
         if not shared:
             conn.close()
+        if success:
+            notify_schedules_changed()
         return success
 
     def _reindex_schedules(self, cursor):
@@ -252,4 +255,6 @@ class CampaignScheduler:
         conn.commit()
         if not shared:
             conn.close()
+        if deleted:
+            notify_schedules_changed()
         return deleted
\ No newline at end of file
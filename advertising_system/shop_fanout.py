@@ -0,0 +1,311 @@
+"""Deliver the campaigns of every shop from one process.
+
+Each shop is isolated: its campaigns, products and target groups are looked
+up with its own ``shop_id``, it sends through its own bot tokens (the
+``telegram`` row of ``platform_config`` for that shop) and a failure in one
+shop only affects that shop.  Deliveries are queued per shop and a worker
+takes a batch of groups from each shop in turn, so a shop with 500 groups
+cannot starve a shop with 5.
+
+Each batch is sent concurrently through the shop's
+:class:`~advertising_system.group_dispatcher.GroupDispatcher`, which spreads
+it over the shop's tokens within Telegram's limits and requeues a group
+answered with ``429`` instead of dropping it.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+import files
+from .group_dispatcher import GroupDispatcher
+from .schedule_service import log_event
+from .telegram_multi import TelegramMultiBot
+
+BATCH_SIZE = 50             # grupos de una tienda por turno
+
+
+def parse_tokens(value):
+    """Return the token list stored in a ``config_data`` value.
+
+    Accepts ``{"tokens": [...]}``, ``{"token": "..."}``, a JSON list or
+    comma-separated text.
+    """
+    if not value:
+        return []
+    try:
+        data = json.loads(value)
+    except (TypeError, ValueError):
+        data = value
+    if isinstance(data, dict):
+        data = data.get('tokens') or data.get('token') or []
+    if isinstance(data, str):
+        data = data.split(',')
+    if not isinstance(data, (list, tuple)):
+        return []
+    return [str(t).strip() for t in data if str(t).strip()]
+
+
+def env_tokens():
+    return parse_tokens(os.getenv("TELEGRAM_TOKEN", ""))
+
+
+def shop_tokens(cursor, shop_id):
+    """Return the Telegram tokens configured for ``shop_id`` (may be empty)."""
+    try:
+        cursor.execute(
+            "SELECT config_data FROM platform_config "
+            "WHERE platform = 'telegram' AND shop_id = ? AND is_active = 1",
+            (shop_id,),
+        )
+        row = cursor.fetchone()
+    except sqlite3.Error:
+        return []
+    return parse_tokens(row[0]) if row else []
+
+
+def target_groups(cursor, shop_id, group_ids=None):
+    """Return ``[(group_id, topic_id)]`` of the shop's active target groups."""
+    ids = [int(g) for g in str(group_ids or '').split(',') if g.strip().isdigit()]
+    query = (
+        "SELECT group_id, topic_id FROM target_groups "
+        "WHERE status = 'active' AND shop_id = ?"
+    )
+    params = [shop_id]
+    if ids:
+        query += f" AND id IN ({','.join('?' for _ in ids)})"
+        params.extend(ids)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def build_campaign_message(cursor, campaign_id, shop_id):
+    """Return the message of a campaign of ``shop_id``, or ``None``.
+
+    Product campaigns (``Producto <nombre>``) use the product of the same
+    shop; otherwise the campaign's own text and media are used.
+    """
+    cursor.execute(
+        "SELECT name, message_text, media_file_id, media_type, button1_text, button1_url "
+        "FROM campaigns WHERE id = ? AND shop_id = ?",
+        (campaign_id, shop_id),
+    )
+    campaign = cursor.fetchone()
+    if not campaign:
+        return None
+    name, message_text, media_file_id, media_type, button_text, button_url = campaign
+
+    product_name = (name or '').replace('Producto ', '')
+    cursor.execute(
+        "SELECT name, description, price, media_file_id, media_type FROM goods "
+        "WHERE shop_id = ? AND name = ?",
+        (shop_id, product_name),
+    )
+    product = cursor.fetchone()
+    if not product:
+        cursor.execute(
+            "SELECT name, description, price, media_file_id, media_type FROM goods "
+            "WHERE shop_id = ? AND name LIKE ?",
+            (shop_id, f'%{product_name}%'),
+        )
+        product = cursor.fetchone()
+
+    if product:
+        parts = [f"🛒 {product[0]}"]
+        if product[1]:
+            parts.append(f"📝 {product[1]}")
+        if product[2]:
+            parts.append(f"💰 Precio: ${product[2]}")
+        text = '\n'.join(parts)
+        media_file_id, media_type = product[3], product[4]
+    else:
+        text = f"📢 {name}\n\n{message_text}" if message_text else f"📢 {name}"
+
+    buttons = None
+    if button_text and button_url:
+        buttons = {'button1_text': button_text, 'button1_url': button_url}
+    return {
+        'text': text,
+        'media_file_id': media_file_id,
+        'media_type': media_type,
+        'buttons': buttons,
+        'is_product': bool(product),
+    }
+
+
+class ShopFanout:
+    """Round-robin delivery queue with one lane per shop.
+
+    ``submit(schedule)`` expands a fired schedule into one delivery per
+    target group; :meth:`deliver_next` sends the next batch of the next
+    shop in turn.  :meth:`start` runs deliveries in a background thread.
+    """
+
+    def __init__(self, db_path=None, fallback_tokens=None, bot_factory=TelegramMultiBot,
+                 dispatcher_factory=GroupDispatcher, batch_size=BATCH_SIZE):
+        self.db_path = db_path or files.main_db
+        self.fallback_tokens = list(fallback_tokens) if fallback_tokens else env_tokens()
+        self.bot_factory = bot_factory
+        self.dispatcher_factory = dispatcher_factory
+        self.batch_size = max(1, int(batch_size))
+        self._lanes = {}
+        self._ring = deque()
+        self._bots = {}
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def _client_for(self, shop_id, tokens):
+        """Return the ``(bot, dispatcher)`` pair of ``shop_id`` for ``tokens``."""
+        key = (shop_id, tuple(tokens))
+        client = self._bots.get(key)
+        if client is None:
+            # Los tokens cambiaron o es la primera vez: descartar el anterior
+            for old in [k for k in self._bots if k[0] == shop_id]:
+                del self._bots[old]
+            bot = self.bot_factory(list(tokens))
+            client = self._bots[key] = (bot, self.dispatcher_factory(len(bot.bots)))
+        return client
+
+    def submit(self, schedule):
+        """Queue the deliveries of a fired schedule; return how many were queued."""
+        shop_id = schedule.get('shop_id') or 1
+        campaign_id = schedule['campaign_id']
+        con = sqlite3.connect(self.db_path)
+        try:
+            cursor = con.cursor()
+            message = build_campaign_message(cursor, campaign_id, shop_id)
+            groups = target_groups(cursor, shop_id, schedule.get('group_ids'))
+            tokens = shop_tokens(cursor, shop_id) or self.fallback_tokens
+        except sqlite3.Error as e:
+            log_event("fanout_submit_failed", logging.ERROR, shop_id=shop_id,
+                      campaign_id=campaign_id, error=e)
+            return 0
+        finally:
+            con.close()
+        if not message or not groups:
+            log_event("fanout_nothing_to_send", logging.WARNING, shop_id=shop_id,
+                      campaign_id=campaign_id, groups=len(groups) if groups else 0)
+            return 0
+        if not tokens:
+            log_event("fanout_no_tokens", logging.ERROR, shop_id=shop_id, campaign_id=campaign_id)
+            return 0
+
+        job = {'shop_id': shop_id, 'campaign_id': campaign_id,
+               'remaining': len(groups), 'sent': 0, 'failed': 0}
+        with self._cond:
+            client = self._client_for(shop_id, tokens)
+            lane = self._lanes.setdefault(shop_id, deque())
+            if not lane:
+                self._ring.append(shop_id)
+            job_key = (shop_id, campaign_id, schedule.get('id'), id(job))
+            self._jobs[job_key] = job
+            for group_id, topic_id in groups:
+                lane.append((job_key, client, message, group_id, topic_id))
+            self._cond.notify()
+        log_event("fanout_queued", shop_id=shop_id, campaign_id=campaign_id, groups=len(groups))
+        return len(groups)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def _take(self):
+        """Pop the next shop's batch, rotating shops; ``[]`` if there is none."""
+        with self._cond:
+            while self._ring:
+                shop_id = self._ring.popleft()
+                lane = self._lanes.get(shop_id)
+                if not lane:
+                    continue
+                batch = [lane.popleft() for _ in range(min(self.batch_size, len(lane)))]
+                if lane:
+                    self._ring.append(shop_id)
+                return batch
+            return []
+
+    def _send_batch(self, client, deliveries):
+        bot, dispatcher = client
+
+        def send(bot_index, group_id, topic_id, n):
+            message = deliveries[n][2]
+            bot.deliver(
+                bot_index,
+                group_id,
+                message['text'],
+                media_file_id=message['media_file_id'],
+                media_type=message['media_type'],
+                buttons=message['buttons'],
+                topic_id=topic_id,
+            )
+
+        def on_result(target, error):
+            job_key = deliveries[target[2]][0]
+            if error is not None:
+                log_event("fanout_send_failed", logging.WARNING, shop_id=job_key[0],
+                          campaign_id=job_key[1], group_id=target[0],
+                          error=TelegramMultiBot.describe_error(error))
+            self._finish(job_key, error is None)
+
+        targets = [(d[3], d[4], n) for n, d in enumerate(deliveries)]
+        dispatcher.run(targets, send, on_result=on_result)
+
+    def deliver_next(self):
+        """Send the next shop's batch; return how many deliveries it had.
+
+        Returns 0 when nothing was queued.
+        """
+        batch = self._take()
+        # Normalmente un solo cliente; varios si la tienda cambió de tokens
+        by_client = {}
+        for delivery in batch:
+            by_client.setdefault(id(delivery[1]), (delivery[1], []))[1].append(delivery)
+        for client, deliveries in by_client.values():
+            self._send_batch(client, deliveries)
+        return len(batch)
+
+    def _finish(self, job_key, ok):
+        with self._cond:
+            job = self._jobs.get(job_key)
+            if job is None:
+                return
+            job['sent' if ok else 'failed'] += 1
+            job['remaining'] -= 1
+            if job['remaining'] > 0:
+                return
+            del self._jobs[job_key]
+        log_event("campaign_delivered", shop_id=job['shop_id'], campaign_id=job['campaign_id'],
+                  sent=job['sent'], failed=job['failed'])
+
+    def run_pending(self):
+        """Deliver everything queued in this thread; return how many were sent."""
+        count = 0
+        while True:
+            delivered = self.deliver_next()
+            if not delivered:
+                return count
+            count += delivered
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._ring:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            self.deliver_next()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="shop-fanout", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
@@ -1,4 +1,3 @@
-import sqlite3
 from datetime import datetime
 import files
 import db
@@ -11,7 +10,7 @@ class StatisticsManager:
     def _get_connection(self):
         if self.db_path == files.main_db:
             return db.get_db_connection(), True
-        return sqlite3.connect(self.db_path), False
+        return db.connect(self.db_path), False
 
     def log_send(self, campaign_id, group_id, platform, success, result):
         conn, shared = self._get_connection()
@@ -1,89 +1,121 @@
 import telebot
 import time
-import random
 from threading import Lock
 
+import http_pool
+from broadcast_engine import classify_error
+
 class TelegramMultiBot:
     MAX_CAPTION_LENGTH = 1024
 
     def __init__(self, tokens):
+        # Todos los tokens comparten la sesión HTTP del proceso
+        http_pool.install()
         self.bots = [telebot.TeleBot(token) for token in tokens]
         self.current_bot = 0
         self.lock = Lock()
         self.rate_limit = 1.0
-        self.last_sends = [0] * len(self.bots)
+        # Momento (``time.time()``) a partir del cual cada token puede enviar
+        self.available_at = [0.0] * len(self.bots)
 
     def get_next_bot(self):
+        """Reserve the token that is free soonest and wait for it.
+
+        The choice is made under the lock but the wait happens outside it, so
+        other threads can reserve the remaining tokens meanwhile.
+        """
         with self.lock:
-            start_bot = self.current_bot
-            while True:
-                bot_index = self.current_bot
-                elapsed = time.time() - self.last_sends[bot_index]
-                if elapsed >= self.rate_limit:
-                    self.current_bot = (self.current_bot + 1) % len(self.bots)
-                    return bot_index
-                self.current_bot = (self.current_bot + 1) % len(self.bots)
-                if self.current_bot == start_bot:
-                    time.sleep(0.1)
+            now = time.time()
+            count = len(self.bots)
+            order = [(self.current_bot + i) % count for i in range(count)]
+            bot_index = min(order, key=lambda i: max(self.available_at[i], now))
+            start = max(self.available_at[bot_index], now)
+            self.available_at[bot_index] = start + self.rate_limit
+            self.current_bot = (bot_index + 1) % count
+        if start > now:
+            time.sleep(start - now)
+        return bot_index
 
-    def send_message(self, group_id, message, media_file_id=None, media_type=None, buttons=None, topic_id=None):
-        bot_index = self.get_next_bot()
+    def pause_bot(self, bot_index, seconds):
+        """Keep ``bot_index`` out of :meth:`get_next_bot` for ``seconds``."""
+        with self.lock:
+            until = time.time() + float(seconds)
+            self.available_at[bot_index] = max(self.available_at[bot_index], until)
+
+    def deliver(self, bot_index, group_id, message, media_file_id=None, media_type=None, buttons=None, topic_id=None):
+        """Send through token ``bot_index``; raise the API error on failure."""
         bot = self.bots[bot_index]
-        try:
-            markup = None
-            if buttons:
-                markup = telebot.types.InlineKeyboardMarkup()
-                if buttons.get('button1_text'):
-                    markup.add(telebot.types.InlineKeyboardButton(buttons['button1_text'], url=buttons['button1_url']))
-                if buttons.get('button2_text'):
-                    markup.add(telebot.types.InlineKeyboardButton(buttons['button2_text'], url=buttons['button2_url']))
-            
-            # Parámetros base para el envío
-            send_params = {
-                'chat_id': group_id,
-                'reply_markup': markup
-            }
-            
-            # Agregar topic_id si está especificado
-            if topic_id is not None:
-                send_params['message_thread_id'] = topic_id
-                
-            if media_file_id:
-                if message and len(message) > self.MAX_CAPTION_LENGTH:
-                    message = message[: self.MAX_CAPTION_LENGTH - 1] + "…"
-                if media_type == 'photo':
-                    bot.send_photo(caption=message, photo=media_file_id, **send_params)
-                elif media_type == 'video':
-                    bot.send_video(caption=message, video=media_file_id, **send_params)
-                elif media_type == 'document':
-                    bot.send_document(caption=message, document=media_file_id, **send_params)
-                else:
-                    send_params['text'] = message
-                    send_params['parse_mode'] = 'Markdown'
-                    bot.send_message(**send_params)
+        markup = None
+        if buttons:
+            markup = telebot.types.InlineKeyboardMarkup()
+            if buttons.get('button1_text'):
+                markup.add(telebot.types.InlineKeyboardButton(buttons['button1_text'], url=buttons['button1_url']))
+            if buttons.get('button2_text'):
+                markup.add(telebot.types.InlineKeyboardButton(buttons['button2_text'], url=buttons['button2_url']))
+
+        # Parámetros base para el envío
+        send_params = {
+            'chat_id': group_id,
+            'reply_markup': markup
+        }
+
+        # Agregar topic_id si está especificado
+        if topic_id is not None:
+            send_params['message_thread_id'] = topic_id
+
+        if media_file_id:
+            if message and len(message) > self.MAX_CAPTION_LENGTH:
+                message = message[: self.MAX_CAPTION_LENGTH - 1] + "…"
+            if media_type == 'photo':
+                bot.send_photo(caption=message, photo=media_file_id, **send_params)
+            elif media_type == 'video':
+                bot.send_video(caption=message, video=media_file_id, **send_params)
+            elif media_type == 'document':
+                bot.send_document(caption=message, document=media_file_id, **send_params)
             else:
                 send_params['text'] = message
                 send_params['parse_mode'] = 'Markdown'
                 bot.send_message(**send_params)
-                
-            self.last_sends[bot_index] = time.time()
+        else:
+            send_params['text'] = message
+            send_params['parse_mode'] = 'Markdown'
+            bot.send_message(**send_params)
+
+    @staticmethod
+    def describe_error(error):
+        error_msg = str(error)
+        lower = error_msg.lower()
+        if "bot was blocked" in lower:
+            return "Bot bloqueado en el grupo"
+        if "chat not found" in lower:
+            return "Grupo no encontrado"
+        if "topic closed" in lower:
+            return "Topic cerrado o no disponible"
+        if "message_thread_id" in lower:
+            return "Topic ID inválido o grupo sin temas habilitados"
+        if "too many requests" in lower:
+            return "Rate limit excedido"
+        if "caption is too long" in lower:
+            return "Caption demasiado largo"
+        return f"Error: {error_msg}"
+
+    def send_message(self, group_id, message, media_file_id=None, media_type=None, buttons=None, topic_id=None):
+        bot_index = self.get_next_bot()
+        try:
+            self.deliver(
+                bot_index,
+                group_id,
+                message,
+                media_file_id=media_file_id,
+                media_type=media_type,
+                buttons=buttons,
+                topic_id=topic_id,
+            )
             topic_info = f" (Topic: {topic_id})" if topic_id else " (Grupo principal)"
             return True, f"Enviado exitosamente{topic_info}"
-            
         except Exception as e:
-            error_msg = str(e)
-            if "bot was blocked" in error_msg.lower():
-                return False, "Bot bloqueado en el grupo"
-            elif "chat not found" in error_msg.lower():
-                return False, "Grupo no encontrado"
-            elif "topic closed" in error_msg.lower():
-                return False, "Topic cerrado o no disponible"
-            elif "message_thread_id" in error_msg.lower():
-                return False, "Topic ID inválido o grupo sin temas habilitados"
-            elif "too many requests" in error_msg.lower():
-                time.sleep(random.uniform(5, 10))
-                return False, "Rate limit excedido"
-            elif "caption is too long" in error_msg.lower():
-                return False, "Caption demasiado largo"
-            else:
-                return False, f"Error: {error_msg}"
+            outcome, retry_after = classify_error(e)
+            if outcome == 'retry':
+                # Se aparta el token en lugar de dormir en este hilo
+                self.pause_bot(bot_index, retry_after)
+            return False, self.describe_error(e)
@@ -1,7 +1,15 @@
 import telebot, config
+import http_pool
+import telemetry
 
 _token = config.token or "123:ABC"
+# Sin hilos propios: update_queue reparte las actualizaciones por chat
 try:
-    bot = telebot.TeleBot(_token)
+    bot = telebot.TeleBot(_token, threaded=False)
 except Exception:
-    bot = telebot.TeleBot("123:ABC")
+    bot = telebot.TeleBot("123:ABC", threaded=False)
+
+# Una sola sesión HTTP con keep-alive para todos los bots del proceso
+http_pool.install()
+# Contar y medir todas las llamadas a la API de Telegram
+telemetry.instrument_telebot()
@@ -1,10 +1,17 @@
-import shelve
+import time
+import logging
+import threading
 from bot_instance import bot
 import files
+import state_store
 import dop
+import broadcast_engine
+import broadcast_jobs
 from navigation import nav_system
 from utils.message_chunker import send_long_message
 
+PROGRESS_INTERVAL = 5  # segundos entre actualizaciones del mensaje de progreso
+
 
 def _key(chat_id: int) -> str:
     return f"broadcast_{chat_id}"
@@ -12,7 +19,7 @@ def _key(chat_id: int) -> str:
 
 def set_broadcast_content(chat_id: int, text: str, media: dict | None = None) -> None:
     """Store broadcast message content for ``chat_id``."""
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(_key(chat_id), {"step": 1})
         state["text"] = text
         state["media"] = media
@@ -21,7 +28,7 @@ def set_broadcast_content(chat_id: int, text: str, media: dict | None = None) ->
 
 def set_broadcast_audience(chat_id: int, audience: str) -> None:
     """Store selected audience filter for ``chat_id``."""
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(_key(chat_id), {"step": 2})
         state["audience"] = audience
         bd[_key(chat_id)] = state
@@ -30,7 +37,7 @@ def set_broadcast_audience(chat_id: int, audience: str) -> None:
 def start_broadcast(store_id: int, chat_id: int) -> None:
     """Interactive wizard to create and send a broadcast."""
     key = _key(chat_id)
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(key, {"step": 0, "store_id": store_id})
         state["store_id"] = store_id
         if state["step"] == 0:
@@ -76,7 +83,7 @@ def start_broadcast(store_id: int, chat_id: int) -> None:
 def broadcast_preview(chat_id: int, store_id: int) -> None:
     """Show a preview of the broadcast message before sending."""
     key = _key(chat_id)
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(key)
     if not state:
         markup = nav_system.create_universal_navigation(chat_id, "broadcast_preview", store_id)
@@ -98,10 +105,15 @@ def broadcast_preview(chat_id: int, store_id: int) -> None:
     send_long_message(bot, chat_id, f"Audiencia: {audience}", markup=markup)
 
 
-def broadcast_confirm(chat_id: int, store_id: int) -> None:
-    """Send the broadcast to the selected audience."""
+def broadcast_confirm(chat_id: int, store_id: int) -> threading.Thread | None:
+    """Send the broadcast to the selected audience.
+
+    The broadcast is stored as a job and sent on a background thread; a
+    status message is edited with the progress and the final summary is
+    sent when it finishes.
+    """
     key = _key(chat_id)
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         state = bd.get(key)
         if not state:
             markup = nav_system.create_universal_navigation(chat_id, "broadcast_confirm", store_id)
@@ -111,12 +123,128 @@ def broadcast_confirm(chat_id: int, store_id: int) -> None:
         media = state.get("media")
         audience = state.get("audience", "all")
         bd.pop(key, None)
-    result = dop.broadcast_message(audience, 1000000, text, media=media, shop_id=store_id)
-    markup = nav_system.create_universal_navigation(chat_id, "broadcast_done", store_id)
-    send_long_message(bot, chat_id, result, markup=markup)
-    nav_system.reset(chat_id)
+    try:
+        job_id = broadcast_jobs.create_job(store_id, audience, text, media, admin_id=chat_id)
+    except Exception as e:
+        logging.error(f"Error creando difusión: {e}")
+        markup = nav_system.create_universal_navigation(chat_id, "broadcast_confirm", store_id)
+        send_long_message(bot, chat_id, "❌ No se pudo crear la difusión.", markup=markup)
+        return None
+    return _start(chat_id, store_id, job_id)
+
+
+def _running_markup(chat_id: int, store_id: int):
+    return nav_system.create_universal_navigation(
+        chat_id,
+        "broadcast_running",
+        store_id,
+        [("⏸️ Pausar", "broadcast_pause"), ("⛔ Cancelar", "broadcast_cancel")],
+    )
+
+
+def _start(chat_id: int, store_id: int, job_id: int) -> threading.Thread:
+    job = broadcast_jobs.get_job(job_id)
+    markup = _running_markup(chat_id, store_id)
+    status = bot.send_message(
+        chat_id,
+        f"📣 Difusión en curso: {_processed(job)}/{job['total']}",
+        reply_markup=markup,
+    )
+    progress = _progress_reporter(chat_id, getattr(status, "message_id", None), job["total"], markup)
+    return broadcast_jobs.start_job(job_id, progress=progress, on_finish=_notify_finished)
+
+
+def _processed(job) -> int:
+    return job["sent"] + job["blocked"] + job["failed"]
+
+
+def _job_summary(job) -> str:
+    result = broadcast_engine.BroadcastResult()
+    result.sent, result.blocked, result.failed = job["sent"], job["blocked"], job["failed"]
+    return result.as_text()
+
+
+def _progress_reporter(chat_id: int, message_id: int | None, total: int, markup=None):
+    """Return a callback that edits the status message every few seconds."""
+    last = {"at": time.monotonic()}
+    lock = threading.Lock()
+
+    def report(result) -> None:
+        if message_id is None:
+            return
+        with lock:
+            now = time.monotonic()
+            if now - last["at"] < PROGRESS_INTERVAL:
+                return
+            last["at"] = now
+        try:
+            bot.edit_message_text(
+                f"📣 Difusión en curso: {result.processed}/{total}\n"
+                f"✅ {result.sent}  🚫 {result.blocked}  ⚠️ {result.failed}",
+                chat_id,
+                message_id,
+                reply_markup=markup,
+            )
+        except Exception as e:
+            logging.error(f"Error actualizando progreso de difusión: {e}")
+
+    return report
+
+
+def _notify_finished(job) -> None:
+    """Tell the admin how the job ended."""
+    if not job or not job.get("admin_id"):
+        return
+    chat_id, store_id = job["admin_id"], job["shop_id"]
+    if job["status"] == "paused":
+        markup = nav_system.create_universal_navigation(
+            chat_id, "broadcast_paused", store_id, [("▶️ Reanudar", "broadcast_resume")]
+        )
+        text = f"⏸️ Difusión pausada ({_processed(job)}/{job['total']}).\n" + _job_summary(job)
+    elif job["status"] == "cancelled":
+        markup = nav_system.create_universal_navigation(chat_id, "broadcast_done", store_id)
+        text = f"⛔ Difusión cancelada ({_processed(job)}/{job['total']}).\n" + _job_summary(job)
+    else:
+        markup = nav_system.create_universal_navigation(chat_id, "broadcast_done", store_id)
+        text = _job_summary(job)
+        nav_system.reset(chat_id)
+    send_long_message(bot, chat_id, text, markup=markup)
+
+
+def broadcast_pause(chat_id: int, store_id: int) -> None:
+    """Pause the admin's running broadcast."""
+    job = broadcast_jobs.get_active_job(chat_id)
+    if not job or not broadcast_jobs.pause_job(job["id"]):
+        send_long_message(bot, chat_id, "❌ No hay difusión en curso.")
+
+
+def broadcast_cancel(chat_id: int, store_id: int) -> None:
+    """Cancel the admin's running or paused broadcast."""
+    job = broadcast_jobs.get_active_job(chat_id)
+    if not job or not broadcast_jobs.cancel_job(job["id"]):
+        send_long_message(bot, chat_id, "❌ No hay difusión en curso.")
+        return
+    if job["status"] == "paused":
+        _notify_finished(broadcast_jobs.get_job(job["id"]))
+
+
+def broadcast_resume(chat_id: int, store_id: int) -> threading.Thread | None:
+    """Resume the admin's paused broadcast from its last checkpoint."""
+    job = broadcast_jobs.get_active_job(chat_id)
+    if not job or job["status"] != "paused":
+        send_long_message(bot, chat_id, "❌ No hay difusión pausada.")
+        return None
+    return _start(chat_id, job["shop_id"], job["id"])
+
+
+def resume_interrupted() -> list[int]:
+    """Restart broadcasts interrupted by a restart; called at bot startup."""
+    return broadcast_jobs.resume_interrupted_jobs(on_finish=_notify_finished)
 
 
 # Register callbacks with navigation system
 nav_system.register("broadcast_preview", lambda chat_id, store_id: broadcast_preview(chat_id, store_id))
 nav_system.register("broadcast_confirm", lambda chat_id, store_id: broadcast_confirm(chat_id, store_id))
+nav_system.register("broadcast_pause", lambda chat_id, store_id: broadcast_pause(chat_id, store_id))
+nav_system.register("broadcast_cancel", lambda chat_id, store_id: broadcast_cancel(chat_id, store_id))
+nav_system.register("broadcast_resume", lambda chat_id, store_id: broadcast_resume(chat_id, store_id))
@@ -0,0 +1,295 @@
+"""Paced, concurrent delivery of broadcast messages.
+
+Recipients are read as a stream and handed to a small pool of worker
+threads.  Every send first takes a token from the bot-wide bucket (Telegram
+allows about 30 messages per second) and from the recipient's own bucket
+(about one message per second per chat).  A ``429 Too Many Requests`` answer
+pauses the whole bot for the ``retry_after`` Telegram asks for and the send
+is retried; only answers that really mean the user is gone (bot blocked,
+account deactivated, chat not found) are reported as blocked.
+"""
+
+import re
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+import db
+import telemetry
+
+GLOBAL_RATE = 30          # mensajes por segundo para todo el bot
+PER_CHAT_RATE = 1         # mensajes por segundo a un mismo chat
+DEFAULT_WORKERS = 8
+MAX_RETRIES = 3
+AUDIENCE_BATCH = 500
+
+_BLOCKED_MARKERS = (
+    'bot was blocked',
+    'user is deactivated',
+    'chat not found',
+    'bot was kicked',
+    'bot can\'t initiate conversation',
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (used on 429 answers)."""
+        with self._lock:
+            until = self._clock() + float(seconds)
+            self._paused_until = max(self._paused_until, until)
+            self.tokens = 0.0
+            self._updated = self._paused_until
+
+    def try_acquire(self):
+        """Take a token if one is available.
+
+        Returns 0 when a token was taken, otherwise the seconds until one
+        will be.
+        """
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            # Espera mínima para no quedar atascados por redondeo
+            return max((1 - self.tokens) / self.rate, 0.001)
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self._sleep(wait)
+
+
+class ChatBuckets:
+    """Per-chat buckets, keeping only the most recently used ``max_chats``."""
+
+    def __init__(self, rate=PER_CHAT_RATE, max_chats=10000):
+        self.rate = rate
+        self.max_chats = max_chats
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        with self._lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, capacity=1)
+                self._buckets[chat_id] = bucket
+                if len(self._buckets) > self.max_chats:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(chat_id)
+            return bucket
+
+
+class BroadcastResult:
+    """Outcome counters of a broadcast run."""
+
+    def __init__(self):
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.blocked_ids = []
+
+    @property
+    def processed(self):
+        return self.sent + self.blocked + self.failed
+
+    def as_text(self):
+        text = (
+            f'¡{self.sent} usuarios recibieron el mensaje exitosamente!\n'
+            f'{self.blocked} usuarios bloquearon el bot y fueron agregados a la lista de usuarios bloqueados'
+        )
+        if self.failed:
+            text += f'\n{self.failed} envíos fallaron por otros errores'
+        return text
+
+
+def classify_error(exc):
+    """Return ``('retry', seconds)``, ``('blocked', None)`` or ``('failed', None)``."""
+    code = getattr(exc, 'error_code', None)
+    description = str(getattr(exc, 'description', '') or exc).lower()
+    if code == 429 or 'too many requests' in description:
+        retry_after = None
+        result_json = getattr(exc, 'result_json', None) or {}
+        params = result_json.get('parameters') or {}
+        if params.get('retry_after') is not None:
+            retry_after = params['retry_after']
+        else:
+            match = re.search(r'retry after (\d+)', description)
+            if match:
+                retry_after = match.group(1)
+        return 'retry', float(retry_after or 1)
+    if code == 403 or any(marker in description for marker in _BLOCKED_MARKERS):
+        return 'blocked', None
+    return 'failed', None
+
+
+class BroadcastEngine:
+    """Send one message to many chats through a bounded worker pool."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, global_bucket=None, chat_buckets=None,
+                 max_retries=MAX_RETRIES):
+        self.workers = max(1, int(workers))
+        self.global_bucket = global_bucket or TokenBucket(GLOBAL_RATE)
+        self.chat_buckets = chat_buckets or ChatBuckets()
+        self.max_retries = max_retries
+
+    def _deliver(self, chat_id, send, result, lock, on_blocked):
+        attempt = 0
+        while True:
+            self.chat_buckets.get(chat_id).acquire()
+            self.global_bucket.acquire()
+            try:
+                send(chat_id)
+                outcome = 'sent'
+            except Exception as e:
+                outcome, retry_after = classify_error(e)
+                if outcome == 'retry' and attempt < self.max_retries:
+                    attempt += 1
+                    logging.info(f"Límite de Telegram alcanzado, reintento en {retry_after}s")
+                    self.global_bucket.pause(retry_after)
+                    continue
+                if outcome == 'retry':
+                    outcome = 'failed'
+                logging.error(f"Error enviando difusión a {chat_id}: {e}")
+            break
+        telemetry.MESSAGES.inc(source='broadcast', outcome=outcome)
+        with lock:
+            if outcome == 'sent':
+                result.sent += 1
+            elif outcome == 'blocked':
+                result.blocked += 1
+                result.blocked_ids.append(chat_id)
+            else:
+                result.failed += 1
+        if outcome == 'blocked' and on_blocked:
+            try:
+                on_blocked(chat_id)
+            except Exception as e:
+                logging.error(f"Error registrando usuario bloqueado {chat_id}: {e}")
+        return outcome
+
+    def run(self, recipients, send, on_progress=None, on_blocked=None,
+            on_outcome=None, result=None, should_stop=None):
+        """Send to every chat id in ``recipients`` and return a :class:`BroadcastResult`.
+
+        ``send(chat_id)`` performs the actual API call.  ``on_progress`` is
+        called with the result after each recipient; ``on_blocked`` with the
+        chat id of users that blocked the bot and ``on_outcome`` with
+        ``(chat_id, outcome)`` for every recipient.  Passing ``result``
+        continues counting on an existing result (used when resuming).
+        Once ``should_stop()`` returns true, queued recipients are dropped
+        without being sent.
+        """
+        result = result or BroadcastResult()
+        lock = threading.Lock()
+        pending = queue.Queue(maxsize=self.workers * 4)
+        done = object()
+
+        def worker():
+            while True:
+                chat_id = pending.get()
+                if chat_id is done:
+                    return
+                if should_stop and should_stop():
+                    continue
+                outcome = self._deliver(chat_id, send, result, lock, on_blocked)
+                if on_outcome:
+                    try:
+                        on_outcome(chat_id, outcome)
+                    except Exception as e:
+                        logging.error(f"Error registrando resultado de difusión: {e}")
+                if on_progress:
+                    try:
+                        on_progress(result)
+                    except Exception as e:
+                        logging.error(f"Error informando progreso de difusión: {e}")
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for th in threads:
+            th.start()
+        try:
+            for chat_id in recipients:
+                pending.put(chat_id)
+        finally:
+            for _ in threads:
+                pending.put(done)
+            for th in threads:
+                th.join()
+        return result
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide engine so all broadcasts share the same buckets."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BroadcastEngine()
+        return _engine
+
+
+def iter_audience(group, shop_id=1, limit=None, batch=AUDIENCE_BATCH):
+    """Yield chat ids of ``group`` ('all' or 'buyers') for ``shop_id`` in pages."""
+    if group == 'buyers':
+        sql = "SELECT id FROM buyers WHERE shop_id = ? AND id > ? ORDER BY id LIMIT ?"
+    elif group == 'all':
+        sql = "SELECT user_id FROM shop_users WHERE shop_id = ? AND user_id > ? ORDER BY user_id LIMIT ?"
+    else:
+        return
+    remaining = None if limit is None else int(limit)
+    last_id = -1 << 63
+    while remaining is None or remaining > 0:
+        size = batch if remaining is None else min(batch, remaining)
+        rows = db.get_db_connection().execute(sql, (shop_id, last_id, size)).fetchall()
+        if not rows:
+            return
+        for (chat_id,) in rows:
+            yield int(chat_id)
+        last_id = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+def count_audience(group, shop_id=1, limit=None):
+    """Return how many recipients :func:`iter_audience` would yield."""
+    if group not in ('all', 'buyers'):
+        return 0
+    table, column = ('buyers', 'id') if group == 'buyers' else ('shop_users', 'user_id')
+    row = db.get_db_connection().execute(
+        f"SELECT COUNT({column}) FROM {table} WHERE shop_id = ?", (shop_id,)
+    ).fetchone()
+    total = row[0] if row else 0
+    return total if limit is None else min(total, int(limit))
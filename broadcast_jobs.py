@@ -0,0 +1,275 @@
+"""Broadcast jobs checkpointed in the database.
+
+A job stores the message, a snapshot of its audience (one row per recipient
+in ``broadcast_recipients``) and each recipient's outcome.  Outcomes are
+written in batches, so a crash can re-send at most the last unflushed batch;
+everything already recorded is skipped when the job is resumed.  Jobs can be
+paused, resumed and cancelled while they run.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+import db
+import dop
+import broadcast_engine
+
+FLUSH_SIZE = 100          # resultados acumulados antes de escribir
+FLUSH_INTERVAL = 2.0      # segundos máximos entre escrituras
+PAGE_SIZE = 200           # destinatarios leídos por consulta
+
+ACTIVE_STATUSES = ('running', 'paused')
+
+_stop_requests = set()
+_stop_lock = threading.Lock()
+
+_AUDIENCE_SQL = {
+    'all': "SELECT ?, user_id, 'pending' FROM shop_users WHERE shop_id = ? ORDER BY user_id",
+    'buyers': "SELECT ?, id, 'pending' FROM buyers WHERE shop_id = ? ORDER BY id",
+}
+
+_JOB_COLUMNS = (
+    'id', 'shop_id', 'admin_id', 'audience', 'text', 'media', 'status',
+    'total', 'sent', 'blocked', 'failed', 'created_at', 'updated_at',
+)
+
+
+def create_job(shop_id, audience, text, media=None, admin_id=None, limit=None):
+    """Create a job and snapshot its audience; return the job id."""
+    sql = _AUDIENCE_SQL.get(audience)
+    if sql is None:
+        raise ValueError(f"Audiencia desconocida: {audience}")
+    con = db.get_db_connection()
+    now = datetime.now().isoformat()
+    try:
+        cur = con.cursor()
+        cur.execute(
+            "INSERT INTO broadcast_jobs (shop_id, admin_id, audience, text, media, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+            (shop_id, admin_id, audience, text, json.dumps(media) if media else None, now, now),
+        )
+        job_id = cur.lastrowid
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        cur.execute(
+            f"INSERT OR IGNORE INTO broadcast_recipients (job_id, chat_id, status) {sql}",
+            (job_id, shop_id),
+        )
+        cur.execute(
+            "UPDATE broadcast_jobs SET total = ? WHERE id = ?",
+            (cur.rowcount, job_id),
+        )
+        con.commit()
+        return job_id
+    except Exception:
+        if con.in_transaction:
+            con.rollback()
+        raise
+
+
+def get_job(job_id):
+    """Return the job as a dict, or ``None`` if it does not exist."""
+    row = db.get_db_connection().execute(
+        f"SELECT {', '.join(_JOB_COLUMNS)} FROM broadcast_jobs WHERE id = ?",
+        (job_id,),
+    ).fetchone()
+    if not row:
+        return None
+    job = dict(zip(_JOB_COLUMNS, row))
+    job['media'] = json.loads(job['media']) if job['media'] else None
+    return job
+
+
+def get_active_job(admin_id):
+    """Return the most recent running or paused job created by ``admin_id``."""
+    row = db.get_db_connection().execute(
+        "SELECT id FROM broadcast_jobs WHERE admin_id = ? AND status IN (?, ?) "
+        "ORDER BY id DESC LIMIT 1",
+        (admin_id, *ACTIVE_STATUSES),
+    ).fetchone()
+    return get_job(row[0]) if row else None
+
+
+def _set_status(job_id, status, only_from=None):
+    con = db.get_db_connection()
+    sql = "UPDATE broadcast_jobs SET status = ?, updated_at = ? WHERE id = ?"
+    params = [status, datetime.now().isoformat(), job_id]
+    if only_from:
+        sql += f" AND status IN ({', '.join('?' for _ in only_from)})"
+        params.extend(only_from)
+    cur = con.execute(sql, params)
+    con.commit()
+    return cur.rowcount > 0
+
+
+def _request_stop(job_id, status):
+    if not _set_status(job_id, status, only_from=('pending', *ACTIVE_STATUSES)):
+        return False
+    with _stop_lock:
+        _stop_requests.add(job_id)
+    return True
+
+
+def pause_job(job_id):
+    """Stop sending after the in-flight messages; the job can be resumed."""
+    return _request_stop(job_id, 'paused')
+
+
+def cancel_job(job_id):
+    """Stop sending for good."""
+    return _request_stop(job_id, 'cancelled')
+
+
+def _stop_requested(job_id):
+    with _stop_lock:
+        return job_id in _stop_requests
+
+
+def _iter_pending(job_id):
+    """Yield pending recipients, re-checking the job status between pages."""
+    last_id = -1 << 63
+    while True:
+        con = db.get_db_connection()
+        row = con.execute("SELECT status FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row or row[0] != 'running':
+            return
+        rows = con.execute(
+            "SELECT chat_id FROM broadcast_recipients "
+            "WHERE job_id = ? AND chat_id > ? AND status = 'pending' "
+            "ORDER BY chat_id LIMIT ?",
+            (job_id, last_id, PAGE_SIZE),
+        ).fetchall()
+        if not rows:
+            return
+        for (chat_id,) in rows:
+            if _stop_requested(job_id):
+                return
+            yield chat_id
+        last_id = rows[-1][0]
+
+
+class _OutcomeWriter:
+    """Buffer per-recipient outcomes and write them in one transaction."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def add(self, chat_id, outcome):
+        with self.lock:
+            self.buffer.append((outcome, chat_id))
+            if (len(self.buffer) >= FLUSH_SIZE
+                    or time.monotonic() - self.last_flush >= FLUSH_INTERVAL):
+                self._flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        counts = {'sent': 0, 'blocked': 0, 'failed': 0}
+        for outcome, _ in rows:
+            counts[outcome] += 1
+        con = db.get_db_connection()
+        try:
+            con.executemany(
+                "UPDATE broadcast_recipients SET status = ? WHERE job_id = ? AND chat_id = ?",
+                [(outcome, self.job_id, chat_id) for outcome, chat_id in rows],
+            )
+            con.execute(
+                "UPDATE broadcast_jobs SET sent = sent + ?, blocked = blocked + ?, "
+                "failed = failed + ?, updated_at = ? WHERE id = ?",
+                (counts['sent'], counts['blocked'], counts['failed'],
+                 datetime.now().isoformat(), self.job_id),
+            )
+            con.commit()
+        except Exception as e:
+            if con.in_transaction:
+                con.rollback()
+            logging.error(f"Error guardando progreso de difusión {self.job_id}: {e}")
+
+
+def _make_sender(job):
+    text, media = job['text'] or '', job['media']
+
+    def send(chat_id):
+        if media:
+            dop._send_media_message(chat_id, text, media)
+        else:
+            dop.bot.send_message(chat_id, text)
+
+    return send
+
+
+def run_job(job_id, progress=None, send=None, engine=None):
+    """Send the job's pending recipients on the calling thread; return the job."""
+    with _stop_lock:
+        _stop_requests.discard(job_id)
+    if not _set_status(job_id, 'running', only_from=('pending', *ACTIVE_STATUSES)):
+        return get_job(job_id)
+    job = get_job(job_id)
+    result = broadcast_engine.BroadcastResult()
+    result.sent, result.blocked, result.failed = job['sent'], job['blocked'], job['failed']
+    writer = _OutcomeWriter(job_id)
+    engine = engine or broadcast_engine.get_engine()
+    try:
+        engine.run(
+            _iter_pending(job_id),
+            send or _make_sender(job),
+            on_progress=progress,
+            on_blocked=dop.new_blockuser,
+            on_outcome=writer.add,
+            result=result,
+            should_stop=lambda: _stop_requested(job_id),
+        )
+    finally:
+        writer.flush()
+        with _stop_lock:
+            _stop_requests.discard(job_id)
+    con = db.get_db_connection()
+    remaining = con.execute(
+        "SELECT 1 FROM broadcast_recipients WHERE job_id = ? AND status = 'pending' LIMIT 1",
+        (job_id,),
+    ).fetchone()
+    if not remaining:
+        _set_status(job_id, 'done', only_from=('running',))
+    return get_job(job_id)
+
+
+def start_job(job_id, progress=None, on_finish=None):
+    """Run the job on a background thread and return the thread."""
+    def target():
+        try:
+            job = run_job(job_id, progress=progress)
+        except Exception as e:
+            logging.error(f"Error ejecutando difusión {job_id}: {e}")
+            return
+        if on_finish:
+            on_finish(job)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def resume_interrupted_jobs(on_finish=None):
+    """Restart jobs left ``running`` by a previous process; return their ids."""
+    try:
+        rows = db.get_db_connection().execute(
+            "SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id"
+        ).fetchall()
+    except Exception as e:
+        logging.error(f"Error buscando difusiones interrumpidas: {e}")
+        return []
+    for (job_id,) in rows:
+        start_job(job_id, on_finish=on_finish)
+    return [job_id for (job_id,) in rows]
@@ -1,56 +1,189 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
 import db
 from utils.ascii_chart import sparkline
 
+# Puntos máximos de la tendencia de cada tienda
+TREND_POINTS = 12
 
-def generate_bi_report():
-    """Generate a simple Business Intelligence report.
 
-    The report compares all stores computing a basic ROI (based on revenue),
-    creates a ranking and shows the sales trend using ASCII sparklines.
+class Period(NamedTuple):
+    key: str
+    label: str
+    start: Optional[str]
+    end: str
+    prev_start: Optional[str] = None
+    prev_end: Optional[str] = None
 
-    Returns:
-        str: Multi-line textual summary.
-    """
-    con = db.get_db_connection()
-    cur = con.cursor()
+
+PERIODS = {
+    "all": "Histórico",
+    "7d": "Últimos 7 días",
+    "30d": "Últimos 30 días",
+    "90d": "Últimos 90 días",
+    "mtd": "Mes en curso",
+    "yoy": "Año en curso vs anterior",
+}
+
+
+def _same_day_last_year(day):
     try:
-        cur.execute("SELECT id, name FROM shops")
-        shops = cur.fetchall()
-    except Exception:
-        shops = []
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 de febrero
+        return day.replace(year=day.year - 1, day=28)
 
-    stats = []
-    for sid, name in shops:
-        try:
-            cur.execute(
-                "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=?",
-                (sid,),
-            )
-            revenue = cur.fetchone()[0] or 0
-        except Exception:
-            revenue = 0
 
-        # Placeholder for costs; none are tracked currently
-        cost = 0
-        roi = revenue - cost
+def resolve_period(key="all", today=None):
+    """Return the :class:`Period` for ``key`` and its comparison range.
+
+    ``7d``/``30d``/``90d`` compare with the same number of days right before,
+    ``mtd`` with the same days of the previous month and ``yoy`` (year to
+    date) with the same dates of the previous year.  ``all`` has no
+    comparison.
+    """
+    if key not in PERIODS:
+        raise ValueError(f"Periodo desconocido: {key}")
+    today = today or date.today()
+    label = PERIODS[key]
+    if key == "all":
+        return Period(key, label, None, today.isoformat())
+    if key == "mtd":
+        start = today.replace(day=1)
+        prev_end_month = start - timedelta(days=1)
+        prev_start = prev_end_month.replace(day=1)
+        prev_end = min(prev_start + (today - start), prev_end_month)
+    elif key == "yoy":
+        start = today.replace(month=1, day=1)
+        prev_start = start.replace(year=start.year - 1)
+        prev_end = _same_day_last_year(today)
+    else:
+        days = int(key[:-1])
+        start = today - timedelta(days=days - 1)
+        prev_end = start - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=days - 1)
+    return Period(
+        key, label, start.isoformat(), today.isoformat(),
+        prev_start.isoformat(), prev_end.isoformat(),
+    )
 
-        sales_ts = db.get_sales_timeseries(store_id=sid)
-        trend = sparkline([s["total"] for s in sales_ts]) if sales_ts else None
 
-        stats.append({
+def build_bi_report(period="all", today=None):
+    """Compute revenue, orders, growth, trend and ranking for every shop.
+
+    All shops are aggregated by a single grouped query
+    (:func:`db.get_shop_sales_buckets`), which reads the daily sales rollups
+    when they exist.  Returns ``(period, rows)`` with ``rows`` sorted by ROI.
+    """
+    if not isinstance(period, Period):
+        period = resolve_period(period, today)
+    end = date.fromisoformat(period.end)
+    if period.start is None:
+        trend_start = end - timedelta(days=6)
+    else:
+        trend_start = date.fromisoformat(period.start)
+    trend_days = (end - trend_start).days + 1
+    points = min(trend_days, TREND_POINTS)
+
+    shops = {}
+    for sid, name, bucket, revenue, orders in db.get_shop_sales_buckets(
+        period.start, period.end, period.prev_start, period.prev_end,
+        trend_start.isoformat(), trend_days, points,
+    ):
+        shop = shops.setdefault(sid, {
             "shop_id": sid,
             "name": name,
-            "roi": roi,
-            "revenue": revenue,
-            "trend": trend,
+            "revenue": 0,
+            "orders": 0,
+            "previous_revenue": 0,
+            "trend": [0] * points,
         })
+        if bucket is None:
+            continue
+        if bucket == -1:
+            shop["previous_revenue"] += revenue or 0
+            continue
+        shop["revenue"] += revenue or 0
+        shop["orders"] += orders or 0
+        if 0 <= bucket < points:
+            shop["trend"][bucket] += revenue or 0
+
+    stats = []
+    for shop in shops.values():
+        # Placeholder for costs; none are tracked currently
+        cost = 0
+        shop["roi"] = shop["revenue"] - cost
+        previous = shop["previous_revenue"]
+        if period.prev_start is None or not previous:
+            shop["growth"] = None
+        else:
+            shop["growth"] = round((shop["revenue"] - previous) * 100 / previous, 1)
+        stats.append(shop)
 
     ranking = sorted(stats, key=lambda x: x["roi"], reverse=True)
+    return period, ranking
+
+
+def generate_bi_report(period="all"):
+    """Generate a simple Business Intelligence report.
+
+    The report compares all stores computing a basic ROI (based on revenue),
+    creates a ranking and shows the sales trend using ASCII sparklines.
 
-    lines = ["📊 *Reporte BI*", ""]
+    Args:
+        period: One of :data:`PERIODS` (``all`` by default).
+
+    Returns:
+        str: Multi-line textual summary.
+    """
+    period, ranking = build_bi_report(period)
+
+    lines = ["📊 *Reporte BI*", f"_{period.label}_", ""]
     for idx, r in enumerate(ranking, 1):
         line = f"{idx}. {r['name']} - ROI: {r['roi']}"
-        if r["trend"]:
-            line += f" ({r['trend']})"
+        if period.start is not None:
+            line += f" · {r['orders']} pedidos"
+        if r["growth"] is not None:
+            line += f" ({r['growth']:+}%)"
+        if any(r["trend"]):
+            line += f" ({sparkline(r['trend'])})"
         lines.append(line)
     return "\n".join(lines)
+
+
+EXPORT_FIELDS = [
+    "rank", "shop_id", "name", "revenue", "orders",
+    "previous_revenue", "growth", "roi",
+]
+
+
+def export_bi_report(period="all", fmt="csv"):
+    """Return the BI ranking of ``period`` as CSV or JSON text."""
+    period, ranking = build_bi_report(period)
+    rows = [
+        dict({field: r[field] for field in EXPORT_FIELDS[1:]}, rank=idx)
+        for idx, r in enumerate(ranking, 1)
+    ]
+    if fmt == "json":
+        return json.dumps(
+            {
+                "period": period.key,
+                "start": period.start,
+                "end": period.end,
+                "previous_start": period.prev_start,
+                "previous_end": period.prev_end,
+                "shops": [{f: row[f] for f in EXPORT_FIELDS} for row in rows],
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    if fmt != "csv":
+        raise ValueError(f"Formato de exportación desconocido: {fmt}")
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
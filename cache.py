@@ -0,0 +1,141 @@
+"""Small in-process cache for data that rarely changes.
+
+Values live in named namespaces, each with its own time to live and maximum
+size (least recently used entries are evicted first).  Functions that write
+the underlying data call :func:`invalidate` so readers never wait for the
+TTL to see their own changes; the TTL only bounds how stale a value can get
+when the data is changed by another process or by hand.
+
+Every namespace counts hits and misses; :func:`stats` returns them.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+# (max_entries, ttl_seconds) por espacio de nombres
+NAMESPACES = {
+    'user_shop': (50000, 300),
+    'goods': (1000, 300),
+    'shop_info': (1000, 300),
+    'discount_config': (1000, 300),
+    'payment_data': (1000, 300),  # o hasta que cambie data_versions (ver dop)
+    'admins': (16, 60),
+    'catalog': (2000, 600),
+}
+DEFAULT_LIMITS = (1000, 60)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, value = item
+                if expires > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def namespace(name):
+    """Return the cache for ``name``, creating it with its configured limits."""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            maxsize, ttl = NAMESPACES.get(name, DEFAULT_LIMITS)
+            cache = _caches[name] = TTLCache(maxsize, ttl)
+        return cache
+
+
+def get_or_load(name, key, loader):
+    """Return the cached value for ``key`` or store and return ``loader()``.
+
+    Exceptions raised by ``loader`` propagate and nothing is cached.
+    """
+    cache = namespace(name)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = loader()
+        cache.set(key, value)
+    return value
+
+
+def invalidate(name, key=_MISSING):
+    """Drop ``key`` from namespace ``name``, or the whole namespace."""
+    cache = namespace(name)
+    if key is _MISSING:
+        cache.clear()
+    else:
+        cache.invalidate(key)
+
+
+def invalidate_where(name, predicate):
+    """Drop every key of namespace ``name`` for which ``predicate(key)`` is true."""
+    namespace(name).invalidate_where(predicate)
+
+
+def clear_all():
+    """Empty every namespace (counters are kept)."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
+
+
+def stats():
+    """Return ``{namespace: {'hits', 'misses', 'evictions', 'size'}}``."""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
@@ -0,0 +1,87 @@
+"""Compact ``callback_data`` for buttons that point at products and shops.
+
+Telegram limits callback data to 64 bytes, which long or accented product
+names easily exceed once a prefix such as ``MAS_INFO_`` is added.  Those
+buttons carry a short token instead::
+
+    ~1p.1f        open product 51
+    ~1e.3.1f      edit product 51 of shop 3
+
+``~`` marks a token, the digit after it is the format version and the
+letter is the action; the fields are base-36 integers separated by dots.
+:func:`decode` returns ``None`` for anything else, so buttons from older
+keyboards keep going through their legacy routes.
+"""
+
+from typing import NamedTuple, Optional
+
+VERSION = '1'
+TOKEN_PREFIX = '~' + VERSION
+MAX_BYTES = 64
+
+# acción -> (código de una letra, campos en orden)
+ACTIONS = {
+    'product': ('p', ('product_id',)),
+    'more_info': ('i', ('product_id',)),
+    'shop': ('s', ('shop_id',)),
+    'product_edit': ('e', ('shop_id', 'product_id')),
+    'product_toggle': ('t', ('shop_id', 'product_id')),
+    'product_page': ('g', ('shop_id', 'page')),
+    'catalog': ('c', ('shop_id', 'category_id', 'page')),
+}
+_BY_CODE = {code: (action, fields) for action, (code, fields) in ACTIONS.items()}
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+class Payload(NamedTuple):
+    action: str
+    shop_id: Optional[int] = None
+    product_id: Optional[int] = None
+    page: Optional[int] = None
+    category_id: Optional[int] = None
+
+
+def _to_base36(value):
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"Valor negativo en callback: {value}")
+    if value == 0:
+        return '0'
+    digits = []
+    while value:
+        value, rem = divmod(value, 36)
+        digits.append(_DIGITS[rem])
+    return ''.join(reversed(digits))
+
+
+def encode(action, **values):
+    """Return the token for ``action`` with the given fields."""
+    try:
+        code, fields = ACTIONS[action]
+    except KeyError:
+        raise ValueError(f"Acción de callback desconocida: {action}") from None
+    missing = [f for f in fields if values.get(f) is None]
+    if missing:
+        raise ValueError(f"Faltan campos para {action}: {', '.join(missing)}")
+    token = TOKEN_PREFIX + code + ''.join('.' + _to_base36(values[f]) for f in fields)
+    if len(token.encode('utf-8')) > MAX_BYTES:
+        raise ValueError(f"Callback demasiado largo: {token}")
+    return token
+
+
+def decode(data):
+    """Return the :class:`Payload` in ``data``, or ``None`` if it is not a token."""
+    if not data or not data.startswith(TOKEN_PREFIX) or len(data) < len(TOKEN_PREFIX) + 1:
+        return None
+    spec = _BY_CODE.get(data[len(TOKEN_PREFIX)])
+    if spec is None:
+        return None
+    action, fields = spec
+    parts = data[len(TOKEN_PREFIX) + 1:].split('.')
+    if parts[0] != '' or len(parts) != len(fields) + 1:
+        return None
+    if not all(p and p.isascii() and p.isalnum() for p in parts[1:]):
+        return None
+    values = {f: int(p, 36) for f, p in zip(fields, parts[1:])}
+    return Payload(action, **values)
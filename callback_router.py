@@ -0,0 +1,117 @@
+"""Dispatch of inline keyboard callbacks.
+
+Exact callback strings are looked up in dicts and prefixed ones
+(``SHOP_12``, ``product_edit_Foo``...) in a character trie, so routing a tap
+costs one dict lookup plus a walk over the callback's own characters no
+matter how many routes are registered.  When several prefixes match, the
+longest one wins.
+
+Handlers receive ``(callback, arg)``: for exact routes ``arg`` is the
+callback data itself, for prefix routes it is the text after the prefix.
+"""
+
+import logging
+
+import telemetry
+
+
+class PrefixTrie:
+    """Map string prefixes to values with longest-prefix lookup."""
+
+    __slots__ = ('_root', '_size')
+
+    _VALUE = object()
+
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, prefix, value):
+        if not prefix:
+            raise ValueError("El prefijo no puede estar vacío")
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if self._VALUE not in node:
+            self._size += 1
+        node[self._VALUE] = value
+
+    def longest_match(self, text):
+        """Return ``(length, value)`` of the longest prefix of ``text``, or ``None``."""
+        node = self._root
+        found = None
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._VALUE in node:
+                found = (i + 1, node[self._VALUE])
+        return found
+
+
+class CallbackRouter:
+    """Route callback data to handlers through dicts and a prefix trie."""
+
+    def __init__(self):
+        self._exact = {}
+        self._tables = []
+        self._prefixes = PrefixTrie()
+        self.fallback = None
+
+    def exact(self, key, handler):
+        self._exact[key] = handler
+        return handler
+
+    def prefix(self, prefix, handler):
+        self._prefixes.insert(prefix, handler)
+        return handler
+
+    def mount(self, table, adapter):
+        """Route the keys of the live mapping ``table`` as exact callbacks.
+
+        ``table`` is consulted on every dispatch, so keys added to it later
+        (``nav_system.register`` runs at import time in many modules) are
+        routed too.  ``adapter(callback, value)`` is called with the value
+        stored under the key.
+        """
+        self._tables.append((table, adapter))
+
+    def route(self, data):
+        """Return ``(handler, arg, route)`` for ``data``.
+
+        ``route`` names the matched route (the exact key, the prefix or
+        ``"fallback"``) for metrics; all three are ``None`` if nothing matched.
+        """
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler, data, data
+        for table, adapter in self._tables:
+            value = table.get(data)
+            if value is not None:
+                return (lambda callback, _arg, a=adapter, v=value: a(callback, v)), data, data
+        match = self._prefixes.longest_match(data)
+        if match is not None:
+            length, handler = match
+            return handler, data[length:], data[:length] + '*'
+        if self.fallback is not None:
+            return self.fallback, data, 'fallback'
+        return None, None, None
+
+    def resolve(self, data):
+        """Return ``(handler, arg)`` for ``data`` or ``(None, None)``."""
+        handler, arg, _ = self.route(data)
+        return handler, arg
+
+    def dispatch(self, callback):
+        """Run the handler for ``callback.data``; return False if none matched."""
+        data = callback.data or ''
+        handler, arg, route = self.route(data)
+        if handler is None:
+            logging.debug(f"Callback sin ruta: {data}")
+            return False
+        with telemetry.CALLBACK_SECONDS.time(route=route):
+            result = handler(callback, arg)
+        return result is not False
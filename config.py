@@ -44,6 +44,10 @@ POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', '2'))
 POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', '10'))
 LONG_POLLING_TIMEOUT = int(os.getenv('LONG_POLLING_TIMEOUT', '10'))
 
+# Almacén de estados de conversación y mensajes del bot: 'sqlite' o 'redis'
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
 # Verificar que el token esté configurado
 if not token:
     print("ERROR: No se encontró TELEGRAM_BOT_TOKEN en el archivo .env")
@@ -1,43 +1,912 @@
 import sqlite3
 import atexit
+import threading
+import logging
+import time
+from datetime import date, timedelta
 import files
 import config
+import cache
+import telemetry
+import query_trace
+
+# SQLite tuning applied to every pooled connection.  WAL lets catalog reads
+# proceed while a purchase is being committed on another thread and
+# ``busy_timeout`` makes writers wait for the lock instead of failing with
+# "database is locked".
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 8000
+
+_local = threading.local()
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _timed(method, sql, *args):
+    start = time.perf_counter()
+    try:
+        return method(sql, *args)
+    finally:
+        kind = telemetry.statement_kind(sql)
+        telemetry.DB_SECONDS.observe(time.perf_counter() - start, kind=kind)
+        telemetry.DB_QUERIES.inc(kind=kind)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records every statement in :mod:`telemetry`."""
+
+    def execute(self, sql, *args):
+        return _timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return _timed(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return _timed(super().executescript, sql)
+
+
+class TracedCursor(TimedCursor):
+    """Cursor handed out while :mod:`query_trace` is enabled.
+
+    A statement's trace stays open while its rows are fetched, so the time
+    and row count include the fetch; it is finished when the rows run out,
+    on the next statement or when the cursor is closed.
+    """
+
+    _trace = None
+
+    def _finish(self):
+        trace, self._trace = self._trace, None
+        if trace is not None:
+            query_trace.finish(trace)
+
+    def _run(self, method, sql, *args):
+        self._finish()
+        trace = query_trace.start(sql)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            trace.seconds = time.perf_counter() - start
+            if self.description is None:
+                trace.rows = self.rowcount
+                query_trace.finish(trace)
+            else:
+                self._trace = trace
+
+    def _fetched(self, start, rows, done):
+        trace = self._trace
+        if trace is not None:
+            trace.seconds += time.perf_counter() - start
+            trace.rows += rows
+            if done:
+                self._finish()
+
+    def execute(self, sql, *args):
+        return self._run(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._run(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._run(super().executescript, sql)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors and shortcut methods are timed."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TracedCursor if query_trace.enabled else TimedCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def executescript(self, sql):
+        return self.cursor().executescript(sql)
+
+
+def _open_connection(path):
+    """Open a new tuned connection to ``path``."""
+    con = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+        factory=TimedConnection,
+    )
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        con.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    except sqlite3.DatabaseError:
+        pass
+    return con
+
+
+def connect(path):
+    """Open a plain connection to ``path`` whose statements are timed and traced.
+
+    For databases other than the main one (the per-class
+    ``_get_connection`` helpers of ``advertising_system``).
+    """
+    return sqlite3.connect(path, factory=TimedConnection)
+
+
+def _prune_dead_threads():
+    """Close connections owned by threads that already finished."""
+    alive = {t.ident for t in threading.enumerate()}
+    for ident in [i for i in _pool if i not in alive]:
+        try:
+            _pool.pop(ident).close()
+        except Exception:
+            pass
 
-_connection = None
-_connection_path = None
 
 def get_db_connection():
-    """Return a cached connection to the main database."""
-    global _connection, _connection_path
+    """Return the calling thread's connection to the main database.
 
-    if _connection is None or _connection_path != files.main_db:
-        if _connection is not None:
-            try:
-                _connection.close()
-            except Exception:
-                pass
-        _connection = sqlite3.connect(files.main_db, check_same_thread=False)
-        _connection_path = files.main_db
-    else:
+    Each worker thread gets its own connection so readers never queue
+    behind a writer sharing the same handle.  Connections are reopened when
+    ``files.main_db`` changes or after :func:`close_connection`.
+    """
+    con = getattr(_local, "connection", None)
+    path = getattr(_local, "path", None)
+
+    if con is not None and path == files.main_db:
         try:
-            _connection.cursor()
+            con.cursor()
+            return con
         except sqlite3.ProgrammingError:
-            _connection = sqlite3.connect(files.main_db, check_same_thread=False)
-            _connection_path = files.main_db
+            pass
+
+    if con is not None:
+        try:
+            con.close()
+        except Exception:
+            pass
+
+    con = _open_connection(files.main_db)
+    _local.connection = con
+    _local.path = files.main_db
+    with _pool_lock:
+        _prune_dead_threads()
+        _pool[threading.get_ident()] = con
+    return con
 
-    return _connection
 
 def close_connection():
-    """Close the cached database connection if it exists."""
-    global _connection, _connection_path
-    if _connection is not None:
-        _connection.close()
-        _connection = None
-        _connection_path = None
+    """Close every pooled database connection."""
+    with _pool_lock:
+        for con in _pool.values():
+            try:
+                con.close()
+            except Exception:
+                pass
+        _pool.clear()
+    _local.connection = None
+    _local.path = None
 
 atexit.register(close_connection)
 
 
+# ---------------------------------------------------------------------------
+# Versioned schema migrations
+# ---------------------------------------------------------------------------
+# ``PRAGMA user_version`` stores the last applied step.  Every step must be
+# idempotent and return ``False`` when it cannot complete yet (for example
+# because a table it depends on has not been created), in which case it is
+# retried on the next start.
+
+HOT_INDEXES = [
+    ("idx_goods_shop_name", "goods", "shop_id, name"),
+    ("idx_purchases_shop_ts", "purchases", "shop_id, timestamp"),
+    ("idx_purchases_user_shop", "purchases", "id, shop_id"),
+    ("idx_send_logs_shop_date", "send_logs", "shop_id, sent_date"),
+    ("idx_shop_users_shop_user", "shop_users", "shop_id, user_id"),
+]
+
+
+def _table_exists(cur, table):
+    cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    )
+    return cur.fetchone() is not None
+
+
+def ensure_hot_indexes(cur):
+    """Create the composite indexes for tables that already exist."""
+    for name, table, columns in HOT_INDEXES:
+        if _table_exists(cur, table):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def _migration_hot_indexes(cur):
+    """Index the per-shop lookups used by the catalog and dashboards.
+
+    Tables created later (``send_logs`` by the advertising setup) call
+    :func:`ensure_hot_indexes` themselves.
+    """
+    ensure_hot_indexes(cur)
+    return True
+
+
+def _migration_inventory_items(cur):
+    """Create the per-unit stock table used by :mod:`inventory`."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            product TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            claimed_at TEXT,
+            claimed_by INTEGER
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_inventory_available "
+        "ON inventory_items (shop_id, product, id) WHERE claimed_at IS NULL"
+    )
+    return True
+
+
+def _migration_broadcast_jobs(cur):
+    """Create the tables that checkpoint broadcasts (see :mod:`broadcast_jobs`)."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            admin_id INTEGER,
+            audience TEXT NOT NULL,
+            text TEXT,
+            media TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            PRIMARY KEY (job_id, chat_id)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status "
+        "ON broadcast_jobs (status)"
+    )
+    return True
+
+
+# Registros de usuarios: tabla -> archivo de texto del que se importan
+REGISTRY_TABLES = {
+    "bot_users": "users_list",
+    "blocked_users": "blockusers_list",
+    "bot_admins": "admins_list",
+}
+
+
+def import_registry_file(cur, table, path):
+    """Insert the numeric ids found in ``path`` into ``table``; return how many."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            ids = []
+            for line in f:
+                try:
+                    ids.append((int(line.strip()),))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return 0
+    if not ids:
+        return 0
+    cur.executemany(f"INSERT OR IGNORE INTO {table} (user_id) VALUES (?)", ids)
+    return max(cur.rowcount, 0)
+
+
+def _migration_registries(cur):
+    """Move the user, blocked-user and admin lists into indexed tables.
+
+    ``registry_counts`` is kept up to date by triggers so counting users
+    does not scan the table.  The old text files are imported once.
+    """
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS registry_counts (name TEXT PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0)"
+    )
+    for table, list_name in REGISTRY_TABLES.items():
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "user_id INTEGER PRIMARY KEY, "
+            "added_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cur.execute(
+            "INSERT OR IGNORE INTO registry_counts (name, total) VALUES (?, 0)",
+            (table,),
+        )
+        cur.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_insert AFTER INSERT ON {table} "
+            f"BEGIN UPDATE registry_counts SET total = total + 1 WHERE name = '{table}'; END"
+        )
+        cur.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_delete AFTER DELETE ON {table} "
+            f"BEGIN UPDATE registry_counts SET total = total - 1 WHERE name = '{table}'; END"
+        )
+        import_registry_file(cur, table, getattr(files, list_name))
+    return True
+
+
+# Búsqueda de productos: nombre y descripciones sin acentos ni mayúsculas,
+# con índices de prefijo; la tienda va en su propia columna para filtrar
+# por ella dentro del índice.
+PRODUCT_SEARCH_COLUMNS = ("name", "description", "additional_description")
+
+
+def _migration_product_search(cur):
+    """Create ``goods_fts`` and the triggers that keep it in sync with ``goods``.
+
+    When this SQLite build lacks FTS5 the step is skipped and
+    ``dop.search_products`` keeps using ``LIKE``.
+    """
+    if not _table_exists(cur, "goods"):
+        return False
+    cur.execute("PRAGMA table_info(goods)")
+    if "additional_description" not in {row[1] for row in cur.fetchall()}:
+        return False
+    try:
+        cur.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS goods_fts USING fts5("
+            "name, description, additional_description, shop, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except sqlite3.OperationalError as e:
+        logging.error(f"FTS5 no disponible, búsqueda sin índice: {e}")
+        return True
+    insert = (
+        "DELETE FROM goods_fts WHERE rowid = new.rowid; "
+        "INSERT INTO goods_fts (rowid, name, description, additional_description, shop) "
+        "VALUES (new.rowid, new.name, new.description, "
+        "COALESCE(new.additional_description, ''), CAST(new.shop_id AS TEXT));"
+    )
+    cur.execute(
+        f"CREATE TRIGGER IF NOT EXISTS trg_goods_fts_insert AFTER INSERT ON goods BEGIN {insert} END"
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_goods_fts_delete AFTER DELETE ON goods "
+        "BEGIN DELETE FROM goods_fts WHERE rowid = old.rowid; END"
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_goods_fts_update AFTER UPDATE OF "
+        "name, description, additional_description, shop_id ON goods "
+        f"BEGIN DELETE FROM goods_fts WHERE rowid = old.rowid; {insert} END"
+    )
+    cur.execute("DELETE FROM goods_fts")
+    cur.execute(
+        "INSERT INTO goods_fts (rowid, name, description, additional_description, shop) "
+        "SELECT rowid, name, description, COALESCE(additional_description, ''), "
+        "CAST(shop_id AS TEXT) FROM goods"
+    )
+    return True
+
+
+# Agregados diarios de ventas por tienda, mantenidos por triggers sobre
+# ``purchases`` para que los paneles lean O(días) filas en vez de O(compras).
+# Las compras sin fecha (bases antiguas) se acumulan en el día ``''``: cuentan
+# en los totales históricos y quedan fuera de cualquier rango de fechas.
+UNDATED_DAY = ""
+_SALES_DAY = "COALESCE(substr({row}.timestamp, 1, 10), '')"
+_SALES_SHOP = "COALESCE({row}.shop_id, 1)"
+
+
+def _sales_rollup_add(row):
+    day, shop = _SALES_DAY.format(row=row), _SALES_SHOP.format(row=row)
+    return f"""
+            INSERT INTO sales_daily (shop_id, day, revenue, orders)
+            VALUES ({shop}, {day}, COALESCE({row}.price, 0), 1)
+            ON CONFLICT (shop_id, day) DO UPDATE SET
+                revenue = revenue + excluded.revenue, orders = orders + 1;
+            INSERT OR IGNORE INTO sales_daily_buyers (shop_id, day, buyer_id)
+            SELECT {shop}, {day}, {row}.id WHERE {row}.id IS NOT NULL;
+            INSERT OR IGNORE INTO sales_buyers (shop_id, buyer_id)
+            SELECT {shop}, {row}.id WHERE {row}.id IS NOT NULL;
+    """
+
+
+def _sales_rollup_remove(row):
+    day, shop = _SALES_DAY.format(row=row), _SALES_SHOP.format(row=row)
+    return f"""
+            UPDATE sales_daily
+            SET revenue = revenue - COALESCE({row}.price, 0), orders = orders - 1
+            WHERE shop_id = {shop} AND day = {day};
+            DELETE FROM sales_daily_buyers
+            WHERE shop_id = {shop} AND day = {day} AND buyer_id = {row}.id
+              AND NOT EXISTS (
+                SELECT 1 FROM purchases p
+                WHERE p.id = {row}.id AND {_SALES_SHOP.format(row="p")} = {shop}
+                  AND {_SALES_DAY.format(row="p")} = {day});
+            DELETE FROM sales_buyers
+            WHERE shop_id = {shop} AND buyer_id = {row}.id
+              AND NOT EXISTS (
+                SELECT 1 FROM purchases p
+                WHERE p.id = {row}.id AND {_SALES_SHOP.format(row="p")} = {shop});
+            DELETE FROM sales_daily
+            WHERE shop_id = {shop} AND day = {day} AND orders <= 0;
+    """
+
+
+def _create_sales_rollup_triggers(cur):
+    """(Re)create the ``purchases`` triggers that keep the rollups current.
+
+    Edits are rolled up as the removal of the old row plus the insertion of
+    the new one, so fixing a price, shop or timestamp moves the sale.
+    """
+    for name in ("insert", "delete", "update"):
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_purchases_rollup_{name}")
+    cur.execute(
+        "CREATE TRIGGER trg_purchases_rollup_insert AFTER INSERT ON purchases "
+        f"BEGIN {_sales_rollup_add('new')} END"
+    )
+    cur.execute(
+        "CREATE TRIGGER trg_purchases_rollup_delete AFTER DELETE ON purchases "
+        f"BEGIN {_sales_rollup_remove('old')} END"
+    )
+    cur.execute(
+        "CREATE TRIGGER trg_purchases_rollup_update "
+        "AFTER UPDATE OF id, price, timestamp, shop_id ON purchases "
+        f"BEGIN {_sales_rollup_remove('old')} {_sales_rollup_add('new')} END"
+    )
+
+
+def _migration_sales_rollups(cur):
+    """Create ``sales_daily`` and the buyer sets it is derived from.
+
+    ``sales_daily`` holds revenue, orders and distinct buyers per shop and
+    day; ``sales_daily_buyers`` and ``sales_buyers`` keep the buyer ids so
+    distinct counts over several days stay exact.  Purchases without a
+    timestamp are rolled up under :data:`UNDATED_DAY`.
+    """
+    if not _table_exists(cur, "purchases"):
+        return False
+    cur.execute("PRAGMA table_info(purchases)")
+    if not {"id", "price", "timestamp", "shop_id"} <= {row[1] for row in cur.fetchall()}:
+        return False
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            shop_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            buyers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (shop_id, day)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_buyers (
+            shop_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            buyer_id INTEGER NOT NULL,
+            PRIMARY KEY (shop_id, day, buyer_id)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sales_buyers (
+            shop_id INTEGER NOT NULL,
+            buyer_id INTEGER NOT NULL,
+            PRIMARY KEY (shop_id, buyer_id)
+        ) WITHOUT ROWID
+        """
+    )
+    _create_sales_rollup_triggers(cur)
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_sales_daily_buyers_insert "
+        "AFTER INSERT ON sales_daily_buyers BEGIN "
+        "UPDATE sales_daily SET buyers = buyers + 1 "
+        "WHERE shop_id = new.shop_id AND day = new.day; END"
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_sales_daily_buyers_delete "
+        "AFTER DELETE ON sales_daily_buyers BEGIN "
+        "UPDATE sales_daily SET buyers = buyers - 1 "
+        "WHERE shop_id = old.shop_id AND day = old.day; END"
+    )
+    rebuild_sales_rollups(cur=cur)
+    return True
+
+
+def rebuild_sales_rollups(shop_id=None, cur=None):
+    """Recompute the sales rollups from ``purchases``.
+
+    Used by the migration and by ``migrate_sales_rollups.py`` to repair the
+    aggregates after editing purchases by hand.  Commits only when it opened
+    its own cursor.  Returns the number of ``sales_daily`` rows written.
+    """
+    own = cur is None
+    con = get_db_connection() if own else cur.connection
+    cur = cur or con.cursor()
+    where, params = "WHERE 1", []
+    if shop_id is not None:
+        where += " AND COALESCE(shop_id, 1) = ?"
+        params.append(shop_id)
+    day, shop = _SALES_DAY.format(row="purchases"), _SALES_SHOP.format(row="purchases")
+    try:
+        for table in ("sales_daily", "sales_daily_buyers", "sales_buyers"):
+            if shop_id is None:
+                cur.execute(f"DELETE FROM {table}")
+            else:
+                cur.execute(f"DELETE FROM {table} WHERE shop_id = ?", (shop_id,))
+        # Los triggers de sales_daily_buyers no deben sumar sobre lo recién calculado
+        cur.execute(
+            f"INSERT INTO sales_daily_buyers (shop_id, day, buyer_id) "
+            f"SELECT DISTINCT {shop}, {day}, id FROM purchases {where} AND id IS NOT NULL",
+            params,
+        )
+        cur.execute(
+            f"INSERT INTO sales_buyers (shop_id, buyer_id) "
+            f"SELECT DISTINCT {shop}, id FROM purchases {where} AND id IS NOT NULL",
+            params,
+        )
+        cur.execute(
+            f"""
+            INSERT INTO sales_daily (shop_id, day, revenue, orders, buyers)
+            SELECT {shop}, {day}, COALESCE(SUM(price), 0), COUNT(*), COUNT(DISTINCT id)
+            FROM purchases {where}
+            GROUP BY 1, 2
+            """,
+            params,
+        )
+        written = cur.rowcount
+        if own:
+            con.commit()
+        return written
+    except Exception:
+        if own and con.in_transaction:
+            con.rollback()
+        raise
+
+
+def _migration_sales_daily_day_index(cur):
+    """Index ``sales_daily`` by day for reports that span every shop."""
+    if not _table_exists(cur, "sales_daily"):
+        return False
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sales_daily_day "
+        "ON sales_daily(day, shop_id, revenue, orders)"
+    )
+    return True
+
+
+def ensure_schedule_fire_times(cur):
+    """Add ``campaign_schedules.next_fire_at`` and its index if missing.
+
+    ``campaign_schedules`` is created by ``init_db.py``/the advertising setup,
+    possibly after the migrations ran, so the advertising code calls this
+    before querying due schedules.  Returns False if the table does not
+    exist.
+    """
+    if not _table_exists(cur, "campaign_schedules"):
+        return False
+    cur.execute("PRAGMA table_info(campaign_schedules)")
+    if "next_fire_at" not in {row[1] for row in cur.fetchall()}:
+        cur.execute("ALTER TABLE campaign_schedules ADD COLUMN next_fire_at TEXT")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_campaign_schedules_due "
+        "ON campaign_schedules(is_active, next_fire_at)"
+    )
+    return True
+
+
+def ensure_data_version(cur, name, tables, update_of=None):
+    """Count the writes to ``tables`` in ``data_versions`` under ``name``.
+
+    Triggers bump the counter on every insert, update and delete, whatever
+    process makes them, so a long-running process can tell whether it must
+    reload by comparing one row (see :func:`get_data_version`) instead of
+    watching ``PRAGMA data_version``, which moves on any commit.  Returns
+    False while some of ``tables`` do not exist yet; call it again later.
+    With ``update_of`` only updates of those columns (the ones present in
+    each table) are counted.
+    """
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS data_versions ("
+        "name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+    )
+    cur.execute("INSERT OR IGNORE INTO data_versions (name) VALUES (?)", (name,))
+    complete = True
+    for table in tables:
+        if not _table_exists(cur, table):
+            complete = False
+            continue
+        events = ["INSERT", "UPDATE", "DELETE"]
+        if update_of:
+            cur.execute(f"PRAGMA table_info({table})")
+            present = {row[1] for row in cur.fetchall()}
+            events[1] = "UPDATE OF " + ", ".join(c for c in update_of if c in present)
+        for event in events:
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.split()[0].lower()} "
+                f"AFTER {event} ON {table} BEGIN "
+                f"UPDATE data_versions SET version = version + 1 WHERE name = '{name}'; END"
+            )
+    return complete
+
+
+def get_data_version(name, con=None):
+    """Return the write counter ``name`` of ``data_versions``, or ``None``."""
+    con = con or get_db_connection()
+    try:
+        row = con.execute(
+            "SELECT version FROM data_versions WHERE name = ?", (name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# Columnas que cambian qué se envía o cuándo; ``next_fire_at`` lo mueve el
+# propio planificador y no cuenta como cambio
+SCHEDULE_COLUMNS = (
+    "campaign_id", "schedule_json", "target_platforms", "is_active", "shop_id", "group_ids",
+)
+
+
+def ensure_schedule_version(cur):
+    """Count edits of ``campaign_schedules`` in ``data_versions``.
+
+    The advertising scheduler compares this counter on every poll and only
+    reloads its schedules when it moved.  Returns False if the table does
+    not exist.
+    """
+    return ensure_data_version(
+        cur, "campaign_schedules", ("campaign_schedules",), update_of=SCHEDULE_COLUMNS
+    )
+
+
+def _migration_schedule_fire_times(cur):
+    """Add the indexed next fire time of campaign schedules.
+
+    Values are filled in by the advertising scheduler the first time it
+    sees a schedule without one.
+    """
+    ensure_schedule_fire_times(cur)
+    return True
+
+
+def _has_sales_rollups(cur):
+    return _table_exists(cur, "sales_daily")
+
+
+_PRODUCT_ID = (
+    "(SELECT id FROM product_ids WHERE shop_id = {row}.shop_id AND name = {row}.name)"
+)
+
+
+def ensure_product_ids(cur):
+    """Create ``product_ids`` and the ``goods`` triggers that maintain it.
+
+    Product callback tokens carry ``product_ids.id`` instead of the implicit
+    ``goods.rowid``, which ``VACUUM`` and table rebuilds (such as
+    ``migrate_goods_unique_pair.py``) may renumber.  ``AUTOINCREMENT`` keeps
+    the id of a deleted product from being handed to a new one, so an old
+    button can never open a different product.  When ``goods_fts`` exists
+    it is re-keyed on the same ids.  Safe to call again after ``goods`` was
+    rebuilt; returns False if ``goods`` does not exist yet.
+    """
+    if not _table_exists(cur, "goods"):
+        return False
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_ids (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (shop_id, name)
+        )
+        """
+    )
+    cur.execute(
+        "INSERT OR IGNORE INTO product_ids (shop_id, name) "
+        "SELECT shop_id, name FROM goods ORDER BY rowid"
+    )
+    # Un único trigger por evento mantiene ids e índice de búsqueda, así el
+    # orden en que SQLite dispara los triggers no importa
+    fts = _table_exists(cur, "goods_fts")
+    add = "INSERT OR IGNORE INTO product_ids (shop_id, name) VALUES (new.shop_id, new.name);"
+    index = ""
+    unindex = ""
+    if fts:
+        new_id = _PRODUCT_ID.format(row="new")
+        old_id = _PRODUCT_ID.format(row="old")
+        index = (
+            f"DELETE FROM goods_fts WHERE rowid = {new_id}; "
+            "INSERT INTO goods_fts (rowid, name, description, additional_description, shop) "
+            f"VALUES ({new_id}, new.name, new.description, "
+            "COALESCE(new.additional_description, ''), CAST(new.shop_id AS TEXT));"
+        )
+        unindex = f"DELETE FROM goods_fts WHERE rowid = {old_id};"
+    for name in ("insert", "delete", "update"):
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_goods_fts_{name}")
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_goods_product_{name}")
+    cur.execute(
+        f"CREATE TRIGGER trg_goods_product_insert AFTER INSERT ON goods BEGIN {add} {index} END"
+    )
+    cur.execute(
+        f"CREATE TRIGGER trg_goods_product_delete AFTER DELETE ON goods BEGIN {unindex} "
+        "DELETE FROM product_ids WHERE shop_id = old.shop_id AND name = old.name; END"
+    )
+    cur.execute(
+        "CREATE TRIGGER trg_goods_product_update AFTER UPDATE OF "
+        "name, description, additional_description, shop_id ON goods "
+        f"BEGIN {unindex} "
+        "UPDATE OR IGNORE product_ids SET shop_id = new.shop_id, name = new.name "
+        "WHERE shop_id = old.shop_id AND name = old.name; "
+        f"{add} {index} END"
+    )
+    if fts:
+        cur.execute("DELETE FROM goods_fts")
+        cur.execute(
+            "INSERT INTO goods_fts (rowid, name, description, additional_description, shop) "
+            "SELECT p.id, g.name, g.description, COALESCE(g.additional_description, ''), "
+            "CAST(g.shop_id AS TEXT) FROM goods AS g "
+            "JOIN product_ids AS p ON p.shop_id = g.shop_id AND p.name = g.name"
+        )
+    return True
+
+
+def _migration_product_ids(cur):
+    """Give every product a stable id for callback tokens and search."""
+    return ensure_product_ids(cur)
+
+
+def _migration_sales_rollups_undated(cur):
+    """Roll up purchase edits and purchases without a timestamp.
+
+    Databases migrated before this step had no ``UPDATE`` trigger and left
+    undated purchases out of the all-time totals.
+    """
+    if not _table_exists(cur, "sales_daily"):
+        return _migration_sales_rollups(cur)
+    _create_sales_rollup_triggers(cur)
+    rebuild_sales_rollups(cur=cur)
+    return True
+
+
+def _migration_import_stock_files(cur):
+    """Move the lines of the ``data/goods/*.txt`` files into stock.
+
+    Lines appended later are imported when the product is next read (see
+    :func:`inventory.sync_stock_file`).
+    """
+    if not _table_exists(cur, "goods"):
+        return False
+    cur.execute("PRAGMA table_info(goods)")
+    if not {"stored", "manual_delivery"} <= {row[1] for row in cur.fetchall()}:
+        # Sin archivos de stock que importar
+        return True
+    import inventory
+
+    imported = inventory.import_stock_files(cur.connection)
+    if imported:
+        logging.info(f"Stock importado de archivos antiguos: {sum(imported.values())} unidades")
+    return True
+
+
+PAYMENT_TABLES = ("paypal_data", "binance_data")
+
+
+def _migration_payment_data_version(cur):
+    """Count writes to the payment credentials (see ``dop.get_paypaldata``).
+
+    The tables are created by ``init_db.py``; if they do not exist yet the
+    bot adds the triggers itself once they do.
+    """
+    ensure_data_version(cur, "payment_data", PAYMENT_TABLES)
+    return True
+
+
+def _migration_schedule_version(cur):
+    """Count schedule edits so the scheduler reloads only after one."""
+    ensure_schedule_version(cur)
+    return True
+
+
+MIGRATIONS = [
+    (1, _migration_hot_indexes),
+    (2, _migration_inventory_items),
+    (3, _migration_broadcast_jobs),
+    (4, _migration_registries),
+    (5, _migration_product_search),
+    (6, _migration_sales_rollups),
+    (7, _migration_sales_daily_day_index),
+    (8, _migration_schedule_fire_times),
+    (9, _migration_product_ids),
+    (10, _migration_sales_rollups_undated),
+    (11, _migration_import_stock_files),
+    (12, _migration_payment_data_version),
+    (13, _migration_schedule_version),
+]
+
+
+def get_schema_version(con=None):
+    """Return the schema version recorded in the database."""
+    con = con or get_db_connection()
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(con=None):
+    """Apply pending schema migrations and return the resulting version."""
+    con = con or get_db_connection()
+    cur = con.cursor()
+    version = get_schema_version(con)
+    for step, migration in MIGRATIONS:
+        if step <= version:
+            continue
+        try:
+            if not migration(cur):
+                break
+        except sqlite3.Error as e:
+            con.rollback()
+            logging.error(f"Error aplicando migración {step}: {e}")
+            break
+        cur.execute(f"PRAGMA user_version = {int(step)}")
+        con.commit()
+        version = step
+    return version
+
+
 def get_user_role(user_id):
     """Return the role for a given user id."""
     try:
@@ -45,22 +914,22 @@ def get_user_role(user_id):
     except Exception:
         return "user"
 
+    admins = cache.get_or_load("admins", ("ids", config.admin_id), _load_admin_ids)
+    return "superadmin" if uid in admins else "user"
+
+
+def _load_admin_ids():
     admins = set()
     try:
         admins.add(int(config.admin_id))
     except Exception:
         pass
     try:
-        with open(files.admins_list, encoding="utf-8") as f:
-            for line in f:
-                try:
-                    admins.add(int(line.strip()))
-                except ValueError:
-                    continue
-    except Exception:
+        rows = get_db_connection().execute("SELECT user_id FROM bot_admins").fetchall()
+        admins.update(row[0] for row in rows)
+    except sqlite3.Error:
         pass
-
-    return "superadmin" if uid in admins else "user"
+    return frozenset(admins)
 
 
 def get_user_stores(user_id):
@@ -183,25 +1052,52 @@ def get_store_overview(store_id):
     return overview
 
 
+def _day_bounds():
+    """Return ISO bounds for today and the current month.
+
+    Purchases store ISO-8601 timestamps in local time, so half-open string
+    ranges select the same rows as ``DATE(timestamp)`` while still being
+    able to use the ``(shop_id, timestamp)`` index.
+    """
+    today = date.today()
+    month_start = today.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return (
+        (today.isoformat(), (today + timedelta(days=1)).isoformat()),
+        (month_start.isoformat(), next_month.isoformat()),
+    )
+
+
 def get_sales_metrics(store_id):
     """Return sales totals for today, this month and overall."""
     stats = {"today": 0, "month": 0, "total": 0}
     try:
         con = get_db_connection()
         cur = con.cursor()
+        day, month = _day_bounds()
+        if _has_sales_rollups(cur):
+            cur.execute(
+                "SELECT COALESCE(SUM(revenue),0), "
+                "COALESCE(SUM(CASE WHEN day>=? AND day<? THEN revenue END),0), "
+                "COALESCE(SUM(CASE WHEN day>=? AND day<? THEN revenue END),0) "
+                "FROM sales_daily WHERE shop_id=?",
+                (*day, *month, store_id),
+            )
+            stats["total"], stats["today"], stats["month"] = cur.fetchone()
+            return stats
         cur.execute(
             "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=?",
             (store_id,),
         )
         stats["total"] = cur.fetchone()[0] or 0
         cur.execute(
-            "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=? AND DATE(timestamp)=DATE('now','localtime')",
-            (store_id,),
+            "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=? AND timestamp>=? AND timestamp<?",
+            (store_id, *day),
         )
         stats["today"] = cur.fetchone()[0] or 0
         cur.execute(
-            "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=? AND strftime('%Y-%m',timestamp)=strftime('%Y-%m','now','localtime')",
-            (store_id,),
+            "SELECT COALESCE(SUM(price),0) FROM purchases WHERE shop_id=? AND timestamp>=? AND timestamp<?",
+            (store_id, *month),
         )
         stats["month"] = cur.fetchone()[0] or 0
     except Exception:
@@ -215,19 +1111,35 @@ def get_user_metrics(store_id):
     try:
         con = get_db_connection()
         cur = con.cursor()
+        day, month = _day_bounds()
+        if _has_sales_rollups(cur):
+            cur.execute("SELECT COUNT(*) FROM sales_buyers WHERE shop_id=?", (store_id,))
+            stats["total"] = cur.fetchone()[0]
+            cur.execute(
+                "SELECT COALESCE(SUM(buyers),0) FROM sales_daily WHERE shop_id=? AND day=?",
+                (store_id, day[0]),
+            )
+            stats["today"] = cur.fetchone()[0]
+            cur.execute(
+                "SELECT COUNT(DISTINCT buyer_id) FROM sales_daily_buyers "
+                "WHERE shop_id=? AND day>=? AND day<?",
+                (store_id, *month),
+            )
+            stats["month"] = cur.fetchone()[0]
+            return stats
         cur.execute(
             "SELECT COUNT(DISTINCT id) FROM purchases WHERE shop_id=?",
             (store_id,),
         )
         stats["total"] = cur.fetchone()[0] or 0
         cur.execute(
-            "SELECT COUNT(DISTINCT id) FROM purchases WHERE shop_id=? AND DATE(timestamp)=DATE('now','localtime')",
-            (store_id,),
+            "SELECT COUNT(DISTINCT id) FROM purchases WHERE shop_id=? AND timestamp>=? AND timestamp<?",
+            (store_id, *day),
         )
         stats["today"] = cur.fetchone()[0] or 0
         cur.execute(
-            "SELECT COUNT(DISTINCT id) FROM purchases WHERE shop_id=? AND strftime('%Y-%m',timestamp)=strftime('%Y-%m','now','localtime')",
-            (store_id,),
+            "SELECT COUNT(DISTINCT id) FROM purchases WHERE shop_id=? AND timestamp>=? AND timestamp<?",
+            (store_id, *month),
         )
         stats["month"] = cur.fetchone()[0] or 0
     except Exception:
@@ -240,14 +1152,26 @@ def get_user_timeseries(store_id=None, days=7):
     con = get_db_connection()
     cur = con.cursor()
     params = []
-    query = (
-        "SELECT substr(timestamp,1,10) AS day, COUNT(DISTINCT id) AS users "
-        "FROM purchases"
-    )
-    if store_id is not None:
-        query += " WHERE shop_id=?"
-        params.append(store_id)
-    query += " GROUP BY day ORDER BY day DESC LIMIT ?"
+    if _has_sales_rollups(cur):
+        if store_id is not None:
+            query = "SELECT day, buyers FROM sales_daily WHERE shop_id=? AND day<>?"
+            params += [store_id, UNDATED_DAY]
+        else:
+            query = (
+                "SELECT day, COUNT(DISTINCT buyer_id) FROM sales_daily_buyers "
+                "WHERE day<>? GROUP BY day"
+            )
+            params.append(UNDATED_DAY)
+        query += " ORDER BY day DESC LIMIT ?"
+    else:
+        query = (
+            "SELECT substr(timestamp,1,10) AS day, COUNT(DISTINCT id) AS users "
+            "FROM purchases"
+        )
+        if store_id is not None:
+            query += " WHERE shop_id=?"
+            params.append(store_id)
+        query += " GROUP BY day ORDER BY day DESC LIMIT ?"
     params.append(days)
     try:
         cur.execute(query, params)
@@ -417,12 +1341,16 @@ def get_sales_timeseries(store_id=None, days=7):
     con = get_db_connection()
     cur = con.cursor()
     params = []
-    query = (
-        "SELECT substr(timestamp,1,10) AS day, COALESCE(SUM(price),0) AS total "
-        "FROM purchases"
-    )
+    if _has_sales_rollups(cur):
+        query = "SELECT day, SUM(revenue) AS total FROM sales_daily WHERE day<>?"
+        params.append(UNDATED_DAY)
+    else:
+        query = (
+            "SELECT substr(timestamp,1,10) AS day, COALESCE(SUM(price),0) AS total "
+            "FROM purchases WHERE 1"
+        )
     if store_id is not None:
-        query += " WHERE shop_id=?"
+        query += " AND shop_id=?"
         params.append(store_id)
     query += " GROUP BY day ORDER BY day DESC LIMIT ?"
     params.append(days)
@@ -435,6 +1363,81 @@ def get_sales_timeseries(store_id=None, days=7):
         return []
 
 
+def get_revenue_by_shop():
+    """Return ``{shop_id: revenue}`` for every shop with sales."""
+    con = get_db_connection()
+    cur = con.cursor()
+    try:
+        if _has_sales_rollups(cur):
+            cur.execute("SELECT shop_id, SUM(revenue) FROM sales_daily GROUP BY shop_id")
+        else:
+            cur.execute("SELECT shop_id, COALESCE(SUM(price),0) FROM purchases GROUP BY shop_id")
+        return {sid: total or 0 for sid, total in cur.fetchall()}
+    except Exception:
+        return {}
+
+
+def get_shop_sales_buckets(start=None, end=None, prev_start=None, prev_end=None,
+                           trend_start=None, trend_days=7, buckets=7):
+    """Return per-shop sales for a period in one grouped query.
+
+    Yields one ``(shop_id, name, bucket, revenue, orders)`` row per shop and
+    bucket: ``0..buckets-1`` split the ``trend_days`` days from
+    ``trend_start`` evenly, ``-1`` is the comparison range
+    ``prev_start..prev_end`` and ``buckets`` holds the rest of the period
+    (only used when the period is longer than the trend).  Shops without
+    sales get a single row with ``bucket`` set to ``None``.  Days are
+    ``YYYY-MM-DD`` strings and ``start=None`` means no lower bound.
+    """
+    con = get_db_connection()
+    cur = con.cursor()
+    try:
+        if _has_sales_rollups(cur):
+            source = "SELECT shop_id, day, revenue, orders FROM sales_daily"
+        else:
+            source = (
+                "SELECT shop_id, substr(timestamp,1,10) AS day, "
+                "COALESCE(SUM(price),0) AS revenue, COUNT(*) AS orders "
+                "FROM purchases GROUP BY shop_id, day"
+            )
+        params = {
+            "start": start, "end": end, "prev_start": prev_start, "prev_end": prev_end,
+            "trend_start": trend_start or start, "trend_days": max(int(trend_days), 1),
+            "buckets": int(buckets),
+        }
+        current = "day BETWEEN :start AND :end" if start is not None else "1"
+        previous = (
+            "day BETWEEN :prev_start AND :prev_end" if prev_start is not None else "0"
+        )
+        cur.execute(
+            f"""
+            SELECT s.id, s.name, t.bucket, t.revenue, t.orders
+            FROM shops s
+            LEFT JOIN (
+                SELECT shop_id,
+                       CASE
+                           WHEN {previous} THEN -1
+                           WHEN day >= :trend_start AND day <= :end THEN
+                               CAST((julianday(day) - julianday(:trend_start))
+                                    * :buckets / :trend_days AS INTEGER)
+                           ELSE :buckets
+                       END AS bucket,
+                       SUM(revenue) AS revenue,
+                       SUM(orders) AS orders
+                FROM ({source})
+                WHERE ({current}) OR ({previous})
+                GROUP BY shop_id, bucket
+            ) t ON t.shop_id = s.id
+            ORDER BY s.id
+            """,
+            params,
+        )
+        return cur.fetchall()
+    except Exception as e:
+        logging.error(f"Error obteniendo ventas por tienda: {e}")
+        return []
+
+
 def get_campaign_timeseries(store_id=None, days=7):
     """Return daily campaign send counts for the last ``days`` days."""
     con = get_db_connection()
@@ -467,9 +1470,17 @@ def get_global_metrics():
     con = get_db_connection()
     cur = con.cursor()
 
+    try:
+        rollups = _has_sales_rollups(cur)
+    except Exception:
+        rollups = False
+
     # Total revenue across all purchases
     try:
-        cur.execute("SELECT COALESCE(SUM(price),0) FROM purchases")
+        if rollups:
+            cur.execute("SELECT COALESCE(SUM(revenue),0) FROM sales_daily")
+        else:
+            cur.execute("SELECT COALESCE(SUM(price),0) FROM purchases")
         revenue = cur.fetchone()[0] or 0
     except Exception:
         revenue = 0
@@ -490,19 +1501,30 @@ def get_global_metrics():
     # Ranking of shops by revenue
     ranking = []
     try:
-        cur.execute(
-            "SELECT shop_id, COALESCE(SUM(price),0) AS total "
-            "FROM purchases GROUP BY shop_id ORDER BY total DESC LIMIT 5"
-        )
+        if rollups:
+            cur.execute(
+                "SELECT shop_id, COALESCE(SUM(revenue),0) AS total "
+                "FROM sales_daily GROUP BY shop_id ORDER BY total DESC LIMIT 5"
+            )
+        else:
+            cur.execute(
+                "SELECT shop_id, COALESCE(SUM(price),0) AS total "
+                "FROM purchases GROUP BY shop_id ORDER BY total DESC LIMIT 5"
+            )
         rows = cur.fetchall()
-        for sid, total_rev in rows:
+        names = {}
+        if rows:
             try:
-                cur.execute("SELECT name FROM shops WHERE id=?", (sid,))
-                name_row = cur.fetchone()
-                name = name_row[0] if name_row else str(sid)
+                placeholders = ",".join("?" * len(rows))
+                cur.execute(
+                    f"SELECT id, name FROM shops WHERE id IN ({placeholders})",
+                    [sid for sid, _ in rows],
+                )
+                names = dict(cur.fetchall())
             except Exception:
-                name = str(sid)
-            ranking.append({"shop_id": sid, "name": name, "total": total_rev})
+                names = {}
+        for sid, total_rev in rows:
+            ranking.append({"shop_id": sid, "name": names.get(sid) or str(sid), "total": total_rev})
     except Exception:
         ranking = []
 
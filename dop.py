@@ -1,13 +1,21 @@
-import telebot, shelve, datetime, sqlite3, random, os, re
+import telebot, datetime, sqlite3, random, os, re
 import files, config
+import state_store
 import db
+import inventory
+import broadcast_engine
+import cache
+import user_registry
 from bot_instance import bot
 import logging
+import threading
+import time
 
 logging.basicConfig(level=logging.INFO)
 
 # Flag to avoid repeated logging when initializing discounts
 _discount_initialized = False
+_discount_ready_db = None
 
 
 def _slugify(name):
@@ -343,6 +351,9 @@ def ensure_database_schema():
         if updated:
             con.commit()
         con.commit()
+
+        # Pasos versionados (índices, tablas auxiliares) registrados en db.py
+        db.apply_migrations(con)
     except Exception as e:
         logging.error(f"Error asegurando esquema de base de datos: {e}")
 ensure_database_schema()
@@ -436,7 +447,7 @@ def log(text):
 
 def check_message(message):
     try:
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             if message in bd:
                 return True
             else:
@@ -446,39 +457,25 @@ def check_message(message):
         return False
 
 def get_adminlist():
+    return list(cache.get_or_load('admins', ('list', config.admin_id), _load_adminlist))
+
+
+def _load_adminlist():
     admins_list = [config.admin_id]  # Siempre incluir el admin principal
-    cleaned = []
-    dirty = False
-    try:
-        with open(files.admins_list, encoding='utf-8') as f:
-            for admin_id in f.readlines():
-                try:
-                    admin_id = int(admin_id.strip())
-                    if admin_id not in admins_list:
-                        admins_list.append(admin_id)
-                    cleaned.append(f"{admin_id}\n")
-                except Exception as e:
-                    logging.error(f"Error leyendo id de admin: {e}")
-                    dirty = True
-        if dirty:
-            with open(files.admins_list, 'w', encoding='utf-8') as f:
-                f.writelines(cleaned)
+    try:
+        for admin_id in user_registry.iter_members(user_registry.ADMINS):
+            if admin_id not in admins_list:
+                admins_list.append(admin_id)
     except Exception as e:
         logging.error(f"Error obteniendo lista de admins: {e}")
-        pass
     return admins_list
 
 def user_loger(chat_id=0):
     if chat_id != 0:
         try:
-            with open(files.users_list, encoding='utf-8') as f:
-                if not str(chat_id) in f.read():
-                    with open(files.users_list, 'a', encoding='utf-8') as f:
-                        f.write(str(chat_id) + '\n')
+            user_registry.add(user_registry.USERS, chat_id)
         except Exception as e:
             logging.error(f"Error registrando usuario: {e}")
-            with open(files.users_list, 'w', encoding='utf-8') as f:
-                f.write(str(chat_id) + '\n')
         try:
             # Registrar o actualizar la tienda del usuario solo si ya existe
             if user_has_shop(chat_id):
@@ -488,8 +485,7 @@ def user_loger(chat_id=0):
             logging.error(f"Error updating user shop: {e}")
 
     try:
-        with open(files.users_list, encoding='utf-8') as f:
-            return len(f.readlines())
+        return user_registry.count(user_registry.USERS)
     except Exception as e:
         logging.error(f"Error contando usuarios: {e}")
         return 0
@@ -523,35 +519,79 @@ def get_productcatalog(shop_id=1):
         logging.error(f"Error obteniendo catálogo: {e}")
         return None
 
+def catalog_changed(shop_id):
+    """Olvidar la lista de productos y las páginas del catálogo de una tienda."""
+    cache.invalidate('goods', shop_id)
+    cache.invalidate_where('catalog', lambda key: key[0] == shop_id)
+
 def get_goods(shop_id=1):
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute("SELECT name FROM goods WHERE shop_id = ?;", (shop_id,))
-        goods = []
-        for row in cursor.fetchall():
-            goods.append(row[0])
-        return goods
+        return list(cache.get_or_load('goods', shop_id, lambda: _load_goods(shop_id)))
     except Exception as e:
         logging.error(f"Error obteniendo productos: {e}")
         return []
 
-def list_products_by_category(cat_id=None, shop_id=1):
-    """Return product names filtered by category for a shop."""
+def _load_goods(shop_id):
+    con = db.get_db_connection()
+    cursor = con.cursor()
+    cursor.execute("SELECT name FROM goods WHERE shop_id = ?;", (shop_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+def get_product_id(name_good, shop_id=1):
+    """Return the id used in product callback tokens, or ``None``."""
+    try:
+        row = db.get_db_connection().execute(
+            "SELECT id FROM product_ids WHERE name = ? AND shop_id = ?;",
+            (name_good, shop_id),
+        ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logging.error(f"Error obteniendo id de producto: {e}")
+        return None
+
+def get_product_by_id(product_id):
+    """Return ``(name, shop_id)`` for a product id, or ``None``.
+
+    Ids come from ``product_ids`` and are never reused, so the id of a
+    deleted product resolves to ``None`` rather than to another product.
+    """
+    try:
+        row = db.get_db_connection().execute(
+            "SELECT g.name, g.shop_id FROM product_ids AS p "
+            "JOIN goods AS g ON g.shop_id = p.shop_id AND g.name = p.name "
+            "WHERE p.id = ?;",
+            (int(product_id),),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    except Exception as e:
+        logging.error(f"Error obteniendo producto {product_id}: {e}")
+        return None
+
+def list_products_by_category(cat_id=None, shop_id=1, with_ids=False):
+    """Return product names filtered by category for a shop.
+
+    With ``with_ids`` the items are ``(product_id, name)`` pairs.
+    """
     try:
         con = db.get_db_connection()
         cursor = con.cursor()
         if cat_id is None:
             cursor.execute(
-                "SELECT name FROM goods WHERE shop_id = ?;",
+                "SELECT p.id, g.name FROM goods AS g "
+                "JOIN product_ids AS p ON p.shop_id = g.shop_id AND p.name = g.name "
+                "WHERE g.shop_id = ?;",
                 (shop_id,)
             )
         else:
             cursor.execute(
-                "SELECT name FROM goods WHERE shop_id = ? AND category_id = ?;",
+                "SELECT p.id, g.name FROM goods AS g "
+                "JOIN product_ids AS p ON p.shop_id = g.shop_id AND p.name = g.name "
+                "WHERE g.shop_id = ? AND g.category_id = ?;",
                 (shop_id, cat_id),
             )
-        return [row[0] for row in cursor.fetchall()]
+        if with_ids:
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+        return [row[1] for row in cursor.fetchall()]
     except Exception as e:
         logging.error(f"Error listando productos por categoría: {e}")
         return []
@@ -645,6 +685,7 @@ def assign_product_category(product, category_id, shop_id=1):
             (category_id, product, shop_id),
         )
         con.commit()
+        catalog_changed(shop_id)
         return True
     except Exception as e:
         logging.error(f"Error asignando categoría: {e}")
@@ -743,30 +784,52 @@ def set_manual_stock(name_good, quantity, shop_id=1):
 
 
 def amount_of_goods(name_good, shop_id=1):
-    if is_manual_delivery(name_good, shop_id):
-        return get_manual_stock(name_good, shop_id)
-    stored = get_stored(name_good, shop_id)
-    if not stored:
-        return 0
     try:
-        with open(stored, encoding='utf-8') as f:
-            lines = f.readlines()
-            return len([line for line in lines if line.strip()])
+        con = db.get_db_connection()
+        cursor = con.cursor()
+        cursor.execute(
+            "SELECT manual_delivery, manual_stock, stored FROM goods WHERE name = ? AND shop_id = ?",
+            (name_good, shop_id),
+        )
+        row = cursor.fetchone()
     except Exception as e:
         logging.error(f"Error contando items en almacen: {e}")
         return 0
+    if not row:
+        return 0
+    manual, manual_stock, stored = row
+    if manual:
+        return int(manual_stock) if manual_stock is not None else 0
+    inventory.sync_stock_file(shop_id, name_good, stored)
+    return inventory.count_available(shop_id, name_good)
 
 def get_stock_overview(shop_id=1):
     """Return a list with stock summary lines for all products."""
     try:
         con = db.get_db_connection()
         cursor = con.cursor()
-        cursor.execute("SELECT name, price FROM goods WHERE shop_id = ?;", (shop_id,))
+        cursor.execute(
+            "SELECT name, stored FROM goods WHERE shop_id = ? AND COALESCE(manual_delivery, 0) = 0",
+            (shop_id,),
+        )
+        for name, stored in cursor.fetchall():
+            inventory.sync_stock_file(shop_id, name, stored)
+
+        cursor.execute(
+            """
+            SELECT g.name, g.price, g.manual_delivery, g.manual_stock,
+                   (SELECT COUNT(*) FROM inventory_items i
+                     WHERE i.shop_id = g.shop_id AND i.product = g.name
+                       AND i.claimed_at IS NULL)
+            FROM goods g WHERE g.shop_id = ?
+            """,
+            (shop_id,),
+        )
         goods = cursor.fetchall()
 
         overview = []
-        for i, (name, price) in enumerate(goods, start=1):
-            count = amount_of_goods(name, shop_id)
+        for i, (name, price, manual, manual_stock, available) in enumerate(goods, start=1):
+            count = (manual_stock or 0) if manual else available
             overview.append(f"{i}. {name} — {count} unidades (${price} USD)")
 
         return overview
@@ -827,7 +890,7 @@ def normal_read_line(filename, linenumber):
 
 def get_sost(chat_id):
     try:
-        with shelve.open(files.sost_bd) as bd:
+        with state_store.open_store(files.sost_bd) as bd:
             return str(chat_id) in bd
     except Exception as e:
         logging.error(f"Error verificando sost para {chat_id}: {e}")
@@ -835,7 +898,7 @@ def get_sost(chat_id):
 
 def check_vklpayments(name):
     try:
-        with shelve.open(files.payments_bd) as bd: 
+        with state_store.open_store(files.payments_bd) as bd: 
             return bd.get(name, '❌')
     except Exception as e:
         logging.error(f"Error verificando pago habilitado {name}: {e}")
@@ -883,66 +946,30 @@ def get_amountsbayers(shop_id=1):
 
 def get_amountblock():
     try:
-        with open(files.blockusers_list, encoding='utf-8') as f: 
-            return len(f.readlines())
+        return user_registry.count(user_registry.BLOCKED)
     except Exception as e:
         logging.error(f"Error contando usuarios bloqueados: {e}")
         return 0
 
 def new_blockuser(his_id):
     try:
-        with open(files.blockusers_list, 'a', encoding='utf-8') as f: 
-            f.write(str(his_id) + '\n')
+        user_registry.add(user_registry.BLOCKED, his_id)
     except Exception as e:
-        logging.error(f"Error eliminando id de archivo {file}: {e}")
+        logging.error(f"Error registrando usuario bloqueado: {e}")
         pass
 
-def rasl(group, amount, text, shop_id=1):
-    good_send = 0
-    lose_send = 0
-    i = 0
-    
+def rasl(group, amount, text, shop_id=1, progress=None):
     if group == 'all':
-        try:
-            with open(files.users_list, encoding='utf-8') as f:
-                users = f.readlines()
-            
-            while i < int(amount) and i < len(users):
-                chat_id = int(users[i].strip())
-                try:
-                    bot.send_message(chat_id, text)
-                    good_send += 1
-                except Exception as e:
-                    lose_send += 1
-                    logging.error(f"Error enviando mensaje a {chat_id}: {e}")
-                    new_blockuser(chat_id)
-                i += 1
-        except Exception as e:
-            logging.error(f"Error enviando mensajes a todos: {e}")
-    
-    elif group == 'buyers':
-        try:
-            con = db.get_db_connection()
-            cursor = con.cursor()
-            cursor.execute(
-                "SELECT id FROM buyers WHERE shop_id = ? LIMIT ?;",
-                (shop_id, int(amount))
-            )
-            buyers = cursor.fetchall()
-            
-            for buyer in buyers:
-                chat_id = int(buyer[0])
-                try:
-                    bot.send_message(chat_id, text)
-                    good_send += 1
-                except Exception as e:
-                    lose_send += 1
-                    logging.error(f"Error enviando mensaje a comprador {chat_id}: {e}")
-                    new_blockuser(chat_id)
-        except Exception as e:
-            logging.error(f"Error obteniendo compradores: {e}")
-
-    return f'¡{good_send} usuarios recibieron el mensaje exitosamente!\n{lose_send} usuarios bloquearon el bot y fueron agregados a la lista de usuarios bloqueados'
+        recipients = user_registry.iter_members(user_registry.USERS, amount)
+    else:
+        recipients = broadcast_engine.iter_audience('buyers', shop_id, amount)
+    result = broadcast_engine.get_engine().run(
+        recipients,
+        lambda chat_id: bot.send_message(chat_id, text),
+        on_progress=progress,
+        on_blocked=new_blockuser,
+    )
+    return result.as_text()
 
 
 def _send_media_message(chat_id, text, media):
@@ -965,66 +992,45 @@ def _send_media_message(chat_id, text, media):
         bot.send_message(chat_id, text)
 
 
-def broadcast_message(group, amount, text, media=None, shop_id=1):
-    """Enviar un anuncio masivo a usuarios o compradores."""
-    good_send = 0
-    lose_send = 0
-    i = 0
+def broadcast_message(group, amount, text, media=None, shop_id=1, progress=None):
+    """Enviar un anuncio masivo a usuarios o compradores.
 
-    if group == 'all':
-        try:
-            con = db.get_db_connection()
-            cursor = con.cursor()
-            cursor.execute(
-                "SELECT user_id FROM shop_users WHERE shop_id = ? LIMIT ?;",
-                (shop_id, int(amount)),
-            )
-            users = cursor.fetchall()
-
-            while i < len(users) and i < int(amount):
-                chat_id = int(users[i][0])
-                try:
-                    if media:
-                        _send_media_message(chat_id, text, media)
-                    else:
-                        bot.send_message(chat_id, text)
-                    good_send += 1
-                except Exception as e:
-                    lose_send += 1
-                    logging.error(f"Error sending message to {chat_id}: {e}")
-                    new_blockuser(chat_id)
-                i += 1
-        except Exception as e:
-            logging.error(f"Error sending broadcast to all users: {e}")
+    Los envíos se reparten en el motor de difusión, que respeta los límites
+    de Telegram; ``progress`` recibe el resultado parcial tras cada envío.
+    """
+    def send(chat_id):
+        if media:
+            _send_media_message(chat_id, text, media)
+        else:
+            bot.send_message(chat_id, text)
 
-    elif group == 'buyers':
-        try:
-            con = db.get_db_connection()
-            cursor = con.cursor()
-            cursor.execute(
-                "SELECT id FROM buyers WHERE shop_id = ? LIMIT ?;",
-                (shop_id, int(amount))
-            )
-            buyers = cursor.fetchall()
-
-            for buyer in buyers:
-                chat_id = int(buyer[0])
-                try:
-                    if media:
-                        _send_media_message(chat_id, text, media)
-                    else:
-                        bot.send_message(chat_id, text)
-                    good_send += 1
-                except Exception as e:
-                    lose_send += 1
-                    logging.error(f"Error enviando mensaje a comprador {chat_id}: {e}")
-                    new_blockuser(chat_id)
-        except Exception as e:
-            logging.error(f"Error obteniendo compradores para broadcast: {e}")
+    try:
+        recipients = broadcast_engine.iter_audience(group, shop_id, amount)
+        result = broadcast_engine.get_engine().run(
+            recipients, send, on_progress=progress, on_blocked=new_blockuser
+        )
+    except Exception as e:
+        logging.error(f"Error enviando difusión: {e}")
+        result = broadcast_engine.BroadcastResult()
+    return result.as_text()
 
-    return f'¡{good_send} usuarios recibieron el mensaje exitosamente!\n{lose_send} usuarios bloquearon el bot y fueron agregados a la lista de usuarios bloqueados'
+def _registry_for(file):
+    """Registro que reemplaza a una de las antiguas listas de texto."""
+    for registry, list_name in db.REGISTRY_TABLES.items():
+        if file == getattr(files, list_name):
+            return registry
+    return None
 
 def del_id(file, chat_id):
+    registry = _registry_for(file)
+    if registry:
+        try:
+            user_registry.remove(registry, chat_id)
+            if registry == user_registry.ADMINS:
+                cache.invalidate('admins')
+        except Exception as e:
+            logging.error(f"Error eliminando id del registro {registry}: {e}")
+        return
     try:
         text = ''
         with open(file, encoding='utf-8') as f:
@@ -1040,11 +1046,8 @@ def del_id(file, chat_id):
 
 def new_admin(his_id):
     try:
-        with open(files.admins_list, encoding='utf-8') as f:
-            content = f.read()
-        if str(his_id) not in content:
-            with open(files.admins_list, 'a', encoding='utf-8') as f:
-                f.write(str(his_id) + '\n')
+        user_registry.add(user_registry.ADMINS, his_id)
+        cache.invalidate('admins')
         con = db.get_db_connection()
         cur = con.cursor()
         cur.execute(
@@ -1054,8 +1057,7 @@ def new_admin(his_id):
         con.commit()
     except Exception as e:
         logging.error(f"Error agregando nuevo admin: {e}")
-        with open(files.admins_list, 'w', encoding='utf-8') as f:
-            f.write(str(his_id) + '\n')
+        cache.invalidate('admins')
 
 def get_shop_id(admin_id):
     """Obtener el ID de tienda asociado a un admin."""
@@ -1182,6 +1184,7 @@ def update_shop_info(shop_id, description=None, media_file_id=None, media_type=N
         params.append(shop_id)
         cur.execute(f"UPDATE shops SET {', '.join(updates)} WHERE id = ?", params)
         con.commit()
+        cache.invalidate('shop_info', shop_id)
         return cur.rowcount > 0
     except Exception as e:
         logging.error(f"Error actualizando información de tienda: {e}")
@@ -1190,32 +1193,38 @@ def update_shop_info(shop_id, description=None, media_file_id=None, media_type=N
 def get_shop_info(shop_id):
     """Obtener descripción, multimedia y botones de una tienda."""
     try:
-        con = db.get_db_connection()
-        cur = con.cursor()
-        cur.execute(
-            """
-            SELECT description, media_file_id, media_type,
-                   button1_text, button1_url, button2_text, button2_url
-            FROM shops WHERE id = ?
-            """,
-            (shop_id,),
-        )
-        row = cur.fetchone()
-        if row:
-            return {
-                'description': row[0],
-                'media_file_id': row[1],
-                'media_type': row[2],
-                'button1_text': row[3],
-                'button1_url': row[4],
-                'button2_text': row[5],
-                'button2_url': row[6],
-            }
-        return None
+        info = cache.get_or_load('shop_info', shop_id, lambda: _load_shop_info(shop_id))
+        return dict(info) if info else None
     except Exception as e:
         logging.error(f"Error obteniendo información de tienda: {e}")
         return None
 
+
+def _load_shop_info(shop_id):
+    con = db.get_db_connection()
+    cur = con.cursor()
+    cur.execute(
+        """
+        SELECT description, media_file_id, media_type,
+               button1_text, button1_url, button2_text, button2_url
+        FROM shops WHERE id = ?
+        """,
+        (shop_id,),
+    )
+    row = cur.fetchone()
+    if row:
+        return {
+            'description': row[0],
+            'media_file_id': row[1],
+            'media_type': row[2],
+            'button1_text': row[3],
+            'button1_url': row[4],
+            'button2_text': row[5],
+            'button2_url': row[6],
+        }
+    return None
+
+
 def get_campaign_limit(shop_id):
     """Obtener el límite de campañas para una tienda."""
     try:
@@ -1257,6 +1266,7 @@ def set_user_shop(user_id, shop_id):
             (int(user_id), int(shop_id)),
         )
         con.commit()
+        cache.invalidate('user_shop', int(user_id))
     except Exception as e:
         logging.error(f"Error setting user shop: {e}")
 
@@ -1264,18 +1274,22 @@ def set_user_shop(user_id, shop_id):
 def get_user_shop(user_id):
     """Obtener la tienda seleccionada por un usuario (por defecto 1)."""
     try:
-        con = db.get_db_connection()
-        cur = con.cursor()
-        cur.execute(
-            "SELECT shop_id FROM shop_users WHERE user_id = ?",
-            (int(user_id),),
-        )
-        row = cur.fetchone()
-        return int(row[0]) if row else 1
+        uid = int(user_id)
+        return cache.get_or_load('user_shop', uid, lambda: _load_user_shop(uid))
     except Exception as e:
         logging.error(f"Error getting user shop: {e}")
         return 1
 
+def _load_user_shop(user_id):
+    con = db.get_db_connection()
+    cur = con.cursor()
+    cur.execute(
+        "SELECT shop_id FROM shop_users WHERE user_id = ?",
+        (user_id,),
+    )
+    row = cur.fetchone()
+    return int(row[0]) if row else 1
+
 def user_has_shop(user_id):
     """Return True if the user already selected a shop."""
     try:
@@ -1323,34 +1337,25 @@ def get_shop_rating(shop_id):
         logging.error(f"Error getting shop rating: {e}")
         return (0.0, 0)
 
-def get_description(name_good, shop_id=1):
+def get_description(name_good, shop_id=1, view=None):
     """Descripción del producto con sistema de descuentos"""
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute(
-            "SELECT description, price, duration_days FROM goods WHERE name = ? AND shop_id = ?;",
-            (name_good, shop_id),
-        )
-        result = cursor.fetchone()
-
-        if not result:
+        view = view or load_product_view(name_good, shop_id)
+        if not view:
             return "Producto no encontrado"
 
-        description, price, duration = result
-        good_amount = amount_of_goods(name_good, shop_id)
-        
-        # Obtener configuración de descuentos
-        discount_config = get_discount_config(shop_id)
-        
+        price = view.price
+        duration = view.duration_days
+        discount_config = view.discount_config
+
         # Construir descripción
-        product_description = f"*{name_good}*\n\n"
-        product_description += f"📝 *Descripción:*\n{description}\n\n"
-        
-        active_percent = get_active_discount(name_good, shop_id)
+        product_description = f"*{view.name}*\n\n"
+        product_description += f"📝 *Descripción:*\n{view.description}\n\n"
+
+        active_percent = view.discount
 
         if active_percent:
-            new_price = int(price * (100 - active_percent) / 100)
+            new_price = view.discounted_price
             orig_str = str(price) + ' USD'
             array = list(orig_str)
             crossed_price = "̶" + "̶".join(array) + "̶"
@@ -1370,31 +1375,61 @@ def get_description(name_good, shop_id=1):
             product_description += f"*${price} USD* (-{discount_percent}% OFF)\n\n"
         else:
             product_description += f"💰 *Precio:* ${price} USD\n\n"
-        
-        product_description += f"📦 *Stock disponible:* {good_amount} unidades\n"
+
+        product_description += f"📦 *Stock disponible:* {view.stock} unidades\n"
         if duration not in (None, 0):
             product_description += f"⏳ *Duración:* {duration} días\n"
-        product_description += f"🛒 *Mínimo de compra:* {get_minimum(name_good, shop_id)} unidades"
-        
+        minimum = view.minimum if view.minimum is not None else 1
+        product_description += f"🛒 *Mínimo de compra:* {minimum} unidades"
+
         return product_description
-        
+
     except Exception as e:
         logging.error(f"Error obteniendo descripción: {e}")
         return "Error obteniendo información del producto"
 
+# Cada cuánto se mira si otro proceso cambió las credenciales de pago
+PAYMENT_DATA_CHECK_SECS = 5
+_payment_data_state = {'checked': None, 'version': None, 'triggers': False}
+_payment_data_lock = threading.Lock()
+
+
+def _refresh_payment_data():
+    """Drop cached credentials when another process changed them.
+
+    ``check_binance_config.py``, ``config_paypal_simple.py`` and
+    ``setup_binance_wallet.py`` write ``paypal_data``/``binance_data`` from
+    their own process, where :func:`cache.invalidate` cannot reach the bot.
+    Triggers count those writes in ``data_versions``; the counter is read at
+    most every :data:`PAYMENT_DATA_CHECK_SECS` seconds per process and the
+    cache is only cleared when it moved.
+    """
+    now = time.monotonic()
+    state = _payment_data_state
+    with _payment_data_lock:
+        if state['checked'] is not None and now - state['checked'] < PAYMENT_DATA_CHECK_SECS:
+            return
+        state['checked'] = now
+    try:
+        con = db.get_db_connection()
+        if not state['triggers'] and not con.in_transaction:
+            state['triggers'] = db.ensure_data_version(con.cursor(), 'payment_data', db.PAYMENT_TABLES)
+            con.commit()
+        version = db.get_data_version('payment_data', con)
+    except Exception as e:
+        logging.error(f"Error comprobando credenciales de pago: {e}")
+        return
+    with _payment_data_lock:
+        previous, state['version'] = state['version'], version
+    if previous is not None and version != previous:
+        cache.invalidate('payment_data')
+
+
 def get_paypaldata(shop_id=1):
     """Obtener credenciales PayPal asociadas a una tienda."""
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute(
-            "SELECT client_id, client_secret, sandbox FROM paypal_data WHERE shop_id = ? ORDER BY rowid DESC LIMIT 1;",
-            (shop_id,),
-        )
-        result = cursor.fetchone()
-        if result:
-            return result[0], result[1], bool(result[2])
-        return None
+        _refresh_payment_data()
+        return cache.get_or_load('payment_data', ('paypal', shop_id), lambda: _load_paypaldata(shop_id))
     except Exception as e:
         logging.error(f"Error getting PayPal data: {e}")
         return None
@@ -1402,20 +1437,36 @@ def get_paypaldata(shop_id=1):
 def get_binancedata(shop_id=1):
     """Obtener credenciales Binance asociadas a una tienda."""
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute(
-            "SELECT api_key, api_secret, merchant_id FROM binance_data WHERE shop_id = ? ORDER BY rowid DESC LIMIT 1;",
-            (shop_id,),
-        )
-        result = cursor.fetchone()
-        if result:
-            return result[0], result[1], result[2]
-        return None
+        _refresh_payment_data()
+        return cache.get_or_load('payment_data', ('binance', shop_id), lambda: _load_binancedata(shop_id))
     except Exception as e:
         logging.error(f"Error getting Binance data: {e}")
         return None
 
+def _load_paypaldata(shop_id):
+    con = db.get_db_connection()
+    cursor = con.cursor()
+    cursor.execute(
+        "SELECT client_id, client_secret, sandbox FROM paypal_data WHERE shop_id = ? ORDER BY rowid DESC LIMIT 1;",
+        (shop_id,),
+    )
+    result = cursor.fetchone()
+    if result:
+        return result[0], result[1], bool(result[2])
+    return None
+
+def _load_binancedata(shop_id):
+    con = db.get_db_connection()
+    cursor = con.cursor()
+    cursor.execute(
+        "SELECT api_key, api_secret, merchant_id FROM binance_data WHERE shop_id = ? ORDER BY rowid DESC LIMIT 1;",
+        (shop_id,),
+    )
+    result = cursor.fetchone()
+    if result:
+        return result[0], result[1], result[2]
+    return None
+
 def save_paypaldata(client_id, client_secret, sandbox=1, shop_id=1):
     """Guardar o actualizar credenciales PayPal para una tienda."""
     try:
@@ -1427,6 +1478,7 @@ def save_paypaldata(client_id, client_secret, sandbox=1, shop_id=1):
             (client_id, client_secret, int(bool(sandbox)), shop_id),
         )
         con.commit()
+        cache.invalidate('payment_data', ('paypal', shop_id))
         return True
     except Exception as e:
         logging.error(f"Error guardando PayPal data: {e}")
@@ -1443,6 +1495,7 @@ def save_binancedata(api_key, api_secret, merchant_id, shop_id=1):
             (api_key, api_secret, merchant_id, shop_id),
         )
         con.commit()
+        cache.invalidate('payment_data', ('binance', shop_id))
         return True
     except Exception as e:
         logging.error(f"Error guardando Binance data: {e}")
@@ -1502,7 +1555,7 @@ def payments_checkvkl(shop_id=1):
             except Exception as e:
                 logging.error(f"Error notificando admin {admin_id} por PayPal: {e}")
         try:
-            with shelve.open(files.payments_bd) as bd:
+            with state_store.open_store(files.payments_bd) as bd:
                 bd['paypal'] = '❌'
         except Exception as e:
             logging.error(f"Error desactivando PayPal: {e}")
@@ -1517,7 +1570,7 @@ def payments_checkvkl(shop_id=1):
             except Exception as e:
                 logging.error(f"Error notificando admin {admin_id} por Binance: {e}")
         try:
-            with shelve.open(files.payments_bd) as bd:
+            with state_store.open_store(files.payments_bd) as bd:
                 bd['binance'] = '❌'
         except Exception as e:
             logging.error(f"Error desactivando Binance: {e}")
@@ -1538,25 +1591,32 @@ def get_tovar(name_good, shop_id=1):
         stored = get_stored(name_good, shop_id)
         if not stored:
             return "Producto no encontrado"
-            
-        with open(stored, encoding='utf-8') as f: 
-            lines = f.readlines()
-        
-        if not lines:
+        inventory.sync_stock_file(shop_id, name_good, stored)
+
+        items = inventory.claim_items(shop_id, name_good, 1)
+        if not items:
             return "Producto agotado"
-            
-        # Obtener primera línea y eliminarla
-        first_line = lines[0].strip()
-        remaining_lines = lines[1:]
-        
-        with open(stored, 'w', encoding='utf-8') as f: 
-            f.writelines(remaining_lines)
-        
-        return first_line
+        return items[0]
     except Exception as e:
         logging.error(f"Error obteniendo producto: {e}")
         return "Error obteniendo producto"
 
+def get_tovar_batch(name_good, amount, shop_id=1, claimed_by=None):
+    """Reserva ``amount`` unidades en una sola transacción.
+
+    Devuelve la lista de unidades entregables; puede ser más corta que
+    ``amount`` si el producto se agota.
+    """
+    try:
+        stored = get_stored(name_good, shop_id)
+        if not stored:
+            return []
+        inventory.sync_stock_file(shop_id, name_good, stored)
+        return inventory.claim_items(shop_id, name_good, amount, claimed_by=claimed_by)
+    except Exception as e:
+        logging.error(f"Error obteniendo productos: {e}")
+        return []
+
 def new_buy(his_id, username, name_good, amount, price, shop_id=1):
     try:
         con = db.get_db_connection()
@@ -1756,33 +1816,73 @@ def search_user_purchases(search_term, shop_id=1):
         return f"❌ Error buscando compras: {e}"
 
 
-def search_products(keyword, limit=10):
+def _search_match_query(keyword, shop_id=None):
+    """Build the FTS5 ``MATCH`` expression for ``keyword`` or ``None``."""
+    words = re.findall(r"\w+", keyword or "")
+    if not words:
+        return None
+    columns = " ".join(db.PRODUCT_SEARCH_COLUMNS)
+    query = f"{{{columns}}} : (" + " ".join(f'"{w}"*' for w in words) + ")"
+    if shop_id is not None:
+        query = f'shop : "{int(shop_id)}" AND {query}'
+    return query
+
+
+def search_products(keyword, limit=10, shop_id=None, with_ids=False):
     """Search products by keyword.
 
-    The function looks for the keyword in both the product name and
-    description using a ``LIKE`` query. It returns a list of tuples with
-    ``(shop_id, shop_name, product_name, price)``.
+    Every word of ``keyword`` must appear, as a word prefix, in the product
+    name, description or additional description; case and accents are
+    ignored and the best matches (name hits first) come first.  Returns a
+    list of ``(shop_id, shop_name, product_name, price)`` tuples, prefixed
+    with the product id when ``with_ids`` is true.  ``shop_id`` limits the
+    search to one shop.
+
+    Uses the ``goods_fts`` index when this SQLite has FTS5 and falls back to
+    ``LIKE`` otherwise.
 
     Example
     -------
     >>> search_products("gift")
     [(1, "Shop 1", "Gift Card", 5)]
     """
+    columns = "p.id, g.shop_id, s.name, g.name, g.price"
     try:
         con = db.get_db_connection()
         cur = con.cursor()
-        like = f"%{keyword}%"
-        cur.execute(
+        match = _search_match_query(keyword, shop_id)
+        if match is None:
+            return []
+        if db._table_exists(cur, "goods_fts"):
+            cur.execute(
+                f"""
+                SELECT {columns}
+                FROM goods_fts AS f
+                JOIN product_ids AS p ON p.id = f.rowid
+                JOIN goods AS g ON g.shop_id = p.shop_id AND g.name = p.name
+                JOIN shops AS s ON g.shop_id = s.id
+                WHERE goods_fts MATCH ?
+                ORDER BY bm25(goods_fts, 10.0, 4.0, 2.0, 0.0)
+                LIMIT ?
+                """,
+                (match, limit),
+            )
+        else:
+            like = f"%{keyword}%"
+            sql = f"""
+                SELECT {columns}
+                FROM goods AS g
+                JOIN shops AS s ON g.shop_id = s.id
+                JOIN product_ids AS p ON p.shop_id = g.shop_id AND p.name = g.name
+                WHERE (g.name LIKE ? OR g.description LIKE ?)
             """
-            SELECT g.shop_id, s.name, g.name, g.price
-            FROM goods AS g
-            JOIN shops AS s ON g.shop_id = s.id
-            WHERE g.name LIKE ? OR g.description LIKE ?
-            LIMIT ?
-            """,
-            (like, like, limit),
-        )
-        return cur.fetchall()
+            params = [like, like]
+            if shop_id is not None:
+                sql += " AND g.shop_id = ?"
+                params.append(shop_id)
+            cur.execute(sql + " LIMIT ?", (*params, limit))
+        rows = cur.fetchall()
+        return rows if with_ids else [row[1:] for row in rows]
     except Exception as e:
         logging.error(f"Error searching products: {e}")
         return []
@@ -1845,32 +1945,8 @@ def get_buyers_summary(shop_id=1):
 
 def get_discount_config(shop_id=1):
     """Obtiene la configuración de descuentos para una tienda"""
-    setup_discount_system()
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute(
-            "SELECT discount_enabled, discount_text, discount_multiplier, show_fake_price "
-            "FROM discount_config WHERE shop_id = ?;",
-            (shop_id,),
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            return {
-                'enabled': bool(result[0]),
-                'text': result[1],
-                'multiplier': result[2],
-                'show_fake_price': bool(result[3])
-            }
-        else:
-            # Configuración por defecto si no existe
-            return {
-                'enabled': True,
-                'text': '🔥 DESCUENTOS ESPECIALES ACTIVOS 🔥',
-                'multiplier': 1.5,
-                'show_fake_price': True
-            }
+        return dict(cache.get_or_load('discount_config', shop_id, lambda: _load_discount_config(shop_id)))
     except Exception as e:
         logging.error(f"Error obteniendo configuración de descuentos: {e}")
         return {
@@ -1880,6 +1956,35 @@ def get_discount_config(shop_id=1):
             'show_fake_price': True
         }
 
+def _load_discount_config(shop_id):
+    # La tabla sólo se prepara una vez por base de datos
+    global _discount_ready_db
+    if _discount_ready_db != files.main_db and setup_discount_system():
+        _discount_ready_db = files.main_db
+    con = db.get_db_connection()
+    cursor = con.cursor()
+    cursor.execute(
+        "SELECT discount_enabled, discount_text, discount_multiplier, show_fake_price "
+        "FROM discount_config WHERE shop_id = ?;",
+        (shop_id,),
+    )
+    result = cursor.fetchone()
+
+    if result:
+        return {
+            'enabled': bool(result[0]),
+            'text': result[1],
+            'multiplier': result[2],
+            'show_fake_price': bool(result[3])
+        }
+    # Configuración por defecto si no existe
+    return {
+        'enabled': True,
+        'text': '🔥 DESCUENTOS ESPECIALES ACTIVOS 🔥',
+        'multiplier': 1.5,
+        'show_fake_price': True
+    }
+
 def update_discount_config(enabled=None, text=None, multiplier=None, show_fake_price=None, shop_id=1):
     """Actualiza la configuración de descuentos para una tienda"""
     setup_discount_system()
@@ -1939,6 +2044,8 @@ def update_discount_config(enabled=None, text=None, multiplier=None, show_fake_p
             )
         
         con.commit()
+        cache.invalidate('discount_config', shop_id)
+        catalog_changed(shop_id)
         return True
         
     except Exception as e:
@@ -2142,7 +2249,7 @@ def is_manual_delivery(product_name, shop_id=1):
 def get_manual_delivery_message(username, name):
     """Obtiene el mensaje de entrega manual personalizado."""
     try:
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             text = bd.get('manual_delivery', 'Gracias por su compra, username')
     except Exception as e:
         logging.error(f"Error retrieving manual delivery message: {e}")
@@ -2150,6 +2257,109 @@ def get_manual_delivery_message(username, name):
     text = text.replace('username', username).replace('name', name)
     return text
 
+# ============================================
+# VISTA DE PRODUCTO EN UNA SOLA CONSULTA
+# ============================================
+
+_DEFAULT_DISCOUNT_TEXT = '🔥 DESCUENTOS ESPECIALES ACTIVOS 🔥'
+_NO_ADDITIONAL_INFO = "No hay información adicional disponible para este producto."
+
+
+class ProductView:
+    """Snapshot of everything needed to render one product.
+
+    Built by :func:`load_product_view` from a single joined query so the
+    catalog formatters do not hit the database once per attribute.
+    """
+
+    def __init__(self, row, shop_id):
+        (self.name, self.description, self.additional_description,
+         self.format, self.minimum, self.price, self.stored,
+         self.media_file_id, self.media_type, self.media_caption,
+         self.duration_days, manual, manual_stock, self.category_id,
+         self.category, discount, cfg_enabled, cfg_text, cfg_multiplier,
+         cfg_fake, self.available) = row
+        self.shop_id = shop_id
+        self.manual_delivery = bool(manual)
+        self.manual_stock = int(manual_stock) if manual_stock is not None else 0
+        self.discount = int(discount) if discount else 0
+        self.discount_config = {
+            'enabled': bool(cfg_enabled) if cfg_enabled is not None else True,
+            'text': cfg_text if cfg_text is not None else _DEFAULT_DISCOUNT_TEXT,
+            'multiplier': cfg_multiplier if cfg_multiplier is not None else 1.5,
+            'show_fake_price': bool(cfg_fake) if cfg_fake is not None else True,
+        }
+        self._stock = None
+
+    @property
+    def stock(self):
+        """Units available for sale."""
+        if self._stock is None:
+            if self.manual_delivery:
+                self._stock = self.manual_stock
+            else:
+                # Unidades añadidas al archivo de stock se importan al leer
+                imported = inventory.sync_stock_file(self.shop_id, self.name, self.stored)
+                self._stock = (self.available or 0) + imported
+        return self._stock
+
+    @property
+    def media(self):
+        if not self.media_file_id:
+            return None
+        return {
+            'file_id': self.media_file_id,
+            'type': self.media_type,
+            'caption': self.media_caption,
+        }
+
+    @property
+    def has_additional_description(self):
+        text = (self.additional_description or '').strip()
+        return bool(text) and text != _NO_ADDITIONAL_INFO
+
+    @property
+    def discounted_price(self):
+        if self.discount:
+            return int(self.price * (100 - self.discount) / 100)
+        return self.price
+
+
+def load_product_view(good_name, shop_id=1):
+    """Load a :class:`ProductView` for ``(shop_id, good_name)`` or ``None``."""
+    try:
+        con = db.get_db_connection()
+        cursor = con.cursor()
+        now = datetime.datetime.now(datetime.UTC).isoformat()
+        cursor.execute(
+            """
+            SELECT g.name, g.description, g.additional_description, g.format,
+                   g.minimum, g.price, g.stored, g.media_file_id, g.media_type,
+                   g.media_caption, g.duration_days, g.manual_delivery,
+                   g.manual_stock, g.category_id, c.name,
+                   (SELECT MAX(d.percent) FROM discounts d
+                     WHERE d.shop_id = g.shop_id
+                       AND (d.category_id IS NULL OR d.category_id = g.category_id)
+                       AND d.start_time <= ? AND (d.end_time IS NULL OR d.end_time > ?)),
+                   dc.discount_enabled, dc.discount_text, dc.discount_multiplier,
+                   dc.show_fake_price,
+                   (SELECT COUNT(*) FROM inventory_items i
+                     WHERE i.shop_id = g.shop_id AND i.product = g.name
+                       AND i.claimed_at IS NULL)
+            FROM goods g
+            LEFT JOIN categories c ON g.category_id = c.id
+            LEFT JOIN discount_config dc ON dc.shop_id = g.shop_id
+            WHERE g.name = ? AND g.shop_id = ?
+            """,
+            (now, now, good_name, shop_id),
+        )
+        row = cursor.fetchone()
+        return ProductView(row, shop_id) if row else None
+    except Exception as e:
+        logging.error(f"Error cargando vista de producto: {e}")
+        return None
+
+
 def get_product_full_info(good_name, shop_id=1):
     """Obtiene toda la información del producto incluyendo descripción adicional"""
     try:
@@ -2185,67 +2395,68 @@ def get_product_full_info(good_name, shop_id=1):
         logging.error(f"Error obteniendo información completa del producto: {e}")
         return None
 
-def format_product_basic_info(good_name, shop_id=1):
+def format_product_basic_info(good_name, shop_id=1, view=None):
     """Formatea la información básica del producto (sin descripción adicional)"""
     try:
-        product_info = get_product_full_info(good_name, shop_id)
-        if not product_info:
+        view = view or load_product_view(good_name, shop_id)
+        if not view:
             return "Producto no encontrado"
-        
-        amount = amount_of_goods(good_name, shop_id)
-        
+
         format_map = {'text': 'Texto', 'file': 'Archivo'}
-        format_display = format_map.get(product_info['format'], product_info['format'])
+        format_display = format_map.get(view.format, view.format)
 
-        info_text = f"""🛍️ **{product_info['name']}**
+        info_text = f"""🛍️ **{view.name}**
 
 📝 **Descripción:**
-{product_info['description']}"""
+{view.description}"""
 
-        if product_info.get('category'):
-            info_text += f"\n🏷️ **Categoría:** {product_info['category']}"
+        if view.category:
+            info_text += f"\n🏷️ **Categoría:** {view.category}"
 
         info_text += f"""
 
-💰 **Precio:** ${product_info['price']} USD
-📦 **Cantidad mínima:** {product_info['minimum']}
+💰 **Precio:** ${view.price} USD
+📦 **Cantidad mínima:** {view.minimum}
 📋 **Formato:** {format_display}"""
 
-        if product_info.get('manual_delivery'):
+        if view.manual_delivery:
             info_text += "\n🚚 **Entrega manual**"
         else:
-            info_text += f"\n📊 **Disponibles:** {amount}"
+            info_text += f"\n📊 **Disponibles:** {view.stock}"
 
-        duration = product_info.get('duration_days')
+        duration = view.duration_days
         if duration not in (None, 0):
             info_text += f"\n⏳ **Duración:** {duration} días"
-        
+
         return info_text
     except Exception as e:
         logging.error(f"Error formateando información básica: {e}")
         return "Error al cargar información del producto"
 
-def format_product_additional_info(good_name, shop_id=1):
+def format_product_additional_info(good_name, shop_id=1, view=None):
     """Formatea la información adicional del producto"""
     try:
-        additional_desc = get_additional_description(good_name, shop_id)
-        
+        if view is not None:
+            additional_desc = view.additional_description or _NO_ADDITIONAL_INFO
+        else:
+            additional_desc = get_additional_description(good_name, shop_id)
+
         info_text = f"""ℹ️ **Información Adicional**
 
 {additional_desc}
 
 ━━━━━━━━━━━━━━━━━━━━━━"""
-        
+
         return info_text
     except Exception as e:
         logging.error(f"Error formateando información adicional: {e}")
         return "Error al cargar información adicional"
 
-def has_additional_description(good_name, shop_id=1):
+def has_additional_description(good_name, shop_id=1, view=None):
     """Verifica si un producto tiene descripción adicional"""
     try:
-        additional_desc = get_additional_description(good_name, shop_id)
-        return additional_desc and additional_desc.strip() != "" and additional_desc != "No hay información adicional disponible para este producto."
+        view = view or load_product_view(good_name, shop_id)
+        return bool(view and view.has_additional_description)
     except Exception as e:
         logging.error(f"Error verificando descripción adicional: {e}")
         return False
@@ -2266,8 +2477,10 @@ def save_product_media(product_name, file_id, media_type, caption=None, shop_id=
         logging.error(f"Error guardando multimedia: {e}")
         return False
 
-def get_product_media(product_name, shop_id=1):
+def get_product_media(product_name, shop_id=1, view=None):
     """Obtener información multimedia de un producto para una tienda"""
+    if view is not None:
+        return view.media
     try:
         con = db.get_db_connection()
         cursor = con.cursor()
@@ -2344,49 +2557,33 @@ def get_products_without_media(shop_id=1):
         logging.error(f"Error obteniendo productos sin multimedia: {e}")
         return []
 
-def format_product_with_media(product_name, shop_id=1):
+def format_product_with_media(product_name, shop_id=1, view=None):
     """Formatear información del producto incluyendo multimedia"""
     try:
-        con = db.get_db_connection()
-        cursor = con.cursor()
-        cursor.execute(
-            """
-            SELECT g.name, g.description, g.price, g.media_file_id, g.media_type, g.media_caption,
-                   g.duration_days, g.manual_delivery, c.name
-            FROM goods g LEFT JOIN categories c ON g.category_id = c.id
-            WHERE g.name = ? AND g.shop_id = ?
-        """,
-            (product_name, shop_id),
-        )
-        result = cursor.fetchone()
-        
-        if not result:
+        view = view or load_product_view(product_name, shop_id)
+        if not view:
             return None
-            
-        name, description, price, file_id, media_type, caption, duration, manual, category = result
 
-        discount = get_active_discount(name, shop_id)
-        display_price = price
+        name, price, discount = view.name, view.price, view.discount
         info = f"🎯 **{name}**\n"
         if discount:
-            new_price = int(price * (100 - discount) / 100)
-            display_price = new_price
+            new_price = view.discounted_price
             orig_str = str(price) + ' USD'
             array = list(orig_str)
             crossed = "̶" + "̶".join(array) + "̶"
             info += f"💰 **Precio:** ~~{crossed}~~ ${new_price} USD (-{discount}% OFF)\n"
         else:
             info += f"💰 **Precio:** ${price} USD\n"
-        info += f"📝 **Descripción:** {description}\n"
-        if category:
-            info += f"🏷️ **Categoría:** {category}\n"
-        if duration not in (None, 0):
-            info += f"⏳ **Duración:** {duration} días\n"
+        info += f"📝 **Descripción:** {view.description}\n"
+        if view.category:
+            info += f"🏷️ **Categoría:** {view.category}\n"
+        if view.duration_days not in (None, 0):
+            info += f"⏳ **Duración:** {view.duration_days} días\n"
 
-        if manual:
+        if view.manual_delivery:
             info += "🚚 **Entrega manual**\n"
 
-        if file_id:
+        if view.media_file_id:
             media_types = {
                 'photo': '📸 Imagen',
                 'video': '🎥 Video', 
@@ -2394,11 +2591,11 @@ def format_product_with_media(product_name, shop_id=1):
                 'audio': '🎵 Audio',
                 'animation': '🎬 GIF'
             }
-            media_name = media_types.get(media_type, '📎 Archivo')
+            media_name = media_types.get(view.media_type, '📎 Archivo')
             info += f"\n{media_name} disponible"
             
-            if caption:
-                info += f"\n*{caption}*"
+            if view.media_caption:
+                info += f"\n*{view.media_caption}*"
         
         return info
         
@@ -2409,7 +2606,7 @@ def format_product_with_media(product_name, shop_id=1):
 def save_message(message_type, message_text, file_id=None, media_type=None):
     """Guardar mensaje del bot"""
     try:
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             bd[message_type] = message_text
             if message_type == 'start':
                 if file_id:
@@ -2427,7 +2624,7 @@ def save_message(message_type, message_text, file_id=None, media_type=None):
 def get_start_media():
     """Obtener multimedia asociada al mensaje de inicio"""
     try:
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             fid = bd.get('start_media_file_id')
             mtype = bd.get('start_media_type')
         if fid:
@@ -2441,7 +2638,7 @@ def get_start_media():
 def remove_start_media():
     """Eliminar multimedia del mensaje de inicio"""
     try:
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             bd.pop('start_media_file_id', None)
             bd.pop('start_media_type', None)
         return True
@@ -2475,6 +2672,7 @@ def create_product(name, description, format_type, minimum, price, stored,
             ),
         )
         con.commit()
+        catalog_changed(shop_id)
         return True
     except Exception as e:
         logging.error(f"Error creando producto: {e}")
@@ -2491,7 +2689,11 @@ def delete_product(name, shop_id=1):
             (name, shop_id),
         )
         con.commit()
-        return cur.rowcount > 0
+        deleted = cur.rowcount > 0
+        if deleted:
+            inventory.remove_product_items(shop_id, name)
+            catalog_changed(shop_id)
+        return deleted
     except Exception as e:
         logging.error(f"Error eliminando producto: {e}")
         return False
@@ -5,10 +5,12 @@ import os
 from dotenv import load_dotenv
 import telebot
 import db
+import http_pool
 
 load_dotenv()
 
 def get_bot():
+    http_pool.install()
     token = os.getenv("TELEGRAM_TOKEN")
     if token:
         token = token.split(",")[0].strip()
@@ -0,0 +1,115 @@
+"""Shared HTTP session for every Bot API client of the process.
+
+telebot sends its requests through ``apihelper``, which by default keeps a
+``requests`` session per thread and throws it away every ten minutes, so
+each worker thread and each renewal pays a new TLS handshake with
+``api.telegram.org``.  :func:`install` replaces it with one process-wide
+session whose connection pool is sized for the bot's worker threads and
+kept alive, with timeouts and connection retries tuned for the Bot API.
+The main bot, the campaign tokens of ``TelegramMultiBot`` and the cron
+scripts all reuse it.
+
+New TLS connections are counted in ``telegram_tls_handshakes_total`` (see
+:mod:`telemetry`); with the pool warm it should grow far slower than
+``telegram_api_calls_total``.
+"""
+
+import logging
+import os
+import threading
+
+import telemetry
+
+POOL_HOSTS = int(os.getenv('TELEGRAM_POOL_HOSTS', '4'))       # hosts con pool propio
+POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '32'))        # conexiones vivas por host
+CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', '30'))
+CONNECT_RETRIES = int(os.getenv('TELEGRAM_CONNECT_RETRIES', '3'))
+
+HANDSHAKES = telemetry.counter(
+    'telegram_tls_handshakes_total', 'New TLS connections opened to the Bot API by host.', ['host']
+)
+
+_session = None
+_lock = threading.Lock()
+
+
+def _adapter():
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPSConnection
+    from urllib3.connectionpool import HTTPSConnectionPool
+    from urllib3.util.retry import Retry
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            super().connect()
+            HANDSHAKES.inc(host=self.host)
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+    class PooledAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = dict(
+                self.poolmanager.pool_classes_by_scheme, https=CountingHTTPSConnectionPool
+            )
+
+    # Solo se reintentan los fallos al conectar: la petición aún no llegó a
+    # Telegram, así que repetir un sendMessage no duplica el mensaje
+    retries = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0,
+                    status=0, other=0, backoff_factor=0.5, raise_on_status=False)
+    return PooledAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE,
+                         max_retries=retries)
+
+
+def build_session():
+    """Return a keep-alive ``requests`` session with the tuned pool."""
+    import requests
+
+    session = requests.Session()
+    session.headers['Connection'] = 'keep-alive'
+    session.mount('https://', _adapter())
+    return session
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def install():
+    """Make telebot use the shared session; return ``False`` if unavailable.
+
+    Safe to call many times; every bot object created before or after the
+    call goes through the same session.
+    """
+    try:
+        from telebot import apihelper
+        session = get_session()
+    except (ImportError, AttributeError) as e:
+        logging.debug(f"Sesión HTTP compartida no disponible: {e}")
+        return False
+    if getattr(apihelper, 'session', None) is not session:
+        apihelper.session = session
+        # Sin caducidad: cada hilo usa la sesión compartida en lugar de una propia
+        apihelper.SESSION_TIME_TO_LIVE = None
+        apihelper.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+        apihelper.READ_TIMEOUT = READ_TIMEOUT
+    return True
+
+
+def stats():
+    """Return the pool settings and TLS handshakes per host."""
+    handshakes = {host: value for (host,), value in HANDSHAKES.values().items()}
+    return {
+        'pool_hosts': POOL_HOSTS,
+        'pool_size': POOL_SIZE,
+        'connect_timeout': CONNECT_TIMEOUT,
+        'read_timeout': READ_TIMEOUT,
+        'handshakes': handshakes,
+    }
@@ -201,9 +201,13 @@ def create_database():
             created_date TEXT,
             shop_id INTEGER DEFAULT 1,
             group_ids TEXT,
+            next_fire_at TEXT,
             FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
         )
     ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_campaign_schedules_due ON campaign_schedules (is_active, next_fire_at)'
+    )
     print("✓ Tabla 'campaign_schedules' creada")
 
     cursor.execute('''
@@ -259,6 +263,9 @@ def create_database():
             FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
         )
     ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_send_logs_shop_date ON send_logs (shop_id, sent_date)'
+    )
     print("✓ Tabla 'send_logs' creada")
 
     cursor.execute('''
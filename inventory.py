@@ -0,0 +1,246 @@
+"""SQLite-backed stock for digital goods.
+
+Each deliverable unit (a key, an account, a file id) is one row in
+``inventory_items``.  Units are handed out with :func:`claim_items`, which
+marks them as claimed inside a single write transaction so two buyers can
+never receive the same unit.
+
+Stock can still be loaded the old way, one line per unit appended to the
+product's ``data/goods/*.txt`` file (the path stored in ``goods.stored``).
+:func:`sync_stock_file` moves those lines into the table; reads call it
+first, and it only costs a ``stat`` while the file is absent or empty.
+:func:`import_stock_files` does the same for every product at once.
+"""
+
+import os
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+import db
+
+_absorb_lock = threading.Lock()
+
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Sufijo del archivo de stock apartado mientras se importa
+IMPORTING_SUFFIX = '.importing'
+
+
+def _read_stock_file(stored):
+    """Return the non-empty lines of a legacy stock file."""
+    if not stored or not os.path.isfile(stored) or os.path.getsize(stored) == 0:
+        return []
+    with open(stored, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _claim_stock_file(stored):
+    """Rename ``stored`` aside and return the path to import from.
+
+    The rename is atomic, so a process appending to the file afterwards
+    starts a new one instead of writing into lines about to be imported.
+    A file left aside by an interrupted import is imported first.
+    """
+    claimed = stored + IMPORTING_SUFFIX
+    if os.path.isfile(claimed):
+        return claimed
+    if not os.path.isfile(stored) or os.path.getsize(stored) == 0:
+        return None
+    os.replace(stored, claimed)
+    return claimed
+
+
+def _has_pending_lines(stored):
+    if not stored:
+        return False
+    if os.path.isfile(stored + IMPORTING_SUFFIX):
+        return True
+    try:
+        return os.path.getsize(stored) > 0
+    except OSError:
+        return False
+
+
+def _absorb_stock_file(con, shop_id, product, stored):
+    """Move the lines of ``stored`` into the table; return how many.
+
+    Runs in its own ``BEGIN IMMEDIATE`` transaction, which also keeps two
+    processes from importing the same file.  The file is removed before the
+    commit; if the commit fails its lines are written back.
+    """
+    if not _has_pending_lines(stored):
+        return 0
+    with _absorb_lock:
+        con.execute("BEGIN IMMEDIATE")
+        removed = []
+        try:
+            while True:
+                claimed = _claim_stock_file(stored)
+                if claimed is None:
+                    break
+                lines = _read_stock_file(claimed)
+                con.executemany(
+                    "INSERT INTO inventory_items (shop_id, product, payload) VALUES (?, ?, ?)",
+                    [(shop_id, product, line) for line in lines],
+                )
+                os.remove(claimed)
+                removed.append((claimed, lines))
+            con.commit()
+        except Exception:
+            con.rollback()
+            # Las líneas vuelven al archivo apartado para el próximo intento
+            for claimed, lines in removed:
+                with open(claimed, 'a', encoding='utf-8') as f:
+                    f.writelines(f"{line}\n" for line in lines)
+            raise
+    return sum(len(lines) for _, lines in removed)
+
+
+def sync_stock_file(shop_id, product, stored):
+    """Import lines appended to the stock file of ``product``; return how many.
+
+    Skipped (returns 0) while the thread's connection has a transaction
+    open, so the caller's work is never committed; the lines are picked up
+    by the next read.
+    """
+    if not _has_pending_lines(stored):
+        return 0
+    try:
+        con = db.get_db_connection()
+        if con.in_transaction:
+            return 0
+        return _absorb_stock_file(con, shop_id, product, stored)
+    except Exception as e:
+        logging.error(f"Error importando archivo de stock {stored}: {e}")
+        return 0
+
+
+def add_items(shop_id, product, payloads):
+    """Append units to the stock of ``product``; return how many were added."""
+    rows = [(shop_id, product, str(p).strip()) for p in payloads if str(p).strip()]
+    if not rows:
+        return 0
+    try:
+        con = db.get_db_connection()
+        con.executemany(
+            "INSERT INTO inventory_items (shop_id, product, payload) VALUES (?, ?, ?)",
+            rows,
+        )
+        con.commit()
+        return len(rows)
+    except Exception as e:
+        logging.error(f"Error agregando stock: {e}")
+        return 0
+
+
+def count_available(shop_id, product):
+    """Return the number of unclaimed units for ``product``."""
+    try:
+        row = db.get_db_connection().execute(
+            "SELECT COUNT(*) FROM inventory_items "
+            "WHERE shop_id = ? AND product = ? AND claimed_at IS NULL",
+            (shop_id, product),
+        ).fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logging.error(f"Error contando stock: {e}")
+        return 0
+
+
+def claim_items(shop_id, product, n, claimed_by=None):
+    """Atomically claim up to ``n`` units and return their payloads.
+
+    The oldest units are handed out first.  Fewer than ``n`` payloads are
+    returned when the product runs out; an empty list means no stock.  When
+    the caller already has a transaction open the claim joins it through a
+    savepoint and is committed with the caller's work.
+    """
+    n = int(n)
+    if n <= 0:
+        return []
+    con = db.get_db_connection()
+    own = not con.in_transaction
+    try:
+        con.execute("BEGIN IMMEDIATE" if own else "SAVEPOINT claim_items")
+        now = datetime.now().isoformat()
+        if _SUPPORTS_RETURNING:
+            rows = con.execute(
+                """
+                UPDATE inventory_items SET claimed_at = ?, claimed_by = ?
+                WHERE id IN (
+                    SELECT id FROM inventory_items
+                    WHERE shop_id = ? AND product = ? AND claimed_at IS NULL
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING id, payload
+                """,
+                (now, claimed_by, shop_id, product, n),
+            ).fetchall()
+        else:
+            rows = con.execute(
+                "SELECT id, payload FROM inventory_items "
+                "WHERE shop_id = ? AND product = ? AND claimed_at IS NULL "
+                "ORDER BY id LIMIT ?",
+                (shop_id, product, n),
+            ).fetchall()
+            con.executemany(
+                "UPDATE inventory_items SET claimed_at = ?, claimed_by = ? WHERE id = ?",
+                [(now, claimed_by, r[0]) for r in rows],
+            )
+        if own:
+            con.commit()
+        else:
+            con.execute("RELEASE claim_items")
+        return [payload for _, payload in sorted(rows)]
+    except Exception as e:
+        if own:
+            if con.in_transaction:
+                con.rollback()
+        else:
+            con.execute("ROLLBACK TO claim_items")
+            con.execute("RELEASE claim_items")
+        logging.error(f"Error reclamando stock: {e}")
+        return []
+
+
+def remove_product_items(shop_id, product):
+    """Delete unclaimed units of a product (used when it is deleted)."""
+    try:
+        con = db.get_db_connection()
+        con.execute(
+            "DELETE FROM inventory_items "
+            "WHERE shop_id = ? AND product = ? AND claimed_at IS NULL",
+            (shop_id, product),
+        )
+        con.commit()
+    except Exception as e:
+        logging.error(f"Error eliminando stock: {e}")
+
+
+def import_stock_files(con=None):
+    """Import every product's stock file; return ``{(shop_id, product): count}``.
+
+    Each file is committed on its own, so ``con`` must not have a
+    transaction open: nothing is imported rather than committing work that
+    belongs to the caller.
+    """
+    con = con or db.get_db_connection()
+    if con.in_transaction:
+        logging.error("Error importando archivos de stock: hay una transacción abierta")
+        return {}
+    rows = con.execute(
+        "SELECT shop_id, name, stored FROM goods "
+        "WHERE stored IS NOT NULL AND COALESCE(manual_delivery, 0) = 0"
+    ).fetchall()
+    imported = {}
+    for shop_id, name, stored in rows:
+        try:
+            count = _absorb_stock_file(con, shop_id, name, stored)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Error importando archivo de stock {stored}: {e}")
+            continue
+        if count:
+            imported[(shop_id, name)] = count
+    return imported
@@ -1,8 +1,13 @@
-import telebot, shelve, sqlite3, os, types
+import telebot, sqlite3, os, types
 import config, dop, payments, adminka, files
+import state_store
 import db
+import cache
 from bot_instance import bot
 from navigation import nav_system
+import callback_codec
+from callback_router import CallbackRouter
+from streaming_manager_bot import StreamingManagerBot
 from utils.message_chunker import send_long_message
 
 try:
@@ -80,7 +85,7 @@ def send_main_menu(chat_id, username, name):
     ]
     key = nav_system.create_universal_navigation(chat_id, 'main_menu', quick_actions)
     if dop.check_message('start'):
-        with shelve.open(files.bot_message_bd) as bd:
+        with state_store.open_store(files.bot_message_bd) as bd:
             start_message = bd['start']
         start_message = start_message.replace('username', username or '')
         start_message = start_message.replace('name', name or '')
@@ -184,7 +189,7 @@ def show_main_interface(chat_id, user_id):
 def show_shop_selection(chat_id, message=None):
     """Mostrar listado de tiendas disponibles"""
     shops = dop.list_shops()
-    quick_actions = [(name, f"SELECT_SHOP_{sid}") for sid, _, name in shops]
+    quick_actions = [(name, callback_codec.encode('shop', shop_id=sid)) for sid, _, name in shops]
     key = nav_system.create_universal_navigation(
         chat_id, "shop_selector", quick_actions=quick_actions
     )
@@ -215,13 +220,14 @@ def show_product_details(chat_id, product_name, shop_id):
     os.makedirs('data/Temp', exist_ok=True)
     with open(f'data/Temp/{chat_id}good_name.txt', 'w', encoding='utf-8') as f:
         f.write(product_name)
+    view = dop.load_product_view(product_name, shop_id)
     key = telebot.types.InlineKeyboardMarkup()
-    if dop.has_additional_description(product_name, shop_id):
-        key.add(telebot.types.InlineKeyboardButton(text='ℹ️ Más información', callback_data=f'MAS_INFO_{product_name}'))
+    if dop.has_additional_description(product_name, shop_id, view=view):
+        key.add(_more_info_button(product_name, shop_id))
     key.add(telebot.types.InlineKeyboardButton(text='💰 Comprar ahora', callback_data='Comprar'))
     key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-    media_info = dop.get_product_media(product_name, shop_id)
-    formatted_info = dop.format_product_with_media(product_name, shop_id)
+    media_info = dop.get_product_media(product_name, shop_id, view=view)
+    formatted_info = dop.format_product_with_media(product_name, shop_id, view=view)
     if media_info:
         if media_info['type'] == 'photo':
             bot.send_photo(chat_id, media_info['file_id'], caption=formatted_info, reply_markup=key, parse_mode='Markdown')
@@ -242,7 +248,7 @@ def show_product_details(chat_id, product_name, shop_id):
 def session_expired(chat_id, username, name):
     """Informar expiración de sesión y volver al menú principal"""
     send_long_message(bot, chat_id, '❌ La sesión expiró.')
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         if str(chat_id) in bd:
             del bd[str(chat_id)]
     send_main_menu(chat_id, username, name)
@@ -292,7 +298,7 @@ def message_send(message):
                 dop.user_loger(chat_id=message.chat.id)
                 return
         if dop.get_sost(message.chat.id):
-            with shelve.open(files.sost_bd) as bd:
+            with state_store.open_store(files.sost_bd) as bd:
                 if str(message.chat.id) in bd:
                     del bd[str(message.chat.id)]
         show_shop_selection(message.chat.id)
@@ -328,11 +334,11 @@ def message_send(message):
         key = telebot.types.InlineKeyboardMarkup()
         key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
         bot.send_message(message.chat.id, '📝 Por favor escribe tu reporte:', reply_markup=key)
-        with shelve.open(files.sost_bd) as bd:
+        with state_store.open_store(files.sost_bd) as bd:
             bd[str(message.chat.id)] = 23
 
     elif dop.get_sost(message.chat.id) is True:
-        with shelve.open(files.sost_bd) as bd:
+        with state_store.open_store(files.sost_bd) as bd:
             sost_num = bd[str(message.chat.id)]
         if sost_num == 22:
             key = telebot.types.InlineKeyboardMarkup()
@@ -358,7 +364,7 @@ def message_send(message):
                             parse_mode='Markdown',
                             reply_markup=key,
                         )
-                        with shelve.open(files.sost_bd) as bd:
+                        with state_store.open_store(files.sost_bd) as bd:
                             if str(message.chat.id) in bd:
                                 del bd[str(message.chat.id)]
                         send_main_menu(message.chat.id, message.chat.username, message.from_user.first_name)
@@ -431,22 +437,22 @@ def message_send(message):
                     e,
                 )
             bot.send_message(message.chat.id, '✅ Reporte enviado al administrador.')
-            with shelve.open(files.sost_bd) as bd:
+            with state_store.open_store(files.sost_bd) as bd:
                 if str(message.chat.id) in bd:
                     del bd[str(message.chat.id)]
             send_main_menu(message.chat.id, message.chat.username, message.from_user.first_name)
         elif sost_num == 24:
             term = (message.text or '').strip()
-            results = dop.search_products(term)
+            results = dop.search_products(term, with_ids=True)
             key = telebot.types.InlineKeyboardMarkup()
             if results:
                 text_lines = ['🔍 **Resultados:**']
-                for sid, sname, pname, price in results:
+                for product_id, sid, sname, pname, price in results:
                     text_lines.append(f"🏬 {sname}\n📦 {pname} - ${price} USD\n")
                     key.add(
                         telebot.types.InlineKeyboardButton(
                             text=f"{sname} - {pname}",
-                            callback_data=f"SEARCH_{sid}_{pname}",
+                            callback_data=callback_codec.encode('product', product_id=product_id),
                         )
                     )
                 resp = '\n'.join(text_lines)
@@ -454,413 +460,580 @@ def message_send(message):
                 resp = '❌ No se encontraron productos.'
             key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
             bot.send_message(message.chat.id, resp, reply_markup=key, parse_mode='Markdown')
-            with shelve.open(files.sost_bd) as bd:
+            with state_store.open_store(files.sost_bd) as bd:
                 if str(message.chat.id) in bd:
                     del bd[str(message.chat.id)]
 
     elif '/help' == message.text:
         if dop.check_message('help') is True:
-            with shelve.open(files.bot_message_bd) as bd:
+            with state_store.open_store(files.bot_message_bd) as bd:
                 help_message = bd['help']
             bot.send_message(message.chat.id, help_message)
         elif dop.check_message('help') is False and message.chat.id in dop.get_adminlist():
             bot.send_message(message.chat.id, '❓ **¡El mensaje de ayuda aún no ha sido agregado!**\n\nPara agregarlo, ve al panel de administración con el comando `/adm` y **configura las respuestas del bot**', parse_mode='Markdown')
 
 
-@bot.callback_query_handler(func=lambda c:True)
-def inline(callback):
+# ---------------------------------------------------------------------------
+# Callbacks de teclados inline
+# ---------------------------------------------------------------------------
+
+callback_router = CallbackRouter()
+streaming_manager = StreamingManagerBot(bot)
+
+
+def _callback_route(key, prefix=False):
+    """Registrar la función decorada en ``callback_router``."""
+    def decorator(func):
+        if prefix:
+            callback_router.prefix(key, func)
+        else:
+            callback_router.exact(key, func)
+        return func
+    return decorator
+
+
+def _open_store_dashboard(callback, arg):
+    shop_id = int(arg)
+    dop.set_user_shop(callback.message.chat.id, shop_id)
     try:
-        # Solo obtener goods cuando sea necesario - optimización aplicada
-        the_goods = None
-        shop_id_cb = dop.get_user_shop(callback.message.chat.id)
-        if callback.data == 'Ir al catálogo de productos' or (callback.data not in ['APROBAR_PAGO_', 'RECHAZAR_PAGO_', 'Enviar comprobante Binance', 'Volver al inicio', 'GLOBAL_CANCEL', 'Comprar'] and not callback.data.startswith('MAS_INFO_')):
-            the_goods = dop.get_goods(shop_id_cb)
-        
-        # Manejar callbacks de aprobación/rechazo de pagos
-        if callback.data.startswith('APROBAR_PAGO_') or callback.data.startswith('RECHAZAR_PAGO_'):
-            if callback.message.chat.id in dop.get_adminlist():
-                payments.handle_admin_payment_decision(
-                    callback.data, 
-                    callback.message.chat.id, 
-                    callback.id, 
-                    callback.message.message_id
-                )
+        con = db.get_db_connection()
+        cur = con.cursor()
+        cur.execute("SELECT name FROM shops WHERE id = ?", (shop_id,))
+        row = cur.fetchone()
+        name = row[0] if row else str(shop_id)
+    except Exception:
+        name = str(shop_id)
+    adminka.show_store_dashboard_unified(
+        callback.message.chat.id, shop_id, name
+    )
+
+
+for _prefix in ('view_store_', 'admin_store_', 'SHOP_'):
+    callback_router.prefix(_prefix, _open_store_dashboard)
+
+
+def _payment_decision(callback, _arg):
+    # Manejar callbacks de aprobación/rechazo de pagos
+    if callback.message.chat.id in dop.get_adminlist():
+        payments.handle_admin_payment_decision(
+            callback.data, 
+            callback.message.chat.id, 
+            callback.id, 
+            callback.message.message_id
+        )
+    else:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='❌ No tienes permisos de administrador')
+
+
+callback_router.prefix('APROBAR_PAGO_', _payment_decision)
+callback_router.prefix('RECHAZAR_PAGO_', _payment_decision)
+
+
+@_callback_route('Enviar comprobante Binance')
+def _send_binance_receipt(callback, _arg):
+    bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, 
+                             text='📱 Envía una captura de pantalla del comprobante de pago como imagen al chat')
+
+
+@_callback_route('GLOBAL_CANCEL')
+def _global_cancel(callback, _arg):
+    # Cancel the current flow and return to the store selector.
+    nav_system.reset(callback.message.chat.id)
+    show_shop_selection(callback.message.chat.id)
+
+
+@_callback_route('GLOBAL_BACK')
+def _global_back(callback, _arg):
+    prev = nav_system.back(callback.message.chat.id)
+    if prev:
+        nav_system.handle(prev, callback.message.chat.id, callback.from_user.id)
+    else:
+        show_shop_selection(callback.message.chat.id)
+
+
+@_callback_route('GLOBAL_REFRESH')
+def _global_refresh(callback, _arg):
+    current = nav_system.current(callback.message.chat.id)
+    if current:
+        nav_system.handle(current, callback.message.chat.id, callback.from_user.id)
+
+
+# Acciones registradas con ``nav_system.register`` (consultadas en cada tap,
+# así que las que se registran más tarde también se enrutan)
+callback_router.mount(
+    nav_system._actions,
+    lambda callback, _action: nav_system.handle(
+        callback.data, callback.message.chat.id, callback.from_user.id
+    ),
+)
+
+
+def _adminka_route(handler):
+    def route(callback, arg):
+        shop_id = dop.get_user_shop(callback.message.chat.id)
+        handler(callback.message.chat.id, shop_id, arg)
+    return route
+
+
+for _prefix, _handler in adminka.CALLBACK_PREFIXES.items():
+    callback_router.prefix(_prefix, _adminka_route(_handler))
+
+
+def _streaming_route(prefix):
+    def route(callback, arg):
+        streaming_manager.dispatch(prefix, arg, callback.message.chat.id)
+    return route
+
+
+for _prefix in streaming_manager.router:
+    callback_router.prefix(_prefix + '_', _streaming_route(_prefix))
+
+
+@_callback_route('SELECT_SHOP_', prefix=True)
+def _select_shop(callback, arg):
+    shop_id = int(arg)
+    dop.set_user_shop(callback.message.chat.id, shop_id)
+    info = dop.get_shop_info(shop_id)
+    avg, count = dop.get_shop_rating(shop_id)
+    desc = (info.get('description') or '') if info else ''
+    if count:
+        desc = f"{desc}\n⭐ {avg:.1f}/5 ({count})"
+    if info and (info.get('description') or info.get('media_file_id')):
+        markup = telebot.types.InlineKeyboardMarkup()
+        if info.get('button1_text') and info.get('button1_url'):
+            markup.add(telebot.types.InlineKeyboardButton(text=info['button1_text'], url=info['button1_url']))
+        if info.get('button2_text') and info.get('button2_url'):
+            markup.add(telebot.types.InlineKeyboardButton(text=info['button2_text'], url=info['button2_url']))
+        markup.add(telebot.types.InlineKeyboardButton(text='⭐ Calificar vendedor', callback_data=f'RATE_SHOP_{shop_id}'))
+        if info.get('media_file_id'):
+            if info.get('media_type') == 'photo':
+                bot.send_photo(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
+            elif info.get('media_type') == 'video':
+                bot.send_video(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
+            elif info.get('media_type') == 'document':
+                bot.send_document(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
+            elif info.get('media_type') == 'audio':
+                bot.send_audio(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
+            elif info.get('media_type') == 'animation':
+                bot.send_animation(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
             else:
-                bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='❌ No tienes permisos de administrador')
-            return
-        
-        # Manejar envío de comprobantes
-        elif callback.data == 'Enviar comprobante Binance':
-            bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, 
-                                     text='📱 Envía una captura de pantalla del comprobante de pago como imagen al chat')
-            return
-        
-        if callback.data == 'GLOBAL_CANCEL':
-            # Cancel the current flow and return to the store selector.
-            nav_system.reset(callback.message.chat.id)
-            show_shop_selection(callback.message.chat.id)
-            return
-        if callback.data == 'GLOBAL_BACK':
-            prev = nav_system.back(callback.message.chat.id)
-            if prev:
-                nav_system.handle(prev, callback.message.chat.id, callback.from_user.id)
+                bot.send_message(callback.message.chat.id, desc or '', reply_markup=markup)
+        else:
+            bot.send_message(callback.message.chat.id, desc, reply_markup=markup)
+
+    categories = dop.list_categories(shop_id)
+    key = telebot.types.InlineKeyboardMarkup()
+    for cid, cname in categories:
+        key.add(telebot.types.InlineKeyboardButton(text=cname, callback_data=f'CAT_{cid}'))
+    key.add(telebot.types.InlineKeyboardButton(text='Todos los productos', callback_data='CAT_NONE'))
+    key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+    bot.send_message(
+        callback.message.chat.id,
+        '📂 **SELECCIONA UNA CATEGORÍA**',
+        reply_markup=key,
+        parse_mode='Markdown'
+    )
+    if callback.message.content_type != 'text':
+        bot.delete_message(callback.message.chat.id, callback.message.message_id)
+
+
+@_callback_route('RATE_SHOP_', prefix=True)
+def _rate_shop(callback, arg):
+    shop_id = int(arg)
+    key = telebot.types.InlineKeyboardMarkup()
+    for i in range(1, 6):
+        key.add(telebot.types.InlineKeyboardButton(text='⭐' * i, callback_data=f'RATE_VAL_{shop_id}_{i}'))
+    bot.answer_callback_query(callback.id)
+    bot.send_message(callback.message.chat.id, 'Elige una calificación:', reply_markup=key)
+
+
+@_callback_route('RATE_VAL_', prefix=True)
+def _rate_value(callback, arg):
+    parts = arg.split('_')
+    if len(parts) == 2:
+        shop_id = int(parts[0])
+        value = int(parts[1])
+        dop.submit_shop_rating(shop_id, callback.from_user.id, value)
+        bot.answer_callback_query(callback.id, text='¡Gracias por calificar!', show_alert=True)
+        _select_shop(callback, str(shop_id))
+
+
+@_callback_route('SEARCH_', prefix=True)
+def _search_result(callback, arg):
+    parts = arg.split('_', 1)
+    if len(parts) == 2:
+        shop_id = int(parts[0])
+        product = parts[1]
+        dop.set_user_shop(callback.message.chat.id, shop_id)
+        if product in dop.get_goods(shop_id):
+            _show_product(callback, product, shop_id)
+
+
+def _product_button(text, action, product_name, shop_id, legacy):
+    """Botón con token compacto; ``legacy`` solo si el producto ya no existe."""
+    product_id = dop.get_product_id(product_name, shop_id)
+    if product_id is not None:
+        data = callback_codec.encode(action, product_id=product_id)
+    else:
+        data = legacy
+    return telebot.types.InlineKeyboardButton(text=text, callback_data=data)
+
+
+def _back_to_product_button(product_name, shop_id):
+    return _product_button('🔙 Volver al producto', 'product', product_name, shop_id, product_name)
+
+
+def _more_info_button(product_name, shop_id):
+    return _product_button('ℹ️ Más información', 'more_info', product_name, shop_id, f'MAS_INFO_{product_name}')
+
+
+# Productos por página del catálogo; Telegram rechaza teclados muy grandes
+CATALOG_PAGE_SIZE = 8
+
+
+def _render_catalog_page(shop_id, cat_id, page):
+    """Construir texto y teclado de una página, o ``None`` si no hay productos."""
+    goods = dop.list_products_by_category(cat_id, shop_id, with_ids=True)
+    if not goods:
+        return None
+    catalog = dop.get_productcatalog(shop_id)
+    if catalog is None:
+        return None
+    pages = -(-len(goods) // CATALOG_PAGE_SIZE)
+    page = max(1, min(page, pages))
+    start = (page - 1) * CATALOG_PAGE_SIZE
+
+    key = telebot.types.InlineKeyboardMarkup()
+    for product_id, name in goods[start:start + CATALOG_PAGE_SIZE]:
+        key.add(telebot.types.InlineKeyboardButton(
+            text=f'📦 {name}',
+            callback_data=callback_codec.encode('product', product_id=product_id),
+        ))
+    nav = []
+    for text, target in (('⬅️ Anterior', page - 1), ('Siguiente ➡️', page + 1)):
+        if 1 <= target <= pages:
+            nav.append(telebot.types.InlineKeyboardButton(
+                text=text,
+                callback_data=callback_codec.encode(
+                    'catalog', shop_id=shop_id, category_id=cat_id or 0, page=target
+                ),
+            ))
+    if nav:
+        key.add(*nav)
+    key.add(telebot.types.InlineKeyboardButton(text='🔙 Categorías', callback_data=callback_codec.encode('shop', shop_id=shop_id)))
+    key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+
+    catalog_text = f"🛍️ **CATÁLOGO DE PRODUCTOS**\n{'-'*30}\n\n{catalog}"
+    if pages > 1:
+        catalog_text += f"\n\n📄 Página {page}/{pages}"
+    return catalog_text, key
+
+
+def catalog_page(shop_id, cat_id=None, page=1):
+    """Texto y teclado de una página del catálogo.
+
+    Se memorizan por ``(shop_id, categoría, página)`` hasta que
+    ``dop.catalog_changed`` invalida la tienda.
+    """
+    return cache.get_or_load(
+        'catalog', (shop_id, cat_id, page),
+        lambda: _render_catalog_page(shop_id, cat_id, page),
+    )
+
+
+def _send_catalog_page(callback, shop_id, cat_id=None, page=1):
+    rendered = catalog_page(shop_id, cat_id, page)
+    if rendered is None:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='📭 No hay productos disponibles en este momento')
+        return
+    catalog_text, key = rendered
+    if callback.message.content_type != 'text':
+        bot.delete_message(callback.message.chat.id, callback.message.message_id)
+        bot.send_message(callback.message.chat.id, catalog_text, reply_markup=key, parse_mode='Markdown')
+    else:
+        dop.safe_edit_message(bot, callback.message, catalog_text, reply_markup=key, parse_mode='Markdown')
+
+
+@_callback_route('Ir al catálogo de productos')
+def _product_catalog(callback, _arg):
+    _send_catalog_page(callback, dop.get_user_shop(callback.message.chat.id))
+
+
+@_callback_route('CAT_', prefix=True)
+def _category_catalog(callback, arg):
+    cat_id = None if arg == 'NONE' else int(arg)
+    _send_catalog_page(callback, dop.get_user_shop(callback.message.chat.id), cat_id)
+
+
+def _show_product(callback, product_name, shop_id_cb):
+    """Mostrar información del producto editando el mensaje del catálogo."""
+    with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', 'w', encoding='utf-8') as f:
+        f.write(product_name)
+
+    # Una sola consulta con todos los datos del producto
+    view = dop.load_product_view(product_name, shop_id_cb)
+
+    # Crear teclado con botón "Más información" si existe descripción adicional
+    key = telebot.types.InlineKeyboardMarkup()
+
+    # Verificar si el producto tiene información adicional
+    if dop.has_additional_description(product_name, shop_id_cb, view=view):
+        key.add(_more_info_button(product_name, shop_id_cb))
+
+    key.add(telebot.types.InlineKeyboardButton(text='💰 Comprar ahora', callback_data='Comprar'))
+    key.add(telebot.types.InlineKeyboardButton(text='🔙 Catálogo', callback_data='Ir al catálogo de productos'))
+    key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+
+    # Optimización: manejo de multimedia más eficiente
+    media_info = dop.get_product_media(product_name, shop_id_cb, view=view)
+    formatted_info = dop.format_product_with_media(product_name, shop_id_cb, view=view)
+
+    if media_info:
+        try:
+            if media_info['type'] == 'photo':
+                bot.edit_message_media(
+                    chat_id=callback.message.chat.id,
+                    message_id=callback.message.message_id,
+                    media=telebot.types.InputMediaPhoto(
+                        media=media_info['file_id'],
+                        caption=formatted_info,
+                        parse_mode='Markdown'
+                    ),
+                    reply_markup=key
+                )
+            elif media_info['type'] == 'video':
+                bot.edit_message_media(
+                    chat_id=callback.message.chat.id,
+                    message_id=callback.message.message_id,
+                    media=telebot.types.InputMediaVideo(
+                        media=media_info['file_id'],
+                        caption=formatted_info,
+                        parse_mode='Markdown'
+                    ),
+                    reply_markup=key
+                )
             else:
-                show_shop_selection(callback.message.chat.id)
-            return
-        if callback.data == 'GLOBAL_REFRESH':
-            current = nav_system.current(callback.message.chat.id)
-            if current:
-                nav_system.handle(current, callback.message.chat.id, callback.from_user.id)
-            return
-        if callback.data in nav_system._actions:
-            nav_system.handle(
-                callback.data, callback.message.chat.id, callback.from_user.id
-            )
-            return
-        elif adminka.route_callback(
-            callback.data, callback.message.chat.id, shop_id_cb
-        ):
-            return
-        elif callback.data.startswith('view_store_'):
-            shop_id = int(callback.data.replace('view_store_', ''))
-            dop.set_user_shop(callback.message.chat.id, shop_id)
-            try:
-                con = db.get_db_connection()
-                cur = con.cursor()
-                cur.execute("SELECT name FROM shops WHERE id = ?", (shop_id,))
-                row = cur.fetchone()
-                name = row[0] if row else str(shop_id)
-            except Exception:
-                name = str(shop_id)
-            adminka.show_store_dashboard_unified(
-                callback.message.chat.id, shop_id, name
-            )
-            return
-        elif callback.data.startswith('admin_store_'):
-            shop_id = int(callback.data.replace('admin_store_', ''))
-            dop.set_user_shop(callback.message.chat.id, shop_id)
-            try:
-                con = db.get_db_connection()
-                cur = con.cursor()
-                cur.execute("SELECT name FROM shops WHERE id = ?", (shop_id,))
-                row = cur.fetchone()
-                name = row[0] if row else str(shop_id)
-            except Exception:
-                name = str(shop_id)
-            adminka.show_store_dashboard_unified(
-                callback.message.chat.id, shop_id, name
-            )
-            return
-        elif callback.data.startswith('SHOP_'):
-            shop_id = int(callback.data.replace('SHOP_', ''))
-            dop.set_user_shop(callback.message.chat.id, shop_id)
-            try:
-                con = db.get_db_connection()
-                cur = con.cursor()
-                cur.execute("SELECT name FROM shops WHERE id = ?", (shop_id,))
-                row = cur.fetchone()
-                name = row[0] if row else str(shop_id)
-            except Exception:
-                name = str(shop_id)
-            adminka.show_store_dashboard_unified(
-                callback.message.chat.id, shop_id, name
-            )
-            return
-        elif callback.data.startswith('SELECT_SHOP_'):
-            shop_id = int(callback.data.replace('SELECT_SHOP_', ''))
-            dop.set_user_shop(callback.message.chat.id, shop_id)
-            info = dop.get_shop_info(shop_id)
-            avg, count = dop.get_shop_rating(shop_id)
-            desc = (info.get('description') or '') if info else ''
-            if count:
-                desc = f"{desc}\n⭐ {avg:.1f}/5 ({count})"
-            if info and (info.get('description') or info.get('media_file_id')):
-                markup = telebot.types.InlineKeyboardMarkup()
-                if info.get('button1_text') and info.get('button1_url'):
-                    markup.add(telebot.types.InlineKeyboardButton(text=info['button1_text'], url=info['button1_url']))
-                if info.get('button2_text') and info.get('button2_url'):
-                    markup.add(telebot.types.InlineKeyboardButton(text=info['button2_text'], url=info['button2_url']))
-                markup.add(telebot.types.InlineKeyboardButton(text='⭐ Calificar vendedor', callback_data=f'RATE_SHOP_{shop_id}'))
-                if info.get('media_file_id'):
-                    if info.get('media_type') == 'photo':
-                        bot.send_photo(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
-                    elif info.get('media_type') == 'video':
-                        bot.send_video(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
-                    elif info.get('media_type') == 'document':
-                        bot.send_document(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
-                    elif info.get('media_type') == 'audio':
-                        bot.send_audio(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
-                    elif info.get('media_type') == 'animation':
-                        bot.send_animation(callback.message.chat.id, info['media_file_id'], caption=desc, reply_markup=markup)
-                    else:
-                        bot.send_message(callback.message.chat.id, desc or '', reply_markup=markup)
-                else:
-                    bot.send_message(callback.message.chat.id, desc, reply_markup=markup)
-
-            categories = dop.list_categories(shop_id)
-            key = telebot.types.InlineKeyboardMarkup()
-            for cid, cname in categories:
-                key.add(telebot.types.InlineKeyboardButton(text=cname, callback_data=f'CAT_{cid}'))
-            key.add(telebot.types.InlineKeyboardButton(text='Todos los productos', callback_data='CAT_NONE'))
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-            bot.send_message(
-                callback.message.chat.id,
-                '📂 **SELECCIONA UNA CATEGORÍA**',
-                reply_markup=key,
-                parse_mode='Markdown'
-            )
-            if callback.message.content_type != 'text':
                 bot.delete_message(callback.message.chat.id, callback.message.message_id)
+                if media_info['type'] == 'document':
+                    bot.send_document(
+                        chat_id=callback.message.chat.id,
+                        document=media_info['file_id'],
+                        caption=formatted_info,
+                        reply_markup=key,
+                        parse_mode='Markdown'
+                    )
+                elif media_info['type'] == 'audio':
+                    bot.send_audio(
+                        chat_id=callback.message.chat.id,
+                        audio=media_info['file_id'],
+                        caption=formatted_info,
+                        reply_markup=key,
+                        parse_mode='Markdown'
+                    )
+        except:
+            # Fallback a mensaje de texto
+            dop.safe_edit_message(bot, callback.message, formatted_info, reply_markup=key, parse_mode='Markdown')
+    else:
+        dop.safe_edit_message(bot, callback.message, formatted_info, reply_markup=key, parse_mode='Markdown')
 
-        elif callback.data.startswith('RATE_SHOP_'):
-            shop_id = int(callback.data.replace('RATE_SHOP_', ''))
-            key = telebot.types.InlineKeyboardMarkup()
-            for i in range(1, 6):
-                key.add(telebot.types.InlineKeyboardButton(text='⭐' * i, callback_data=f'RATE_VAL_{shop_id}_{i}'))
-            bot.answer_callback_query(callback.id)
-            bot.send_message(callback.message.chat.id, 'Elige una calificación:', reply_markup=key)
-
-        elif callback.data.startswith('RATE_VAL_'):
-            parts = callback.data.split('_')
-            if len(parts) == 4:
-                shop_id = int(parts[2])
-                value = int(parts[3])
-                dop.submit_shop_rating(shop_id, callback.from_user.id, value)
-                bot.answer_callback_query(callback.id, text='¡Gracias por calificar!', show_alert=True)
-                cb = types.SimpleNamespace(data=f'SELECT_SHOP_{shop_id}', message=callback.message, id=callback.id, from_user=callback.from_user)
-                inline(cb)
-
-        elif callback.data.startswith('SEARCH_'):
-            parts = callback.data.split('_', 2)
-            if len(parts) == 3:
-                shop_id = int(parts[1])
-                product = parts[2]
-                dop.set_user_shop(callback.message.chat.id, shop_id)
-                cb = types.SimpleNamespace(data=product, message=callback.message, id=callback.id, from_user=callback.from_user)
-                inline(cb)
-            return
 
-        elif callback.data == 'Ir al catálogo de productos':
-            # Optimización: usar conexión eficiente
-            con = dop.get_db_connection() if hasattr(dop, 'get_db_connection') else db.get_db_connection()
-            cursor = con.cursor()
-            cursor.execute("SELECT name, price FROM goods WHERE shop_id = ?;", (shop_id_cb,))
-            key = telebot.types.InlineKeyboardMarkup()
-            
-            # Agregar productos con emojis
-            for name, price in cursor.fetchall():
-                key.add(telebot.types.InlineKeyboardButton(text=f'📦 {name}', callback_data=name))
-            
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+def _product_by_id(callback, product_id):
+    product = dop.get_product_by_id(product_id)
+    if product is None:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='❌ Producto no disponible')
+        return None
+    name, shop_id = product
+    if dop.get_user_shop(callback.message.chat.id) != shop_id:
+        dop.set_user_shop(callback.message.chat.id, shop_id)
+    return name, shop_id
 
-            if dop.get_productcatalog(shop_id_cb) == None:
-                bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='📭 No hay productos disponibles en este momento')
-            else:
-                catalog_text = f"🛍️ **CATÁLOGO DE PRODUCTOS**\n{'-'*30}\n\n{dop.get_productcatalog(shop_id_cb)}"
-                if callback.message.content_type != 'text':
-                    bot.delete_message(callback.message.chat.id, callback.message.message_id)
-                    bot.send_message(callback.message.chat.id, catalog_text, reply_markup=key, parse_mode='Markdown')
-                else:
-                    dop.safe_edit_message(bot, callback.message, catalog_text, reply_markup=key, parse_mode='Markdown')
-
-        elif callback.data.startswith('CAT_'):
-            raw = callback.data.replace('CAT_', '')
-            cat_id = None if raw == 'NONE' else int(raw)
-            goods = dop.list_products_by_category(cat_id, shop_id_cb)
-            key = telebot.types.InlineKeyboardMarkup()
-            for name in goods:
-                key.add(telebot.types.InlineKeyboardButton(text=f'📦 {name}', callback_data=name))
-            key.add(telebot.types.InlineKeyboardButton(text='🔙 Categorías', callback_data=f'SELECT_SHOP_{shop_id_cb}'))
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-            if dop.get_productcatalog(shop_id_cb) is None or not goods:
-                bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='📭 No hay productos disponibles en este momento')
-            else:
-                catalog_text = f"🛍️ **CATÁLOGO DE PRODUCTOS**\n{'-'*30}\n\n{dop.get_productcatalog(shop_id_cb)}"
-                if callback.message.content_type != 'text':
-                    bot.delete_message(callback.message.chat.id, callback.message.message_id)
-                    bot.send_message(callback.message.chat.id, catalog_text, reply_markup=key, parse_mode='Markdown')
-                else:
-                    dop.safe_edit_message(bot, callback.message, catalog_text, reply_markup=key, parse_mode='Markdown')
-
-        # Mostrar información del producto
-        elif the_goods and callback.data in the_goods:
-            with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', 'w', encoding='utf-8') as f:
-                f.write(callback.data)
-            
-            # Crear teclado con botón "Más información" si existe descripción adicional
-            key = telebot.types.InlineKeyboardMarkup()
-            
-            # Verificar si el producto tiene información adicional
-            if dop.has_additional_description(callback.data, shop_id_cb):
-                key.add(telebot.types.InlineKeyboardButton(text='ℹ️ Más información', callback_data=f'MAS_INFO_{callback.data}'))
-            
-            key.add(telebot.types.InlineKeyboardButton(text='💰 Comprar ahora', callback_data='Comprar'))
-            key.add(telebot.types.InlineKeyboardButton(text='🔙 Catálogo', callback_data='Ir al catálogo de productos'))
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-            
-            # Optimización: manejo de multimedia más eficiente
-            media_info = dop.get_product_media(callback.data, shop_id_cb)
-            formatted_info = dop.format_product_with_media(callback.data, shop_id_cb)
 
-            if media_info:
-                try:
-                    if media_info['type'] == 'photo':
-                        bot.edit_message_media(
-                            chat_id=callback.message.chat.id,
-                            message_id=callback.message.message_id,
-                            media=telebot.types.InputMediaPhoto(
-                                media=media_info['file_id'],
-                                caption=formatted_info,
-                                parse_mode='Markdown'
-                            ),
-                            reply_markup=key
-                        )
-                    elif media_info['type'] == 'video':
-                        bot.edit_message_media(
-                            chat_id=callback.message.chat.id,
-                            message_id=callback.message.message_id,
-                            media=telebot.types.InputMediaVideo(
-                                media=media_info['file_id'],
-                                caption=formatted_info,
-                                parse_mode='Markdown'
-                            ),
-                            reply_markup=key
-                        )
-                    else:
-                        bot.delete_message(callback.message.chat.id, callback.message.message_id)
-                        if media_info['type'] == 'document':
-                            bot.send_document(
-                                chat_id=callback.message.chat.id,
-                                document=media_info['file_id'],
-                                caption=formatted_info,
-                                reply_markup=key,
-                                parse_mode='Markdown'
-                            )
-                        elif media_info['type'] == 'audio':
-                            bot.send_audio(
-                                chat_id=callback.message.chat.id,
-                                audio=media_info['file_id'],
-                                caption=formatted_info,
-                                reply_markup=key,
-                                parse_mode='Markdown'
-                            )
-                except:
-                    # Fallback a mensaje de texto
-                    dop.safe_edit_message(bot, callback.message, formatted_info, reply_markup=key, parse_mode='Markdown')
-            else:
-                dop.safe_edit_message(bot, callback.message, formatted_info, reply_markup=key, parse_mode='Markdown')
-        
-        # Mostrar información adicional del producto
-        elif callback.data.startswith('MAS_INFO_'):
-            product_name = callback.data.replace('MAS_INFO_', '')
-            
-            # Crear teclado para volver a la vista del producto
-            key = telebot.types.InlineKeyboardMarkup()
-            key.add(telebot.types.InlineKeyboardButton(text='🔙 Volver al producto', callback_data=product_name))
-            key.add(telebot.types.InlineKeyboardButton(text='💰 Comprar ahora', callback_data='Comprar'))
-            key.add(telebot.types.InlineKeyboardButton(text='🛍️ Catálogo', callback_data='Ir al catálogo de productos'))
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-            
-            # Mostrar información adicional
-            additional_info = dop.format_product_additional_info(product_name, shop_id_cb)
-            enhanced_additional = f"📋 **INFORMACIÓN ADICIONAL**\n{'-'*30}\n\n{additional_info}"
-            
-            dop.safe_edit_message(bot, callback.message, enhanced_additional, reply_markup=key, parse_mode='Markdown')
-            bot.answer_callback_query(callback_query_id=callback.id, show_alert=False, text='ℹ️ Información adicional mostrada')
+def _legacy_product(callback, data):
+    """Teclados antiguos usaban el nombre del producto como callback."""
+    shop_id_cb = dop.get_user_shop(callback.message.chat.id)
+    if data not in dop.get_goods(shop_id_cb):
+        return False
+    _show_product(callback, data, shop_id_cb)
 
 
-        elif callback.data == 'Buscar productos':
-            key = telebot.types.InlineKeyboardMarkup()
-            key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-            bot.answer_callback_query(callback.id)
-            dop.safe_edit_message(
-                bot,
-                callback.message,
-                '🔍 Escribe palabras clave para buscar productos:',
-                reply_markup=key,
-            )
-            with shelve.open(files.sost_bd) as bd:
-                bd[str(callback.message.chat.id)] = 24
+callback_router.fallback = _legacy_product
 
-        elif callback.data == 'Ver mis compras':
-            history = dop.get_user_purchases(callback.message.chat.id)
-            key = telebot.types.InlineKeyboardMarkup()
-            key.add(telebot.types.InlineKeyboardButton(
-                text='🏠 Inicio', callback_data='Volver al inicio'))
-            bot.answer_callback_query(callback.id)
-            dop.safe_edit_message(bot, callback.message,
-                                  history, reply_markup=key, parse_mode='Markdown')
-        elif callback.data == 'Cambiar tienda':
-            bot.answer_callback_query(callback.id)
-            show_shop_selection(callback.message.chat.id, callback.message)
-
-
-        elif callback.data == 'Volver al inicio':
-            nav_system.reset(callback.message.chat.id)
-            user_id = getattr(callback.from_user, 'id', None)
-            if user_id is not None:
-                show_main_interface(callback.message.chat.id, user_id)
-            else:
-                show_shop_selection(callback.message.chat.id, callback.message)
-            
-        elif callback.data == 'Comprar':
-            try:
-                with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', encoding='utf-8') as f:
-                    name_good = f.read()
-            except FileNotFoundError:
-                session_expired(callback.message.chat.id, callback.message.chat.username, callback.message.from_user.first_name)
-                return
-            if dop.amount_of_goods(name_good, shop_id_cb) == 0:
-                bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='❌ Producto agotado - No disponible para compra')
-            elif dop.payments_checkvkl(shop_id_cb) == None:
-                bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='💳 Los pagos están temporalmente desactivados')
-            else:
-                key = telebot.types.InlineKeyboardMarkup()
-                key.add(telebot.types.InlineKeyboardButton(text='🔙 Volver al producto', callback_data=name_good))
-                key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
-                purchase_text = f"""🛒 **REALIZAR COMPRA**\n{'-'*25}\n\n📦 **Producto:** {name_good}\n\n🔢 **Ingresa la cantidad** que deseas comprar:\n\n📊 **Cantidad mínima:** {str(dop.get_minimum(name_good, shop_id_cb))} unidades\n📦 **Stock disponible:** {str(dop.amount_of_goods(name_good, shop_id_cb))} unidades\n\n💡 **Tip:** Envía solo el número (ej: 5)"""
-                dop.safe_edit_message(bot, callback.message, purchase_text, reply_markup=key, parse_mode='Markdown')
-                with shelve.open(files.sost_bd) as bd:
-                    bd[str(callback.message.chat.id)] = 22
-
-        # Callbacks de pagos
-        elif callback.data == 'PayPal' or callback.data == 'Binance':
-            if callback.data == 'PayPal':
-                try:
-                    with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', encoding='utf-8') as f:
-                        name_good = f.read()
-                except FileNotFoundError:
-                    session_expired(callback.message.chat.id, callback.message.chat.username, callback.message.from_user.first_name)
-                    return
-                amount = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 0)
-                sum_price = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 1)
-                payments.creat_bill_paypal(callback.message.chat.id, callback.id, callback.message.message_id, sum_price, name_good, amount)
-            elif callback.data == 'Binance':
-                sum_price = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 1)
-                try:
-                    with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', encoding='utf-8') as f:
-                        name_good = f.read()
-                except FileNotFoundError:
-                    session_expired(callback.message.chat.id, callback.message.chat.username, callback.message.from_user.first_name)
-                    return
-                amount = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 0)
-                if int(sum_price) < 5:
-                    bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='⚠️ Binance Pay requiere un mínimo de $5 USD')
-                else: 
-                    payments.creat_bill_binance(callback.message.chat.id, callback.id, callback.message.message_id, sum_price, name_good, amount)
-        
-        elif callback.data == 'Verificar pago PayPal':
-            payments.check_oplata_paypal(callback.message.chat.id, callback.from_user.username, callback.id, callback.from_user.first_name, callback.message.message_id)
-        
-        elif callback.data == 'Verificar pago Binance':
-            payments.check_oplata_binance(callback.message.chat.id, callback.from_user.username, callback.id, callback.from_user.first_name, callback.message.message_id)
 
+# Mostrar información adicional del producto
+@_callback_route('MAS_INFO_', prefix=True)
+def _product_more_info(callback, product_name):
+    shop_id_cb = dop.get_user_shop(callback.message.chat.id)
+
+    # Crear teclado para volver a la vista del producto
+    key = telebot.types.InlineKeyboardMarkup()
+    key.add(_back_to_product_button(product_name, shop_id_cb))
+    key.add(telebot.types.InlineKeyboardButton(text='💰 Comprar ahora', callback_data='Comprar'))
+    key.add(telebot.types.InlineKeyboardButton(text='🛍️ Catálogo', callback_data='Ir al catálogo de productos'))
+    key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+
+    # Mostrar información adicional
+    additional_info = dop.format_product_additional_info(product_name, shop_id_cb)
+    enhanced_additional = f"📋 **INFORMACIÓN ADICIONAL**\n{'-'*30}\n\n{additional_info}"
+
+    dop.safe_edit_message(bot, callback.message, enhanced_additional, reply_markup=key, parse_mode='Markdown')
+    bot.answer_callback_query(callback_query_id=callback.id, show_alert=False, text='ℹ️ Información adicional mostrada')
+
+
+def _coded_product(callback, payload):
+    product = _product_by_id(callback, payload.product_id)
+    if product:
+        _show_product(callback, *product)
+
+
+def _coded_more_info(callback, payload):
+    product = _product_by_id(callback, payload.product_id)
+    if product:
+        _product_more_info(callback, product[0])
+
+
+_CODED_ROUTES = {
+    'product': _coded_product,
+    'more_info': _coded_more_info,
+    'shop': lambda callback, payload: _select_shop(callback, str(payload.shop_id)),
+    'catalog': lambda callback, payload: _send_catalog_page(
+        callback, payload.shop_id, payload.category_id or None, payload.page
+    ),
+}
+def _adminka_coded_route(handler):
+    def route(callback, payload):
+        chat_id = callback.message.chat.id
+        handler(chat_id, dop.get_user_shop(chat_id), payload)
+    return route
+
+
+for _action, _handler in adminka.CODED_ACTIONS.items():
+    _CODED_ROUTES[_action] = _adminka_coded_route(_handler)
+
+
+@_callback_route(callback_codec.TOKEN_PREFIX, prefix=True)
+def _coded_callback(callback, _arg):
+    """Botones con token de :mod:`callback_codec`."""
+    payload = callback_codec.decode(callback.data)
+    handler = _CODED_ROUTES.get(payload.action) if payload else None
+    if handler is None:
+        return False
+    handler(callback, payload)
+
+
+@_callback_route('Buscar productos')
+def _search_prompt(callback, _arg):
+    key = telebot.types.InlineKeyboardMarkup()
+    key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+    bot.answer_callback_query(callback.id)
+    dop.safe_edit_message(
+        bot,
+        callback.message,
+        '🔍 Escribe palabras clave para buscar productos:',
+        reply_markup=key,
+    )
+    with state_store.open_store(files.sost_bd) as bd:
+        bd[str(callback.message.chat.id)] = 24
+
+
+@_callback_route('Ver mis compras')
+def _purchase_history(callback, _arg):
+    history = dop.get_user_purchases(callback.message.chat.id)
+    key = telebot.types.InlineKeyboardMarkup()
+    key.add(telebot.types.InlineKeyboardButton(
+        text='🏠 Inicio', callback_data='Volver al inicio'))
+    bot.answer_callback_query(callback.id)
+    dop.safe_edit_message(bot, callback.message,
+                          history, reply_markup=key, parse_mode='Markdown')
+
+
+@_callback_route('Cambiar tienda')
+def _change_shop(callback, _arg):
+    bot.answer_callback_query(callback.id)
+    show_shop_selection(callback.message.chat.id, callback.message)
+
+
+@_callback_route('Volver al inicio')
+def _back_home(callback, _arg):
+    nav_system.reset(callback.message.chat.id)
+    user_id = getattr(callback.from_user, 'id', None)
+    if user_id is not None:
+        show_main_interface(callback.message.chat.id, user_id)
+    else:
+        show_shop_selection(callback.message.chat.id, callback.message)
+
+
+def _read_good_name(callback):
+    try:
+        with open('data/Temp/' + str(callback.message.chat.id) + 'good_name.txt', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        session_expired(callback.message.chat.id, callback.message.chat.username, callback.message.from_user.first_name)
+        return None
+
+
+@_callback_route('Comprar')
+def _buy(callback, _arg):
+    shop_id_cb = dop.get_user_shop(callback.message.chat.id)
+    name_good = _read_good_name(callback)
+    if name_good is None:
+        return
+    if dop.amount_of_goods(name_good, shop_id_cb) == 0:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='❌ Producto agotado - No disponible para compra')
+    elif dop.payments_checkvkl(shop_id_cb) == None:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='💳 Los pagos están temporalmente desactivados')
+    else:
+        key = telebot.types.InlineKeyboardMarkup()
+        key.add(_back_to_product_button(name_good, shop_id_cb))
+        key.add(telebot.types.InlineKeyboardButton(text='🏠 Inicio', callback_data='Volver al inicio'))
+        purchase_text = f"""🛒 **REALIZAR COMPRA**\n{'-'*25}\n\n📦 **Producto:** {name_good}\n\n🔢 **Ingresa la cantidad** que deseas comprar:\n\n📊 **Cantidad mínima:** {str(dop.get_minimum(name_good, shop_id_cb))} unidades\n📦 **Stock disponible:** {str(dop.amount_of_goods(name_good, shop_id_cb))} unidades\n\n💡 **Tip:** Envía solo el número (ej: 5)"""
+        dop.safe_edit_message(bot, callback.message, purchase_text, reply_markup=key, parse_mode='Markdown')
+        with state_store.open_store(files.sost_bd) as bd:
+            bd[str(callback.message.chat.id)] = 22
+
+
+# Callbacks de pagos
+@_callback_route('PayPal')
+def _pay_paypal(callback, _arg):
+    name_good = _read_good_name(callback)
+    if name_good is None:
+        return
+    amount = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 0)
+    sum_price = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 1)
+    payments.creat_bill_paypal(callback.message.chat.id, callback.id, callback.message.message_id, sum_price, name_good, amount)
+
+
+@_callback_route('Binance')
+def _pay_binance(callback, _arg):
+    sum_price = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 1)
+    name_good = _read_good_name(callback)
+    if name_good is None:
+        return
+    amount = dop.normal_read_line('data/Temp/' + str(callback.message.chat.id) + '.txt', 0)
+    if int(sum_price) < 5:
+        bot.answer_callback_query(callback_query_id=callback.id, show_alert=True, text='⚠️ Binance Pay requiere un mínimo de $5 USD')
+    else: 
+        payments.creat_bill_binance(callback.message.chat.id, callback.id, callback.message.message_id, sum_price, name_good, amount)
+
+
+@_callback_route('Verificar pago PayPal')
+def _check_paypal(callback, _arg):
+    payments.check_oplata_paypal(callback.message.chat.id, callback.from_user.username, callback.id, callback.from_user.first_name, callback.message.message_id)
+
+
+@_callback_route('Verificar pago Binance')
+def _check_binance(callback, _arg):
+    payments.check_oplata_binance(callback.message.chat.id, callback.from_user.username, callback.id, callback.from_user.first_name, callback.message.message_id)
+
+
+@bot.callback_query_handler(func=lambda c:True)
+def inline(callback):
+    try:
+        callback_router.dispatch(callback)
     except Exception as e:
         # Manejo de errores optimizado - no hacer print de todos los errores
         if "bad request" not in str(e).lower():
             logging.error(f"Error en callback: {e}")
 
-
 if hasattr(bot, "my_chat_member_handler"):
     @bot.my_chat_member_handler()
     def track_bot_membership(update):
@@ -879,7 +1052,7 @@ def handle_docs_log(message):
     """Manejar documentos enviados al bot"""
     adminka.handle_multimedia(message)
     if dop.get_sost(message.chat.id):
-        with shelve.open(files.sost_bd) as bd:
+        with state_store.open_store(files.sost_bd) as bd:
             if bd.get(str(message.chat.id)) == 12:
                 adminka.new_files(message.document.file_id, message.chat.id)
 
@@ -896,21 +1069,29 @@ def run_webhook():
         )
 
     import flask
+    import telemetry
+    from update_queue import UpdateQueue, RETRY_AFTER, render_stats
 
     app = flask.Flask(__name__)
+    # Responder a Telegram enseguida y procesar la actualización en segundo
+    # plano: en orden dentro de cada chat y en paralelo entre chats
+    updates = UpdateQueue(lambda update: bot.process_new_updates([update]))
+    updates.start()
+    telemetry.set_collector('update_queue', lambda: render_stats(updates.stats()))
 
     @app.route(config.WEBHOOK_PATH, methods=['POST'])
     def webhook():
         if flask.request.headers.get('content-type') == 'application/json':
             data = flask.request.get_data().decode('utf-8')
             update = telebot.types.Update.de_json(data)
-            bot.process_new_updates([update])
+            if not updates.put(update):
+                return '', 503, {'Retry-After': str(RETRY_AFTER)}
             return ''
         return flask.abort(403)
 
     @app.route('/metrics', methods=['GET'])
     def metrics():
-        return 'ok'
+        return telemetry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
     bot.remove_webhook()
     time.sleep(0.1)
@@ -925,7 +1106,11 @@ def run_webhook():
 
 def run_polling():
     """Iniciar el bot usando long polling."""
+    from update_queue import route_polling
+
     bot.remove_webhook()
+    # Mismo reparto por chat que en modo webhook
+    route_polling(bot)
     bot.infinity_polling(
         interval=config.POLL_INTERVAL,
         timeout=config.POLL_TIMEOUT,
@@ -944,6 +1129,10 @@ if __name__ == '__main__':
     except Exception:
         logging.error("⚠️ No se pudo escribir data/bot.pid")
 
+    # Retomar difusiones que quedaron a medias en la ejecución anterior
+    import broadcast
+    broadcast.resume_interrupted()
+
     if config.WEBHOOK_URL:
         logging.info("✅ Bot iniciando en modo webhook...")
         run_webhook()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Apply pending versioned migrations, including the hot-lookup indexes."""
+import db
+
+
+def main():
+    conn = db.get_db_connection()
+    before = db.get_schema_version(conn)
+    after = db.apply_migrations(conn)
+    cur = conn.cursor()
+    db.ensure_hot_indexes(cur)
+    conn.commit()
+    if after == before:
+        print(f"ℹ️ Esquema ya actualizado (versión {after})")
+    else:
+        print(f"✓ Esquema migrado de la versión {before} a la {after}")
+    print("✓ Migración completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -72,6 +72,10 @@ def main():
 
     conn.commit()
     cur.execute("DROP TABLE goods_old")
+    # Los triggers se fueron con goods_old; product_ids conserva los ids
+    # que llevan los botones ya enviados
+    if db.ensure_product_ids(cur):
+        print("✓ Ids de producto y triggers restaurados")
     conn.commit()
     print("✓ Migración completada")
 
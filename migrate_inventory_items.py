@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""Move stock from data/goods/*.txt files into the inventory_items table."""
+import db
+import inventory
+
+
+def main():
+    conn = db.get_db_connection()
+    db.apply_migrations(conn)
+    imported = inventory.import_stock_files()
+    if not imported:
+        print("ℹ️ No hay archivos de stock pendientes de importar")
+    for (shop_id, name), count in sorted(imported.items()):
+        print(f"✓ {count} unidades importadas para '{name}' (tienda {shop_id})")
+    print("✓ Migración completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""Import data/lists/*.txt into the bot_users, blocked_users and bot_admins tables."""
+import db
+import user_registry
+
+
+def main():
+    conn = db.get_db_connection()
+    db.apply_migrations(conn)
+    for registry, added in user_registry.import_text_files().items():
+        total = user_registry.count(registry)
+        print(f"✓ {added} ids nuevos en {registry} ({total} en total)")
+    print("✓ Migración completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""Rebuild the daily sales rollups (sales_daily) from the purchases table."""
+import sys
+
+import db
+
+
+def main():
+    conn = db.get_db_connection()
+    db.apply_migrations(conn)
+    shop_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    rows = db.rebuild_sales_rollups(shop_id)
+    target = f"tienda {shop_id}" if shop_id is not None else "todas las tiendas"
+    print(f"✓ {rows} días de ventas recalculados ({target})")
+    print("✓ Migración completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""Copy the old shelve files (data/bd/*.bd) into the configured state store.
+
+The bot does this by itself the first time it opens each store; the script
+lets it be done ahead of time.
+"""
+import files
+import state_store
+
+
+def main():
+    for path in (files.sost_bd, files.bot_message_bd, files.payments_bd):
+        if not state_store.shelve_files(path):
+            print(f"ℹ️ {path} no existe o ya fue migrado")
+            continue
+        store = state_store.open_store(path)
+        if state_store.shelve_files(path):
+            print(f"❌ No se pudo migrar {path}, revisa el registro")
+            continue
+        print(f"✓ {path} migrado ({len(store)} claves en el almacén)")
+    print("✓ Migración completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-import telebot, time, shelve, requests, json
+import telebot, time, requests, json
 from datetime import datetime, timedelta
 import dop, config, files
+import state_store
 from bot_instance import bot
 import logging
 
@@ -9,6 +10,9 @@ logging.basicConfig(level=logging.INFO)
 he_client = []
 pending_payments = {}  # Para almacenar pagos pendientes
 
+MAX_MESSAGE_LENGTH = 4096
+MEDIA_GROUP_SIZE = 10  # Máximo de documentos por álbum de Telegram
+
 try:
     import paypalrestsdk
     PAYPAL_AVAILABLE = True
@@ -460,6 +464,49 @@ Tu pago de ${payment_info['amount']} USD no pudo ser verificado.
         logging.error(f"Error en handle_admin_payment_decision: {e}")
         bot.answer_callback_query(callback_query_id=callback_id, show_alert=True, text='❌ Error procesando decisión')
 
+def chunk_text_units(units, limit=MAX_MESSAGE_LENGTH):
+    """Agrupa unidades de texto en bloques que caben en un mensaje.
+
+    Las unidades nunca se parten entre mensajes salvo que una sola supere
+    ``limit``.
+    """
+    chunks, current = [], ''
+    for unit in units:
+        unit = str(unit)
+        while len(unit) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(unit[:limit])
+            unit = unit[limit:]
+        if current and len(current) + 1 + len(unit) > limit:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def send_text_units(chat_id, units):
+    """Envía unidades de texto en el menor número de mensajes posible."""
+    for chunk in chunk_text_units(units):
+        bot.send_message(chat_id, chunk)
+
+
+def send_file_units(chat_id, units):
+    """Envía archivos como álbumes de hasta ``MEDIA_GROUP_SIZE`` documentos."""
+    for i in range(0, len(units), MEDIA_GROUP_SIZE):
+        group = units[i:i + MEDIA_GROUP_SIZE]
+        if len(group) == 1:
+            # Telegram exige al menos dos elementos por álbum
+            bot.send_document(chat_id, group[0])
+        else:
+            bot.send_media_group(
+                chat_id, [telebot.types.InputMediaDocument(f) for f in group]
+            )
+
+
 def deliver_product(chat_id, username, first_name, name_good, amount, sum_amount, payment_method):
     """Función común para entregar productos"""
     try:
@@ -467,33 +514,28 @@ def deliver_product(chat_id, username, first_name, name_good, amount, sum_amount
 
         shop_id = dop.get_user_shop(chat_id)
 
-        if dop.is_manual_delivery(name_good):
+        if dop.is_manual_delivery(name_good, shop_id):
             manual_msg = dop.get_manual_delivery_message(username, first_name)
             bot.send_message(chat_id, manual_msg)
             dop.decrement_manual_stock(name_good, amount, shop_id)
         else:
-            # Entregar producto físico/digital
-            text = ''
-            for i in range(int(amount)):
-                if dop.get_goodformat(name_good) == 'file':
-                    product_data = dop.get_tovar(name_good, shop_id)
-                    if product_data != "Error obteniendo producto" and product_data != "Producto agotado":
-                        bot.send_document(chat_id, product_data)
-                    else:
-                        bot.send_message(chat_id, f"❌ Error obteniendo {name_good}: {product_data}")
-                elif dop.get_goodformat(name_good) == 'text':
-                    product_data = dop.get_tovar(name_good, shop_id)
-                    if product_data != "Error obteniendo producto" and product_data != "Producto agotado":
-                        text += product_data + '\n'
-                    else:
-                        bot.send_message(chat_id, f"❌ Error obteniendo {name_good}: {product_data}")
-
-            if dop.get_goodformat(name_good) == 'text' and text.strip():
-                bot.send_message(chat_id, text)
-        
+            # Reservar todas las unidades de una vez y enviarlas en bloque
+            good_format = dop.get_goodformat(name_good, shop_id)
+            units = dop.get_tovar_batch(name_good, int(amount), shop_id, claimed_by=chat_id)
+            if good_format == 'file':
+                send_file_units(chat_id, units)
+            else:
+                send_text_units(chat_id, units)
+            missing = int(amount) - len(units)
+            if missing > 0:
+                bot.send_message(
+                    chat_id,
+                    f"❌ Error obteniendo {name_good}: Producto agotado ({missing} sin entregar)",
+                )
+
         # Mensaje después de compra
         if dop.check_message('after_buy') is True:
-            with shelve.open(files.bot_message_bd) as bd: 
+            with state_store.open_store(files.bot_message_bd) as bd: 
                 after_buy = bd['after_buy']
             after_buy = after_buy.replace('username', username)
             after_buy = after_buy.replace('name', first_name)
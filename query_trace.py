@@ -0,0 +1,237 @@
+"""Opt-in tracing of the SQLite statements run by the bot.
+
+Disabled by default; set ``SQL_TRACE=1`` (or call :func:`enable`) to turn it
+on.  While disabled the connections of :mod:`db` only pay one flag check per
+statement.  While enabled every statement is recorded with:
+
+* its normalized SQL (literals replaced by ``?``, ``IN (?, ?, ?)`` folded),
+* the time spent executing it and fetching its rows,
+* the number of rows read or changed,
+* the function that ran it (``module.function:line``).
+
+Statements slower than ``SQL_SLOW_MS`` (100 ms) are written to the
+``sql.slow`` logger, and to ``SQL_SLOW_LOG`` if that file is set.  Inside an
+:func:`update_scope` (one per Telegram update) the statements are counted
+and a statement repeated ``SQL_N1_THRESHOLD`` (10) times or more is reported
+as a likely N+1 pattern.  :func:`summary` returns the top statements and,
+with ``SQL_TRACE_SUMMARY_SECS`` set, a thread logs them periodically.
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+
+SLOW_MS = float(os.getenv('SQL_SLOW_MS', '100'))
+N1_THRESHOLD = int(os.getenv('SQL_N1_THRESHOLD', '10'))
+SUMMARY_SECS = float(os.getenv('SQL_TRACE_SUMMARY_SECS', '0'))
+SUMMARY_LIMIT = 10
+
+logger = logging.getLogger('sql.trace')
+slow_logger = logging.getLogger('sql.slow')
+
+enabled = False
+slow_ms = SLOW_MS
+n1_threshold = N1_THRESHOLD
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+_summary_thread = None
+_summary_stop = threading.Event()
+_slow_handler = None
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+# Marcos de los envoltorios de db.py que no cuentan como «quién llamó»
+_WRAPPER_MODULES = {'db', __name__}
+_WRAPPER_FUNCTIONS = {
+    '_timed', 'execute', 'executemany', 'executescript', 'cursor',
+    'fetchone', 'fetchmany', 'fetchall', '__next__', 'close', '_finish',
+    '_run', '_fetched', '__del__',
+}
+
+
+def normalize(sql):
+    """Return ``sql`` with literals replaced so equal statements group together."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def caller():
+    """Return ``module.function:line`` of the code that ran the statement."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module == __name__ or (
+            module in _WRAPPER_MODULES and frame.f_code.co_name in _WRAPPER_FUNCTIONS
+        ):
+            frame = frame.f_back
+            continue
+        return f"{module}.{frame.f_code.co_name}:{frame.f_lineno}"
+    return '?'
+
+
+class QueryStats:
+    """Aggregated figures of one normalized statement."""
+
+    __slots__ = ('sql', 'count', 'total', 'max', 'rows', 'callers')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.callers = {}
+
+    def as_dict(self):
+        top = max(self.callers.items(), key=lambda item: item[1])[0] if self.callers else '?'
+        return {
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'avg_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'rows': self.rows,
+            'caller': top,
+        }
+
+
+class Trace:
+    """One statement being traced; finished once its rows were read."""
+
+    __slots__ = ('sql', 'caller', 'seconds', 'rows')
+
+    def __init__(self, sql, caller_name):
+        self.sql = sql
+        self.caller = caller_name
+        self.seconds = 0.0
+        self.rows = 0
+
+
+def start(sql):
+    """Begin tracing ``sql``; return the :class:`Trace` to finish later."""
+    normalized = normalize(sql)
+    where = caller()
+    counts = getattr(_local, 'counts', None)
+    if counts is not None:
+        key = (normalized, where)
+        counts[key] = counts.get(key, 0) + 1
+    return Trace(normalized, where)
+
+
+def finish(trace):
+    """Add a finished statement to the aggregates and the slow-query log."""
+    with _lock:
+        stats = _stats.get(trace.sql)
+        if stats is None:
+            stats = _stats[trace.sql] = QueryStats(trace.sql)
+        stats.count += 1
+        stats.total += trace.seconds
+        stats.max = max(stats.max, trace.seconds)
+        stats.rows += max(trace.rows, 0)
+        stats.callers[trace.caller] = stats.callers.get(trace.caller, 0) + 1
+    elapsed_ms = trace.seconds * 1000
+    if elapsed_ms >= slow_ms:
+        slow_logger.warning(
+            f"slow_query ms={elapsed_ms:.1f} rows={trace.rows} caller={trace.caller} sql={trace.sql}"
+        )
+
+
+@contextmanager
+def update_scope(label=''):
+    """Count the statements run while handling one update.
+
+    On exit, statements repeated at least :data:`n1_threshold` times from
+    the same place are logged as a possible N+1 pattern.
+    """
+    if not enabled or getattr(_local, 'counts', None) is not None:
+        yield
+        return
+    _local.counts = counts = {}
+    try:
+        yield
+    finally:
+        _local.counts = None
+        for (sql, where), count in counts.items():
+            if count >= n1_threshold:
+                logger.warning(
+                    f"n_plus_one update={label} count={count} caller={where} sql={sql}"
+                )
+
+
+def summary(limit=SUMMARY_LIMIT, key='total_ms'):
+    """Return the ``limit`` statements with the highest ``key`` as dicts."""
+    with _lock:
+        rows = [stats.as_dict() for stats in _stats.values()]
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:limit]
+
+
+def format_summary(limit=SUMMARY_LIMIT, key='total_ms'):
+    lines = [f"Top {limit} consultas SQL por {key}:"]
+    for row in summary(limit, key):
+        lines.append(
+            f"{row['total_ms']:9.1f} ms  x{row['count']:<6} avg={row['avg_ms']:.2f} ms "
+            f"max={row['max_ms']:.1f} ms rows={row['rows']} caller={row['caller']}  {row['sql']}"
+        )
+    return "\n".join(lines)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _summary_loop(interval):
+    while not _summary_stop.wait(interval):
+        if _stats:
+            logger.info(format_summary())
+
+
+def enable(slow=None, n1=None, summary_secs=None, slow_log=None):
+    """Turn tracing on; arguments override the ``SQL_*`` environment values."""
+    global enabled, slow_ms, n1_threshold, _summary_thread, _slow_handler
+    slow_ms = SLOW_MS if slow is None else float(slow)
+    n1_threshold = N1_THRESHOLD if n1 is None else int(n1)
+    slow_log = slow_log if slow_log is not None else os.getenv('SQL_SLOW_LOG')
+    if slow_log and _slow_handler is None:
+        try:
+            os.makedirs(os.path.dirname(slow_log) or '.', exist_ok=True)
+            _slow_handler = logging.FileHandler(slow_log, encoding='utf-8')
+            _slow_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_logger.addHandler(_slow_handler)
+        except OSError as e:
+            logging.error(f"Error abriendo el registro de consultas lentas: {e}")
+    interval = SUMMARY_SECS if summary_secs is None else float(summary_secs)
+    if interval > 0 and _summary_thread is None:
+        _summary_stop.clear()
+        _summary_thread = threading.Thread(
+            target=_summary_loop, args=(interval,), name='sql-trace-summary', daemon=True
+        )
+        _summary_thread.start()
+    enabled = True
+
+
+def disable():
+    """Turn tracing off and stop the summary thread (aggregates are kept)."""
+    global enabled, _summary_thread, _slow_handler
+    enabled = False
+    _summary_stop.set()
+    _summary_thread = None
+    if _slow_handler is not None:
+        slow_logger.removeHandler(_slow_handler)
+        _slow_handler.close()
+        _slow_handler = None
+
+
+if os.getenv('SQL_TRACE', '').lower() in ('1', 'true', 'yes', 'on'):
+    enable()
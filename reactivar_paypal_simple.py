@@ -26,8 +26,8 @@ def reactivar():
         
         # Habilitar en config
         try:
-            import shelve
-            with shelve.open('data/bd/payments_bd.bd') as bd:
+            import state_store
+            with state_store.open_store('data/bd/payments_bd.bd') as bd:
                 bd['paypal'] = '✅'
             print("PAYPAL REACTIVADO!")
         except:
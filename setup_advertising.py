@@ -33,6 +33,7 @@ SQL_TABLES = [
         shop_id INTEGER DEFAULT 1,
         FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
     )""",
+    "CREATE INDEX IF NOT EXISTS idx_send_logs_shop_date ON send_logs (shop_id, sent_date)",
     """CREATE TABLE IF NOT EXISTS target_groups (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         platform TEXT NOT NULL,
@@ -0,0 +1,347 @@
+"""Key/value stores for per-chat state and bot settings.
+
+Replaces the ``shelve`` files listed in :mod:`files` (``sost_bd``,
+``bot_message_bd`` and ``payments_bd``).  :func:`open_store` returns a
+dict-like object that can also be used as ``with open_store(path) as bd:``
+so existing call sites keep their shape, but the handle stays open between
+calls and every single operation is atomic.
+
+Two backends are available, chosen with ``STATE_BACKEND``:
+
+``sqlite`` (default)
+    One small WAL database per store, next to the old shelve file
+    (``<path>.sqlite``), with one connection per thread.
+``redis``
+    Any client exposing ``get``/``set``/``delete``/``scan_iter`` and, for
+    :meth:`StateStore.update`, ``pipeline`` (``redis-py`` or a compatible
+    stand-in).  Keys are prefixed with the store name.
+
+Values are pickled, like shelve did.  The first time a store is opened in
+a process, an old ``.bd`` shelve file found at its path is copied into it
+with :func:`migrate_shelve` and renamed to ``*.migrated``, so upgraded bots
+keep their messages, payment toggles and user states.
+"""
+
+import abc
+import os
+import pickle
+import sqlite3
+import logging
+import threading
+
+import config
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+    _WatchError = redis.WatchError
+except ImportError:
+    REDIS_AVAILABLE = False
+    _WatchError = ()
+
+BUSY_TIMEOUT_MS = 5000
+
+# Archivos que ``shelve`` crea según el módulo dbm disponible
+SHELVE_SUFFIXES = ('', '.db', '.dat', '.dir', '.bak')
+MIGRATED_SUFFIX = '.migrated'
+
+_MISSING = object()
+
+
+class StateStore(abc.ABC):
+    """Dict-like interface shared by all backends."""
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        """Return the value of ``key`` or ``default``."""
+
+    @abc.abstractmethod
+    def set(self, key, value):
+        """Store ``value`` under ``key``."""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Remove ``key``; return True if it existed."""
+
+    @abc.abstractmethod
+    def keys(self):
+        """Return a list with every key."""
+
+    @abc.abstractmethod
+    def update(self, key, func, default=None):
+        """Atomically replace the value of ``key`` with ``func(value)``."""
+
+    def pop(self, key, default=_MISSING):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        self.delete(key)
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    # ``with open_store(path) as bd`` keeps working like ``shelve.open``; the
+    # underlying handle is shared and stays open.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class SQLiteStateStore(StateStore):
+    """Store backed by a ``kv`` table in its own SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        con = getattr(self._local, 'connection', None)
+        if con is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            con = sqlite3.connect(
+                self.path,
+                timeout=BUSY_TIMEOUT_MS / 1000,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+            )
+            self._local.connection = con
+            with self._lock:
+                self._connections.append(con)
+        return con
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ?", (str(key),)
+        ).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+            (str(key), pickle.dumps(value)),
+        )
+
+    def delete(self, key):
+        cur = self._connection().execute("DELETE FROM kv WHERE key = ?", (str(key),))
+        return cur.rowcount > 0
+
+    def keys(self):
+        return [row[0] for row in self._connection().execute("SELECT key FROM kv")]
+
+    def update(self, key, func, default=None):
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT value FROM kv WHERE key = ?", (str(key),)).fetchone()
+            value = func(pickle.loads(row[0]) if row else default)
+            con.execute(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                (str(key), pickle.dumps(value)),
+            )
+            con.execute("COMMIT")
+            return value
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._lock:
+            for con in self._connections:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class RedisStateStore(StateStore):
+    """Store backed by a Redis-compatible client."""
+
+    def __init__(self, client, namespace):
+        self.client = client
+        self.prefix = f"{namespace}:"
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key, default=None):
+        raw = self.client.get(self._key(key))
+        return pickle.loads(raw) if raw is not None else default
+
+    def set(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value))
+
+    def delete(self, key):
+        return bool(self.client.delete(self._key(key)))
+
+    def keys(self):
+        keys = []
+        for raw in self.client.scan_iter(match=f"{self.prefix}*"):
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            keys.append(raw[len(self.prefix):])
+        return keys
+
+    def update(self, key, func, default=None):
+        # Transacción optimista: se reintenta si otra escritura cambió la clave
+        full_key = self._key(key)
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(full_key)
+                    raw = pipe.get(full_key)
+                    value = func(pickle.loads(raw) if raw is not None else default)
+                    pipe.multi()
+                    pipe.set(full_key, pickle.dumps(value))
+                    pipe.execute()
+                    return value
+                except _WatchError:
+                    continue
+
+    def close(self):
+        pass
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_redis_client = None
+
+
+def _backend():
+    return getattr(config, 'STATE_BACKEND', 'sqlite') or 'sqlite'
+
+
+def _namespace(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("STATE_BACKEND=redis requiere el paquete 'redis'")
+        _redis_client = redis.Redis.from_url(getattr(config, 'REDIS_URL', None) or 'redis://localhost:6379/0')
+    return _redis_client
+
+
+def set_redis_client(client):
+    """Use ``client`` for the redis backend (a local stand-in in tests)."""
+    global _redis_client
+    _redis_client = client
+    reset()
+
+
+def shelve_files(path):
+    """Return the files of an old shelve database at ``path`` that exist."""
+    return [f"{path}{suffix}" for suffix in SHELVE_SUFFIXES if os.path.isfile(f"{path}{suffix}")]
+
+
+def _import_shelve(path, store):
+    """Copy the shelve file at ``path`` into ``store`` and rename it aside.
+
+    If the file cannot be read it is left in place and retried the next
+    time the bot starts.
+    """
+    old_files = shelve_files(path)
+    if not old_files:
+        return
+    try:
+        copied = _copy_shelve(path, store)
+    except Exception as e:
+        logging.error(f"Error migrando {path} al almacén de estado: {e}")
+        return
+    for name in old_files:
+        os.replace(name, f"{name}{MIGRATED_SUFFIX}")
+    logging.info(f"{copied} claves migradas desde {path}")
+
+
+def open_store(path):
+    """Return the store that replaces the shelve file at ``path``.
+
+    An old shelve file still at ``path`` is imported the first time.
+    """
+    backend = _backend()
+    with _stores_lock:
+        store = _stores.get((backend, path))
+        if store is None:
+            if backend == 'redis':
+                store = RedisStateStore(_get_redis_client(), _namespace(path))
+            else:
+                store = SQLiteStateStore(f"{path}.sqlite")
+            _import_shelve(path, store)
+            _stores[(backend, path)] = store
+        return store
+
+
+def reset():
+    """Close and forget every open store."""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+
+
+def _copy_shelve(path, store):
+    import shelve
+
+    copied = 0
+    with shelve.open(path, flag='r') as old:
+        for key in list(old.keys()):
+            if key in store:
+                continue
+            try:
+                store.set(key, old[key])
+                copied += 1
+            except Exception as e:
+                logging.error(f"Error migrando clave {key} de {path}: {e}")
+    return copied
+
+
+def migrate_shelve(path, store=None):
+    """Copy the keys of the shelve file at ``path`` into the store.
+
+    Existing keys in the store are kept.  Returns the number of keys copied.
+    """
+    import dbm
+
+    store = store or open_store(path)
+    try:
+        return _copy_shelve(path, store)
+    except dbm.error as e:
+        logging.error(f"No se pudo abrir {path}: {e}")
+        return 0
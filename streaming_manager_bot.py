@@ -62,14 +62,20 @@ class StreamingManagerBot:
     def route_callback(self, callback_data, chat_id):
         """Dispatch callbacks to the appropriate Telethon helper."""
 
-        for prefix, handler in self.router.items():
+        for prefix in self.router:
             if callback_data.startswith(prefix + "_"):
-                if prefix == "start_auto_detection":
-                    parts = callback_data.split("_")
-                    store_id = int(parts[3])
-                    mode = parts[4] if len(parts) > 4 else "all"
-                    handler(chat_id, store_id, mode)
-                else:
-                    store_id = int(callback_data.rsplit("_", 1)[1])
-                    handler(chat_id, store_id)
+                self.dispatch(prefix, callback_data[len(prefix) + 1 :], chat_id)
                 break
+
+    def dispatch(self, prefix, arg, chat_id):
+        """Run the handler for ``prefix`` with the text that followed it."""
+
+        handler = self.router[prefix]
+        if prefix == "start_auto_detection":
+            parts = arg.split("_")
+            store_id = int(parts[0])
+            mode = parts[1] if len(parts) > 1 else "all"
+            handler(chat_id, store_id, mode)
+        else:
+            store_id = int(arg.rsplit("_", 1)[-1])
+            handler(chat_id, store_id)
@@ -0,0 +1,275 @@
+"""Process metrics exported in the Prometheus text format.
+
+Counters and histograms are kept in memory and rendered by :func:`render`,
+which both ``/metrics`` routes return.  The hot paths record into them:
+
+* ``telegram_updates_total{type}``: updates accepted into the queue, by type
+  (those rejected with ``503`` are counted when Telegram redelivers them).
+* ``callback_handler_seconds{route}``: time spent in each callback route.
+* ``telegram_api_calls_total{method,status}`` and
+  ``telegram_api_seconds{method}``: every Bot API request, by method.
+* ``telegram_rate_limited_total{method}``: ``429 Too Many Requests`` answers.
+* ``sqlite_queries_total{kind}`` and ``sqlite_query_seconds{kind}``: queries
+  run on the pooled connections of :mod:`db`, by statement kind.
+* ``outgoing_messages_total{source,outcome}``: broadcast and campaign sends.
+
+Values that are read rather than counted (queue depths, cache sizes) come
+from collectors registered with :func:`set_collector`.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = {}
+_collectors = {}
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def values(self):
+        """Return ``{label_values_tuple: value}``."""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram:
+    """Cumulative histogram of observed values (seconds) with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float('inf'),), counts):
+                cumulative += hits
+                le = '+Inf' if bound == float('inf') else _number(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, key, ('le', le))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def _register(cls, name, documentation, labelnames, **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Return the counter ``name``, creating it on first use."""
+    return _register(Counter, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Return the histogram ``name``, creating it on first use."""
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def set_collector(key, collect):
+    """Register ``collect()``, returning extra exposition text, under ``key``.
+
+    Registering the same ``key`` again replaces the previous collector;
+    ``collect=None`` removes it.
+    """
+    with _lock:
+        if collect is None:
+            _collectors.pop(key, None)
+        else:
+            _collectors[key] = collect
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    with _lock:
+        metrics = sorted(_metrics.items())
+        collectors = sorted(_collectors.items())
+    lines = []
+    for name, metric in metrics:
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.samples())
+    text = "\n".join(lines) + "\n" if lines else ""
+    for key, collect in collectors:
+        try:
+            extra = collect()
+        except Exception as e:
+            extra = f"# collector {key} failed: {e}\n"
+        if extra:
+            text += extra if extra.endswith("\n") else extra + "\n"
+    return text
+
+
+UPDATES = counter('telegram_updates_total', 'Updates received from Telegram by type.', ['type'])
+CALLBACK_SECONDS = histogram(
+    'callback_handler_seconds', 'Time spent handling callback queries by route.', ['route']
+)
+API_CALLS = counter(
+    'telegram_api_calls_total', 'Bot API requests by method and result.', ['method', 'status']
+)
+API_SECONDS = histogram('telegram_api_seconds', 'Bot API request latency by method.', ['method'])
+RATE_LIMITED = counter(
+    'telegram_rate_limited_total', 'Bot API requests answered with 429 by method.', ['method']
+)
+DB_QUERIES = counter('sqlite_queries_total', 'SQLite statements executed by kind.', ['kind'])
+DB_SECONDS = histogram(
+    'sqlite_query_seconds', 'SQLite statement latency by kind.', ['kind'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+MESSAGES = counter(
+    'outgoing_messages_total', 'Broadcast and campaign messages by source and outcome.',
+    ['source', 'outcome'],
+)
+
+
+def statement_kind(sql):
+    """Return the lower-cased first keyword of ``sql`` (``select``, ``insert``...)."""
+    sql = sql.lstrip()
+    end = 0
+    while end < len(sql) and sql[end].isalpha():
+        end += 1
+    return sql[:end].lower() or 'other'
+
+
+def _api_status(exc):
+    code = getattr(exc, 'error_code', None)
+    return str(code) if code else 'error'
+
+
+def instrument_telebot():
+    """Time every Bot API request made through ``telebot.apihelper``.
+
+    All bots of the process (main bot, campaign tokens, cron scripts) go
+    through ``apihelper._make_request``, so wrapping it once covers them.
+    Returns ``False`` if telebot is not available.
+    """
+    try:
+        from telebot import apihelper
+    except ImportError:
+        return False
+    original = getattr(apihelper, '_make_request', None)
+    if original is None:
+        return False
+    if getattr(original, '_telemetry', False):
+        return True
+
+    def _make_request(token, method_name, *args, **kwargs):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            return original(token, method_name, *args, **kwargs)
+        except Exception as e:
+            status = _api_status(e)
+            if status == '429':
+                RATE_LIMITED.inc(method=method_name)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method=method_name)
+            API_CALLS.inc(method=method_name, status=status)
+
+    _make_request._telemetry = True
+    apihelper._make_request = _make_request
+    return True
+
+
+def render_cache_stats():
+    """Expose :func:`cache.stats` per namespace."""
+    import cache
+
+    lines = []
+    for name, values in cache.stats().items():
+        for field, value in values.items():
+            suffix = '' if field == 'size' else '_total'
+            lines.append(f'cache_{field}{suffix}{{namespace="{_escape(name)}"}} {value}')
+    return "\n".join(lines)
+
+
+set_collector('cache', render_cache_stats)
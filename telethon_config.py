@@ -3,7 +3,7 @@ from bot_instance import bot
 import db
 import telethon_manager
 import files
-import shelve
+import state_store
 from utils.message_chunker import send_long_message
 from navigation import nav_system
 
@@ -79,7 +79,7 @@ def start_telethon_wizard(chat_id, store_id, action="next"):
     """Execute the Telethon configuration wizard step by step.
 
     Each invocation advances the wizard for ``chat_id`` one step forward.  The
-    current position is persisted in :mod:`shelve` under ``telethon_step`` so the
+    current position is persisted in :mod:`state_store` under ``telethon_step`` so the
     process can be resumed later.  A simple text based progress bar is shown to
     the user after each step.
     """
@@ -91,7 +91,7 @@ def start_telethon_wizard(chat_id, store_id, action="next"):
         bar = "#" * current + "-" * (total_steps - current)
         send_long_message(bot, chat_id, f"[{bar}] {int(current / total_steps * 100)}%")
 
-    with shelve.open(files.sost_bd) as bd:
+    with state_store.open_store(files.sost_bd) as bd:
         step = bd.get(key, 0)
 
         status = db.get_global_telethon_status()
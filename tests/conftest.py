@@ -1,8 +1,26 @@
+import sys
+import pathlib
 import warnings
 
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import cache
+import state_store
+
 warnings.filterwarnings(
     "ignore", category=DeprecationWarning, module=r"^binance\.ws\.websocket_api"
 )
 warnings.filterwarnings(
     "ignore", category=DeprecationWarning, module=r"^websockets\.legacy"
 )
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    # Cada prueba usa su propia base de datos temporal
+    cache.clear_all()
+    yield
+    cache.clear_all()
+    state_store.reset()
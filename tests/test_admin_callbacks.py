@@ -48,6 +48,10 @@ def setup_env(monkeypatch, tmp_path):
     conn.commit(); conn.close()
 
     sys.modules.pop("db", None)
+    sys.modules.pop("inventory", None)
+    sys.modules.pop("broadcast_engine", None)
+    sys.modules.pop("broadcast_jobs", None)
+    sys.modules.pop("user_registry", None)
     sys.modules.pop("dop", None)
     sys.modules.pop("adminka", None)
     importlib.import_module("db")
@@ -1,14 +1,24 @@
 from tests.test_categories import setup_dop
 
 
-def test_get_adminlist_cleans_invalid(monkeypatch, tmp_path):
+def test_get_adminlist_imports_valid_ids(monkeypatch, tmp_path):
     dop = setup_dop(monkeypatch, tmp_path)
     admins_file = tmp_path / "admins_list.txt"
     admins_file.write_text("123\nabc\n456\n")
     monkeypatch.setattr(dop.files, "admins_list", str(admins_file))
 
+    assert dop.user_registry.import_text_file(dop.user_registry.ADMINS, str(admins_file)) == 2
     admins = dop.get_adminlist()
 
     assert admins == [1, 123, 456]
-    assert admins_file.read_text().splitlines() == ["123", "456"]
+    assert admins_file.read_text().splitlines() == ["123", "abc", "456"]
 
+
+def test_del_id_removes_admin(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.new_admin(55)
+    assert 55 in dop.get_adminlist()
+
+    dop.del_id(dop.files.admins_list, 55)
+
+    assert 55 not in dop.get_adminlist()
@@ -328,6 +328,17 @@ def test_deactivate_schedule_removes_from_pending(tmp_path, monkeypatch):
     init_ads_db(db_path)
     manager = AdvertisingManager(str(db_path))
 
+    import advertising_system.ad_manager as ad_mod
+    import advertising_system.scheduler as mod
+    class DummyDatetime(mod.datetime):
+        @classmethod
+        def now(cls):
+            return cls(2023, 1, 2, 10, 0)
+
+    monkeypatch.setattr(mod, "datetime", DummyDatetime)
+    # La próxima hora de envío se calcula al crear la programación
+    monkeypatch.setattr(ad_mod, "datetime", DummyDatetime)
+
     camp_id = manager.create_campaign({"name": "Camp", "message_text": "Hi", "created_by": 1})
     ok, _ = manager.schedule_campaign(camp_id, ["lunes"], ["10:00"])
     assert ok
@@ -338,14 +349,6 @@ def test_deactivate_schedule_removes_from_pending(tmp_path, monkeypatch):
     schedule_id = cur.fetchone()[0]
     conn.close()
 
-    import advertising_system.scheduler as mod
-    class DummyDatetime(mod.datetime):
-        @classmethod
-        def now(cls):
-            return cls(2023, 1, 2, 10, 0)
-
-    monkeypatch.setattr(mod, "datetime", DummyDatetime)
-
     scheduler = CampaignScheduler(str(db_path))
     assert len(scheduler.get_pending_sends()) == 1
 
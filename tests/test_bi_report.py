@@ -76,3 +76,108 @@ def test_show_bi_report_access(monkeypatch):
     adminka.show_bi_report(1, 2)
     assert any('Solo SuperAdmin' in m[1] for m in dummy.messages)
     assert events and events[-1][0] == 'WARNING'
+
+
+def test_resolve_period_ranges():
+    import business_intelligence as bi
+    from datetime import date
+
+    today = date(2024, 3, 31)
+    p = bi.resolve_period('7d', today)
+    assert (p.start, p.end, p.prev_start, p.prev_end) == (
+        '2024-03-25', '2024-03-31', '2024-03-18', '2024-03-24')
+    p = bi.resolve_period('mtd', today)
+    assert (p.start, p.prev_start, p.prev_end) == ('2024-03-01', '2024-02-01', '2024-02-29')
+    p = bi.resolve_period('yoy', date(2024, 2, 29))
+    assert (p.start, p.prev_start, p.prev_end) == ('2024-01-01', '2023-01-01', '2023-02-28')
+    assert bi.resolve_period('all', today).prev_start is None
+
+
+def _multi_shop_db(shops=50):
+    from datetime import date, timedelta
+
+    con = sqlite3.connect(':memory:')
+    cur = con.cursor()
+    cur.execute('CREATE TABLE shops (id INTEGER PRIMARY KEY, name TEXT)')
+    cur.execute(
+        'CREATE TABLE sales_daily (shop_id INTEGER, day TEXT, revenue INTEGER, '
+        'orders INTEGER, buyers INTEGER, PRIMARY KEY (shop_id, day))'
+    )
+    today = date.today()
+    for sid in range(1, shops + 1):
+        cur.execute('INSERT INTO shops VALUES (?, ?)', (sid, f'S{sid}'))
+        for ago in range(14):
+            day = (today - timedelta(days=ago)).isoformat()
+            # los últimos 7 días venden el doble que la semana anterior
+            revenue = sid * (2 if ago < 7 else 1)
+            cur.execute('INSERT INTO sales_daily VALUES (?,?,?,?,1)', (sid, day, revenue, 1))
+    con.commit()
+    return con
+
+
+def test_bi_report_aggregates_all_shops_in_one_query(monkeypatch):
+    import business_intelligence as bi
+
+    con = _multi_shop_db()
+    monkeypatch.setattr(db, 'get_db_connection', lambda: con)
+    queries = []
+    con.set_trace_callback(queries.append)
+
+    period, ranking = bi.build_bi_report('7d')
+
+    selects = [q for q in queries if q.lstrip().upper().startswith(('SELECT', 'WITH'))]
+    assert len([q for q in selects if 'sales_daily' in q and 'sqlite_master' not in q]) == 1
+    assert len(ranking) == 50
+    top = ranking[0]
+    assert top['shop_id'] == 50
+    assert top['revenue'] == 50 * 2 * 7
+    assert top['orders'] == 7
+    assert top['previous_revenue'] == 50 * 7
+    assert top['growth'] == 100.0
+    assert top['trend'] == [100] * 7
+
+
+def test_export_bi_report_csv_and_json(monkeypatch):
+    import csv, io, json
+    import business_intelligence as bi
+
+    con = _multi_shop_db(shops=3)
+    monkeypatch.setattr(db, 'get_db_connection', lambda: con)
+
+    rows = list(csv.DictReader(io.StringIO(bi.export_bi_report('30d', 'csv'))))
+    assert [r['name'] for r in rows] == ['S3', 'S2', 'S1']
+    assert rows[0]['rank'] == '1' and rows[0]['revenue'] == str(3 * 21)
+
+    data = json.loads(bi.export_bi_report('mtd', 'json'))
+    assert data['period'] == 'mtd'
+    assert [s['shop_id'] for s in data['shops']] == [3, 2, 1]
+
+
+def test_bi_export_sends_document_to_superadmin(monkeypatch):
+    import adminka
+
+    sent = []
+    dummy = DummyBot()
+    dummy.send_document = lambda chat_id, doc, caption=None: sent.append((chat_id, doc.name, doc.read()))
+    monkeypatch.setattr(adminka, 'bot', dummy)
+    monkeypatch.setattr(adminka.db, 'log_event', lambda *a, **k: None)
+    monkeypatch.setattr(adminka.db, 'get_user_role', lambda uid: 'superadmin')
+    monkeypatch.setattr(
+        adminka.nav_system,
+        'create_universal_navigation',
+        lambda c, p, quick_actions=None: None,
+    )
+    monkeypatch.setattr(
+        adminka.business_intelligence, 'export_bi_report',
+        lambda period, fmt: f'{period}:{fmt}',
+    )
+
+    adminka._bi_report_period[5] = '90d'
+    adminka.admin_bi_export(5, 1, 'csv')
+    assert sent[0][0] == 5
+    assert sent[0][1].startswith('reporte_bi_90d_') and sent[0][1].endswith('.csv')
+    assert sent[0][2] == b'90d:csv'
+
+    monkeypatch.setattr(adminka.db, 'get_user_role', lambda uid: 'user')
+    adminka.admin_bi_export(5, 2, 'json')
+    assert len(sent) == 1
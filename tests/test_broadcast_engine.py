@@ -0,0 +1,110 @@
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from broadcast_engine import BroadcastEngine, ChatBuckets, TokenBucket, classify_error
+from tests.test_categories import setup_dop
+
+
+class ApiError(Exception):
+    def __init__(self, code, description, retry_after=None):
+        super().__init__(description)
+        self.error_code = code
+        self.description = description
+        self.result_json = {"parameters": {"retry_after": retry_after}} if retry_after is not None else {}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_paces_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(30, clock=clock, sleep=clock.sleep)
+    for _ in range(60):
+        bucket.acquire()
+    # 30 sent immediately from the burst, the other 30 need one more second
+    assert 0.99 < clock.now < 1.05
+
+
+def test_token_bucket_pause_delays_next_token():
+    clock = FakeClock()
+    bucket = TokenBucket(30, clock=clock, sleep=clock.sleep)
+    bucket.pause(7)
+    bucket.acquire()
+    assert clock.now >= 7
+
+
+def test_classify_error_separates_rate_limits_from_blocks():
+    assert classify_error(ApiError(429, "Too Many Requests", retry_after=4)) == ("retry", 4.0)
+    assert classify_error(ApiError(429, "Too Many Requests: retry after 9")) == ("retry", 9.0)
+    assert classify_error(ApiError(403, "Forbidden: bot was blocked by the user")) == ("blocked", None)
+    assert classify_error(ApiError(400, "Bad Request: message is too long")) == ("failed", None)
+
+
+def test_engine_retries_429_and_reports_outcomes():
+    attempts = {}
+
+    def send(chat_id):
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if chat_id == 2 and attempts[chat_id] == 1:
+            raise ApiError(429, "Too Many Requests", retry_after=0)
+        if chat_id == 3:
+            raise ApiError(403, "Forbidden: bot was blocked by the user")
+        if chat_id == 4:
+            raise ApiError(400, "Bad Request: message is too long")
+
+    blocked = []
+    engine = BroadcastEngine(workers=3, chat_buckets=ChatBuckets(rate=1000))
+    result = engine.run(iter([1, 2, 3, 4, 5]), send, on_blocked=blocked.append)
+
+    assert (result.sent, result.blocked, result.failed) == (3, 1, 1)
+    assert attempts[2] == 2
+    assert blocked == [3]
+
+
+def test_broadcast_message_only_blocks_real_blocks(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    for uid in range(1, 6):
+        dop.set_user_shop(uid, 1)
+    dop.set_user_shop(99, 2)
+
+    sent = []
+
+    def send_message(cid, text):
+        if cid == 2:
+            raise ApiError(429, "Too Many Requests: retry after 1")
+        if cid == 4:
+            raise ApiError(403, "Forbidden: user is deactivated")
+        sent.append(cid)
+
+    monkeypatch.setattr(dop.bot, "send_message", send_message, raising=False)
+    engine_mod = dop.broadcast_engine
+    monkeypatch.setattr(
+        engine_mod,
+        "_engine",
+        BroadcastEngine(workers=2, chat_buckets=ChatBuckets(rate=1000), max_retries=0),
+    )
+    blocked = []
+    monkeypatch.setattr(dop, "new_blockuser", blocked.append)
+    progress = []
+
+    res = dop.broadcast_message("all", 100, "hola", shop_id=1, progress=lambda r: progress.append(r.processed))
+
+    assert sorted(sent) == [1, 3, 5]
+    assert blocked == [4]
+    assert "3 usuarios recibieron" in res and "1 envíos fallaron" in res
+    assert sorted(progress) == [1, 2, 3, 4, 5]
+    assert engine_mod.count_audience("all", 1) == 5
+    assert list(engine_mod.iter_audience("all", 1, limit=3, batch=2)) == [1, 2, 3]
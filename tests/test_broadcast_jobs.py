@@ -0,0 +1,93 @@
+import importlib
+import sys
+
+from tests.test_categories import setup_dop
+
+
+def _setup(monkeypatch, tmp_path, users=5):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    for uid in range(1, users + 1):
+        dop.set_user_shop(uid, 1)
+    dop.set_user_shop(99, 2)
+    monkeypatch.setattr(dop, "new_blockuser", lambda cid: None)
+    jobs = importlib.import_module("broadcast_jobs")
+    engine_mod = sys.modules["broadcast_engine"]
+    engine = engine_mod.BroadcastEngine(workers=1, chat_buckets=engine_mod.ChatBuckets(rate=1000))
+    return dop, jobs, engine
+
+
+def _statuses(dop, job_id):
+    con = dop.db.get_db_connection()
+    return dict(
+        con.execute(
+            "SELECT chat_id, status FROM broadcast_recipients WHERE job_id = ?", (job_id,)
+        ).fetchall()
+    )
+
+
+def test_job_snapshots_audience_and_records_outcomes(monkeypatch, tmp_path):
+    dop, jobs, engine = _setup(monkeypatch, tmp_path)
+    job_id = jobs.create_job(1, "all", "hola", admin_id=7)
+    dop.set_user_shop(6, 1)  # llega después: no forma parte de la difusión
+
+    sent = []
+    job = jobs.run_job(job_id, send=sent.append, engine=engine)
+
+    assert sorted(sent) == [1, 2, 3, 4, 5]
+    assert job["status"] == "done"
+    assert (job["total"], job["sent"]) == (5, 5)
+    assert set(_statuses(dop, job_id).values()) == {"sent"}
+
+
+def test_interrupted_job_resumes_from_checkpoint(monkeypatch, tmp_path):
+    dop, jobs, engine = _setup(monkeypatch, tmp_path)
+    job_id = jobs.create_job(1, "all", "hola", admin_id=7)
+    con = dop.db.get_db_connection()
+    # Estado que deja un proceso que murió tras enviar a los dos primeros
+    con.execute(
+        "UPDATE broadcast_recipients SET status = 'sent' WHERE job_id = ? AND chat_id <= 2",
+        (job_id,),
+    )
+    con.execute("UPDATE broadcast_jobs SET status = 'running', sent = 2 WHERE id = ?", (job_id,))
+    con.commit()
+
+    sent = []
+    job = jobs.run_job(job_id, send=sent.append, engine=engine)
+
+    assert sorted(sent) == [3, 4, 5]
+    assert job["status"] == "done" and job["sent"] == 5
+
+
+def test_pause_and_resume_without_duplicates(monkeypatch, tmp_path):
+    dop, jobs, engine = _setup(monkeypatch, tmp_path)
+    job_id = jobs.create_job(1, "all", "hola", admin_id=7)
+
+    sent = []
+
+    def send(chat_id):
+        sent.append(chat_id)
+        if chat_id == 2:
+            jobs.pause_job(job_id)
+
+    job = jobs.run_job(job_id, send=send, engine=engine)
+    assert job["status"] == "paused"
+    assert jobs.get_active_job(7)["id"] == job_id
+    assert "pending" in _statuses(dop, job_id).values()
+
+    job = jobs.run_job(job_id, send=send, engine=engine)
+    assert job["status"] == "done"
+    assert sorted(sent) == [1, 2, 3, 4, 5]
+    assert jobs.get_active_job(7) is None
+
+
+def test_cancelled_job_is_not_resumed(monkeypatch, tmp_path):
+    dop, jobs, engine = _setup(monkeypatch, tmp_path)
+    job_id = jobs.create_job(1, "buyers", "hola", admin_id=7)
+    assert jobs.cancel_job(job_id)
+
+    sent = []
+    job = jobs.run_job(job_id, send=sent.append, engine=engine)
+
+    assert job["status"] == "cancelled" and sent == []
+    assert jobs.resume_interrupted_jobs() == []
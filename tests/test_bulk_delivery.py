@@ -0,0 +1,55 @@
+from tests.test_payments import setup_payments
+
+
+def _setup(monkeypatch, tmp_path, fmt):
+    payments, bot = setup_payments(monkeypatch, tmp_path)
+    dop = payments.dop
+    dop.ensure_database_schema()
+    dop.create_product("K", "d", fmt, 1, 1, str(tmp_path / "K.txt"), shop_id=1)
+    dop.inventory.add_items(1, "K", [f"key-{i}" for i in range(50)])
+
+    monkeypatch.setattr(dop, "get_user_shop", lambda cid: 1)
+    monkeypatch.setattr(dop, "check_message", lambda *a, **k: False)
+    monkeypatch.setattr(dop, "get_adminlist", lambda: [])
+
+    calls = []
+    bot.send_message = lambda cid, text, **k: calls.append(("message", text))
+    bot.send_document = lambda cid, doc, **k: calls.append(("document", doc))
+    bot.send_media_group = lambda cid, media, **k: calls.append(("album", media))
+    payments.telebot.types.InputMediaDocument = lambda media: media
+    return payments, dop, calls
+
+
+def test_text_order_is_claimed_and_sent_in_one_message(monkeypatch, tmp_path):
+    payments, dop, calls = _setup(monkeypatch, tmp_path, "text")
+
+    assert payments.deliver_product(7, "u", "U", "K", 50, 50, "PayPal")
+
+    assert calls == [("message", "\n".join(f"key-{i}" for i in range(50)))]
+    assert dop.amount_of_goods("K", 1) == 0
+
+
+def test_file_order_is_sent_as_albums(monkeypatch, tmp_path):
+    payments, dop, calls = _setup(monkeypatch, tmp_path, "file")
+
+    payments.deliver_product(7, "u", "U", "K", 21, 21, "PayPal")
+
+    assert [kind for kind, _ in calls] == ["album", "album", "document"]
+    assert calls[0][1] == [f"key-{i}" for i in range(10)]
+    assert calls[2][1] == "key-20"
+    assert dop.amount_of_goods("K", 1) == 29
+
+
+def test_short_stock_reports_missing_units(monkeypatch, tmp_path):
+    payments, dop, calls = _setup(monkeypatch, tmp_path, "text")
+
+    payments.deliver_product(7, "u", "U", "K", 52, 52, "PayPal")
+
+    assert len(calls) == 2
+    assert "2 sin entregar" in calls[1][1]
+
+
+def test_chunk_text_units_keeps_units_whole(monkeypatch, tmp_path):
+    payments, _ = setup_payments(monkeypatch, tmp_path)
+    chunks = payments.chunk_text_units(["a" * 3000, "b" * 3000, "c"], limit=4096)
+    assert chunks == ["a" * 3000, "b" * 3000 + "\nc"]
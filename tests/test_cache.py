@@ -0,0 +1,126 @@
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import cache
+from tests.test_categories import setup_dop
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_and_lru_is_evicted():
+    clock = FakeClock()
+    c = cache.TTLCache(maxsize=2, ttl=10, clock=clock)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # "a" pasa a ser el más reciente
+    c.set("c", 3)
+    assert c.get("b") is None
+    clock.now = 11
+    assert c.get("a") is None
+    assert c.stats() == {"hits": 1, "misses": 2, "evictions": 1, "size": 1}
+
+
+def test_loader_errors_are_not_cached():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+        return 5
+
+    try:
+        cache.get_or_load("tests", "k", loader)
+    except RuntimeError:
+        pass
+    assert cache.get_or_load("tests", "k", loader) == 5
+    assert cache.get_or_load("tests", "k", loader) == 5
+    assert len(calls) == 2
+
+
+def test_dop_reads_hit_cache_and_writes_invalidate(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    dop.set_user_shop(5, 2)
+
+    queries = []
+    con = dop.db.get_db_connection()
+    con.set_trace_callback(queries.append)
+    try:
+        assert dop.get_user_shop(5) == 2
+        assert dop.get_user_shop(5) == 2
+        assert dop.get_discount_config(1)["multiplier"] == 1.5
+        assert dop.get_discount_config(1)["multiplier"] == 1.5
+        user_shop_queries = [q for q in queries if "FROM shop_users" in q]
+        discount_queries = [q for q in queries if "discount_config" in q]
+        assert len(user_shop_queries) == 1
+        setup_queries = [q for q in discount_queries if "CREATE TABLE" in q]
+        assert len(setup_queries) == 1
+
+        dop.set_user_shop(5, 3)
+        dop.update_discount_config(multiplier=2.0, shop_id=1)
+        assert dop.get_user_shop(5) == 3
+        assert dop.get_discount_config(1)["multiplier"] == 2.0
+    finally:
+        con.set_trace_callback(None)
+
+    stats = cache.stats()
+    assert stats["user_shop"]["hits"] >= 1
+    assert stats["discount_config"]["misses"] >= 2
+
+
+def test_new_admin_invalidates_admin_list(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    admins_file = tmp_path / "admins_list.txt"
+    admins_file.write_text("")
+    monkeypatch.setattr(dop.files, "admins_list", str(admins_file))
+
+    assert 77 not in dop.get_adminlist()
+    assert dop.db.get_user_role(77) == "user"
+    dop.new_admin(77)
+    assert 77 in dop.get_adminlist()
+    assert dop.db.get_user_role(77) == "superadmin"
+
+
+def test_payment_data_is_reloaded_after_another_process_writes(monkeypatch, tmp_path):
+    import sqlite3
+
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    dop.db.get_db_connection().execute(
+        "CREATE TABLE IF NOT EXISTS binance_data "
+        "(api_key TEXT, api_secret TEXT, merchant_id TEXT, shop_id INTEGER)"
+    )
+    monkeypatch.setattr(dop, "PAYMENT_DATA_CHECK_SECS", 0)
+    monkeypatch.setattr(dop, "_payment_data_state", {"checked": None, "version": None, "triggers": False})
+    dop.save_binancedata("k", "s", "OLD", shop_id=1)
+    assert dop.get_binancedata(1) == ("k", "s", "OLD")
+
+    # Escrituras en otras tablas, aunque vengan de otra conexión, no la vacían
+    other = sqlite3.connect(dop.files.main_db)
+    other.execute("UPDATE shops SET name = name")
+    other.commit()
+    other.close()
+    queries = []
+    con = dop.db.get_db_connection()
+    con.set_trace_callback(queries.append)
+    assert dop.get_binancedata(1) == ("k", "s", "OLD")
+    con.set_trace_callback(None)
+    assert not any("FROM binance_data" in q for q in queries)
+
+    # Como setup_binance_wallet.py, desde otra conexión
+    other = sqlite3.connect(dop.files.main_db)
+    other.execute("UPDATE binance_data SET merchant_id = 'NEW' WHERE shop_id = 1")
+    other.commit()
+    other.close()
+
+    assert dop.get_binancedata(1) == ("k", "s", "NEW")
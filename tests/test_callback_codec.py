@@ -0,0 +1,98 @@
+import os
+import types
+
+import pytest
+
+import callback_codec
+from tests.test_shop_info import setup_main
+
+
+def test_round_trip_and_size():
+    token = callback_codec.encode("product_edit", shop_id=3, product_id=123456789)
+
+    assert token.startswith(callback_codec.TOKEN_PREFIX)
+    assert len(token.encode("utf-8")) <= callback_codec.MAX_BYTES
+    assert callback_codec.decode(token) == callback_codec.Payload(
+        "product_edit", shop_id=3, product_id=123456789
+    )
+    assert callback_codec.decode(callback_codec.encode("product_page", shop_id=1, page=0)).page == 0
+
+
+@pytest.mark.parametrize(
+    "data",
+    ["Netflix Premium", "MAS_INFO_Canción", "SELECT_SHOP_2", "~1", "~1x.1", "~1p", "~1p.", "~1p.1.2", "~1p.-1", "~9p.1"],
+)
+def test_legacy_and_malformed_data_is_not_a_token(data):
+    assert callback_codec.decode(data) is None
+
+
+def test_encode_rejects_bad_payloads():
+    with pytest.raises(ValueError):
+        callback_codec.encode("unknown", product_id=1)
+    with pytest.raises(ValueError):
+        callback_codec.encode("product")
+    with pytest.raises(ValueError):
+        callback_codec.encode("product", product_id=-1)
+
+
+class Msg:
+    def __init__(self):
+        self.chat = types.SimpleNamespace(id=5, username="u")
+        self.message_id = 1
+        self.content_type = "text"
+        self.from_user = types.SimpleNamespace(first_name="N")
+
+
+def _callback(data):
+    return types.SimpleNamespace(data=data, message=Msg(), id="1", from_user=types.SimpleNamespace(id=5, username="u"))
+
+
+def test_long_accented_product_uses_short_tokens(monkeypatch, tmp_path):
+    dop, main, calls, _ = setup_main(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    sid = dop.create_shop("S", admin_id=1)
+    name = "Suscripción Anual Música Ñandú " * 3
+    dop.create_product(name, "d", "txt", 1, 5, "x", shop_id=sid)
+    con = dop.db.get_db_connection()
+    con.execute("UPDATE goods SET additional_description = 'extra' WHERE name = ?", (name,))
+    con.commit()
+    dop.set_user_shop(5, sid)
+    os.makedirs("data/Temp", exist_ok=True)
+    edits = []
+    monkeypatch.setattr(dop, "safe_edit_message", lambda bot, msg, text, **k: edits.append((text, k)))
+    monkeypatch.setattr(main.bot, "answer_callback_query", lambda *a, **k: None, raising=False)
+
+    product_id = dop.get_product_id(name, sid)
+    main.inline(_callback(callback_codec.encode("product", product_id=product_id)))
+
+    buttons = edits[-1][1]["reply_markup"].buttons
+    assert all(len(b.callback_data.encode("utf-8")) <= 64 for b in buttons)
+    more = next(b for b in buttons if "Más información" in b.text)
+    assert callback_codec.decode(more.callback_data).product_id == product_id
+
+    main.inline(_callback(more.callback_data))
+    assert "INFORMACIÓN ADICIONAL" in edits[-1][0]
+
+
+def test_admin_product_buttons_resolve_by_id(monkeypatch, tmp_path):
+    dop, main, _, _ = setup_main(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    sid = dop.create_shop("S", admin_id=1)
+    dop.create_product("Item", "d", "txt", 1, 5, "x", shop_id=sid)
+    other = dop.create_shop("Ajena", admin_id=2)
+    dop.create_product("Secreto", "d", "txt", 1, 5, "x", shop_id=other)
+    dop.set_user_shop(5, sid)
+    seen = []
+    monkeypatch.setattr(main.adminka, "edit_product", lambda c, s, n: seen.append((c, s, n)))
+    monkeypatch.setattr(main.adminka, "toggle_product", lambda c, s, n: seen.append(("toggle", s, n)))
+
+    product_id = dop.get_product_id("Item", sid)
+    main.inline(_callback(callback_codec.encode("product_edit", shop_id=sid, product_id=product_id)))
+    # Un id de otra tienda no se acepta
+    main.inline(_callback(callback_codec.encode("product_edit", shop_id=sid + 1, product_id=product_id)))
+    # Ni un token fabricado con el producto y la tienda de otro administrador
+    foreign = dop.get_product_id("Secreto", other)
+    main.inline(_callback(callback_codec.encode("product_toggle", shop_id=other, product_id=foreign)))
+    main.inline(_callback(callback_codec.encode("product_edit", shop_id=sid, product_id=foreign)))
+
+    assert seen == [(5, sid, "Item")]
@@ -0,0 +1,95 @@
+import os
+import types
+
+import callback_codec
+from callback_router import CallbackRouter, PrefixTrie
+from tests.test_shop_info import setup_main
+
+
+def test_trie_prefers_longest_prefix():
+    trie = PrefixTrie()
+    trie.insert("SHOP_", "shop")
+    trie.insert("SHOP_ADMIN_", "admin")
+
+    assert trie.longest_match("SHOP_ADMIN_4") == (11, "admin")
+    assert trie.longest_match("SHOP_4") == (5, "shop")
+    assert trie.longest_match("SHO") is None
+    assert len(trie) == 2
+
+
+def test_router_exact_mounted_prefix_and_fallback():
+    router = CallbackRouter()
+    seen = []
+    actions = {}
+    router.exact("Comprar", lambda cb, arg: seen.append(("exact", arg)))
+    router.prefix("CAT_", lambda cb, arg: seen.append(("prefix", arg)))
+    router.mount(actions, lambda cb, action: seen.append(("nav", action())))
+    router.fallback = lambda cb, data: False
+
+    # Acciones registradas después de montar la tabla también se enrutan
+    actions["stats_sales"] = lambda: "ok"
+
+    for data in ("Comprar", "CAT_7", "stats_sales"):
+        assert router.dispatch(types.SimpleNamespace(data=data))
+    assert not router.dispatch(types.SimpleNamespace(data="desconocido"))
+    assert seen == [("exact", "Comprar"), ("prefix", "7"), ("nav", "ok")]
+
+
+class Msg:
+    def __init__(self):
+        self.chat = types.SimpleNamespace(id=5, username="u")
+        self.message_id = 1
+        self.content_type = "text"
+        self.from_user = types.SimpleNamespace(first_name="N")
+
+
+def _callback(data):
+    return types.SimpleNamespace(data=data, message=Msg(), id="1", from_user=types.SimpleNamespace(id=5, username="u"))
+
+
+def test_product_buttons_use_ids_and_skip_goods_scan(monkeypatch, tmp_path):
+    dop, main, calls, _ = setup_main(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    sid = dop.create_shop("S", admin_id=1)
+    dop.create_product("Item", "d", "txt", 1, 5, "x", shop_id=sid)
+    dop.set_user_shop(5, sid)
+    os.makedirs("data/Temp", exist_ok=True)
+    monkeypatch.setattr(dop, "safe_edit_message", lambda *a, **k: calls.append(("edit", a, k)))
+
+    main.inline(_callback("CAT_NONE"))
+    button = next(b for b in calls[-1][2]["reply_markup"].buttons if "Item" in b.text)
+    assert button.callback_data == callback_codec.encode("product", product_id=dop.get_product_id("Item", sid))
+
+    def no_scan(*a, **k):
+        raise AssertionError("get_goods no debe consultarse")
+
+    monkeypatch.setattr(dop, "get_goods", no_scan)
+    main.inline(_callback(button.callback_data))
+
+    with open("data/Temp/5good_name.txt", encoding="utf-8") as f:
+        assert f.read() == "Item"
+
+
+def test_legacy_product_name_still_opens_product(monkeypatch, tmp_path):
+    dop, main, calls, _ = setup_main(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    sid = dop.create_shop("S", admin_id=1)
+    dop.create_product("Old Item", "d", "txt", 1, 5, "x", shop_id=sid)
+    dop.set_user_shop(5, sid)
+    os.makedirs("data/Temp", exist_ok=True)
+    monkeypatch.setattr(dop, "safe_edit_message", lambda *a, **k: True)
+
+    main.inline(_callback("Old Item"))
+
+    with open("data/Temp/5good_name.txt", encoding="utf-8") as f:
+        assert f.read() == "Old Item"
+
+
+def test_streaming_manager_callbacks_are_routed(monkeypatch, tmp_path):
+    dop, main, _, _ = setup_main(monkeypatch, tmp_path)
+    seen = []
+    monkeypatch.setitem(main.streaming_manager.router, "quick_test", lambda chat_id, sid: seen.append((chat_id, sid)))
+
+    main.inline(_callback("quick_test_3"))
+
+    assert seen == [(5, 3)]
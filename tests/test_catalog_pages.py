@@ -0,0 +1,83 @@
+import types
+
+import callback_codec
+from tests.test_shop_info import setup_main
+
+
+class Msg:
+    def __init__(self):
+        self.chat = types.SimpleNamespace(id=5, username="u")
+        self.message_id = 1
+        self.content_type = "text"
+        self.from_user = types.SimpleNamespace(first_name="N")
+
+
+def _callback(data):
+    return types.SimpleNamespace(data=data, message=Msg(), id="1", from_user=types.SimpleNamespace(id=5, username="u"))
+
+
+def _setup(monkeypatch, tmp_path, products=20):
+    dop, main, calls, _ = setup_main(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    sid = dop.create_shop("S", admin_id=1)
+    for i in range(products):
+        dop.create_product(f"Prod{i:02d}", "d", "txt", 1, 5, "x", shop_id=sid)
+    dop.set_user_shop(5, sid)
+    edits = []
+    monkeypatch.setattr(dop, "safe_edit_message", lambda bot, msg, text, **k: edits.append((text, k["reply_markup"])))
+    monkeypatch.setattr(main.bot, "answer_callback_query", lambda *a, **k: calls.append(("alert", a, k)), raising=False)
+    return dop, main, sid, edits, calls
+
+
+def _product_buttons(markup):
+    return [b for b in markup.buttons if b.text.startswith("📦")]
+
+
+def test_catalog_is_split_in_pages(monkeypatch, tmp_path):
+    dop, main, sid, edits, _ = _setup(monkeypatch, tmp_path)
+
+    main.inline(_callback("Ir al catálogo de productos"))
+    text, markup = edits[-1]
+    assert len(_product_buttons(markup)) == main.CATALOG_PAGE_SIZE
+    assert "Página 1/3" in text
+    next_button = next(b for b in markup.buttons if "Siguiente" in b.text)
+    payload = callback_codec.decode(next_button.callback_data)
+    assert (payload.action, payload.shop_id, payload.page) == ("catalog", sid, 2)
+
+    main.inline(_callback(callback_codec.encode("catalog", shop_id=sid, category_id=0, page=3)))
+    text, markup = edits[-1]
+    assert [b.text for b in _product_buttons(markup)] == [f"📦 Prod{i}" for i in range(16, 20)]
+    assert not any("Siguiente" in b.text for b in markup.buttons)
+    assert any("Anterior" in b.text for b in markup.buttons)
+
+
+def test_pages_are_memoized_until_catalog_changes(monkeypatch, tmp_path):
+    dop, main, sid, _, _ = _setup(monkeypatch, tmp_path, products=3)
+
+    first = main.catalog_page(sid)
+    queries = []
+    con = dop.db.get_db_connection()
+    con.set_trace_callback(queries.append)
+    try:
+        assert main.catalog_page(sid) is first
+        assert queries == []
+    finally:
+        con.set_trace_callback(None)
+
+    dop.create_product("Nuevo", "d", "txt", 1, 5, "x", shop_id=sid)
+    refreshed = main.catalog_page(sid)
+    assert refreshed is not first
+    assert any("Nuevo" in b.text for b in refreshed[1].buttons)
+
+
+def test_category_pages_only_list_category(monkeypatch, tmp_path):
+    dop, main, sid, edits, calls = _setup(monkeypatch, tmp_path, products=2)
+    cid = dop.create_category("Cat", shop_id=sid)
+    dop.assign_product_category("Prod01", cid, sid)
+
+    main.inline(_callback(f"CAT_{cid}"))
+    assert [b.text for b in _product_buttons(edits[-1][1])] == ["📦 Prod01"]
+
+    empty = dop.create_category("Vacía", shop_id=sid)
+    main.inline(_callback(f"CAT_{empty}"))
+    assert calls[-1][0] == "alert"
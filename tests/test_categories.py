@@ -36,6 +36,10 @@ def setup_dop(monkeypatch, tmp_path):
     conn.close()
 
     sys.modules.pop("db", None)
+    sys.modules.pop("inventory", None)
+    sys.modules.pop("broadcast_engine", None)
+    sys.modules.pop("broadcast_jobs", None)
+    sys.modules.pop("user_registry", None)
     sys.modules.pop("dop", None)
     dop = importlib.import_module("dop")
     return dop
@@ -0,0 +1,58 @@
+import sys
+import pathlib
+import threading
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import db, files
+
+
+def _use_tmp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, 'main_db', str(tmp_path / 'main.db'))
+    db.close_connection()
+
+
+def test_connection_is_reused_per_thread_and_uses_wal(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    con = db.get_db_connection()
+    assert db.get_db_connection() is con
+    assert con.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert con.execute('PRAGMA busy_timeout').fetchone()[0] == db.BUSY_TIMEOUT_MS
+    db.close_connection()
+
+
+def test_threads_get_separate_connections(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    main_con = db.get_db_connection()
+    main_con.execute('CREATE TABLE t (v INTEGER)')
+    main_con.execute('INSERT INTO t VALUES (1)')
+    main_con.commit()
+
+    # Keep a write transaction open on the main thread; readers in other
+    # threads must still see the committed row without blocking.
+    main_con.execute('INSERT INTO t VALUES (2)')
+
+    seen = {}
+
+    def reader():
+        con = db.get_db_connection()
+        seen['same'] = con is main_con
+        seen['rows'] = con.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+    th = threading.Thread(target=reader)
+    th.start()
+    th.join(5)
+
+    assert seen == {'same': False, 'rows': 1}
+    main_con.commit()
+    db.close_connection()
+
+
+def test_close_connection_reopens_on_next_use(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    con = db.get_db_connection()
+    db.close_connection()
+    new_con = db.get_db_connection()
+    assert new_con is not con
+    assert new_con.execute('SELECT 1').fetchone()[0] == 1
+    db.close_connection()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from advertising_system.group_dispatcher import GroupDispatcher
+from broadcast_engine import ChatBuckets
+
+
+class TooManyRequests(Exception):
+    error_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Too Many Requests")
+        self.result_json = {'parameters': {'retry_after': retry_after}}
+
+
+def test_sends_to_all_groups_in_parallel_across_tokens():
+    targets = [(f"g{i}", None) for i in range(40)]
+    active = {'now': 0, 'max': 0}
+    used_bots = set()
+    lock = threading.Lock()
+
+    def send(bot_index, group_id, topic_id):
+        with lock:
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+            used_bots.add(bot_index)
+        time.sleep(0.01)
+        with lock:
+            active['now'] -= 1
+
+    dispatcher = GroupDispatcher(3, workers=8, group_buckets=ChatBuckets(rate=1))
+    result = dispatcher.run(targets, send)
+
+    assert result.sent == 40 and result.failed == 0
+    assert active['max'] > 1
+    assert used_bots == {0, 1, 2}
+
+
+def test_429_is_requeued_without_blocking_other_groups():
+    calls = []
+    lock = threading.Lock()
+
+    def send(bot_index, group_id, topic_id):
+        with lock:
+            calls.append((time.monotonic(), bot_index, group_id))
+            first = sum(1 for c in calls if c[2] == group_id) == 1
+        if group_id == 'slow' and first:
+            raise TooManyRequests(1)
+
+    dispatcher = GroupDispatcher(2, workers=2, group_buckets=ChatBuckets(rate=10))
+    start = time.monotonic()
+    result = dispatcher.run([('slow', None), ('a', None), ('b', None)], send)
+
+    assert result.sent == 3 and result.retried == 1
+    done = {g: t - start for t, _, g in calls}
+    # Los demás grupos salen enseguida; el del 429 vuelve tras retry_after
+    assert done['a'] < 0.5 and done['b'] < 0.5
+    assert done['slow'] >= 0.9
+    # El token que recibió el 429 queda en pausa y el reintento usa el otro
+    slow_bots = [bot for _, bot, g in calls if g == 'slow']
+    assert slow_bots[0] != slow_bots[1]
+
+
+def test_gives_up_after_max_retries_and_reports_errors():
+    def send(bot_index, group_id, topic_id):
+        if group_id == 'bad':
+            raise RuntimeError("chat not found")
+
+    result = GroupDispatcher(1, group_buckets=ChatBuckets(rate=10)).run([('bad', 1), ('ok', None)], send)
+    assert result.sent == 1 and result.failed == 1
+    assert 'chat not found' in result.errors[('bad', 1)]
+
+
+def test_group_rate_limit_spaces_messages_to_the_same_group():
+    times = []
+    dispatcher = GroupDispatcher(2, workers=4, group_buckets=ChatBuckets(rate=5))
+    dispatcher.run([('g', 1), ('g', 2)], lambda b, g, t: times.append(time.monotonic()))
+    assert len(times) == 2
+    assert times[1] - times[0] >= 0.15
@@ -0,0 +1,55 @@
+import sys
+import types
+
+import pytest
+
+import http_pool
+
+
+@pytest.fixture(autouse=True)
+def real_requests(monkeypatch):
+    # Otros tests dejan un ``requests`` simulado en sys.modules
+    if not hasattr(sys.modules.get('requests'), 'adapters'):
+        monkeypatch.delitem(sys.modules, 'requests', raising=False)
+
+
+def _adapter(session):
+    return session.get_adapter('https://api.telegram.org/bot123/getMe')
+
+
+def test_session_pool_is_sized_and_retries_only_connections():
+    session = http_pool.build_session()
+    adapter = _adapter(session)
+    assert adapter._pool_maxsize == http_pool.POOL_SIZE
+    assert adapter.max_retries.connect == http_pool.CONNECT_RETRIES
+    assert adapter.max_retries.read == 0 and adapter.max_retries.status == 0
+    assert session.headers['Connection'] == 'keep-alive'
+
+
+def test_tls_handshakes_are_counted_per_new_connection(monkeypatch):
+    from urllib3.connection import HTTPSConnection
+
+    monkeypatch.setattr(HTTPSConnection, 'connect', lambda self: None)
+    pool = _adapter(http_pool.build_session()).poolmanager.connection_from_url(
+        'https://api.telegram.org'
+    )
+    before = http_pool.HANDSHAKES.value(host='api.telegram.org')
+    conn = pool._get_conn()
+    conn.connect()
+    assert http_pool.HANDSHAKES.value(host='api.telegram.org') == before + 1
+    # Una conexión devuelta al pool se reutiliza sin otro handshake
+    pool._put_conn(conn)
+    assert pool._get_conn() is conn
+    assert http_pool.stats()['handshakes']['api.telegram.org'] == before + 1
+
+
+def test_install_shares_one_session_for_every_bot(monkeypatch):
+    apihelper = types.SimpleNamespace(session=None, SESSION_TIME_TO_LIVE=600,
+                                      CONNECT_TIMEOUT=15, READ_TIMEOUT=30)
+    monkeypatch.setitem(sys.modules, 'telebot', types.SimpleNamespace(apihelper=apihelper))
+    monkeypatch.setattr(http_pool, '_session', None)
+    assert http_pool.install()
+    assert http_pool.install()
+    assert apihelper.session is http_pool.get_session()
+    assert apihelper.SESSION_TIME_TO_LIVE is None
+    assert apihelper.CONNECT_TIMEOUT == http_pool.CONNECT_TIMEOUT
@@ -0,0 +1,101 @@
+import threading
+from tests.test_categories import setup_dop
+
+
+def _product(dop, tmp_path, lines):
+    stock = tmp_path / "stock.txt"
+    stock.write_text("".join(f"{l}\n" for l in lines), encoding="utf-8")
+    dop.create_product("Key", "d", "text", 1, 5, str(stock), shop_id=1)
+    return stock
+
+
+def test_legacy_file_is_imported_and_claimed_in_order(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    stock = _product(dop, tmp_path, ["k1", "k2", "", "k3"])
+
+    assert dop.amount_of_goods("Key", 1) == 3
+    assert not stock.exists()
+
+    assert dop.get_tovar("Key", 1) == "k1"
+    assert dop.inventory.claim_items(1, "Key", 5) == ["k2", "k3"]
+    assert dop.get_tovar("Key", 1) == "Producto agotado"
+    assert dop.amount_of_goods("Key", 1) == 0
+
+    # Reponer añadiendo líneas al archivo sigue funcionando
+    stock.write_text("k4\n", encoding="utf-8")
+    assert dop.get_tovar("Key", 1) == "k4"
+
+    # Un import interrumpido deja el archivo apartado; se importa primero
+    (tmp_path / "stock.txt.importing").write_text("k5\n", encoding="utf-8")
+    stock.write_text("k6\n", encoding="utf-8")
+    assert dop.get_stock_overview(1) == ["1. Key — 2 unidades ($5 USD)"]
+    assert dop.inventory.claim_items(1, "Key", 2) == ["k5", "k6"]
+
+
+def test_stock_file_is_not_imported_inside_caller_transaction(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    stock = _product(dop, tmp_path, ["k1"])
+    con = dop.db.get_db_connection()
+
+    con.execute("UPDATE goods SET price = 9 WHERE name = 'Key'")
+    assert dop.inventory.sync_stock_file(1, "Key", str(stock)) == 0
+    assert stock.exists() and con.in_transaction
+    con.rollback()
+
+    assert dop.inventory.sync_stock_file(1, "Key", str(stock)) == 1
+    assert con.execute("SELECT price FROM goods WHERE name = 'Key'").fetchone()[0] == 5
+
+
+def test_claim_inside_caller_transaction_does_not_commit_it(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    _product(dop, tmp_path, [])
+    dop.inventory.add_items(1, "Key", ["k1"])
+    con = dop.db.get_db_connection()
+
+    con.execute("UPDATE goods SET price = 9 WHERE name = 'Key'")
+    assert dop.inventory.claim_items(1, "Key", 1) == ["k1"]
+    assert con.in_transaction
+    con.rollback()
+
+    assert dop.inventory.count_available(1, "Key") == 1
+    assert con.execute("SELECT price FROM goods WHERE name = 'Key'").fetchone()[0] == 5
+
+
+def test_concurrent_claims_never_share_units(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    _product(dop, tmp_path, [])
+    dop.inventory.add_items(1, "Key", [f"k{i}" for i in range(200)])
+
+    claimed = []
+    lock = threading.Lock()
+
+    def buyer():
+        for _ in range(10):
+            items = dop.inventory.claim_items(1, "Key", 3)
+            with lock:
+                claimed.extend(items)
+
+    threads = [threading.Thread(target=buyer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert len(claimed) == 200
+    assert len(set(claimed)) == 200
+    assert dop.inventory.count_available(1, "Key") == 0
+
+
+def test_import_stock_files_and_delete(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    _product(dop, tmp_path, ["a", "b"])
+
+    assert dop.inventory.import_stock_files() == {(1, "Key"): 2}
+    assert dop.inventory.import_stock_files() == {}
+    assert dop.delete_product("Key", 1)
+    assert dop.inventory.count_available(1, "Key") == 0
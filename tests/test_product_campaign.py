@@ -1,4 +1,4 @@
-import types, os, re, shelve
+import types, os, re
 from tests.test_shop_info import setup_main
 
 
@@ -0,0 +1,76 @@
+from tests.test_categories import setup_dop
+
+
+def _setup(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    s1 = dop.create_shop("Uno", admin_id=1)
+    s2 = dop.create_shop("Dos", admin_id=2)
+    dop.create_product("Canción Premium", "Lista de música", "txt", 1, 5, "x", shop_id=s1)
+    dop.create_product("Cuenta anual", "Incluye canciones sin anuncios", "txt", 1, 9, "x", shop_id=s1)
+    dop.create_product("CANCIÓN básica", "d", "txt", 1, 3, "x", shop_id=s2)
+    return dop, s1, s2
+
+
+def test_search_folds_accents_case_and_prefixes(monkeypatch, tmp_path):
+    dop, s1, s2 = _setup(monkeypatch, tmp_path)
+
+    names = [r[2] for r in dop.search_products("cancion")]
+    assert set(names) == {"Canción Premium", "Cuenta anual", "CANCIÓN básica"}
+    # Coincidencias en el nombre van antes que en la descripción
+    assert names[-1] == "Cuenta anual"
+
+    assert [r[2] for r in dop.search_products("MUSI prem")] == ["Canción Premium"]
+    assert dop.search_products("!!!") == []
+
+
+def test_search_filters_by_shop_and_returns_ids(monkeypatch, tmp_path):
+    dop, s1, s2 = _setup(monkeypatch, tmp_path)
+
+    rows = dop.search_products("canción", shop_id=s2, with_ids=True)
+
+    assert rows == [(dop.get_product_id("CANCIÓN básica", s2), s2, "Dos", "CANCIÓN básica", 3)]
+
+
+def test_index_follows_updates_and_deletes(monkeypatch, tmp_path):
+    dop, s1, _ = _setup(monkeypatch, tmp_path)
+
+    dop.update_product_description("Cuenta anual", "Vídeo en familia", s1)
+    dop.delete_product("Canción Premium", s1)
+
+    assert [r[2] for r in dop.search_products("video")] == ["Cuenta anual"]
+    assert [r[2] for r in dop.search_products("cancion", shop_id=s1)] == []
+
+
+def test_like_fallback_without_index(monkeypatch, tmp_path):
+    dop, s1, _ = _setup(monkeypatch, tmp_path)
+    con = dop.db.get_db_connection()
+    con.execute("DROP TABLE goods_fts")
+    con.commit()
+
+    assert [r[2] for r in dop.search_products("anual")] == ["Cuenta anual"]
+
+
+def test_product_ids_survive_rebuilds_and_are_not_reused(monkeypatch, tmp_path):
+    dop, s1, s2 = _setup(monkeypatch, tmp_path)
+    premium = dop.get_product_id("Canción Premium", s1)
+    basic = dop.get_product_id("CANCIÓN básica", s2)
+
+    # Reconstruir goods como migrate_goods_unique_pair.py: cambian los rowid
+    con = dop.db.get_db_connection()
+    cur = con.cursor()
+    cur.execute("ALTER TABLE goods RENAME TO goods_old")
+    cur.execute("CREATE TABLE goods AS SELECT * FROM goods_old ORDER BY rowid DESC")
+    cur.execute("DROP TABLE goods_old")
+    assert dop.db.ensure_product_ids(cur)
+    con.commit()
+
+    assert dop.get_product_by_id(premium) == ("Canción Premium", s1)
+    assert dop.search_products("básica", with_ids=True)[0][0] == basic
+
+    # Un botón viejo de un producto borrado no abre el siguiente que se cree
+    dop.delete_product("Canción Premium", s1)
+    dop.create_product("Otro", "d", "txt", 1, 5, "x", shop_id=s1)
+    assert dop.get_product_by_id(premium) is None
+    assert dop.get_product_id("Otro", s1) not in (premium, basic)
+    assert [r[2] for r in dop.search_products("otro")] == ["Otro"]
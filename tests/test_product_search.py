@@ -1,6 +1,6 @@
 import types
 import os
-import shelve
+import state_store
 from tests.test_shop_info import setup_main
 
 
@@ -40,13 +40,13 @@ def test_search_flow_returns_results(monkeypatch, tmp_path):
     cb = types.SimpleNamespace(data='Buscar productos', message=Msg(), id='1', from_user=types.SimpleNamespace(username='u'))
     main.inline(cb)
 
-    with shelve.open(main.files.sost_bd) as bd:
+    with state_store.open_store(main.files.sost_bd) as bd:
         assert bd[str(cb.message.chat.id)] == 24
 
     query_msg = types.SimpleNamespace(text='Widget', chat=types.SimpleNamespace(id=5, username='u'), from_user=types.SimpleNamespace(first_name='N'), content_type='text')
     main.message_send(query_msg)
 
-    with shelve.open(main.files.sost_bd) as bd:
+    with state_store.open_store(main.files.sost_bd) as bd:
         assert str(cb.message.chat.id) not in bd
 
     assert calls[-1][0] == 'send_message'
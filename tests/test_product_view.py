@@ -0,0 +1,74 @@
+import sqlite3, datetime
+from tests.test_categories import setup_dop
+
+
+def _seed(tmp_path):
+    conn = sqlite3.connect(tmp_path / "main.db")
+    cur = conn.cursor()
+    cur.execute("INSERT INTO categories (id,name,shop_id) VALUES (1,'Cat',1)")
+    cur.execute(
+        "INSERT INTO goods (name, description, format, minimum, price, stored, category_id, shop_id, "
+        "additional_description, media_file_id, media_type, media_caption, duration_days) "
+        "VALUES ('Prod','d','text',2,100,?,1,1,'more','fid','photo','cap',30)",
+        (str(tmp_path / "stock.txt"),),
+    )
+    conn.commit()
+    conn.close()
+    (tmp_path / "stock.txt").write_text("a\nb\n\nc\n", encoding="utf-8")
+
+
+def test_product_view_loads_everything_in_one_query(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    _seed(tmp_path)
+    start = datetime.datetime.now(datetime.UTC) - datetime.timedelta(hours=1)
+    dop.create_discount(20, start, None, 1, 1)
+
+    statements = []
+    dop.db.get_db_connection().set_trace_callback(statements.append)
+    view = dop.load_product_view('Prod', 1)
+    dop.db.get_db_connection().set_trace_callback(None)
+
+    assert len(statements) == 1
+    assert view.category == 'Cat'
+    assert view.discount == 20
+    assert view.discounted_price == 80
+    assert view.stock == 3
+    assert view.media == {'file_id': 'fid', 'type': 'photo', 'caption': 'cap'}
+    assert view.has_additional_description
+    assert view.discount_config['enabled'] is True
+
+
+def test_formatters_render_from_view_without_queries(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    _seed(tmp_path)
+    # Importing the legacy stock file happens once, on first read
+    assert dop.amount_of_goods('Prod', 1) == 3
+    view = dop.load_product_view('Prod', 1)
+
+    statements = []
+    dop.db.get_db_connection().set_trace_callback(statements.append)
+    desc = dop.get_description('Prod', 1, view=view)
+    basic = dop.format_product_basic_info('Prod', 1, view=view)
+    media_text = dop.format_product_with_media('Prod', 1, view=view)
+    extra = dop.format_product_additional_info('Prod', 1, view=view)
+    has_extra = dop.has_additional_description('Prod', 1, view=view)
+    media = dop.get_product_media('Prod', 1, view=view)
+    dop.db.get_db_connection().set_trace_callback(None)
+
+    assert statements == []
+    assert 'Stock disponible:* 3' in desc
+    assert 'Mínimo de compra:* 2' in desc
+    assert 'Categoría:** Cat' in basic
+    assert '📸 Imagen disponible' in media_text
+    assert 'more' in extra
+    assert has_extra and media['file_id'] == 'fid'
+
+
+def test_missing_product_view(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    assert dop.load_product_view('Nope', 1) is None
+    assert dop.get_description('Nope', 1) == "Producto no encontrado"
+    assert dop.format_product_with_media('Nope', 1) is None
@@ -11,9 +11,9 @@ def test_deliver_product_records_purchase(monkeypatch, tmp_path):
 
     # Stubs para simplificar la entrega del producto
     monkeypatch.setattr(dop, "get_user_shop", lambda cid: 1)
-    monkeypatch.setattr(dop, "is_manual_delivery", lambda name: False)
-    monkeypatch.setattr(dop, "get_goodformat", lambda name: "text")
-    monkeypatch.setattr(dop, "get_tovar", lambda name, shop_id: "data")
+    monkeypatch.setattr(dop, "is_manual_delivery", lambda name, shop_id=1: False)
+    monkeypatch.setattr(dop, "get_goodformat", lambda name, shop_id=1: "text")
+    monkeypatch.setattr(dop, "get_tovar_batch", lambda name, n, shop_id=1, claimed_by=None: ["data"] * n)
     monkeypatch.setattr(dop, "check_message", lambda *a, **k: False)
     monkeypatch.setattr(dop, "get_adminlist", lambda: [])
     monkeypatch.setattr(dop, "new_buyer", lambda *a, **k: None)
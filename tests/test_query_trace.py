@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+
+import db
+import query_trace
+
+
+@pytest.fixture
+def traced(tmp_path):
+    query_trace.reset()
+    query_trace.enable(slow=10_000, n1=3, summary_secs=0)
+    con = db.connect(str(tmp_path / 't.db'))
+    con.execute('CREATE TABLE goods (id INTEGER, name TEXT)')
+    con.executemany('INSERT INTO goods VALUES (?, ?)', [(i, f'g{i}') for i in range(5)])
+    try:
+        yield con
+    finally:
+        con.close()
+        query_trace.disable()
+        query_trace.reset()
+
+
+def test_normalize_groups_equal_statements():
+    assert query_trace.normalize("SELECT * FROM goods WHERE id = 12 AND name = 'x'") == \
+        'SELECT * FROM goods WHERE id = ? AND name = ?'
+    assert query_trace.normalize('SELECT 1 FROM t WHERE id IN (?, ?,  ?)\n') == \
+        'SELECT ? FROM t WHERE id IN (?...)'
+
+
+def test_disabled_connections_use_plain_timed_cursors(tmp_path):
+    con = db.connect(str(tmp_path / 't.db'))
+    assert type(con.cursor()) is db.TimedCursor
+    con.close()
+
+
+def test_records_sql_rows_and_caller(traced):
+    cur = traced.cursor()
+    assert isinstance(cur, db.TracedCursor)
+    cur.execute('SELECT id, name FROM goods WHERE id > 1')
+    assert len(cur.fetchall()) == 3
+    for row in traced.execute('SELECT id FROM goods WHERE id < 2'):
+        pass
+    top = {row['sql']: row for row in query_trace.summary(limit=10)}
+    select = top['SELECT id, name FROM goods WHERE id > ?']
+    assert select['count'] == 1 and select['rows'] == 3
+    assert 'test_records_sql_rows_and_caller' in select['caller']
+    assert top['SELECT id FROM goods WHERE id < ?']['rows'] == 2
+    assert top['INSERT INTO goods VALUES (?, ?)']['rows'] == 5
+    assert 'consultas SQL' in query_trace.format_summary()
+
+
+def test_slow_queries_are_logged(traced, caplog):
+    query_trace.slow_ms = 0
+    with caplog.at_level(logging.WARNING, logger='sql.slow'):
+        traced.execute("UPDATE goods SET name = 'x' WHERE id = 1")
+    assert any('slow_query' in r.message and 'rows=1' in r.message for r in caplog.records)
+
+
+def test_repeated_statements_in_one_update_are_flagged(traced, caplog):
+    with caplog.at_level(logging.WARNING, logger='sql.trace'):
+        with query_trace.update_scope('callback_query'):
+            for i in range(4):
+                traced.execute('SELECT name FROM goods WHERE id = ?', (i,)).fetchone()
+            traced.execute('SELECT COUNT(*) FROM goods').fetchone()
+    flagged = [r.message for r in caplog.records if 'n_plus_one' in r.message]
+    assert len(flagged) == 1
+    assert 'count=4' in flagged[0] and 'WHERE id = ?' in flagged[0]
@@ -1,5 +1,6 @@
 from tests.test_shop_info import setup_main
-import shelve, types, os
+import types, os
+import state_store
 
 
 def test_report_command_sets_state(monkeypatch, tmp_path):
@@ -17,7 +18,7 @@ def test_report_command_sets_state(monkeypatch, tmp_path):
             self.from_user = types.SimpleNamespace(first_name='N')
     msg = Msg('/report@mybot')
     main.message_send(msg)
-    with shelve.open(main.files.sost_bd) as bd:
+    with state_store.open_store(main.files.sost_bd) as bd:
         assert bd[str(msg.chat.id)] == 23
     assert any(c[0] == 'send_message' for c in calls)
 
@@ -44,7 +45,7 @@ def test_report_text_forwarded(monkeypatch, tmp_path):
     os.makedirs('data/bd', exist_ok=True)
     monkeypatch.setattr(main.files, 'sost_bd', str(tmp_path / 'sost.bd'))
 
-    with shelve.open(main.files.sost_bd) as bd:
+    with state_store.open_store(main.files.sost_bd) as bd:
         bd['5'] = 23
 
     monkeypatch.setattr(main.config, 'admin_id', 99)
@@ -65,7 +66,7 @@ def test_report_text_forwarded(monkeypatch, tmp_path):
     msg = Msg('algo malo')
     main.message_send(msg)
 
-    with shelve.open(main.files.sost_bd) as bd:
+    with state_store.open_store(main.files.sost_bd) as bd:
         assert str(msg.chat.id) not in bd
 
     assert any(c[0] == 'send_message' and c[1][0] == 99 for c in calls)
@@ -1,4 +1,5 @@
-import types, sys, shelve
+import types, sys
+import state_store
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
@@ -29,7 +30,7 @@ def test_configure_responses_actions(monkeypatch, tmp_path):
     monkeypatch.setattr(files, 'sost_bd', str(tmp_path/'state.db'))
     monkeypatch.setattr(adminka, 'send_long_message', lambda *a, **k: None)
     # Preload start message so preview action appears
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         bd['start'] = 'hi'
     adminka.configure_responses(1, 1)
     actions = nav_system.get_quick_actions(1, 'configure_responses')
@@ -51,7 +52,7 @@ def test_response_edit_flow(monkeypatch, tmp_path):
     adminka.response_edit_start(2, 1)
     dop.save_message('start', 'nuevo')
     adminka.configure_responses(1, 2)
-    with shelve.open(files.bot_message_bd) as bd:
+    with state_store.open_store(files.bot_message_bd) as bd:
         assert bd['start'] == 'nuevo'
     # After saving, configure_responses should be shown
     assert any('Respuestas' in t for t in sent)
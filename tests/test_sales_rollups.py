@@ -0,0 +1,104 @@
+from datetime import date, datetime, timedelta
+
+from tests.test_categories import setup_dop
+
+
+def _setup(monkeypatch, tmp_path):
+    dop = setup_dop(monkeypatch, tmp_path)
+    dop.ensure_database_schema()
+    return dop, dop.db
+
+
+def _daily(db):
+    return db.get_db_connection().execute(
+        "SELECT shop_id, day, revenue, orders, buyers FROM sales_daily ORDER BY shop_id, day"
+    ).fetchall()
+
+
+def test_purchases_update_rollups_incrementally(monkeypatch, tmp_path):
+    dop, db = _setup(monkeypatch, tmp_path)
+    today = date.today().isoformat()
+
+    dop.new_buy_improved(10, "a", "P", 1, 5, shop_id=1)
+    dop.new_buy_improved(10, "a", "P", 2, 7, shop_id=1)
+    dop.new_buy_improved(11, "b", "P", 1, 3, shop_id=1)
+    dop.new_buy_improved(12, "c", "P", 1, 4, shop_id=2)
+
+    assert _daily(db) == [(1, today, 15, 3, 2), (2, today, 4, 1, 1)]
+    rebuilt = list(_daily(db))
+    db.rebuild_sales_rollups()
+    assert _daily(db) == rebuilt
+
+
+def test_dashboards_read_rollups_not_purchases(monkeypatch, tmp_path):
+    dop, db = _setup(monkeypatch, tmp_path)
+    con = db.get_db_connection()
+    now = datetime.now()
+    yesterday = (now - timedelta(days=1)).isoformat()
+    con.executemany(
+        "INSERT INTO purchases (id, price, timestamp, shop_id) VALUES (?,?,?,?)",
+        [(1, 10, now.isoformat(), 1), (2, 20, now.isoformat(), 1), (1, 5, yesterday, 1)],
+    )
+    con.commit()
+
+    queries = []
+    con.set_trace_callback(queries.append)
+    try:
+        sales = db.get_sales_metrics(1)
+        users = db.get_user_metrics(1)
+        series = db.get_sales_timeseries(1, 7)
+        buyers = db.get_user_timeseries(None, 7)
+        global_metrics = db.get_global_metrics()
+    finally:
+        con.set_trace_callback(None)
+
+    assert not any("FROM purchases" in q for q in queries)
+    assert sales["today"] == 30 and sales["total"] == 35
+    assert users["today"] == 2 and users["total"] == 2
+    assert [p["total"] for p in series] == [5, 30]
+    assert [p["users"] for p in buyers] == [1, 2]
+    assert global_metrics["revenue"] == 35
+
+
+def test_deleting_purchases_updates_rollups(monkeypatch, tmp_path):
+    dop, db = _setup(monkeypatch, tmp_path)
+    dop.new_buy_improved(10, "a", "P", 1, 5, shop_id=1)
+    dop.new_buy_improved(10, "a", "P", 1, 6, shop_id=1)
+    dop.new_buy_improved(11, "b", "P", 1, 3, shop_id=2)
+    con = db.get_db_connection()
+
+    con.execute("DELETE FROM purchases WHERE rowid = (SELECT MIN(rowid) FROM purchases)")
+    con.commit()
+    assert [row[2:] for row in _daily(db)] == [(6, 1, 1), (3, 1, 1)]
+
+    con.execute("DELETE FROM purchases WHERE shop_id = 1")
+    con.commit()
+    assert [row[0] for row in _daily(db)] == [2]
+    assert db.get_user_metrics(1)["total"] == 0
+
+
+def test_updates_and_undated_purchases_are_rolled_up(monkeypatch, tmp_path):
+    dop, db = _setup(monkeypatch, tmp_path)
+    today = date.today().isoformat()
+    con = db.get_db_connection()
+    con.executemany(
+        "INSERT INTO purchases (id, price, timestamp, shop_id) VALUES (?,?,?,?)",
+        [(1, 10, datetime.now().isoformat(), 1), (2, 4, None, 1)],
+    )
+    con.commit()
+
+    # Las compras sin fecha cuentan en los totales, no en los días
+    assert db.get_sales_metrics(1) == {"today": 10, "month": 10, "total": 14}
+    assert db.get_user_metrics(1)["total"] == 2
+    assert [p["total"] for p in db.get_sales_timeseries(1, 7)] == [10]
+
+    # Como hace install_improvements.py al añadir la columna timestamp
+    con.execute("UPDATE purchases SET timestamp = ? WHERE timestamp IS NULL", (today,))
+    con.execute("UPDATE purchases SET price = 12, shop_id = 2 WHERE id = 1")
+    con.commit()
+
+    assert _daily(db) == [(1, today, 4, 1, 1), (2, today, 12, 1, 1)]
+    rebuilt = list(_daily(db))
+    db.rebuild_sales_rollups()
+    assert _daily(db) == rebuilt
+    assert db.get_user_metrics(1)["total"] == 1
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+from datetime import datetime
+
+from advertising_system import schedule_service
+from advertising_system.schedule_service import (
+    ScheduleService,
+    next_fire_time,
+    parse_schedule,
+)
+
+CREATE_SCHEDULES = """CREATE TABLE campaign_schedules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER,
+    schedule_name TEXT,
+    frequency TEXT,
+    schedule_json TEXT,
+    target_platforms TEXT,
+    is_active INTEGER DEFAULT 1,
+    next_send_telegram TEXT,
+    created_date TEXT,
+    shop_id INTEGER DEFAULT 1,
+    group_ids TEXT
+)"""
+
+# 2024-01-01 fue lunes
+MONDAY = datetime(2024, 1, 1, 9, 0)
+
+
+def _db(tmp_path, schedules):
+    path = tmp_path / "ads.sqlite"
+    con = sqlite3.connect(path)
+    con.execute(CREATE_SCHEDULES)
+    for campaign_id, schedule, shop_id in schedules:
+        con.execute(
+            "INSERT INTO campaign_schedules (campaign_id, schedule_json, target_platforms, shop_id)"
+            " VALUES (?, ?, 'telegram', ?)",
+            (campaign_id, json.dumps(schedule), shop_id),
+        )
+    con.commit()
+    return path, con
+
+
+def test_parse_schedule_and_next_fire_time():
+    slots = parse_schedule(json.dumps({"lunes": ["10:00", "08:30"], "Friday": ["7:05"], "x": ["1"]}))
+    assert slots == {0: [(8, 30), (10, 0)], 4: [(7, 5)]}
+
+    assert next_fire_time(slots, MONDAY) == datetime(2024, 1, 1, 10, 0)
+    assert next_fire_time(slots, datetime(2024, 1, 1, 10, 0)) == datetime(2024, 1, 1, 10, 0)
+    assert next_fire_time(slots, datetime(2024, 1, 1, 10, 0, 1)) == datetime(2024, 1, 5, 7, 5)
+    assert next_fire_time(slots, datetime(2024, 1, 6)) == datetime(2024, 1, 8, 8, 30)
+    assert next_fire_time({}, MONDAY) is None
+
+
+def test_service_fires_due_schedules_in_order(tmp_path):
+    path, con = _db(tmp_path, [
+        (1, {"lunes": ["10:00", "12:00"]}, 1),
+        (2, {"monday": ["11:00"]}, 1),
+        (3, {"lunes": ["10:30"]}, 2),
+    ])
+    sent = []
+    service = ScheduleService(lambda s: sent.append(s['campaign_id']) or True,
+                              shop_id=1, db_path=str(path))
+    service.reload(MONDAY)
+
+    assert service.next_due() == datetime(2024, 1, 1, 10, 0)
+    assert service.run_pending(datetime(2024, 1, 1, 9, 59)) == 0
+    assert service.run_pending(datetime(2024, 1, 1, 10, 0, 30)) == 1
+    assert service.run_pending(datetime(2024, 1, 1, 11, 1)) == 1
+    assert sent == [1, 2]
+    assert service.next_due() == datetime(2024, 1, 1, 12, 0)
+
+    # El siguiente envío queda guardado y no se repite tras reiniciar
+    stored = con.execute(
+        "SELECT next_send_telegram FROM campaign_schedules WHERE id = 2"
+    ).fetchone()[0]
+    assert stored == datetime(2024, 1, 8, 11, 0).isoformat()
+    restarted = ScheduleService(lambda s: sent.append(s['campaign_id']), shop_id=1, db_path=str(path))
+    restarted.reload(datetime(2024, 1, 1, 11, 1))
+    assert restarted.run_pending(datetime(2024, 1, 1, 11, 1)) == 0
+    assert sent == [1, 2]
+
+
+def test_service_skips_sends_late_beyond_grace(tmp_path):
+    path, _ = _db(tmp_path, [(1, {"lunes": ["10:00"]}, 1)])
+    sent = []
+    service = ScheduleService(lambda s: sent.append(s) or True, db_path=str(path))
+    service.reload(MONDAY)
+
+    assert service.run_pending(datetime(2024, 1, 1, 10, 30)) == 0
+    assert sent == []
+    assert service.next_due() == datetime(2024, 1, 8, 10, 0)
+
+
+def test_service_reloads_on_notification_and_external_commit(tmp_path):
+    path, con = _db(tmp_path, [(1, {"lunes": ["10:00"]}, 1)])
+    service = ScheduleService(lambda s: True, db_path=str(path), clock=lambda: MONDAY)
+    service.reload()
+    assert service._schedules_changed() is False
+
+    # Las escrituras ajenas a las programaciones no provocan recargas
+    con.execute("CREATE TABLE user_log (id INTEGER)")
+    con.execute("INSERT INTO user_log VALUES (1)")
+    con.execute("UPDATE campaign_schedules SET next_fire_at = next_fire_at")
+    con.commit()
+    assert service._schedules_changed() is False
+
+    con.execute(
+        "INSERT INTO campaign_schedules (campaign_id, schedule_json, target_platforms)"
+        " VALUES (2, ?, 'telegram')",
+        (json.dumps({"lunes": ["09:30"]}),),
+    )
+    con.commit()
+    assert service._schedules_changed() is True
+
+    service._reload = False
+    schedule_service.notify_schedules_changed()
+    assert service._reload is True
+    service.reload()
+    assert service.next_due() == datetime(2024, 1, 1, 9, 30)
@@ -2,6 +2,7 @@ import sqlite3
 import json
 import sys
 import types
+from datetime import datetime
 
 telebot_stub = types.SimpleNamespace(
     TeleBot=lambda *a, **k: None,
@@ -142,4 +143,80 @@ def test_update_and_reindex(monkeypatch, tmp_path):
 
     assert rows[0][0] == 1
     data = json.loads(rows[0][1])
-    assert data == {'tuesday': ['12:00']}
\ No newline at end of file
+    assert data == {'tuesday': ['12:00']}
+
+def _due_schedule_db(tmp_path):
+    db_path = tmp_path / "db.sqlite"
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(CREATE_SHOPS)
+    cur.execute(CREATE_CAMPAIGNS)
+    cur.execute(CREATE_SCHEDULES)
+    cur.execute(
+        "INSERT INTO campaigns (name, message_text, status, shop_id) VALUES ('c','m','active',1)"
+    )
+    cur.execute(
+        "INSERT INTO campaign_schedules (campaign_id, schedule_name, frequency, schedule_json, target_platforms, is_active, created_date, shop_id)"
+        " VALUES (?,?,?,?,?,1,'now',1)",
+        (cur.lastrowid, 'manual', 'weekly', json.dumps({"lunes": ["10:00", "18:00"]}), 'telegram'),
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _freeze(monkeypatch, moment):
+    import advertising_system.scheduler as mod
+
+    class DummyDatetime(mod.datetime):
+        @classmethod
+        def now(cls):
+            return moment
+
+    monkeypatch.setattr(mod, 'datetime', DummyDatetime)
+    return mod
+
+
+def test_pending_sends_are_claimed_once(monkeypatch, tmp_path):
+    db_path = _due_schedule_db(tmp_path)
+    _freeze(monkeypatch, datetime(2023, 1, 2, 10, 1))
+
+    viewer = CampaignScheduler(str(db_path), readonly=True)
+    assert len(viewer.get_pending_sends()) == 1
+    assert len(viewer.get_pending_sends()) == 1
+
+    first = CampaignScheduler(str(db_path))
+    second = CampaignScheduler(str(db_path))
+    rows = first.get_pending_sends()
+    assert [r[0] for r in rows] == [1]
+    assert rows[0][11] == 'c'
+    assert second.get_pending_sends() == []
+    assert viewer.get_pending_sends() == []
+
+    conn = sqlite3.connect(db_path)
+    fire_at, next_send = conn.execute(
+        "SELECT next_fire_at, next_send_telegram FROM campaign_schedules"
+    ).fetchone()
+    assert fire_at == next_send == '2023-01-02T18:00:00'
+
+    # El índice responde a "qué toca ahora" sin recorrer la tabla
+    plan = ' '.join(
+        str(r[-1]) for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM campaign_schedules WHERE is_active = 1 AND next_fire_at <= ?",
+            ('2023-01-02T18:00:00',),
+        )
+    )
+    conn.close()
+    assert 'idx_campaign_schedules_due' in plan
+
+
+def test_update_schedule_recomputes_next_fire_at(monkeypatch, tmp_path):
+    db_path = _due_schedule_db(tmp_path)
+    _freeze(monkeypatch, datetime(2023, 1, 2, 10, 1))
+
+    sch = CampaignScheduler(str(db_path))
+    assert sch.update_schedule(1, ['martes'], ['12:00'])
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT next_fire_at FROM campaign_schedules").fetchone()[0] == '2023-01-03T12:00:00'
+    conn.close()
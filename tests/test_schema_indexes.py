@@ -0,0 +1,78 @@
+import sqlite3
+import sys
+import pathlib
+from datetime import date, datetime, timedelta
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import db, files
+
+
+def _setup(tmp_path, monkeypatch):
+    db_path = tmp_path / 'main.db'
+    monkeypatch.setattr(files, 'main_db', str(db_path))
+    db.close_connection()
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE goods (name TEXT, description TEXT, additional_description TEXT, shop_id INTEGER)')
+    cur.execute('CREATE TABLE purchases (id INTEGER, price INTEGER, timestamp TEXT, shop_id INTEGER)')
+    cur.execute('CREATE TABLE shop_users (user_id INTEGER PRIMARY KEY, shop_id INTEGER)')
+    conn.commit()
+    return conn
+
+
+def _indexes(con):
+    rows = con.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+    return {r[0] for r in rows}
+
+
+def test_apply_migrations_creates_indexes_once(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch).close()
+    con = db.get_db_connection()
+
+    assert db.apply_migrations() == db.MIGRATIONS[-1][0]
+    assert db.get_schema_version() == db.MIGRATIONS[-1][0]
+    names = _indexes(con)
+    assert {'idx_goods_shop_name', 'idx_purchases_shop_ts',
+            'idx_purchases_user_shop', 'idx_shop_users_shop_user'} <= names
+    # send_logs does not exist yet, so its index is skipped
+    assert 'idx_send_logs_shop_date' not in names
+
+    plan = con.execute(
+        'EXPLAIN QUERY PLAN SELECT SUM(price) FROM purchases '
+        'WHERE shop_id=? AND timestamp>=? AND timestamp<?',
+        (1, '2024-01-01', '2024-01-02'),
+    ).fetchall()
+    assert any('idx_purchases_shop_ts' in row[-1] for row in plan)
+
+    # Running again is a no-op
+    assert db.apply_migrations() == db.MIGRATIONS[-1][0]
+    db.close_connection()
+
+
+def test_metrics_use_date_ranges(tmp_path, monkeypatch):
+    conn = _setup(tmp_path, monkeypatch)
+    now = datetime.now()
+    yesterday = now - timedelta(days=1)
+    last_year = now.replace(year=now.year - 1)
+    conn.executemany('INSERT INTO purchases VALUES (?,?,?,?)', [
+        (1, 10, now.isoformat(), 1),
+        (2, 20, now.isoformat(), 1),
+        (1, 5, yesterday.isoformat(), 1),
+        (3, 100, last_year.isoformat(), 1),
+        (4, 7, now.isoformat(), 2),
+    ])
+    conn.commit()
+    conn.close()
+
+    sales = db.get_sales_metrics(1)
+    users = db.get_user_metrics(1)
+    same_month = yesterday.month == now.month
+
+    assert sales['today'] == 30
+    assert sales['month'] == (35 if same_month else 30)
+    assert sales['total'] == 135
+    assert users['today'] == 2
+    assert users['total'] == 3
+    assert date.fromisoformat(db._day_bounds()[0][0]) == date.today()
+    db.close_connection()
@@ -0,0 +1,162 @@
+import json
+import sqlite3
+
+from advertising_system.group_dispatcher import GroupDispatcher
+from advertising_system.shop_fanout import ShopFanout, parse_tokens
+from broadcast_engine import ChatBuckets
+
+
+def _db(tmp_path, groups_per_shop):
+    path = tmp_path / "ads.sqlite"
+    con = sqlite3.connect(path)
+    cur = con.cursor()
+    cur.execute(
+        "CREATE TABLE campaigns (id INTEGER PRIMARY KEY, name TEXT, message_text TEXT, "
+        "media_file_id TEXT, media_type TEXT, button1_text TEXT, button1_url TEXT, shop_id INTEGER)"
+    )
+    cur.execute(
+        "CREATE TABLE goods (name TEXT, description TEXT, price INTEGER, "
+        "media_file_id TEXT, media_type TEXT, shop_id INTEGER)"
+    )
+    cur.execute(
+        "CREATE TABLE target_groups (id INTEGER PRIMARY KEY, group_id TEXT, topic_id INTEGER, "
+        "status TEXT, shop_id INTEGER)"
+    )
+    cur.execute(
+        "CREATE TABLE platform_config (id INTEGER PRIMARY KEY, platform TEXT, config_data TEXT, "
+        "is_active INTEGER, shop_id INTEGER)"
+    )
+    for shop_id, count in groups_per_shop.items():
+        cur.execute(
+            "INSERT INTO campaigns (id, name, message_text, shop_id) VALUES (?, ?, 'hola', ?)",
+            (shop_id, f"Producto Item{shop_id}", shop_id),
+        )
+        cur.execute(
+            "INSERT INTO goods VALUES (?, 'desc', 10, NULL, NULL, ?)", (f"Item{shop_id}", shop_id)
+        )
+        cur.executemany(
+            "INSERT INTO target_groups (group_id, status, shop_id) VALUES (?, 'active', ?)",
+            [(f"{shop_id}-{n}", shop_id) for n in range(count)],
+        )
+        cur.execute(
+            "INSERT INTO platform_config (platform, config_data, is_active, shop_id) VALUES ('telegram', ?, 1, ?)",
+            (json.dumps({"tokens": [f"token-{shop_id}"]}), shop_id),
+        )
+    con.commit()
+    con.close()
+    return str(path)
+
+
+class FakeBot:
+    def __init__(self, tokens, sent, fail=False):
+        self.bots = tokens
+        self.sent = sent
+        self.fail = fail
+
+    def deliver(self, bot_index, group_id, text, **kwargs):
+        if self.fail:
+            raise RuntimeError("caído")
+        self.sent.append((self.bots[bot_index], group_id, text))
+
+
+class TooManyRequests(Exception):
+    error_code = 429
+    result_json = {'parameters': {'retry_after': 0}}
+
+
+def fast_dispatcher(bot_count):
+    return GroupDispatcher(bot_count, bot_rate=10000, group_buckets=ChatBuckets(rate=100))
+
+
+def make_fanout(path, bot_factory, **kwargs):
+    return ShopFanout(path, bot_factory=bot_factory, dispatcher_factory=fast_dispatcher, **kwargs)
+
+
+def test_parse_tokens_formats():
+    assert parse_tokens('{"tokens": ["a", " b "]}') == ["a", "b"]
+    assert parse_tokens('{"token": "a"}') == ["a"]
+    assert parse_tokens('["a"]') == ["a"]
+    assert parse_tokens("a, b") == ["a", "b"]
+    assert parse_tokens(None) == []
+
+
+def test_small_shop_is_not_starved_by_a_big_one(tmp_path):
+    path = _db(tmp_path, {1: 500, 2: 5})
+    sent = []
+    fanout = make_fanout(path, lambda tokens: FakeBot(tokens, sent), batch_size=1)
+
+    assert fanout.submit({'id': 1, 'campaign_id': 1, 'shop_id': 1}) == 500
+    assert fanout.submit({'id': 2, 'campaign_id': 2, 'shop_id': 2}) == 5
+
+    for _ in range(10):
+        fanout.deliver_next()
+    assert [s[1].split('-')[0] for s in sent] == ['1', '2'] * 5
+    assert fanout.pending() == 495
+
+    fanout.run_pending()
+    assert len(sent) == 505
+    # Cada tienda envía con sus tokens y sus productos
+    assert {(s[0], s[1].split('-')[0]) for s in sent} == {('token-1', '1'), ('token-2', '2')}
+    assert all(f"Item{s[1].split('-')[0]}" in s[2] for s in sent)
+
+
+def test_failures_stay_inside_their_shop(tmp_path):
+    path = _db(tmp_path, {1: 3, 2: 3})
+    sent = []
+    fanout = make_fanout(
+        path,
+        lambda tokens: FakeBot(tokens, sent, fail=tokens == ['token-1']),
+    )
+    fanout.submit({'campaign_id': 1, 'shop_id': 1})
+    fanout.submit({'campaign_id': 2, 'shop_id': 2})
+
+    assert fanout.run_pending() == 6
+    assert sorted(s[1] for s in sent) == ['2-0', '2-1', '2-2']
+
+
+def test_shop_without_tokens_uses_fallback(tmp_path):
+    path = _db(tmp_path, {3: 1})
+    con = sqlite3.connect(path)
+    con.execute("DELETE FROM platform_config")
+    con.commit()
+    con.close()
+    sent = []
+    fanout = ShopFanout(path, fallback_tokens=['main'], bot_factory=lambda t: FakeBot(t, sent),
+                        dispatcher_factory=fast_dispatcher)
+
+    fanout.submit({'campaign_id': 3, 'shop_id': 3, 'group_ids': '1'})
+    fanout.run_pending()
+    assert sent == [('main', '3-0', sent[0][2])]
+
+
+def test_batches_are_sent_concurrently_and_429s_requeued(tmp_path):
+    import threading
+    import time
+
+    path = _db(tmp_path, {1: 20})
+    sent = []
+    limited = set()
+    active = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+
+    class SlowBot(FakeBot):
+        def deliver(self, bot_index, group_id, text, **kwargs):
+            with lock:
+                first = group_id not in limited
+                limited.add(group_id)
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.01)
+            with lock:
+                active['now'] -= 1
+            if group_id == '1-3' and first:
+                raise TooManyRequests('Too Many Requests')
+            super().deliver(bot_index, group_id, text)
+
+    fanout = make_fanout(path, lambda tokens: SlowBot(tokens, sent))
+    fanout.submit({'campaign_id': 1, 'shop_id': 1})
+    assert fanout.deliver_next() == 20
+    assert fanout.pending() == 0
+    assert active['max'] > 1
+    # El grupo que recibió el 429 se reintenta en lugar de perderse
+    assert sorted(s[1] for s in sent) == sorted(f'1-{n}' for n in range(20))
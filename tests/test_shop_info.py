@@ -87,6 +87,10 @@ def setup_main(monkeypatch, tmp_path):
     conn.close()
 
     sys.modules.pop("db", None)
+    sys.modules.pop("inventory", None)
+    sys.modules.pop("broadcast_engine", None)
+    sys.modules.pop("broadcast_jobs", None)
+    sys.modules.pop("user_registry", None)
     sys.modules.pop("dop", None)
     sys.modules.pop("main", None)
     sys.modules.pop("adminka", None)
@@ -0,0 +1,126 @@
+import pathlib
+import shelve
+import sys
+import threading
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import state_store
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis client."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [k.encode() for k in list(self.data) if k.startswith(prefix)]
+
+
+def test_sqlite_store_behaves_like_a_dict(tmp_path):
+    path = str(tmp_path / "sost.bd")
+    with state_store.open_store(path) as bd:
+        bd["1"] = 23
+        bd["1_new_product"] = {"shop_id": 2}
+        assert "1" in bd and bd.get("2") is None
+        assert bd.pop("1") == 23
+        assert "1" not in bd
+    assert state_store.open_store(path) is state_store.open_store(path)
+
+    state_store.reset()
+    assert state_store.open_store(path)["1_new_product"] == {"shop_id": 2}
+    assert list(state_store.open_store(path)) == ["1_new_product"]
+
+
+def test_update_is_atomic_across_threads(tmp_path):
+    store = state_store.open_store(str(tmp_path / "counter.bd"))
+
+    def bump():
+        for _ in range(50):
+            store.update("n", lambda v: v + 1, default=0)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert store["n"] == 200
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoUpdate(state_store.StateStore):
+        def get(self, key, default=None):
+            return default
+
+        def set(self, key, value):
+            pass
+
+        def delete(self, key):
+            return False
+
+        def keys(self):
+            return []
+
+    try:
+        NoUpdate()
+    except TypeError as e:
+        assert "update" in str(e)
+    else:
+        raise AssertionError("un backend sin update no debe poder crearse")
+
+
+def test_redis_backend_uses_namespaced_keys(monkeypatch, tmp_path):
+    fake = FakeRedis()
+    monkeypatch.setattr(state_store.config, "STATE_BACKEND", "redis", raising=False)
+    state_store.set_redis_client(fake)
+    try:
+        with state_store.open_store("data/bd/payments_bd.bd") as bd:
+            bd["paypal"] = "✅"
+            assert list(fake.data) == ["payments_bd:paypal"]
+            assert bd["paypal"] == "✅"
+            assert list(bd) == ["paypal"]
+            del bd["paypal"]
+            assert "paypal" not in bd
+    finally:
+        state_store.set_redis_client(None)
+
+
+def test_open_store_imports_old_shelve_once(tmp_path):
+    path = str(tmp_path / "bot_message_bd.bd")
+    with shelve.open(path) as old:
+        old["start"] = "Hola username"
+        old["help"] = "Ayuda"
+
+    store = state_store.open_store(path)
+    assert store["start"] == "Hola username"
+    assert state_store.shelve_files(path) == []
+    assert list(tmp_path.glob("bot_message_bd.bd*.migrated"))
+
+    store["help"] = "Nueva ayuda"
+    state_store.reset()
+    assert state_store.open_store(path)["help"] == "Nueva ayuda"
+
+
+def test_migrate_shelve_keeps_existing_keys(tmp_path):
+    path = str(tmp_path / "bot_message_bd.bd")
+    with shelve.open(path) as old:
+        old["start"] = "Hola username"
+        old["help"] = "Ayuda"
+
+    store = state_store.SQLiteStateStore(str(tmp_path / "other.sqlite"))
+    store["help"] = "Nueva ayuda"
+
+    assert state_store.migrate_shelve(path, store) == 1
+    assert store["start"] == "Hola username"
+    assert store["help"] == "Nueva ayuda"
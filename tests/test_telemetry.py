@@ -0,0 +1,82 @@
+import sys
+import types
+
+import pytest
+
+import telemetry
+
+
+def test_render_counters_and_histograms():
+    calls = telemetry.counter('test_calls_total', 'Test calls.', ['route'])
+    latency = telemetry.histogram('test_seconds', 'Test latency.', ['route'], buckets=(0.1, 1))
+    calls.inc(route='a')
+    calls.inc(2, route='a')
+    latency.observe(0.05, route='a')
+    latency.observe(0.5, route='a')
+    text = telemetry.render()
+    assert '# TYPE test_calls_total counter' in text
+    assert 'test_calls_total{route="a"} 3' in text
+    assert 'test_seconds_bucket{route="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="a",le="1"} 2' in text
+    assert 'test_seconds_bucket{route="a",le="+Inf"} 2' in text
+    assert 'test_seconds_count{route="a"} 2' in text
+    assert telemetry.counter('test_calls_total', 'Test calls.', ['route']) is calls
+
+
+def test_collectors_are_rendered_and_replaced():
+    telemetry.set_collector('test', lambda: 'test_queue_depth 1')
+    telemetry.set_collector('test', lambda: 'test_queue_depth 2')
+    text = telemetry.render()
+    assert 'test_queue_depth 2' in text and 'test_queue_depth 1' not in text
+    telemetry.set_collector('test', None)
+    assert 'test_queue_depth' not in telemetry.render()
+
+
+def test_sqlite_queries_are_counted_by_kind(tmp_path):
+    import db
+
+    before = telemetry.DB_QUERIES.value(kind='insert')
+    selects = telemetry.DB_SECONDS.count(kind='select')
+    con = db._open_connection(str(tmp_path / 't.db'))
+    con.execute('CREATE TABLE t (x INTEGER)')
+    con.cursor().executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+    assert con.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2
+    con.close()
+    assert telemetry.DB_QUERIES.value(kind='insert') == before + 1
+    assert telemetry.DB_SECONDS.count(kind='select') == selects + 1
+
+
+def test_callback_routes_are_timed():
+    from callback_router import CallbackRouter
+
+    router = CallbackRouter()
+    router.prefix('SHOP_', lambda cb, arg: None)
+    cb = types.SimpleNamespace(data='SHOP_12')
+    before = telemetry.CALLBACK_SECONDS.count(route='SHOP_*')
+    assert router.dispatch(cb)
+    assert telemetry.CALLBACK_SECONDS.count(route='SHOP_*') == before + 1
+
+
+def test_bot_api_calls_and_rate_limits_are_counted(monkeypatch):
+    class ApiError(Exception):
+        error_code = 429
+
+    def make_request(token, method_name, method='get', params=None, files=None):
+        if params and params.get('fail'):
+            raise ApiError('Too Many Requests')
+        return {'ok': True}
+
+    apihelper = types.SimpleNamespace(_make_request=make_request)
+    monkeypatch.setitem(sys.modules, 'telebot', types.SimpleNamespace(apihelper=apihelper))
+    monkeypatch.setitem(sys.modules, 'telebot.apihelper', apihelper)
+    assert telemetry.instrument_telebot()
+    assert telemetry.instrument_telebot()  # no se envuelve dos veces
+
+    ok = telemetry.API_CALLS.value(method='sendMessage', status='ok')
+    limited = telemetry.RATE_LIMITED.value(method='sendMessage')
+    apihelper._make_request('t', 'sendMessage', params={})
+    with pytest.raises(ApiError):
+        apihelper._make_request('t', 'sendMessage', params={'fail': True})
+    assert telemetry.API_CALLS.value(method='sendMessage', status='ok') == ok + 1
+    assert telemetry.RATE_LIMITED.value(method='sendMessage') == limited + 1
+    assert telemetry.API_SECONDS.count(method='sendMessage') >= 2
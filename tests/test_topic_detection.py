@@ -9,7 +9,7 @@ if str(root) not in sys.path:
 import telethon_manager
 import db
 import files
-import shelve
+import state_store
 
 
 def _setup_tmp_db(tmp_path, monkeypatch):
@@ -207,13 +207,13 @@ def test_wizard_progress_and_auto_selection(monkeypatch, tmp_path):
     )
 
     telethon_config.start_telethon_wizard(1, 5)
-    with shelve.open(telethon_config.files.sost_bd) as bd:
+    with state_store.open_store(telethon_config.files.sost_bd) as bd:
         assert bd["1_telethon_step"] == 1
     telethon_config.start_telethon_wizard(1, 5)
-    with shelve.open(telethon_config.files.sost_bd) as bd:
+    with state_store.open_store(telethon_config.files.sost_bd) as bd:
         assert bd["1_telethon_step"] == 2
     telethon_config.start_telethon_wizard(1, 5)
-    with shelve.open(telethon_config.files.sost_bd) as bd:
+    with state_store.open_store(telethon_config.files.sost_bd) as bd:
         assert "1_telethon_step" not in bd
 
     assert "resumen" in msgs
@@ -186,7 +186,8 @@ def test_auto_sender_topic_groups(tmp_path, monkeypatch):
     monkeypatch.setattr(sender.scheduler, 'update_next_send', lambda *a, **k: None)
 
     sender._send_telegram_campaign(camp_id, schedule_id, row)
-    assert DummyTeleBot.calls == [1, 2]
+    # Los grupos se atienden en paralelo: el orden de llegada no es fijo
+    assert sorted(DummyTeleBot.calls) == [1, 2]
 
 
 def test_auto_sender_respects_group_ids(tmp_path, monkeypatch):
@@ -435,7 +436,7 @@ def test_telethon_wizard_activation(monkeypatch, tmp_path):
     telethon_config.start_telethon_wizard(1, 7)
 
     assert actions == [('detect', 7), ('test', 7), ('activate', 7)]
-    import shelve
+    import state_store
 
-    with shelve.open(telethon_config.files.sost_bd) as bd:
+    with state_store.open_store(telethon_config.files.sost_bd) as bd:
         assert '1_telethon_step' not in bd
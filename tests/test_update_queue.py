@@ -0,0 +1,141 @@
+import threading
+
+import telemetry
+from update_queue import UpdateQueue, render_stats, route_polling, update_chat_id
+
+
+def test_workers_drain_queue_and_survive_errors():
+    seen = []
+    lock = threading.Lock()
+
+    def process(update):
+        if update == 'bad':
+            raise ValueError('boom')
+        with lock:
+            seen.append(update)
+
+    updates = UpdateQueue(process, maxsize=10, lanes=3)
+    updates.start()
+    for u in [1, 'bad', 2, 3]:
+        assert updates.put(u)
+    assert updates.join(timeout=5)
+    stats = updates.stats()
+    assert sorted(seen) == [1, 2, 3]
+    assert stats['processed'] == 3 and stats['failed'] == 1
+    assert stats['depth'] == 0 and stats['accepted'] == 4
+    updates.stop()
+
+
+def test_stats_report_depth_and_lag():
+    now = [100.0]
+    updates = UpdateQueue(lambda u: None, maxsize=2, lanes=1, clock=lambda: now[0])
+    received = telemetry.UPDATES.value(type='other')
+    assert updates.put('a') and updates.put('b')
+    assert not updates.put('c')
+    # Las rechazadas no cuentan como recibidas
+    assert telemetry.UPDATES.value(type='other') == received + 2
+    now[0] += 3
+    stats = updates.stats()
+    assert stats['depth'] == 2 and stats['rejected'] == 1
+    assert stats['oldest_age'] == 3
+    text = render_stats(stats)
+    assert 'webhook_queue_depth 2' in text
+    assert 'webhook_queue_oldest_age 3.000' in text
+    updates.start()
+    assert updates.join(timeout=5)
+    assert updates.stats()['max_lag'] == 3
+    updates.stop()
+
+
+def _callback(chat_id, data):
+    return {'callback_query': {'data': data, 'from': {'id': chat_id},
+                               'message': {'chat': {'id': chat_id}}}}
+
+
+def test_same_chat_is_ordered_and_chats_run_in_parallel():
+    import time
+
+    events = []
+    lock = threading.Lock()
+    active = {'now': 0, 'max': 0}
+
+    def process(update):
+        chat = update_chat_id(update)
+        with lock:
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+            events.append((chat, update['callback_query']['data']))
+        time.sleep(0.02)
+        with lock:
+            active['now'] -= 1
+
+    updates = UpdateQueue(process, maxsize=100, lanes=4)
+    lanes = {updates.lane_for(_callback(c, '')) for c in (10, 11, 12, 13)}
+    updates.start()
+    for i in range(5):
+        for chat in (10, 11, 12, 13):
+            updates.put(_callback(chat, i))
+    assert updates.join(timeout=5)
+    for chat in (10, 11, 12, 13):
+        assert [d for c, d in events if c == chat] == [0, 1, 2, 3, 4]
+    if len(lanes) > 1:
+        assert active['max'] > 1
+    stats = updates.stats()
+    assert len(stats['per_lane']) == 4
+    assert sum(lane['processed'] for lane in stats['per_lane']) == 20
+    assert 'webhook_queue_lane_depth{lane="0"} 0' in render_stats(stats)
+    updates.stop()
+
+
+def test_update_chat_id_for_each_update_type():
+    assert update_chat_id({'message': {'chat': {'id': 5}}}) == 5
+    assert update_chat_id(_callback(6, 'x')) == 6
+    assert update_chat_id({'callback_query': {'from': {'id': 7}}}) == 7
+    assert update_chat_id({'pre_checkout_query': {'from': {'id': 8}}}) == 8
+    assert update_chat_id({'update_id': 1}) is None
+
+
+def test_route_polling_sends_batches_through_lanes():
+    seen = []
+
+    class Bot:
+        def process_new_updates(self, batch):
+            seen.extend(batch)
+
+    bot = Bot()
+    updates = route_polling(bot, lanes=2)
+    bot.process_new_updates([{'message': {'chat': {'id': 1}}}, {'message': {'chat': {'id': 2}}}])
+    assert updates.join(timeout=5)
+    assert len(seen) == 2
+    updates.stop()
+
+
+def test_route_polling_moves_offset_before_slow_updates_finish():
+    import time
+
+    handled = []
+    pending = [{'update_id': 1, 'message': {'chat': {'id': 1}}}]
+
+    class Bot:
+        last_update_id = 0
+
+        def process_new_updates(self, batch):
+            time.sleep(0.2)
+            for update in batch:
+                self.last_update_id = max(self.last_update_id, update['update_id'])
+                handled.append(update['update_id'])
+
+        def get_updates(self, offset):
+            return [u for u in pending if u['update_id'] >= offset]
+
+    bot = Bot()
+    updates = route_polling(bot, lanes=2)
+    # Dos consultas mientras la primera actualización sigue en su carril
+    for _ in range(2):
+        bot.process_new_updates(bot.get_updates(offset=bot.last_update_id + 1))
+    assert bot.last_update_id == 1
+    # Una repetición con el mismo id tampoco se vuelve a encolar
+    bot.process_new_updates(list(pending))
+    assert updates.join(timeout=5)
+    assert handled == [1]
+    updates.stop()
@@ -0,0 +1,62 @@
+from tests.test_categories import setup_dop
+
+
+def _setup(monkeypatch, tmp_path, users="", blocked="", admins=""):
+    import files
+    for name, content in (("users_list", users), ("blockusers_list", blocked), ("admins_list", admins)):
+        path = tmp_path / f"{name}.txt"
+        path.write_text(content)
+        monkeypatch.setattr(files, name, str(path))
+    return setup_dop(monkeypatch, tmp_path)
+
+
+def test_user_loger_matches_whole_ids(monkeypatch, tmp_path):
+    dop = _setup(monkeypatch, tmp_path, users="3124\n")
+
+    assert dop.user_loger(12) == 2
+    assert dop.user_registry.contains(dop.user_registry.USERS, 12)
+    assert dop.user_loger(12) == 2
+    assert dop.user_loger(3124) == 2
+
+
+def test_counts_follow_inserts_and_deletes(monkeypatch, tmp_path):
+    dop = _setup(monkeypatch, tmp_path)
+    registry = dop.user_registry
+
+    for user_id in (5, 6, 7):
+        dop.user_loger(user_id)
+    dop.del_id(dop.files.users_list, 6)
+    dop.del_id(dop.files.users_list, 99)
+
+    assert registry.count(registry.USERS) == 2
+    assert registry.members(registry.USERS) == [5, 7]
+
+
+def test_migration_imports_text_files(monkeypatch, tmp_path):
+    dop = _setup(monkeypatch, tmp_path, users="10\n11\n\n11\n", blocked="11\n", admins="20\nxx\n")
+    registry = dop.user_registry
+
+    assert registry.members(registry.USERS) == [10, 11]
+    assert dop.get_amountblock() == 1
+    assert dop.get_adminlist() == [1, 20]
+    assert registry.import_text_files() == {registry.USERS: 0, registry.BLOCKED: 0, registry.ADMINS: 0}
+
+
+def test_new_blockuser_counts_once(monkeypatch, tmp_path):
+    dop = _setup(monkeypatch, tmp_path)
+
+    dop.new_blockuser(8)
+    dop.new_blockuser(8)
+
+    assert dop.get_amountblock() == 1
+
+
+def test_iter_members_pages(monkeypatch, tmp_path):
+    dop = _setup(monkeypatch, tmp_path)
+    registry = dop.user_registry
+    monkeypatch.setattr(registry, "PAGE_SIZE", 2)
+    for user_id in range(1, 6):
+        registry.add(registry.USERS, user_id)
+
+    assert list(registry.iter_members(registry.USERS)) == [1, 2, 3, 4, 5]
+    assert list(registry.iter_members(registry.USERS, 3)) == [1, 2, 3]
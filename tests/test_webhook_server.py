@@ -91,6 +91,7 @@ def test_valid_update(monkeypatch, tmp_path):
     before = server.metrics.copy()
     resp = client.post(main.config.WEBHOOK_PATH, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": "secret"})
     assert resp.status_code == 200
+    assert app.update_queue.join(timeout=5)
     assert any(c[0] == "process_new_updates" for c in calls)
     assert server.metrics["updates_total"] == before["updates_total"] + 1
     assert server.metrics["requests_total"] == before["requests_total"] + 1
@@ -119,3 +120,55 @@ def test_invalid_content_type(monkeypatch, tmp_path):
     assert not any(c[0] == "process_new_updates" for c in calls)
     assert server.metrics["updates_total"] == before["updates_total"]
     assert server.metrics["requests_total"] == before["requests_total"] + 1
+
+
+def test_returns_immediately_and_rejects_when_queue_is_full(monkeypatch, tmp_path):
+    import threading
+    from update_queue import UpdateQueue
+
+    dop, main, calls, bot = setup_main(monkeypatch, tmp_path)
+    monkeypatch.setattr(webhook_server.config, "WEBHOOK_SECRET_TOKEN", None, raising=False)
+    monkeypatch.setattr(webhook_server, "telebot", sys.modules["telebot"], raising=False)
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def slow(update):
+        started.set()
+        release.wait(5)
+        processed.append(update)
+
+    updates = UpdateQueue(slow, maxsize=1, lanes=1)
+    app = webhook_server.create_app(updates)
+    client = app.test_client()
+    try:
+        assert client.post(main.config.WEBHOOK_PATH, json={"update_id": 0}).status_code == 200
+        # Esperar (con límite) a que el worker tome la primera
+        assert started.wait(2)
+        # La segunda espera en cola y la tercera se rechaza
+        assert client.post(main.config.WEBHOOK_PATH, json={"update_id": 1}).status_code == 200
+        assert client.post(main.config.WEBHOOK_PATH, json={"update_id": 2}).status_code == 503
+        assert processed == []
+        assert updates.stats()["rejected"] == 1
+    finally:
+        release.set()
+    assert updates.join(timeout=5)
+    assert processed == [{"update_id": 0}, {"update_id": 1}]
+    updates.stop()
+
+
+def test_metrics_endpoint_exports_prometheus_text(monkeypatch, tmp_path):
+    import telemetry
+
+    app, server, calls, bot, main = setup_app(monkeypatch, tmp_path)
+    monkeypatch.setattr(bot, "process_new_updates", lambda updates: None, raising=False)
+    client = app.test_client()
+    client.post(main.config.WEBHOOK_PATH, json={"update_id": 1, "message": {"chat": {"id": 3}}},
+                headers={"X-Telegram-Bot-Api-Secret-Token": "secret"})
+    assert app.update_queue.join(timeout=5)
+    text = telemetry.render()
+    assert 'telegram_updates_total{type="message"}' in text
+    assert "webhook_queue_depth 0" in text
+    assert "webhook_requests_total 1" in text
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
@@ -0,0 +1,311 @@
+"""Bounded queue between Telegram and the bot handlers.
+
+The webhook only validates the request and puts the update here, so Telegram
+gets its ``200`` right away instead of waiting for payment lookups or
+broadcasts.  Polling mode feeds the same queue.
+
+Updates are sharded by chat onto lanes, each drained by its own thread: the
+updates of one chat are handled strictly in order (two quick taps never race
+on the same ``data/Temp`` files or ``shop_users`` row) while different chats
+are handled concurrently.
+
+When the queue is full :meth:`UpdateQueue.put` returns ``False`` and the
+endpoint answers ``503`` with ``Retry-After``; Telegram keeps the update and
+delivers it again later, so nothing is lost while the lanes catch up.
+
+:meth:`UpdateQueue.stats` reports the depth and how long updates wait
+before being handled (the lag), in total and per lane.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import query_trace
+import telemetry
+
+DEFAULT_MAXSIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+DEFAULT_LANES = int(os.getenv('UPDATE_LANES', os.getenv('WEBHOOK_WORKERS', '4')))
+RETRY_AFTER = int(os.getenv('WEBHOOK_RETRY_AFTER', '5'))
+
+# Tipos de actualización cuyo chat está en ``<campo>.chat``
+_CHAT_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+)
+# Tipos sin chat: se ordenan por el usuario que los envía
+_USER_FIELDS = (
+    'inline_query', 'chosen_inline_result', 'shipping_query',
+    'pre_checkout_query', 'poll_answer',
+)
+
+
+def _field(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _user_id(obj):
+    user = _field(obj, 'from_user') or _field(obj, 'from') or _field(obj, 'user')
+    return _field(user, 'id')
+
+
+def update_chat_id(update):
+    """Return the chat an update belongs to, or ``None`` if it has none.
+
+    Callback queries use the chat of the message that holds the button;
+    updates without a chat (inline queries, payments) use the sender's id,
+    which is the chat id of their private chat with the bot.
+    """
+    for name in _CHAT_FIELDS:
+        obj = _field(update, name)
+        if obj is not None:
+            return _field(_field(obj, 'chat'), 'id')
+    callback = _field(update, 'callback_query')
+    if callback is not None:
+        message = _field(callback, 'message')
+        chat_id = _field(_field(message, 'chat'), 'id') if message is not None else None
+        return chat_id if chat_id is not None else _user_id(callback)
+    for name in _USER_FIELDS:
+        obj = _field(update, name)
+        if obj is not None:
+            return _user_id(obj)
+    return None
+
+
+def update_type(update):
+    """Return the kind of an update (``message``, ``callback_query``...)."""
+    for name in _CHAT_FIELDS + ('callback_query',) + _USER_FIELDS:
+        if _field(update, name) is not None:
+            return name
+    return 'other'
+
+
+class _Lane:
+    def __init__(self, lock):
+        self.items = deque()
+        self.cond = threading.Condition(lock)
+        self.busy = False
+        self.processed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+
+class UpdateQueue:
+    """Bounded queue of updates drained by ``lanes`` ordered lanes.
+
+    ``process(update)`` is called once per update from the thread of the
+    update's lane; exceptions are logged and do not stop the lane.
+    ``maxsize`` bounds the updates waiting in all lanes together.
+    """
+
+    def __init__(self, process, maxsize=DEFAULT_MAXSIZE, lanes=DEFAULT_LANES,
+                 clock=time.monotonic):
+        self.process = process
+        self.maxsize = max(1, int(maxsize))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._lanes = [_Lane(self._lock) for _ in range(max(1, int(lanes)))]
+        self._threads = []
+        self._stopped = False
+        self._size = 0
+        self._next_lane = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_lag = 0.0
+
+    @property
+    def lanes(self):
+        return len(self._lanes)
+
+    def lane_for(self, update):
+        """Return the lane index of ``update`` (same chat, same lane)."""
+        chat_id = update_chat_id(update)
+        if chat_id is None:
+            # Sin chat no hay orden que respetar: repartir por turnos
+            index = self._next_lane
+            self._next_lane = (index + 1) % len(self._lanes)
+            return index
+        return hash(chat_id) % len(self._lanes)
+
+    def put(self, update, block=False, timeout=None):
+        """Queue ``update``; return ``False`` if the queue is full.
+
+        With ``block=True`` wait up to ``timeout`` seconds (forever if
+        ``None``) for room instead of rejecting right away.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._size >= self.maxsize:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    self.rejected += 1
+                    return False
+                self._cond.wait(remaining)
+            lane = self._lanes[self.lane_for(update)]
+            lane.items.append((self._clock(), update))
+            self._size += 1
+            self.accepted += 1
+            lane.cond.notify()
+        # Las rechazadas con 503 se cuentan cuando Telegram las reenvía
+        telemetry.UPDATES.inc(type=update_type(update))
+        return True
+
+    def _take(self, lane):
+        with self._lock:
+            while not self._stopped and not lane.items:
+                lane.cond.wait()
+            if self._stopped:
+                return None
+            queued_at, update = lane.items.popleft()
+            self._size -= 1
+            lag = self._clock() - queued_at
+            lane.last_lag = lag
+            lane.max_lag = max(lane.max_lag, lag)
+            self.max_lag = max(self.max_lag, lag)
+            lane.busy = True
+            self._cond.notify_all()
+            return update
+
+    def _worker(self, lane):
+        while True:
+            update = self._take(lane)
+            if update is None:
+                return
+            try:
+                with query_trace.update_scope(update_type(update)):
+                    self.process(update)
+                ok = True
+            except Exception as e:
+                logging.error(f"Error procesando actualización: {e}")
+                ok = False
+            with self._lock:
+                lane.busy = False
+                lane.processed += 1
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+
+    def start(self):
+        """Start one thread per lane (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped = False
+            self._threads = [
+                threading.Thread(target=self._worker, args=(lane,),
+                                 name=f"update-lane-{i}", daemon=True)
+                for i, lane in enumerate(self._lanes)
+            ]
+        for th in self._threads:
+            th.start()
+
+    def stop(self):
+        """Stop the lanes; updates still queued are left unprocessed."""
+        with self._lock:
+            self._stopped = True
+            for lane in self._lanes:
+                lane.cond.notify_all()
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for th in threads:
+            th.join()
+
+    def join(self, timeout=None):
+        """Wait until every queued update has been processed.
+
+        Returns ``False`` if ``timeout`` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._size or any(lane.busy for lane in self._lanes):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def depth(self):
+        with self._lock:
+            return self._size
+
+    def stats(self):
+        """Return depth, lag in seconds and counters, with a ``per_lane`` list."""
+        with self._lock:
+            now = self._clock()
+            per_lane = [
+                {
+                    'depth': len(lane.items),
+                    'oldest_age': now - lane.items[0][0] if lane.items else 0.0,
+                    'last_lag': lane.last_lag,
+                    'max_lag': lane.max_lag,
+                    'processed': lane.processed,
+                }
+                for lane in self._lanes
+            ]
+            return {
+                'depth': self._size,
+                'maxsize': self.maxsize,
+                'lanes': len(self._lanes),
+                'in_flight': sum(1 for lane in self._lanes if lane.busy),
+                'oldest_age': max(lane['oldest_age'] for lane in per_lane),
+                'max_lag': self.max_lag,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'processed': self.processed,
+                'failed': self.failed,
+                'per_lane': per_lane,
+            }
+
+
+def _format(value):
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def render_stats(stats):
+    """Format :meth:`UpdateQueue.stats` as ``webhook_queue_<name> <value>`` lines."""
+    lines = []
+    for name, value in stats.items():
+        if name == 'per_lane':
+            continue
+        lines.append(f"webhook_queue_{name} {_format(value)}")
+    for index, lane in enumerate(stats.get('per_lane', [])):
+        for name, value in lane.items():
+            lines.append(f'webhook_queue_lane_{name}{{lane="{index}"}} {_format(value)}')
+    return "\n".join(lines) + "\n"
+
+
+def route_polling(bot, maxsize=DEFAULT_MAXSIZE, lanes=DEFAULT_LANES):
+    """Send the updates fetched by ``bot`` in polling mode through lanes.
+
+    ``bot`` must be non-threaded so its polling loop calls
+    ``process_new_updates`` itself; the loop waits when the queue is full.
+    The offset (``bot.last_update_id``) moves forward as soon as an update
+    is queued, so the next ``getUpdates`` does not fetch it again while it
+    is still waiting in its lane.  Returns the started :class:`UpdateQueue`.
+    """
+    process = bot.process_new_updates
+    updates = UpdateQueue(lambda update: process([update]), maxsize=maxsize, lanes=lanes)
+
+    def enqueue(batch):
+        for update in batch:
+            update_id = _field(update, 'update_id')
+            last = getattr(bot, 'last_update_id', 0) or 0
+            if update_id is not None:
+                if update_id <= last:
+                    # Ya encolada en una consulta anterior
+                    continue
+                bot.last_update_id = update_id
+            updates.put(update, block=True)
+
+    bot.process_new_updates = enqueue
+    updates.start()
+    return updates
@@ -0,0 +1,95 @@
+"""Registries of bot users, blocked users and admins.
+
+Each registry is a table keyed by ``user_id`` (created by schema migration
+4, which also imports the old ``data/lists/*.txt`` files), so membership
+checks and inserts are single index lookups.  Counts come from
+``registry_counts``, maintained by triggers.
+"""
+
+import logging
+
+import db
+import files
+
+USERS = 'bot_users'
+BLOCKED = 'blocked_users'
+ADMINS = 'bot_admins'
+
+PAGE_SIZE = 500
+
+
+def add(registry, user_id):
+    """Register ``user_id``; return True if it was not registered yet."""
+    con = db.get_db_connection()
+    cur = con.execute(
+        f"INSERT OR IGNORE INTO {registry} (user_id) VALUES (?)", (int(user_id),)
+    )
+    con.commit()
+    return cur.rowcount > 0
+
+
+def remove(registry, user_id):
+    """Unregister ``user_id``; return True if it was registered."""
+    con = db.get_db_connection()
+    cur = con.execute(f"DELETE FROM {registry} WHERE user_id = ?", (int(user_id),))
+    con.commit()
+    return cur.rowcount > 0
+
+
+def contains(registry, user_id):
+    row = db.get_db_connection().execute(
+        f"SELECT 1 FROM {registry} WHERE user_id = ?", (int(user_id),)
+    ).fetchone()
+    return row is not None
+
+
+def count(registry):
+    row = db.get_db_connection().execute(
+        "SELECT total FROM registry_counts WHERE name = ?", (registry,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def iter_members(registry, limit=None):
+    """Yield registered ids in ascending order, reading them in pages."""
+    last_id = -1 << 63
+    remaining = None if limit is None else int(limit)
+    while remaining is None or remaining > 0:
+        size = PAGE_SIZE if remaining is None else min(PAGE_SIZE, remaining)
+        rows = db.get_db_connection().execute(
+            f"SELECT user_id FROM {registry} WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (last_id, size),
+        ).fetchall()
+        for (user_id,) in rows:
+            yield user_id
+        if len(rows) < size:
+            return
+        last_id = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def members(registry):
+    return list(iter_members(registry))
+
+
+def import_text_file(registry, path):
+    """Import ids from an old one-id-per-line list; return how many were new."""
+    con = db.get_db_connection()
+    try:
+        added = db.import_registry_file(con.cursor(), registry, path)
+        con.commit()
+        return added
+    except Exception as e:
+        if con.in_transaction:
+            con.rollback()
+        logging.error(f"Error importando {path}: {e}")
+        return 0
+
+
+def import_text_files():
+    """Import the three legacy list files; return ``{registry: added}``."""
+    return {
+        registry: import_text_file(registry, getattr(files, list_name))
+        for registry, list_name in db.REGISTRY_TABLES.items()
+    }
@@ -1,7 +1,9 @@
 from flask import Flask, request, abort
 import telebot
 import config
+import telemetry
 from bot_instance import bot
+from update_queue import UpdateQueue, RETRY_AFTER, render_stats
 
 # Simple in-memory metrics
 metrics = {
@@ -10,9 +12,28 @@ metrics = {
 }
 
 
-def create_app():
+def _process_update(update):
+    bot.process_new_updates([update])
+
+
+def _render_request_metrics():
+    return "\n".join(f"webhook_{name} {value}" for name, value in metrics.items())
+
+
+def create_app(updates=None):
+    """Crear la app Flask del webhook.
+
+    Las actualizaciones se encolan en ``updates`` (una :class:`UpdateQueue`)
+    y se procesan en segundo plano; la cola queda en ``app.update_queue``.
+    """
     app = Flask(__name__)
     secret = getattr(config, "WEBHOOK_SECRET_TOKEN", None)
+    if updates is None:
+        updates = UpdateQueue(_process_update)
+    updates.start()
+    app.update_queue = updates
+    telemetry.set_collector("webhook", _render_request_metrics)
+    telemetry.set_collector("update_queue", lambda: render_stats(updates.stats()))
 
     @app.route(config.WEBHOOK_PATH, methods=["POST"])
     def webhook():
@@ -23,12 +44,14 @@ def create_app():
             return "", 403
         data = request.get_json()
         update = telebot.types.Update.de_json(data)
-        bot.process_new_updates([update])
+        if not updates.put(update):
+            # Cola llena: Telegram reintentará más tarde
+            return "", 503, {"Retry-After": str(RETRY_AFTER)}
         metrics["updates_total"] += 1
         return ""
 
     @app.route("/metrics", methods=["GET"])
     def metrics_route():
-        return "ok"
+        return telemetry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
     return app